@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""Persistent aggregate cache next to an index file.
+
+``capture_<RUN_ID>.index.agg.json`` keeps what ``diff_captures.py`` and
+``ai_brief.py`` compute from an index, so comparing against a fixed baseline
+aggregates only the other capture:
+
+    {"schemaVersion": "1",
+     "source": {"size": bytes, "mtimeNs": ns, "sha256": hex},
+     "entries": {"<kind>|<endpoint templater fingerprint>": payload, ...}}
+
+An entry is used when the index still has the recorded size and mtime, or,
+when only the mtime differs (a copied or touched baseline), the same
+SHA-256. A file with any other content discards every entry. Kinds are
+``diff`` (aggregate_endpoints output with serialized sketches) and
+``ai_brief`` (calc_stats output). The cache is best effort: unreadable,
+stale or incompatible files are recomputed, and an unwritable directory
+only costs the next run its reuse.
+"""
+
+import hashlib
+import json
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+AGG_SUFFIX = ".agg.json"
+SCHEMA_VERSION = "1"
+HASH_CHUNK = 1 << 20
+
+
+def agg_path_for(index_file):
+    """capture_<RUN_ID>.index.ndjson -> capture_<RUN_ID>.index.agg.json."""
+    base = index_file[:-len(".ndjson")] if index_file.endswith(".ndjson") else index_file
+    return base + AGG_SUFFIX
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def entry_key(kind, templater):
+    """Cache key of one aggregation: its kind and the endpoint templating used."""
+    return f"{kind}|{templater.fingerprint() if templater is not None else 'raw'}"
+
+
+def read_cache(index_file):
+    """Return (cache dict, current source record) for index_file.
+
+    The cache dict is empty when there is no usable cache for the index's
+    current content.
+    """
+    real_index = os.path.realpath(index_file)
+    st = os.stat(real_index)
+    source = {"size": st.st_size, "mtimeNs": st.st_mtime_ns}
+    try:
+        with open(agg_path_for(real_index), "r", encoding="utf-8") as f:
+            cache = json.load(f)
+        cached = cache["source"]
+        if cache.get("schemaVersion") != SCHEMA_VERSION or not isinstance(cache.get("entries"), dict):
+            raise ValueError("incompatible cache")
+    except (OSError, ValueError, KeyError, TypeError):
+        return {}, source
+    if cached.get("size") != source["size"]:
+        return {}, source
+    if cached.get("mtimeNs") == source["mtimeNs"]:
+        source["sha256"] = cached.get("sha256")
+        return cache, source
+    # Same size, new mtime: only the content decides
+    source["sha256"] = file_sha256(real_index)
+    if cached.get("sha256") != source["sha256"]:
+        return {}, source
+    cache["source"] = source
+    write_cache(index_file, cache)
+    return cache, source
+
+
+def write_cache(index_file, cache):
+    """Replace the cache file atomically (owner-only); failures are ignored."""
+    agg_file = agg_path_for(os.path.realpath(index_file))
+    tmp_file = f"{agg_file}.tmp.{os.getpid()}"
+    try:
+        fd = os.open(tmp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(cache, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_file, agg_file)
+    except OSError as exc:
+        print(f"Warning: could not write {agg_file}: {exc}", file=sys.stderr)
+        try:
+            os.unlink(tmp_file)
+        except OSError:
+            pass
+
+
+def cached_aggregate(index_file, kind, templater, compute, encode=None, decode=None):
+    """Return compute() for index_file, from the cache when it is current.
+
+    encode/decode convert the result to and from its JSON payload (identity
+    by default). A miss computes, then stores the payload alongside entries
+    of other kinds for the same content.
+    """
+    key = entry_key(kind, templater)
+    cache, source = read_cache(index_file)
+    payload = cache.get("entries", {}).get(key) if cache else None
+    if payload is not None:
+        try:
+            return decode(payload) if decode else payload
+        except (ValueError, KeyError, TypeError) as exc:
+            print(f"Warning: ignoring cached {kind} aggregate of {index_file}: {exc}", file=sys.stderr)
+
+    result = compute()
+    # The index may have grown while it was read (a live capture): keep the
+    # result but do not pin it to a size it no longer has
+    if os.path.getsize(os.path.realpath(index_file)) != source["size"]:
+        return result
+    if not cache:
+        if not source.get("sha256"):
+            source["sha256"] = file_sha256(os.path.realpath(index_file))
+        cache = {"schemaVersion": SCHEMA_VERSION, "source": source, "entries": {}}
+    cache["entries"][key] = encode(result) if encode else result
+    write_cache(index_file, cache)
+    return result
+
+
+def main(argv=None):
+    """CLI interface: show or drop the cache of index files."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Inspect the aggregate cache of index files")
+    parser.add_argument("index_files", nargs="+", help="index.ndjson files")
+    parser.add_argument("--clear", action="store_true", help="Delete their .agg.json files")
+    args = parser.parse_args(argv)
+
+    for index_file in args.index_files:
+        agg_file = agg_path_for(os.path.realpath(index_file))
+        if args.clear:
+            if os.path.isfile(agg_file):
+                os.unlink(agg_file)
+                print(f"removed {agg_file}")
+            continue
+        if not os.path.isfile(index_file):
+            print(f"{index_file}: not found", file=sys.stderr)
+            continue
+        cache, _ = read_cache(index_file)
+        state = "current" if cache else ("stale" if os.path.isfile(agg_file) else "none")
+        kinds = sorted(key.split("|", 1)[0] for key in cache.get("entries", {})) if cache else []
+        print(f"{index_file}: {state}" + (f" ({', '.join(kinds)})" if kinds else ""))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
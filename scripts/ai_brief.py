@@ -1,11 +1,24 @@
 #!/usr/bin/env python3
-"""Build AI-friendly analysis artifacts from capture manifest and index files."""
+"""Build AI-friendly analysis artifacts from capture manifest and index files.
 
+The index statistics are cached in ``<index>.agg.json`` (agg_cache.py) and
+reused while the index is unchanged; ``--no-cache`` recomputes them.
+"""
+
+import heapq
 import json
 import os
 import sys
-from collections import Counter, defaultdict
+from collections import Counter
 from datetime import datetime, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+from agg_cache import cached_aggregate
+from endpoint_templates import load_templater
+from index_arrays import endpoint_groups, first_seen_counts, load_arrays, top_rows
+from index_columns import INT_NULL, iter_rows
+from quantiles import LatencySketch, grouped_sketches, merge_sketches
 
 
 def load_manifest(path):
@@ -14,17 +27,7 @@ def load_manifest(path):
 
 
 def load_index(path):
-    MAX_ENTRIES = 100000
-    entries = []
-    with open(path, "r", encoding="utf-8") as f:
-        for line in f:
-            text = line.strip()
-            if not text:
-                continue
-            entries.append(json.loads(text))
-            if len(entries) >= MAX_ENTRIES:
-                break
-    return entries
+    return list(iter_rows(path))
 
 
 def endpoint_key(item):
@@ -34,84 +37,229 @@ def endpoint_key(item):
     return f"{method} {host}{path}"
 
 
-def calc_stats(entries):
-    total = len(entries)
-    responded = [entry for entry in entries if entry.get("status") is not None]
-    no_response = total - len(responded)
-
-    durations = [entry.get("durationMs") for entry in responded if isinstance(entry.get("durationMs"), int)]
-    avg_ms = int(sum(durations) / len(durations)) if durations else 0
-    p95_ms = 0
-    if durations:
-        sorted_durations = sorted(durations)
-        p95_idx = int((len(sorted_durations) - 1) * 0.95)
-        p95_ms = sorted_durations[p95_idx]
-
-    status_buckets = Counter(entry.get("statusBucket") or "unknown" for entry in entries)
-    top_hosts = Counter(entry.get("host") or "" for entry in entries if entry.get("host")).most_common(15)
-
-    endpoint_counter = Counter(endpoint_key(entry) for entry in entries)
-    top_endpoints = endpoint_counter.most_common(30)
-
-    error_entries = [entry for entry in responded if isinstance(entry.get("status"), int) and entry.get("status") >= 400]
-    error_counter = Counter(endpoint_key(entry) for entry in error_entries)
-    top_error_endpoints = error_counter.most_common(20)
-
-    slow_entries = sorted(
-        [entry for entry in responded if isinstance(entry.get("durationMs"), int)],
-        key=lambda item: item.get("durationMs", 0),
-        reverse=True,
-    )[:30]
-
-    endpoint_status_counter = defaultdict(Counter)
-    for entry in entries:
-        ep = endpoint_key(entry)
-        bucket = entry.get("statusBucket") or "unknown"
-        endpoint_status_counter[ep][bucket] += 1
-
-    error_prone = []
-    for ep, bucket_counter in endpoint_status_counter.items():
-        total_ep = sum(bucket_counter.values())
-        err_ep = bucket_counter.get("4xx", 0) + bucket_counter.get("5xx", 0)
-        if total_ep >= 2 and err_ep > 0:
-            ratio = err_ep / total_ep
-            error_prone.append((ep, total_ep, err_ep, ratio))
-    error_prone.sort(key=lambda item: (item[3], item[2], item[1]), reverse=True)
-
+class StatsAccumulator:
+    """Single-pass statistics over index rows.
+
+    Rows are consumed one at a time (``add``) and only aggregates are kept:
+    counters, one record per endpoint, latency sketches (quantiles.py) for
+    the capture and for each endpoint, and a bounded heap of the slowest
+    requests. ``result`` returns the dict that calc_stats always produced,
+    including its tie ordering, plus the percentiles and serialized sketches.
+
+    With an endpoint_templates.EndpointTemplater, endpoint keys use the
+    templated path (``/users/{id}``) as rows arrive, and ``result`` merges
+    the endpoints that the templates learned from the capture collapse.
+    """
+
+    SLOWEST = 30
+
+    def __init__(self, templater=None):
+        self.templater = templater
+        self.total = 0
+        self.responded = 0
+        self.latency = LatencySketch()
+        self.status_buckets = Counter()
+        self.hosts = Counter()
+        # endpoint -> [requests, 4xx+5xx bucket count, LatencySketch], in first-seen order
+        self.endpoints = {}
+        # first-error order decides ties in topErrorEndpoints
+        self.error_endpoints = Counter()
+        # min-heap of (durationMs, -seq, row); the earliest row wins ties
+        self.slowest = []
+
+    def add(self, entry):
+        self.add_many((entry,))
+
+    def add_many(self, entries):
+        """Consume an iterable of rows (the per-row loop of ``add``, with locals bound once)."""
+        status_buckets = self.status_buckets
+        hosts = self.hosts
+        endpoints = self.endpoints
+        error_endpoints = self.error_endpoints
+        latency = self.latency
+        push_slowest = self.push_slowest
+        normalize = self.templater.normalize if self.templater is not None else None
+        seq = self.total
+        responded = 0
+
+        for entry in entries:
+            get = entry.get
+            bucket = get("statusBucket") or "unknown"
+            status_buckets[bucket] += 1
+            host = get("host")
+            if host:
+                hosts[host] += 1
+
+            path = get("path") or ""
+            if normalize is not None:
+                path = normalize(path)
+            ep = f"{get('method') or ''} {host or ''}{path}"  # endpoint_key()
+            record = endpoints.get(ep)
+            if record is None:
+                record = endpoints[ep] = [0, 0, LatencySketch()]
+            record[0] += 1
+            if bucket == "4xx" or bucket == "5xx":
+                record[1] += 1
+
+            status = get("status")
+            if status is not None:
+                responded += 1
+                if isinstance(status, int) and status >= 400:
+                    error_endpoints[ep] += 1
+                duration = get("durationMs")
+                if isinstance(duration, int):
+                    latency.add(duration)
+                    record[2].add(duration)
+                    push_slowest(duration, seq, entry)
+            seq += 1
+
+        self.total = seq
+        self.responded += responded
+
+    def push_slowest(self, duration, seq, entry):
+        slowest = self.slowest
+        if len(slowest) < self.SLOWEST:
+            heapq.heappush(slowest, (duration, -seq, slow_request(entry)))
+        elif (duration, -seq) > slowest[0][:2]:
+            heapq.heapreplace(slowest, (duration, -seq, slow_request(entry)))
+
+    def add_arrays(self, arrays):
+        """Consume an index_arrays.IndexArrays: what add_many does, vectorized."""
+        np = arrays.np
+        seq = self.total
+
+        bucket, bucket_labels = arrays.labels("statusBucket", "unknown")
+        for code, count in first_seen_counts(np, bucket):
+            self.status_buckets[bucket_labels[code]] += count
+        host, host_labels = arrays.labels("host", "")
+        named = np.array([bool(label) for label in host_labels])[host]
+        for code, count in first_seen_counts(np, host[named]):
+            self.hosts[host_labels[code]] += count
+
+        ep_ids, ep_keys = endpoint_groups(arrays, self.templater.normalize if self.templater is not None else None)
+        error_codes = [code for code, label in enumerate(bucket_labels) if label in ("4xx", "5xx")]
+        requests = np.bincount(ep_ids, minlength=len(ep_keys)).tolist()
+        bucket_errors = np.bincount(ep_ids[np.isin(bucket, error_codes)], minlength=len(ep_keys)).tolist()
+
+        status = arrays.array("status")
+        responded = status != INT_NULL
+        duration = arrays.array("durationMs")
+        timed = responded & (duration != INT_NULL)
+        self.latency.add_many(duration[timed])
+        sketches = grouped_sketches(np, ep_ids[timed], duration[timed], len(ep_keys))
+
+        endpoints = self.endpoints
+        for ep, count, errors, sketch in zip(ep_keys, requests, bucket_errors, sketches):
+            record = endpoints.get(ep)
+            if record is None:
+                endpoints[ep] = [count, errors, sketch]
+            else:
+                record[0] += count
+                record[1] += errors
+                record[2].merge(sketch)
+        for group, count in first_seen_counts(np, ep_ids[responded & (status >= 400)]):
+            self.error_endpoints[ep_keys[group]] += count
+
+        rows = np.flatnonzero(timed)
+        for row in top_rows(np, rows, duration[rows], self.SLOWEST):
+            self.push_slowest(int(duration[row]), seq + row, arrays.row(row))
+
+        self.total = seq + len(arrays)
+        self.responded += int(responded.sum())
+
+    def templated_endpoints(self):
+        """(endpoints, error_endpoints) re-keyed by the templates learned from them."""
+        if self.templater is None:
+            return self.endpoints, self.error_endpoints
+        self.templater.learn(self.endpoints)
+        endpoints = {}
+        for ep, records in self.templater.group(self.endpoints).items():
+            endpoints[ep] = [
+                sum(record[0] for record in records),
+                sum(record[1] for record in records),
+                merge_sketches(record[2] for record in records),
+            ]
+        error_endpoints = Counter()
+        for ep, count in self.error_endpoints.items():
+            error_endpoints[self.templater.apply(ep)] += count
+        return endpoints, error_endpoints
+
+    def result(self):
+        endpoints, error_endpoints = self.templated_endpoints()
+        top_endpoints = Counter({ep: record[0] for ep, record in endpoints.items()}).most_common(30)
+
+        error_prone = []
+        for ep, (total_ep, err_ep, _) in endpoints.items():
+            if total_ep >= 2 and err_ep > 0:
+                error_prone.append((ep, total_ep, err_ep, err_ep / total_ep))
+        error_prone.sort(key=lambda item: (item[3], item[2], item[1]), reverse=True)
+
+        slowest = [row for _, _, row in sorted(self.slowest, key=lambda item: (-item[0], -item[1]))]
+
+        return {
+            "totalRequests": self.total,
+            "respondedRequests": self.responded,
+            "noResponseRequests": self.total - self.responded,
+            "avgDurationMs": self.latency.mean(),
+            "p95DurationMs": self.latency.quantile(0.95),
+            "latencyPercentilesMs": self.latency.percentiles(),
+            "statusBuckets": dict(self.status_buckets),
+            "topHosts": [{"host": host, "count": count} for host, count in self.hosts.most_common(15)],
+            "topEndpoints": [{"endpoint": ep, "count": count} for ep, count in top_endpoints],
+            "topErrorEndpoints": [
+                {"endpoint": ep, "count": count} for ep, count in error_endpoints.most_common(20)
+            ],
+            "slowestRequests": slowest,
+            "errorProneEndpoints": [
+                {
+                    "endpoint": ep,
+                    "total": total_ep,
+                    "errors": err_ep,
+                    "errorRatio": round(ratio, 4),
+                }
+                for ep, total_ep, err_ep, ratio in error_prone[:20]
+            ],
+            "latencySketch": self.latency.to_dict(),
+            "endpointLatency": {
+                ep: {"count": sketch.count, **sketch.percentiles(), "sketch": sketch.to_dict()}
+                for ep, (_, _, sketch) in endpoints.items()
+                if sketch.count
+            },
+        }
+
+
+def slow_request(item):
     return {
-        "totalRequests": total,
-        "respondedRequests": len(responded),
-        "noResponseRequests": no_response,
-        "avgDurationMs": avg_ms,
-        "p95DurationMs": p95_ms,
-        "statusBuckets": dict(status_buckets),
-        "topHosts": [{"host": host, "count": count} for host, count in top_hosts],
-        "topEndpoints": [{"endpoint": ep, "count": count} for ep, count in top_endpoints],
-        "topErrorEndpoints": [{"endpoint": ep, "count": count} for ep, count in top_error_endpoints],
-        "slowestRequests": [
-            {
-                "id": item.get("id"),
-                "durationMs": item.get("durationMs"),
-                "status": item.get("status"),
-                "method": item.get("method"),
-                "host": item.get("host"),
-                "path": item.get("path"),
-                "url": item.get("url"),
-            }
-            for item in slow_entries
-        ],
-        "errorProneEndpoints": [
-            {
-                "endpoint": ep,
-                "total": total_ep,
-                "errors": err_ep,
-                "errorRatio": round(ratio, 4),
-            }
-            for ep, total_ep, err_ep, ratio in error_prone[:20]
-        ],
+        "id": item.get("id"),
+        "durationMs": item.get("durationMs"),
+        "status": item.get("status"),
+        "method": item.get("method"),
+        "host": item.get("host"),
+        "path": item.get("path"),
+        "url": item.get("url"),
     }
 
 
+def index_stats(index_path, templater=None):
+    """Statistics for an index file, vectorized when NumPy is available."""
+    arrays = load_arrays(index_path)
+    if arrays is None:
+        # Rows are streamed into the accumulator, never held as a list
+        return calc_stats(iter_rows(index_path), templater)
+    stats = StatsAccumulator(templater)
+    try:
+        stats.add_arrays(arrays)
+    finally:
+        arrays.close()
+    return stats.result()
+
+
+def calc_stats(entries, templater=None):
+    stats = StatsAccumulator(templater)
+    stats.add_many(entries)
+    return stats.result()
+
+
 def build_findings(stats):
     findings = []
 
@@ -188,6 +336,9 @@ def render_ai_markdown(ai_payload):
     lines.append(f"- Stopped: `{ai_payload['capture'].get('stoppedAt', '')}`")
     lines.append(f"- Total requests: `{stats.get('totalRequests', 0)}`")
     lines.append(f"- Avg/P95 latency: `{stats.get('avgDurationMs', 0)}ms / {stats.get('p95DurationMs', 0)}ms`")
+    percentiles = stats.get("latencyPercentilesMs") or {}
+    if percentiles:
+        lines.append(f"- Latency {'/'.join(percentiles)}: `{' / '.join(f'{value}ms' for value in percentiles.values())}`")
     lines.append("")
     lines.append("## Files")
     lines.append("")
@@ -221,21 +372,7 @@ def render_ai_markdown(ai_payload):
     return "\n".join(lines)
 
 
-def main(argv):
-    if len(argv) != 5:
-        print(f"Usage: {argv[0]} <manifest_json> <index_ndjson> <ai_json_out> <ai_md_out>")
-        return 1
-
-    manifest_path = argv[1]
-    index_path = argv[2]
-    ai_json_path = argv[3]
-    ai_md_path = argv[4]
-
-    manifest = load_manifest(manifest_path)
-    entries = load_index(index_path)
-    stats = calc_stats(entries)
-    ai_payload = build_ai_json(manifest, stats)
-
+def write_ai_outputs(ai_payload, ai_json_path, ai_md_path):
     fd = os.open(ai_json_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
     with os.fdopen(fd, "w", encoding="utf-8") as f:
         json.dump(ai_payload, f, indent=2, ensure_ascii=False)
@@ -244,6 +381,43 @@ def main(argv):
     with os.fdopen(fd, "w", encoding="utf-8") as f:
         f.write(render_ai_markdown(ai_payload))
 
+
+def main(argv):
+    positional = []
+    policy_file = None
+    raw_endpoints = False
+    no_cache = False
+    i = 1
+    while i < len(argv):
+        if argv[i] == "--policy" and i + 1 < len(argv):
+            policy_file = argv[i + 1]
+            i += 2
+        elif argv[i] == "--raw-endpoints":
+            raw_endpoints = True
+            i += 1
+        elif argv[i] == "--no-cache":
+            no_cache = True
+            i += 1
+        else:
+            positional.append(argv[i])
+            i += 1
+
+    if len(positional) != 4:
+        print(f"Usage: {argv[0]} <manifest_json> <index_ndjson> <ai_json_out> <ai_md_out> [--policy <policy.json>] [--raw-endpoints] [--no-cache]")
+        return 1
+
+    manifest_path, index_path, ai_json_path, ai_md_path = positional
+
+    manifest = load_manifest(manifest_path)
+    templater = None if raw_endpoints else load_templater(policy_file)
+    if no_cache:
+        stats = index_stats(index_path, templater)
+    else:
+        stats = cached_aggregate(index_path, "ai_brief", templater, lambda: index_stats(index_path, templater))
+    ai_payload = build_ai_json(manifest, stats)
+
+    write_ai_outputs(ai_payload, ai_json_path, ai_md_path)
+
     print(f"Generated {ai_json_path} and {ai_md_path}")
     return 0
 
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""Content-addressed store for captured request/response bodies.
+
+Bodies are written once to ``captures/bodies/<sha256[:2]>/<sha256>`` and shared
+by every entry and every run that sees the same bytes. HAR entries reference
+them through a ``_bodyRef`` field and index rows through
+``requestBodyRef``/``responseBodyRef``.
+
+Each run lists the hashes it references in ``capture_<RUN_ID>.bodies.txt``.
+cleanup.py treats those files as reference counts: once no refs file names a
+blob, the blob is deleted.
+"""
+
+import hashlib
+import os
+import re
+import sys
+import time
+from pathlib import Path
+
+BODY_DIR_NAME = "bodies"
+REFS_SUFFIX = ".bodies.txt"
+HASH_RE = re.compile(r"^[0-9a-f]{64}$")
+
+# Blobs touched within this window are never collected, so a stop that is
+# still writing its refs file cannot lose bodies to a concurrent cleanup.
+GC_GRACE_SECONDS = 3600
+
+
+class BodyStore:
+    """Write-once blob store rooted at ``root`` (``captures/bodies``)."""
+
+    def __init__(self, root):
+        self.root = root
+        self.refs = set()
+
+    def path_for(self, digest):
+        if not HASH_RE.match(digest):
+            raise ValueError(f"invalid body hash: {digest}")
+        return os.path.join(self.root, digest[:2], digest)
+
+    def put(self, data):
+        """Store data (bytes) and return its SHA-256 hex digest."""
+        digest = hashlib.sha256(data).hexdigest()
+        if digest in self.refs:
+            return digest
+        path = self.path_for(digest)
+        if os.path.isfile(path):
+            os.utime(path)  # keep shared blobs out of the GC grace window
+        else:
+            os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+            tmp_path = f"{path}.tmp.{os.getpid()}"
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            # Same content under the same name: a concurrent writer is harmless
+            os.replace(tmp_path, path)
+        self.refs.add(digest)
+        return digest
+
+    def get(self, digest):
+        with open(self.path_for(digest), "rb") as f:
+            return f.read()
+
+    def store_flow(self, flow):
+        """Store the request and response bodies of flow.
+
+        Returns (request_ref, response_ref); a ref is None for an empty body.
+        """
+        refs = []
+        for message in (flow.request, flow.response):
+            content = message.get_content(strict=False) if message is not None else None
+            refs.append(self.put(content) if content else None)
+        return tuple(refs)
+
+
+def write_refs(refs_file, refs):
+    """Write one hash per line (sorted) with owner-only permissions."""
+    fd = os.open(refs_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        for digest in sorted(refs):
+            f.write(digest + "\n")
+
+
+def read_refs(refs_file):
+    with open(refs_file, "r", encoding="utf-8") as f:
+        return {line.strip() for line in f if HASH_RE.match(line.strip())}
+
+
+def referenced_hashes(captures_dir, exclude_run_ids=()):
+    """Union of hashes listed by capture_<RUN_ID>.bodies.txt files."""
+    refs = set()
+    for name in os.listdir(captures_dir):
+        if not (name.startswith("capture_") and name.endswith(REFS_SUFFIX)):
+            continue
+        if name[len("capture_"):-len(REFS_SUFFIX)] in exclude_run_ids:
+            continue
+        path = os.path.join(captures_dir, name)
+        if os.path.isfile(path) and not os.path.islink(path):
+            refs |= read_refs(path)
+    return refs
+
+
+def unreferenced_bodies(captures_dir, exclude_run_ids=(), grace_seconds=GC_GRACE_SECONDS):
+    """Return [(path, size)] for blobs no remaining run references.
+
+    exclude_run_ids lets a dry run treat those runs as already deleted.
+    """
+    root = os.path.join(captures_dir, BODY_DIR_NAME)
+    if not os.path.isdir(root) or os.path.islink(root):
+        return []
+    refs = referenced_hashes(captures_dir, exclude_run_ids)
+    cutoff = time.time() - grace_seconds
+    orphans = []
+    for prefix in sorted(os.listdir(root)):
+        prefix_dir = os.path.join(root, prefix)
+        if os.path.islink(prefix_dir) or not os.path.isdir(prefix_dir):
+            continue
+        for name in sorted(os.listdir(prefix_dir)):
+            path = os.path.join(prefix_dir, name)
+            if not HASH_RE.match(name) or name in refs or os.path.islink(path):
+                continue
+            st = os.stat(path)
+            if st.st_mtime < cutoff:
+                orphans.append((path, st.st_size))
+    return orphans
+
+
+def main(argv=None):
+    """CLI interface for the body store."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Content-addressed body store")
+    subparsers = parser.add_subparsers(dest="command", help="Commands")
+
+    cat_parser = subparsers.add_parser("cat", help="Write a stored body by hash")
+    cat_parser.add_argument("captures_dir", help="Captures directory")
+    cat_parser.add_argument("hash", help="Body SHA-256 (_bodyRef / *BodyRef)")
+    cat_parser.add_argument("-o", "--output", help="Output file (default: stdout)")
+
+    orphans_parser = subparsers.add_parser("orphans", help="List bodies no run references")
+    orphans_parser.add_argument("captures_dir", help="Captures directory")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "cat":
+        store = BodyStore(os.path.join(args.captures_dir, BODY_DIR_NAME))
+        try:
+            data = store.get(args.hash)
+        except (OSError, ValueError) as exc:
+            print(f"Error: {exc}", file=sys.stderr)
+            return 1
+        if args.output:
+            fd = os.open(args.output, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+        else:
+            sys.stdout.buffer.write(data)
+        return 0
+
+    if args.command == "orphans":
+        for path, size in unreferenced_bodies(args.captures_dir):
+            print(f"{size}\t{Path(path).name}")
+        return 0
+
+    parser.print_help()
+    return 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
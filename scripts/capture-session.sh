@@ -27,6 +27,10 @@ Commands:
   doctor              Check environment prerequisites
   cleanup             Clean up old capture sessions
   diff <a> <b>        Compare two capture index files
+  diff trend <glob>   Per-endpoint series and change points across many captures
+  timeline [index]    Concurrency, idle gaps and slow request causes (default: latest)
+  connections [index] Connection reuse, handshake cost and protocol mix (default: latest)
+  query [filters]     Query requests across sessions (captures/catalog.sqlite)
   navlog <cmd>        Manage navigation log (init/append/show)
 
 Options:
@@ -35,6 +39,10 @@ Options:
   --allow-hosts <list>   Comma-separated allowed hosts
   --deny-hosts <list>    Comma-separated denied hosts
   --policy <file>        Policy JSON file for scope control
+  --scope-mode <mode>    Start: enforce scope while capturing (block,
+                         passthrough-without-recording, record-and-flag)
+  --rotate-size <SIZE>   Start: rotate the flow file at SIZE (e.g. 512M)
+  --rotate-interval <T>  Start: rotate the flow file every T (e.g. 10m)
   --force-recover        Start: clean stale state file before launch
   --keep-days <N>        Cleanup: keep captures from last N days
   --keep-size <SIZE>     Cleanup: keep latest captures up to SIZE
@@ -59,6 +67,11 @@ Examples:
   capture-session.sh cleanup --keep-size 1G --dry-run
   capture-session.sh cleanup --secure --keep-days 3
   capture-session.sh diff captures/a.index.ndjson captures/b.index.ndjson
+  capture-session.sh diff trend 'captures/capture_*.index.ndjson' --md trend.md
+  capture-session.sh timeline --waterfall captures/latest.waterfall.ndjson
+  capture-session.sh connections --json connections.json
+  capture-session.sh query --status 5xx --group-by endpoint
+  capture-session.sh query --host api.example.com --since 2025-02-01 --slowest
   capture-session.sh navlog append --action navigate --url "https://example.com"
   driveBrowserTraffic.sh --url https://example.com -P 18080
 
@@ -95,6 +108,9 @@ PROXY_PORT="18080"
 ALLOW_HOSTS=""
 DENY_HOSTS=""
 POLICY_FILE=""
+SCOPE_MODE=""
+ROTATE_SIZE=""
+ROTATE_INTERVAL=""
 FORCE_RECOVER=""
 KEEP_DAYS=""
 KEEP_SIZE=""
@@ -110,6 +126,24 @@ fi
 COMMAND="$1"
 shift
 
+# Query filters pass through verbatim so values such as host names are not
+# mistaken for a target URL by the option loop below
+if [[ "$COMMAND" == "query" ]]; then
+    while [[ $# -gt 0 ]]; do
+        case "$1" in
+            -d|--dir)
+                require_value_arg "$1" "${2:-}"
+                WORK_DIR="${2:-}"
+                shift 2
+                ;;
+            *)
+                EXTRA_ARGS+=("$1")
+                shift
+                ;;
+        esac
+    done
+fi
+
 while [[ $# -gt 0 ]]; do
     case "$1" in
         -d|--dir)
@@ -137,6 +171,21 @@ while [[ $# -gt 0 ]]; do
             POLICY_FILE="${2:-}"
             shift 2
             ;;
+        --scope-mode)
+            require_value_arg "$1" "${2:-}"
+            SCOPE_MODE="${2:-}"
+            shift 2
+            ;;
+        --rotate-size)
+            require_value_arg "$1" "${2:-}"
+            ROTATE_SIZE="${2:-}"
+            shift 2
+            ;;
+        --rotate-interval)
+            require_value_arg "$1" "${2:-}"
+            ROTATE_INTERVAL="${2:-}"
+            shift 2
+            ;;
         --force-recover)
             FORCE_RECOVER="true"
             shift
@@ -220,6 +269,9 @@ case "$COMMAND" in
         [[ -n "$ALLOW_HOSTS" ]] && START_CMD+=(--allow-hosts "$ALLOW_HOSTS")
         [[ -n "$DENY_HOSTS" ]] && START_CMD+=(--deny-hosts "$DENY_HOSTS")
         [[ -n "$POLICY_FILE" ]] && START_CMD+=(--policy "$POLICY_FILE")
+        [[ -n "$SCOPE_MODE" ]] && START_CMD+=(--scope-mode "$SCOPE_MODE")
+        [[ -n "$ROTATE_SIZE" ]] && START_CMD+=(--rotate-size "$ROTATE_SIZE")
+        [[ -n "$ROTATE_INTERVAL" ]] && START_CMD+=(--rotate-interval "$ROTATE_INTERVAL")
         [[ "$FORCE_RECOVER" == "true" ]] && START_CMD+=(--force-recover)
 
         "${START_CMD[@]}"
@@ -298,6 +350,8 @@ case "$COMMAND" in
         STARTED_AT="$(read_kv "STARTED_AT" "$ENV_FILE")"
         LISTEN_PORT="$(read_kv "LISTEN_PORT" "$ENV_FILE")"
         FLOW_FILE="$(read_kv "FLOW_FILE" "$ENV_FILE")"
+        COUNTERS_FILE="$(read_kv "COUNTERS_FILE" "$ENV_FILE")"
+        SEGMENTS_FILE="$(read_kv "SEGMENTS_FILE" "$ENV_FILE")"
 
         if [[ ! "$MITM_PID" =~ ^[0-9]+$ ]] || ! kill -0 "$MITM_PID" 2>/dev/null; then
             err "Capture not running (stale state)"
@@ -320,9 +374,58 @@ case "$COMMAND" in
         if [[ -z "$FLOW_FILE" ]]; then
             FLOW_FILE="$WORK_DIR/captures/capture.flow"
         fi
-        if [[ -f "$FLOW_FILE" ]]; then
+        COUNTER_LINES=""
+        SEGMENT_LINE=""
+        if [[ -n "$SEGMENTS_FILE" ]]; then
+            # Rotated capture: total size of all segments so far
+            SEGMENT_FLOWS=("${SEGMENTS_FILE%.segments.json}".[0-9]*.flow)
+            if [[ -f "${SEGMENT_FLOWS[0]}" ]]; then
+                FLOW_SIZE=$(du -ch "${SEGMENT_FLOWS[@]}" 2>/dev/null | tail -n 1 | cut -f1 || echo "0")
+                SEGMENT_LINE="Segments:  ${#SEGMENT_FLOWS[@]} (current: $(basename "${SEGMENT_FLOWS[${#SEGMENT_FLOWS[@]}-1]}"))"
+            else
+                FLOW_SIZE="0"
+            fi
+        elif [[ -f "$FLOW_FILE" ]]; then
             FLOW_SIZE=$(du -h "$FLOW_FILE" 2>/dev/null | cut -f1 || echo "0")
-            # Count requests by parsing flow file (rough estimate)
+        else
+            FLOW_SIZE="0"
+        fi
+
+        if [[ -n "$COUNTERS_FILE" && -f "$COUNTERS_FILE" ]]; then
+            # Live counters written by the capture_addons.py addon (O(1), no flow decoding)
+            COUNTER_LINES=$(python3 -c "
+import json, sys
+
+def human(n):
+    for unit in ('B', 'K', 'M', 'G'):
+        if n < 1024 or unit == 'G':
+            return f'{n:.0f}{unit}' if unit == 'B' else f'{n:.1f}{unit}'
+        n /= 1024
+
+with open(sys.argv[1], encoding='utf-8') as f:
+    c = json.load(f)
+prev = c.get('previous') or {}
+elapsed = c['at'] - prev['at'] if prev.get('at') else 0
+if elapsed > 0:
+    rate = (c['requests'] - prev['requests']) / elapsed
+    bps_in = (c['bytesIn'] - prev['bytesIn']) / elapsed
+    bps_out = (c['bytesOut'] - prev['bytesOut']) / elapsed
+    print(f'Rate:      {rate:.1f} req/s (last {elapsed:.1f}s)')
+    print(f'Transfer:  in {human(bps_in)}/s, out {human(bps_out)}/s')
+requests, responses, errors = c['requests'], c['responses'], c['errors']
+print(f'Requests:  {requests} ({responses} responses, {errors} errors)')
+print('Body Data: in ' + human(c['bytesIn']) + ', out ' + human(c['bytesOut']))
+buckets = c.get('statusBuckets') or {}
+if buckets:
+    print('Statuses:  ' + ', '.join(f'{k}={buckets[k]}' for k in sorted(buckets)))
+hosts = sorted((c.get('hosts') or {}).items(), key=lambda kv: (-kv[1], kv[0]))
+if hosts:
+    print('Top Hosts: ' + ', '.join(f'{h} ({n})' for h, n in hosts[:5]))
+" "$COUNTERS_FILE" 2>/dev/null || true)
+        fi
+
+        if [[ -z "$COUNTER_LINES" && -f "$FLOW_FILE" ]]; then
+            # No live counters (older capture or addon disabled): count by parsing flow file
             REQ_COUNT=$(python3 -c "
 from mitmproxy import io
 try:
@@ -332,16 +435,19 @@ try:
 except:
     print('?')
 " 2>/dev/null || echo "?")
-        else
-            FLOW_SIZE="0"
-            REQ_COUNT="0"
+            COUNTER_LINES="Requests:  $REQ_COUNT"
+        elif [[ -z "$COUNTER_LINES" ]]; then
+            COUNTER_LINES="Requests:  0"
         fi
 
         echo "=== Capture Progress ==="
         echo "Status:    RUNNING"
         echo "Duration:  $DURATION"
-        echo "Requests:  $REQ_COUNT"
+        echo "$COUNTER_LINES"
         echo "Data Size: $FLOW_SIZE"
+        if [[ -n "$SEGMENT_LINE" ]]; then
+            echo "$SEGMENT_LINE"
+        fi
         echo "Proxy:     127.0.0.1:${LISTEN_PORT:-18080}"
         echo "PID:       $MITM_PID"
         ;;
@@ -358,10 +464,21 @@ except:
         ;;
 
     diff)
+        # diff trend <index|glob>...: series across many captures
+        if [[ "${EXTRA_ARGS[0]:-}" == "trend" ]]; then
+            if [[ ${#EXTRA_ARGS[@]} -lt 2 ]]; then
+                err "diff trend requires index.ndjson files or a quoted glob"
+                echo "Usage: capture-session.sh diff trend '<dir>/captures/capture_*.index.ndjson' [--json <out>] [--md <out>] [--fail-on-regression]" >&2
+                exit 1
+            fi
+            python3 "$SCRIPT_DIR/diff_captures.py" "${EXTRA_ARGS[@]}"
+            exit $?
+        fi
+
         # Diff requires two index file paths as positional args
         if [[ ${#EXTRA_ARGS[@]} -lt 2 ]]; then
             err "diff requires two index.ndjson file paths"
-            echo "Usage: capture-session.sh diff <baseline.index.ndjson> <current.index.ndjson> [--json <out>] [--md <out>]" >&2
+            echo "Usage: capture-session.sh diff <baseline.index.ndjson> <current.index.ndjson> [--json <out>] [--md <out>] [--min-samples N] [--alpha P] [--fail-on-regression]" >&2
             exit 1
         fi
 
@@ -375,6 +492,46 @@ except:
         "${DIFF_CMD[@]}"
         ;;
 
+    timeline|connections)
+        # <command> [index.ndjson] [options]: latest capture by default
+        INDEX_FILE="$WORK_DIR/captures/latest.index.ndjson"
+        if [[ ${#EXTRA_ARGS[@]} -gt 0 && "${EXTRA_ARGS[0]}" != -* ]]; then
+            INDEX_FILE="${EXTRA_ARGS[0]}"
+            EXTRA_ARGS=("${EXTRA_ARGS[@]:1}")
+        fi
+        if [[ ! -f "$INDEX_FILE" ]]; then
+            err "Index file not found: $INDEX_FILE"
+            if [[ "$COMMAND" == "timeline" ]]; then
+                echo "Usage: capture-session.sh timeline [<index.ndjson>] [--json <out>] [--md <out>] [--waterfall <out>] [--saturation N] [--gap-ms MS] [--slow-ms MS]" >&2
+            else
+                echo "Usage: capture-session.sh connections [<index.ndjson>] [--json <out>] [--md <out>] [--min-requests N]" >&2
+            fi
+            exit 1
+        fi
+
+        REPORT_CMD=(python3 "$SCRIPT_DIR/$COMMAND.py" "$INDEX_FILE")
+        if [[ ${#EXTRA_ARGS[@]} -gt 0 ]]; then
+            REPORT_CMD+=("${EXTRA_ARGS[@]}")
+        fi
+
+        "${REPORT_CMD[@]}"
+        ;;
+
+    query)
+        CAPTURES_DIR="$WORK_DIR/captures"
+        if [[ ! -d "$CAPTURES_DIR" ]]; then
+            err "No captures directory found at $CAPTURES_DIR"
+            exit 1
+        fi
+
+        QUERY_CMD=(python3 "$SCRIPT_DIR/catalog.py" query "$CAPTURES_DIR")
+        if [[ ${#EXTRA_ARGS[@]} -gt 0 ]]; then
+            QUERY_CMD+=("${EXTRA_ARGS[@]}")
+        fi
+
+        "${QUERY_CMD[@]}"
+        ;;
+
     navlog)
         # Forward to navlog.sh with work dir and extra args
         NAVLOG_CMD=("$SCRIPT_DIR/navlog.sh")
@@ -0,0 +1,596 @@
+#!/usr/bin/env python3
+"""mitmproxy addons loaded by startCaptures.sh via ``mitmdump -s``.
+
+LiveIndex appends a flow_report-compatible index row for every flow that
+mitmdump persists (the same ``response``/``error``/``websocket_end`` hooks the
+built-in save addon uses), so ``index.ndjson`` exists while the capture runs
+and the stop step does not have to rebuild it from the flow file.
+
+Rows are buffered and written in batches; every batch is flushed and fsynced.
+A small JSON state file records how many rows were written and whether the
+addon shut down cleanly.
+
+LiveCounters keeps running totals (requests, responses, errors, body bytes,
+status buckets, per-host requests) and atomically rewrites a small counters
+file on a fixed interval, so ``capture-session.sh progress`` never has to
+read the flow file.
+
+ScopeGuard enforces the capture scope policy while traffic flows instead of
+auditing it after the fact. Hosts are checked with ``policy.CompiledPolicy``
+and, depending on ``scope_guard_mode``, out-of-scope requests are answered
+with 403 (``block``), proxied but kept out of the flow file and live index
+(``passthrough-without-recording``), or recorded with a comment and marker
+(``record-and-flag``). Its counters file has the scope_audit.py result
+layout, so the stop step reads it instead of running a separate audit.
+
+SegmentRotator splits the capture into ``capture_<RUN_ID>.0001.flow``,
+``.0002.flow``, ... once the current segment reaches ``rotate_size`` or has
+been open for ``rotate_interval``: it points the save addon (and a
+per-segment live index) at the next file and records every segment in
+``capture_<RUN_ID>.segments.json`` (see segments.py).
+"""
+
+import asyncio
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+from flow_report import flow_to_index_entry, safe_len, status_bucket
+
+SCOPE_GUARD_MODES = ("off", "block", "passthrough-without-recording", "record-and-flag")
+
+# Comment prefix of flows kept out of the flow file, and the save filter that does it
+SCOPE_DROP_COMMENT = "scope-guard:dropped"
+SCOPE_DROP_FILTER = f"!~comment ^{SCOPE_DROP_COMMENT}"
+SCOPE_FLAG_COMMENT = "scope-guard:out-of-scope"
+
+
+def scope_dropped(flow):
+    """True for flows ScopeGuard keeps out of the capture."""
+    return flow.comment.startswith(SCOPE_DROP_COMMENT)
+
+
+def write_json_atomic(path, payload):
+    """Replace path with payload (JSON) via temp file + rename."""
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(payload, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+class LiveIndex:
+    def __init__(self):
+        self.output = None
+        self.buffer = []
+        self.next_id = 1
+        self.rows_written = 0
+        self.last_flush = time.monotonic()
+        self.active = set()
+        self.ticker = None
+
+    def load(self, loader):
+        loader.add_option(
+            "live_index_file", str, "",
+            "Append index.ndjson rows while capturing (empty to disable).",
+        )
+        loader.add_option(
+            "live_index_state", str, "",
+            "JSON state file recording live index progress and clean shutdown.",
+        )
+        loader.add_option(
+            "live_index_batch", int, 64,
+            "Flush the live index after this many buffered rows.",
+        )
+        loader.add_option(
+            "live_index_flush_ms", int, 1000,
+            "Flush buffered live index rows at least this often (milliseconds).",
+        )
+
+    def configure(self, updated):
+        from mitmproxy import ctx
+
+        if "live_index_file" in updated:
+            self.close()
+            if ctx.options.live_index_file:
+                fd = os.open(ctx.options.live_index_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+                self.output = os.fdopen(fd, "w", encoding="utf-8")
+                self.next_id = 1
+                self.rows_written = 0
+                self.write_state(complete=False)
+
+    async def running(self):
+        self.ticker = asyncio.get_running_loop().create_task(self.tick())
+
+    async def tick(self):
+        from mitmproxy import ctx
+
+        while True:
+            await asyncio.sleep(max(ctx.options.live_index_flush_ms, 50) / 1000)
+            if self.buffer:
+                self.flush()
+
+    def append(self, flow):
+        if self.output is None:
+            return
+        self.active.discard(flow)
+        if scope_dropped(flow):
+            return
+        self.buffer.append(flow_to_index_entry(self.next_id, flow))
+        self.next_id += 1
+        self.maybe_flush()
+
+    def maybe_flush(self):
+        from mitmproxy import ctx
+
+        elapsed_ms = (time.monotonic() - self.last_flush) * 1000
+        if len(self.buffer) >= ctx.options.live_index_batch or elapsed_ms >= ctx.options.live_index_flush_ms:
+            self.flush()
+
+    def flush(self):
+        self.last_flush = time.monotonic()
+        if self.output is None or not self.buffer:
+            return
+        self.output.write("".join(json.dumps(row, ensure_ascii=False) + "\n" for row in self.buffer))
+        self.output.flush()
+        os.fsync(self.output.fileno())
+        self.rows_written += len(self.buffer)
+        self.buffer.clear()
+        self.write_state(complete=False)
+
+    def write_state(self, complete):
+        from mitmproxy import ctx
+
+        if not ctx.options.live_index_state:
+            return
+        write_json_atomic(ctx.options.live_index_state, {
+            "indexFile": ctx.options.live_index_file,
+            "rows": self.rows_written,
+            "complete": complete,
+            "updatedAt": time.time(),
+        })
+
+    def close(self, complete=False):
+        if self.output is None:
+            return
+        self.flush()
+        self.output.close()
+        self.output = None
+        self.write_state(complete=complete)
+
+    def request(self, flow):
+        if self.output is not None and not scope_dropped(flow):
+            self.active.add(flow)
+
+    def response(self, flow):
+        # websocket flows are persisted at websocket_end, like the save addon
+        if flow.websocket is None:
+            self.append(flow)
+
+    def error(self, flow):
+        self.response(flow)
+
+    def websocket_end(self, flow):
+        self.append(flow)
+
+    def done(self):
+        if self.ticker is not None:
+            self.ticker.cancel()
+            self.ticker = None
+        # The save addon writes still-open flows on shutdown in its own set
+        # order, so their ids cannot be matched here: leave the index
+        # incomplete and let stop rebuild it from the flow file
+        in_flight = bool(self.active)
+        self.active.clear()
+        self.close(complete=not in_flight)
+
+
+class LiveCounters:
+    def __init__(self):
+        self.reset()
+        self.ticker = None
+
+    def reset(self):
+        self.requests = 0
+        self.responses = 0
+        self.errors = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.status_buckets = {}
+        self.hosts = {}
+        self.started_at = time.time()
+        self.previous = None
+
+    def load(self, loader):
+        loader.add_option(
+            "live_counters_file", str, "",
+            "Periodically write capture counters JSON here (empty to disable).",
+        )
+        loader.add_option(
+            "live_counters_interval_ms", int, 1000,
+            "Rewrite the live counters file at this interval (milliseconds).",
+        )
+
+    def configure(self, updated):
+        from mitmproxy import ctx
+
+        if "live_counters_file" in updated:
+            self.reset()
+            if ctx.options.live_counters_file:
+                self.write(complete=False)
+
+    async def running(self):
+        self.ticker = asyncio.get_running_loop().create_task(self.tick())
+
+    async def tick(self):
+        from mitmproxy import ctx
+
+        while True:
+            await asyncio.sleep(max(ctx.options.live_counters_interval_ms, 100) / 1000)
+            self.write(complete=False)
+
+    def snapshot(self):
+        return {
+            "requests": self.requests,
+            "responses": self.responses,
+            "errors": self.errors,
+            "bytesIn": self.bytes_in,
+            "bytesOut": self.bytes_out,
+            "at": time.time(),
+        }
+
+    def write(self, complete):
+        from mitmproxy import ctx
+
+        if not ctx.options.live_counters_file:
+            return
+        current = self.snapshot()
+        payload = dict(current)
+        payload.update({
+            "startedAt": self.started_at,
+            "statusBuckets": self.status_buckets,
+            "hosts": self.hosts,
+            "previous": self.previous,
+            "complete": complete,
+        })
+        write_json_atomic(ctx.options.live_counters_file, payload)
+        self.previous = current
+
+    def request(self, flow):
+        self.requests += 1
+        self.bytes_out += safe_len(flow.request.raw_content)
+        host = flow.request.host
+        self.hosts[host] = self.hosts.get(host, 0) + 1
+
+    def response(self, flow):
+        self.responses += 1
+        self.bytes_in += safe_len(flow.response.raw_content)
+        bucket = status_bucket(flow.response.status_code)
+        self.status_buckets[bucket] = self.status_buckets.get(bucket, 0) + 1
+
+    def error(self, flow):
+        self.errors += 1
+
+    def done(self):
+        if self.ticker is not None:
+            self.ticker.cancel()
+            self.ticker = None
+        self.write(complete=True)
+
+
+class ScopeGuard:
+    def __init__(self):
+        self.audit = None
+        self.ticker = None
+        self.actions = {}
+        self.written = None
+
+    def load(self, loader):
+        loader.add_option(
+            "scope_guard_policy", str, "",
+            "Policy JSON whose scope section ScopeGuard enforces.",
+        )
+        loader.add_option(
+            "scope_guard_mode", str, "off",
+            "What to do with out-of-scope requests.",
+            choices=SCOPE_GUARD_MODES,
+        )
+        loader.add_option(
+            "scope_guard_file", str, "",
+            "Periodically write scope violation counters JSON here (empty to disable).",
+        )
+        loader.add_option(
+            "scope_guard_interval_ms", int, 1000,
+            "Rewrite the scope guard file at this interval (milliseconds).",
+        )
+
+    def configure(self, updated):
+        from mitmproxy import ctx, exceptions
+
+        if "scope_guard_policy" in updated or "scope_guard_mode" in updated:
+            self.audit = None
+            self.actions = {}
+            self.written = None
+            if ctx.options.scope_guard_mode == "off":
+                return
+            if not ctx.options.scope_guard_policy:
+                raise exceptions.OptionsError("scope_guard_mode needs scope_guard_policy")
+            from policy import load_policy
+            from scope_audit import ScopeAuditor
+
+            try:
+                scope = load_policy(ctx.options.scope_guard_policy)["scope"]
+            except (OSError, ValueError) as exc:
+                raise exceptions.OptionsError(f"Cannot load scope policy: {exc}") from exc
+            self.audit = ScopeAuditor(scope.get("allow_hosts", []), scope.get("deny_hosts", []))
+            if ctx.options.scope_guard_mode in ("block", "passthrough-without-recording"):
+                current = ctx.options.save_stream_filter or ""
+                if SCOPE_DROP_FILTER not in current:
+                    combined = f"({current}) & {SCOPE_DROP_FILTER}" if current else SCOPE_DROP_FILTER
+                    ctx.options.update(save_stream_filter=combined)
+            self.write(complete=False)
+
+    async def running(self):
+        self.ticker = asyncio.get_running_loop().create_task(self.tick())
+
+    async def tick(self):
+        from mitmproxy import ctx
+
+        while True:
+            await asyncio.sleep(max(ctx.options.scope_guard_interval_ms, 100) / 1000)
+            self.write(complete=False)
+
+    def judge(self, flow):
+        """Count flow against the policy; returns the violation reason or None."""
+        request = flow.request
+        allowed, reason = self.audit.add({
+            "id": flow.id,
+            "host": request.host,
+            "url": request.pretty_url,
+            "method": request.method,
+        })
+        return None if allowed else reason
+
+    def act(self, action):
+        self.actions[action] = self.actions.get(action, 0) + 1
+
+    def http_connect(self, flow):
+        from mitmproxy import ctx, http
+
+        # Refuse blocked tunnels outright; otherwise the requests inside are
+        # judged, so an allowed CONNECT is not counted as a request itself
+        if self.audit is None or ctx.options.scope_guard_mode != "block":
+            return
+        if self.audit.policy.is_allowed(flow.request.host):
+            return
+        reason = self.judge(flow)
+        if reason is not None:
+            flow.response = http.Response.make(403, f"Blocked by capture scope policy ({reason})\n")
+            self.act("blocked")
+
+    def requestheaders(self, flow):
+        from mitmproxy import ctx, http
+
+        if self.audit is None:
+            return
+        reason = self.judge(flow)
+        if reason is None:
+            return
+        mode = ctx.options.scope_guard_mode
+        if mode == "block":
+            flow.comment = f"{SCOPE_DROP_COMMENT} {reason}"
+            flow.response = http.Response.make(403, f"Blocked by capture scope policy ({reason})\n")
+            self.act("blocked")
+        elif mode == "passthrough-without-recording":
+            flow.comment = f"{SCOPE_DROP_COMMENT} {reason}"
+            # Nothing is recorded, so do not buffer the bodies either
+            flow.request.stream = True
+            self.act("dropped")
+        else:
+            flow.comment = f"{SCOPE_FLAG_COMMENT} {reason}"
+            flow.marked = ":warning:"
+            self.act("flagged")
+
+    def responseheaders(self, flow):
+        if scope_dropped(flow):
+            flow.response.stream = True
+
+    def write(self, complete):
+        from mitmproxy import ctx
+
+        if self.audit is None or not ctx.options.scope_guard_file:
+            return
+        # Skip unchanged rewrites between ticks
+        state = (self.audit.total, complete)
+        if state == self.written:
+            return
+        payload = self.audit.result()
+        payload.update({
+            "source": "scope-guard",
+            "mode": ctx.options.scope_guard_mode,
+            "policyFile": ctx.options.scope_guard_policy,
+            "actions": dict(self.actions),
+            "complete": complete,
+        })
+        write_json_atomic(ctx.options.scope_guard_file, payload)
+        self.written = state
+
+    def done(self):
+        if self.ticker is not None:
+            self.ticker.cancel()
+            self.ticker = None
+        self.write(complete=True)
+
+
+class SegmentRotator:
+    def __init__(self):
+        self.data = None
+        self.current = None
+        self.base = ""
+        self.opened = 0.0
+        self.limit_bytes = 0
+        self.limit_seconds = 0.0
+
+    def load(self, loader):
+        loader.add_option(
+            "rotate_segments_file", str, "",
+            "Session segment list (capture_<RUN_ID>.segments.json); empty disables rotation.",
+        )
+        loader.add_option(
+            "rotate_size", str, "",
+            "Start a new flow file segment once the current one reaches this size (e.g. 512M).",
+        )
+        loader.add_option(
+            "rotate_interval", str, "",
+            "Start a new flow file segment after this long (e.g. 10m).",
+        )
+
+    def configure(self, updated):
+        from mitmproxy import ctx, exceptions
+        from segments import parse_duration, parse_rotate_size, segment_flow_path, session_base_for
+
+        if not {"rotate_segments_file", "rotate_size", "rotate_interval"} & set(updated):
+            return
+        if not ctx.options.rotate_segments_file:
+            self.data = self.current = None
+            return
+        try:
+            self.limit_bytes = parse_rotate_size(ctx.options.rotate_size) if ctx.options.rotate_size else 0
+            self.limit_seconds = parse_duration(ctx.options.rotate_interval) if ctx.options.rotate_interval else 0.0
+            self.base = session_base_for(ctx.options.rotate_segments_file)
+        except ValueError as exc:
+            raise exceptions.OptionsError(str(exc)) from exc
+        if not self.limit_bytes and not self.limit_seconds:
+            raise exceptions.OptionsError("rotate_segments_file needs rotate_size or rotate_interval")
+        if self.data is not None:
+            self.write()
+            return
+        first = segment_flow_path(self.base, 1)
+        if ctx.options.save_stream_file != first:
+            raise exceptions.OptionsError(f"rotation expects save_stream_file {first}")
+        self.data = {
+            "schemaVersion": "1",
+            "runId": os.path.basename(self.base)[len("capture_"):],
+            "rotateSize": self.limit_bytes,
+            "rotateInterval": self.limit_seconds,
+            "complete": False,
+            "segments": [],
+        }
+        self.open_segment(1, first)
+
+    def open_segment(self, seq, flow_file):
+        from mitmproxy import ctx
+        from segments import now_local
+
+        self.current = {
+            "seq": seq,
+            "flow": flow_file,
+            "openedAt": now_local(),
+            "closedAt": None,
+            "bytes": 0,
+            "flows": 0,
+            "liveIndex": ctx.options.live_index_file,
+        }
+        self.data["segments"].append(self.current)
+        self.opened = time.monotonic()
+        self.write()
+
+    def close_segment(self):
+        from segments import now_local
+
+        try:
+            self.current["bytes"] = os.path.getsize(self.current["flow"])
+        except OSError:
+            pass
+        self.current["closedAt"] = now_local()
+
+    def write(self):
+        from mitmproxy import ctx
+        from segments import load_segments
+
+        # cleanup.py may have expired (and deleted) closed segments since the
+        # last write; keep its marks so stop does not look for their files
+        try:
+            on_disk = load_segments(ctx.options.rotate_segments_file)["segments"]
+        except (OSError, ValueError, KeyError):
+            on_disk = []
+        expired = {segment.get("seq"): segment for segment in on_disk if segment.get("expired")}
+        for segment in self.data["segments"]:
+            marked = expired.get(segment["seq"])
+            if marked is not None and not segment.get("expired"):
+                segment["expired"] = True
+                segment["expiredAt"] = marked.get("expiredAt")
+        write_json_atomic(ctx.options.rotate_segments_file, self.data)
+
+    def rotate(self):
+        """Close the current segment and point the save addon and live index at the next."""
+        from mitmproxy import ctx
+        from segments import segment_artifact, segment_flow_path
+
+        self.close_segment()
+        closing = self.current["flow"]
+        next_flow = segment_flow_path(self.base, self.current["seq"] + 1)
+        updates = {"save_stream_file": next_flow}
+        live_index = segment_artifact(closing[:-len(".flow")], next_flow, ctx.options.live_index_file)
+        if live_index:
+            updates["live_index_file"] = live_index
+        ctx.options.update(**updates)
+        self.open_segment(self.current["seq"] + 1, next_flow)
+
+    def segment_bytes(self):
+        """Bytes written to the current segment, including the save addon's unflushed buffer."""
+        from mitmproxy import ctx
+
+        save = ctx.master.addons.get("save")
+        stream = getattr(save, "stream", None)
+        if stream is not None and getattr(save, "current_path", None) == self.current["flow"]:
+            try:
+                return stream.fo.tell()
+            except (OSError, ValueError):
+                pass
+        try:
+            return os.path.getsize(self.current["flow"])
+        except OSError:
+            return 0
+
+    def saving(self, flow):
+        """Count a flow the save addon is about to write, rotating first if due.
+
+        Script addons run before the built-in save addon, so rotating here
+        puts this flow, and its live index row, in the new segment.
+        """
+        if self.current is None or scope_dropped(flow):
+            return
+        due = self.limit_seconds and time.monotonic() - self.opened >= self.limit_seconds
+        if not due and self.limit_bytes:
+            due = self.segment_bytes() >= self.limit_bytes
+        if due and self.current["flows"]:
+            self.rotate()
+        self.current["flows"] += 1
+
+    def response(self, flow):
+        if flow.websocket is None:
+            self.saving(flow)
+
+    def error(self, flow):
+        self.response(flow)
+
+    def websocket_end(self, flow):
+        self.saving(flow)
+
+    def done(self):
+        if self.current is None:
+            return
+        # The save addon closes the file after this hook; stop records the final size
+        self.close_segment()
+        self.data["complete"] = True
+        self.write()
+        self.current = None
+
+
+# ScopeGuard comes first so the other addons see its verdict on each flow;
+# SegmentRotator switches segments before LiveIndex indexes the flow
+addons = [ScopeGuard(), SegmentRotator(), LiveIndex(), LiveCounters()]
@@ -0,0 +1,581 @@
+#!/usr/bin/env python3
+"""Single-pass post-capture pipeline.
+
+Streams a mitmproxy flow file exactly once and fans every decoded flow out to
+pluggable sinks (HAR, index, summary, scope audit, AI brief). The flow file
+SHA-256 is computed from the same bytes FlowReader consumes, so the stop step
+no longer re-reads or re-decodes the capture for each artifact.
+
+A rotated capture (``--segments capture_<RUN_ID>.segments.json``) is
+processed one segment per worker process; the session index, summary, AI
+brief and scope audit are then built from the segment index rows.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+import ai_brief
+import body_store
+import endpoint_templates
+import flow2har
+import flow_lookup
+import flow_report
+import index_arrays
+import index_columns
+import quantiles
+import scope_audit
+import segments
+
+
+class HashingReader:
+    """Binary reader wrapper that feeds every byte read into a SHA-256 digest.
+
+    ``position`` counts bytes consumed, which gives the flow byte offsets for
+    the .flow.idx sidecar without a second scan.
+    """
+
+    def __init__(self, fo):
+        self.fo = fo
+        self.digest = hashlib.sha256()
+        self.position = 0
+
+    def read(self, size=-1):
+        data = self.fo.read(size)
+        self.digest.update(data)
+        self.position += len(data)
+        return data
+
+    def peek(self, size=0):
+        return self.fo.peek(size)
+
+    def hexdigest(self):
+        # Drain bytes FlowReader did not consume so the digest covers the whole file.
+        while self.read(1 << 20):
+            pass
+        return self.digest.hexdigest()
+
+
+class Sink:
+    """Base class for pipeline sinks.
+
+    ``add`` receives each decoded flow together with its index row; ``close``
+    finalizes output and returns a status string for the stop summary.
+    """
+
+    name = "sink"
+
+    def add(self, flow, entry):
+        pass
+
+    def close(self):
+        return "ok"
+
+
+class HarSink(Sink):
+    name = "har"
+
+    def __init__(self, har_file, compact=False):
+        self.writer = flow2har.HarWriter(har_file, compact=compact)
+
+    def add(self, flow, entry):
+        if flow2har.should_skip(flow):
+            return
+        body_refs = None
+        if "responseBodyRef" in entry:
+            body_refs = (entry["requestBodyRef"], entry["responseBodyRef"])
+        har_entry = flow2har.flow_to_entry(flow, body_refs)
+        if har_entry:
+            self.writer.add(har_entry)
+
+    def close(self):
+        self.writer.close()
+        return "ok"
+
+
+class IndexSink(Sink):
+    """Write index rows as NDJSON.
+
+    Rows are not kept: every aggregate sink consumes them as they stream by.
+    With index_file=None nothing is written (used when the live index written
+    during capture is reused as-is).
+    """
+
+    name = "index"
+
+    def __init__(self, index_file):
+        self.output = None
+        if index_file:
+            fd = os.open(index_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            self.output = os.fdopen(fd, "w", encoding="utf-8")
+        self.count = 0
+
+    def add(self, flow, entry):
+        if self.output is not None:
+            self.output.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self.count += 1
+
+    def close(self):
+        if self.output is not None:
+            self.output.close()
+        return "ok"
+
+
+class IndexColumnsSink(Sink):
+    """Write the .index.col sidecar for the rows IndexSink writes.
+
+    Listed after IndexSink so the NDJSON file is closed, and its final size
+    and hash known, when this sink closes.
+    """
+
+    name = "index_col"
+
+    def __init__(self, col_file, index_file):
+        self.writer = index_columns.ColumnWriter(col_file)
+        self.index_file = index_file
+        self.written = False
+
+    def add(self, flow, entry):
+        self.writer.add(entry)
+
+    def close(self):
+        self.writer.close(self.index_file)
+        self.written = True
+        return "ok"
+
+
+class SummarySink(Sink):
+    """Write summary.md.
+
+    With a columns_sink and NumPy installed, the sidecar writer's in-memory
+    column arrays are aggregated at close; otherwise rows are folded into a
+    bounded flow_report.SummaryAccumulator as they stream by.
+    """
+
+    name = "summary"
+
+    def __init__(self, flow_file, summary_file, index_file, columns_sink=None):
+        self.flow_file = flow_file
+        self.summary_file = summary_file
+        self.index_file = index_file
+        self.columns_sink = columns_sink
+        self.summary = None
+        if columns_sink is None or quantiles.numpy_module() is None:
+            self.summary = flow_report.SummaryAccumulator()
+
+    def add(self, flow, entry):
+        if self.summary is not None:
+            self.summary.add(entry)
+
+    def close(self):
+        source = self.summary
+        if source is None:
+            if self.columns_sink.written:
+                source = index_arrays.writer_arrays(self.columns_sink.writer, min_rows=1)
+            if source is None:
+                # The columns sink failed or saw no rows: read the index back
+                source = index_columns.iter_ndjson(self.index_file)
+        flow_report.write_summary(self.flow_file, self.summary_file, source)
+        return "ok"
+
+
+class ScopeAuditSink(Sink):
+    name = "scope_audit"
+
+    def __init__(self, output_file, allow_hosts, deny_hosts):
+        self.output_file = output_file
+        self.allow_hosts = allow_hosts
+        self.deny_hosts = deny_hosts
+        self.audit = scope_audit.ScopeAuditor(allow_hosts, deny_hosts)
+        self.violations = 0
+
+    def add(self, flow, entry):
+        self.audit.add(entry)
+
+    def close(self):
+        result = self.audit.result()
+        scope_audit.write_audit_result(self.output_file, result)
+        self.violations = result["outOfScopeCount"]
+        return result["status"]
+
+
+class AiBriefSink(Sink):
+    name = "ai_brief"
+
+    def __init__(self, manifest_file, ai_json_file, ai_md_file, templater=None):
+        self.manifest_file = manifest_file
+        self.ai_json_file = ai_json_file
+        self.ai_md_file = ai_md_file
+        self.stats = ai_brief.StatsAccumulator(templater)
+
+    def add(self, flow, entry):
+        self.stats.add(entry)
+
+    def close(self):
+        manifest = ai_brief.load_manifest(self.manifest_file)
+        stats = self.stats.result()
+        ai_brief.write_ai_outputs(ai_brief.build_ai_json(manifest, stats), self.ai_json_file, self.ai_md_file)
+        return "ok"
+
+
+class SinkSet:
+    """Dispatch to sinks, isolating failures so one sink cannot stop others."""
+
+    def __init__(self, sinks):
+        self.active = list(sinks)
+        self.statuses = {}
+
+    def fail(self, sink, exc):
+        print(f"Error in {sink.name} sink: {exc}", file=sys.stderr)
+        self.statuses[sink.name] = "failed"
+        self.active.remove(sink)
+
+    def add(self, flow, entry):
+        for sink in list(self.active):
+            try:
+                sink.add(flow, entry)
+            except Exception as exc:
+                self.fail(sink, exc)
+
+    def close(self):
+        for sink in list(self.active):
+            try:
+                self.statuses[sink.name] = sink.close()
+            except Exception as exc:
+                self.fail(sink, exc)
+        return self.statuses
+
+
+def annotate_body_refs(entry, flow, store):
+    """Store bodies of HAR-eligible flows and add their hashes to the index row."""
+    refs = (None, None) if flow2har.should_skip(flow) else store.store_flow(flow)
+    entry["requestBodyRef"], entry["responseBodyRef"] = refs
+
+
+def run_pipeline(flow_file, sinks, idx_file=None, store=None):
+    """Stream flow_file once, feeding every sink.
+
+    WARNING: FlowReader uses pickle internally. Only process .flow files
+    generated by your own mitmdump instances. Never open untrusted .flow files.
+
+    With idx_file, the byte offset and length of every flow are written to a
+    flow_lookup sidecar as they are read. With store (a body_store.BodyStore),
+    bodies are written to the store and rows/HAR entries reference them.
+
+    Returns (flow_sha256, {sink_name: status}). A failing sink is reported as
+    "failed" without stopping the others.
+    """
+    from mitmproxy.io import FlowReader
+
+    sink_set = SinkSet(sinks)
+    idx_writer = flow_lookup.FlowIndexWriter(idx_file) if idx_file else None
+    try:
+        with open(flow_file, "rb") as raw:
+            stream = HashingReader(raw)
+            reader = FlowReader(stream)
+            start = stream.position
+            for index_id, flow in enumerate(reader.stream(), start=1):
+                if idx_writer is not None:
+                    idx_writer.add(start, stream.position - start)
+                    start = stream.position
+                entry = flow_report.flow_to_index_entry(index_id, flow)
+                if store is not None:
+                    annotate_body_refs(entry, flow, store)
+                sink_set.add(flow, entry)
+            digest = stream.hexdigest()
+    except Exception:
+        if idx_writer is not None:
+            idx_writer.abort()
+        raise
+    if idx_writer is not None:
+        idx_writer.close()
+
+    return digest, sink_set.close()
+
+
+def run_index_pipeline(flow_file, index_file, sinks):
+    """Feed sinks from an existing index.ndjson instead of decoding flows.
+
+    Used when the live index addon already produced a complete index; the
+    flow file is only hashed, never deserialized. Sinks receive flow=None.
+    """
+    sink_set = SinkSet(sinks)
+    with open(index_file, "r", encoding="utf-8") as f:
+        for line in f:
+            text = line.strip()
+            if text:
+                sink_set.add(None, json.loads(text))
+
+    digest = hashlib.sha256()
+    with open(flow_file, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+
+    return digest.hexdigest(), sink_set.close()
+
+
+def write_status_file(path, values):
+    """Write KEY="value" lines readable by common.sh read_kv."""
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        for key, value in values.items():
+            f.write(f'{key}="{value}"\n')
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Single-pass post-capture pipeline")
+    parser.add_argument("flow_file", nargs="?", help="Path to .flow file")
+    parser.add_argument("--segments", help="Process the segments of a rotated capture (capture_*.segments.json) "
+                                           "instead of one flow file")
+    parser.add_argument("--jobs", type=int, default=0,
+                        help="With --segments: segments processed in parallel (default: one per CPU)")
+    parser.add_argument("--har", help="HAR output file; .gz/.zst compresses (omit to skip HAR)")
+    parser.add_argument("--har-compact", action="store_true", help="Write HAR without indentation")
+    parser.add_argument("--body-store", help="Content-addressed body store directory (captures/bodies)")
+    parser.add_argument("--body-refs", help="Write body hashes referenced by this run (with --body-store)")
+    parser.add_argument("--index", required=True, help="Index NDJSON output file")
+    parser.add_argument("--summary", required=True, help="Summary Markdown output file")
+    parser.add_argument("--flow-idx", help="Write the flow_lookup byte-offset sidecar (.flow.idx)")
+    parser.add_argument("--index-col", help="Write the columnar index sidecar (.index.col)")
+    parser.add_argument("--manifest", help="Start manifest JSON (enables AI brief)")
+    parser.add_argument("--ai-json", help="AI brief JSON output file")
+    parser.add_argument("--ai-md", help="AI brief Markdown output file")
+    parser.add_argument("--scope-audit", help="Scope audit JSON output file")
+    parser.add_argument("--policy", help="Policy JSON file (scope, endpoint templates)")
+    parser.add_argument("--allow-hosts", help="Comma-separated allow hosts (overrides policy)")
+    parser.add_argument("--deny-hosts", help="Comma-separated deny hosts (overrides policy)")
+    parser.add_argument("--raw-endpoints", action="store_true",
+                        help="Key AI brief endpoints by raw path instead of endpoint templates")
+    parser.add_argument("--reuse-index", action="store_true",
+                        help="Reuse an existing (live) index instead of decoding flows when no HAR is requested")
+    parser.add_argument("--status-file", help="Write KEY=\"value\" stage statuses for shell callers")
+    return parser
+
+
+def report_sinks(args, source_file, write_index=True):
+    """Index, columns, summary, AI brief and scope audit sinks for args.
+
+    Returns (sinks, audit_sink); audit_sink is None without a scope to audit.
+    """
+    sinks = [IndexSink(args.index if write_index else None)]
+    columns_sink = None
+    if args.index_col:
+        columns_sink = IndexColumnsSink(args.index_col, args.index)
+        sinks.append(columns_sink)
+    sinks.append(SummarySink(source_file, args.summary, args.index, columns_sink))
+
+    if args.manifest and args.ai_json and args.ai_md and os.path.isfile(args.manifest):
+        policy_file = args.policy if args.policy and os.path.isfile(args.policy) else None
+        templater = None if args.raw_endpoints else endpoint_templates.load_templater(policy_file)
+        sinks.append(AiBriefSink(args.manifest, args.ai_json, args.ai_md, templater))
+
+    audit_sink = None
+    if args.scope_audit and (args.policy or args.allow_hosts or args.deny_hosts):
+        policy_file = args.policy if args.policy and os.path.isfile(args.policy) else None
+        allow_hosts, deny_hosts = scope_audit.resolve_scope_hosts(policy_file, args.allow_hosts, args.deny_hosts)
+        audit_sink = ScopeAuditSink(args.scope_audit, allow_hosts, deny_hosts)
+        sinks.append(audit_sink)
+    return sinks, audit_sink
+
+
+def run(args):
+    """Process one flow file; returns (exit code, status values)."""
+    flow_file = args.flow_file
+    error = flow_lookup.check_flow_path(flow_file)
+    if error:
+        print(f"Error: {error}", file=sys.stderr)
+        return 3, {}
+
+    reuse_index = bool(args.reuse_index and not args.har and not args.body_store and os.path.isfile(args.index))
+    store = body_store.BodyStore(args.body_store) if args.body_store else None
+    sinks, audit_sink = report_sinks(args, flow_file, write_index=not reuse_index)
+
+    har_status = "skipped"
+    if args.har:
+        try:
+            sinks.append(HarSink(args.har, compact=args.har_compact))
+        except RuntimeError as exc:
+            print(f"Error in har sink: {exc}", file=sys.stderr)
+            har_status = "failed"
+
+    try:
+        if reuse_index:
+            digest, statuses = run_index_pipeline(flow_file, args.index, sinks)
+        else:
+            digest, statuses = run_pipeline(flow_file, sinks, args.flow_idx, store)
+        if store is not None and args.body_refs:
+            body_store.write_refs(args.body_refs, store.refs)
+    except Exception as exc:
+        print(f"Pipeline failed: {exc}", file=sys.stderr)
+        return 4, {}
+
+    report_ok = statuses.get("index") == "ok" and statuses.get("summary") == "ok"
+    return 0, {
+        "FLOW_SHA256": digest,
+        "HAR_STATUS": statuses.get("har", har_status),
+        "REPORT_STATUS": "ok" if report_ok else "failed",
+        "AI_BRIEF_STATUS": statuses.get("ai_brief", "skipped"),
+        "SCOPE_AUDIT_STATUS": statuses.get("scope_audit", "failed") if audit_sink is not None else "no-policy",
+        "SCOPE_AUDIT_VIOLATIONS": audit_sink.violations if audit_sink is not None else 0,
+        "INDEX_SOURCE": "live" if reuse_index else "flow",
+        "INDEX_COL_STATUS": statuses.get("index_col", "skipped"),
+        "BODY_REFS": len(store.refs) if store is not None else 0,
+    }
+
+
+def run_segment(argv):
+    """Process one segment with per-segment outputs (process pool worker)."""
+    try:
+        return run(build_parser().parse_args(argv))
+    except Exception as exc:
+        print(f"Pipeline failed for {argv[0]}: {exc}", file=sys.stderr)
+        return 4, {}
+
+
+def segment_argv(args, session_base, segment):
+    """Pipeline arguments for one segment, its outputs named after the segment."""
+    flow_file = segment["flow"]
+    segment_base = flow_file[:-len(".flow")]
+
+    def name(path, suffix):
+        return segments.segment_artifact(session_base, flow_file, path) or segment_base + suffix
+
+    outputs = {
+        "index": name(args.index, ".index.ndjson"),
+        "summary": name(args.summary, ".summary.md"),
+        "flowIdx": name(args.flow_idx, ".flow.idx"),
+    }
+    argv = [flow_file, "--index", outputs["index"], "--summary", outputs["summary"], "--flow-idx", outputs["flowIdx"]]
+    if args.index_col:
+        outputs["indexCol"] = name(args.index_col, ".index.col")
+        argv += ["--index-col", outputs["indexCol"]]
+    if args.har:
+        outputs["har"] = name(args.har, ".har")
+        argv += ["--har", outputs["har"]] + (["--har-compact"] if args.har_compact else [])
+    if args.body_store:
+        outputs["bodyRefs"] = name(args.body_refs, ".bodies.txt")
+        argv += ["--body-store", args.body_store, "--body-refs", outputs["bodyRefs"]]
+    # A closed segment's live index was flushed when the addon moved to the next one
+    if segment.get("closedAt") and segment.get("liveIndex") == outputs["index"]:
+        argv.append("--reuse-index")
+    return argv, outputs
+
+
+def run_segments(args):
+    """Process every segment of a rotated capture, then the session outputs.
+
+    Segments are decoded in a process pool into per-segment index, summary,
+    flow offsets, columns and HAR. Their index rows are then streamed, with
+    ids renumbered across segments, into the session index, summary, AI brief
+    and scope audit sinks, so those match a capture written to one file.
+    Segment artifacts, digests and id ranges are recorded in the segments
+    file. Returns (exit code, status values).
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    try:
+        session_base = segments.session_base_for(args.segments)
+        data = segments.load_segments(args.segments)
+    except (OSError, ValueError) as exc:
+        print(f"Error: {exc}", file=sys.stderr)
+        return 1, {}
+    parts = segments.live_segments(data)
+    segments_dir = os.path.realpath(os.path.dirname(args.segments))
+    for segment in parts:
+        # Segments live next to their list; anything else was not written by the capture
+        if os.path.realpath(os.path.dirname(segment["flow"])) != segments_dir:
+            print(f"Error: segment outside {segments_dir}: {segment['flow']}", file=sys.stderr)
+            return 3, {}
+        error = flow_lookup.check_flow_path(segment["flow"])
+        if error:
+            print(f"Error: {error}", file=sys.stderr)
+            return 3, {}
+
+    work = [segment_argv(args, session_base, segment) for segment in parts]
+    jobs = min(args.jobs or os.cpu_count() or 1, max(len(work), 1))
+    if jobs > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            results = list(pool.map(run_segment, [argv for argv, _ in work]))
+    else:
+        results = [run_segment(argv) for argv, _ in work]
+
+    sinks, audit_sink = report_sinks(args, args.segments)
+    sink_set = SinkSet(sinks)
+    next_id = 1
+    segment_ok = True
+    sources = set()
+    for segment, (_, outputs), (code, values) in zip(parts, work, results):
+        ok = code == 0 and values.get("REPORT_STATUS") == "ok"
+        segment_ok = segment_ok and ok
+        segment.update(outputs)
+        segment.update({
+            "status": "ok" if ok else "failed",
+            "sha256": values.get("FLOW_SHA256", ""),
+            "firstId": next_id,
+            "rows": 0,
+        })
+        if os.path.isfile(segment["flow"]):
+            segment["bytes"] = os.path.getsize(segment["flow"])
+        if values.get("HAR_STATUS", "skipped") != "skipped":
+            segment["harStatus"] = values["HAR_STATUS"]
+        sources.add(values.get("INDEX_SOURCE", "flow"))
+        if not ok:
+            continue
+        for entry in index_columns.iter_ndjson(outputs["index"]):
+            entry["id"] = next_id
+            next_id += 1
+            sink_set.add(None, entry)
+        segment["rows"] = next_id - segment["firstId"]
+    statuses = sink_set.close()
+    segments.write_segments(args.segments, data)
+
+    refs = set()
+    for segment in parts:
+        if segment.get("bodyRefs") and os.path.isfile(segment["bodyRefs"]):
+            refs |= body_store.read_refs(segment["bodyRefs"])
+    har_statuses = {segment.get("harStatus", "failed") for segment in parts} if args.har else {"skipped"}
+    report_ok = segment_ok and statuses.get("index") == "ok" and statuses.get("summary") == "ok"
+    return 0, {
+        "FLOW_SHA256": "",
+        "HAR_STATUS": "ok" if har_statuses == {"ok"} else ("skipped" if har_statuses == {"skipped"} else "failed"),
+        "REPORT_STATUS": "ok" if report_ok else "failed",
+        "AI_BRIEF_STATUS": statuses.get("ai_brief", "skipped"),
+        "SCOPE_AUDIT_STATUS": statuses.get("scope_audit", "failed") if audit_sink is not None else "no-policy",
+        "SCOPE_AUDIT_VIOLATIONS": audit_sink.violations if audit_sink is not None else 0,
+        "INDEX_SOURCE": "+".join(sorted(sources)) or "flow",
+        "INDEX_COL_STATUS": statuses.get("index_col", "skipped"),
+        "BODY_REFS": len(refs),
+        "SEGMENTS": len(parts),
+    }
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if bool(args.flow_file) == bool(args.segments):
+        parser.error("give either a flow file or --segments")
+
+    try:
+        from mitmproxy.io import FlowReader  # noqa: F401
+    except Exception as exc:
+        print(f"Failed to import FlowReader: {exc}", file=sys.stderr)
+        return 2
+
+    code, values = run_segments(args) if args.segments else run(args)
+    if code != 0:
+        return code
+    if args.status_file:
+        write_status_file(args.status_file, values)
+    else:
+        for key, value in values.items():
+            print(f"{key}={value}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
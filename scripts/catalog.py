@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+"""SQLite catalog of capture sessions for cross-session queries.
+
+``captures/catalog.sqlite`` holds one ``runs`` row per session (from its
+manifest) and one ``requests`` row per index row, indexed on run, host, path,
+status and start time. stopCaptures.sh ingests each session when the catalog
+exists (or with ``--catalog``); cleanup.py drops the rows of deleted sessions.
+The first ``query`` builds the catalog from the sessions already on disk.
+
+The catalog is derived data: ``rebuild`` recreates it from the per-session
+files at any time.
+"""
+
+import glob
+import json
+import os
+import sqlite3
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+from flow_report import to_markdown_table
+from index_columns import iter_rows
+
+CATALOG_NAME = "catalog.sqlite"
+SCHEMA_VERSION = 1
+
+# index.ndjson key -> requests column
+REQUEST_COLUMNS = [
+    ("id", "id", "INTEGER NOT NULL"),
+    ("startedDateTime", "started_at", "TEXT"),
+    ("method", "method", "TEXT"),
+    ("scheme", "scheme", "TEXT"),
+    ("host", "host", "TEXT"),
+    ("port", "port", "INTEGER"),
+    ("path", "path", "TEXT"),
+    ("url", "url", "TEXT"),
+    ("status", "status", "INTEGER"),
+    ("statusBucket", "status_bucket", "TEXT"),
+    ("durationMs", "duration_ms", "INTEGER"),
+    ("ttfbMs", "ttfb_ms", "INTEGER"),
+    ("connectMs", "connect_ms", "INTEGER"),
+    ("tlsMs", "tls_ms", "INTEGER"),
+    ("receiveMs", "receive_ms", "INTEGER"),
+    ("requestBytes", "request_bytes", "INTEGER"),
+    ("responseBytes", "response_bytes", "INTEGER"),
+    ("contentType", "content_type", "TEXT"),
+    ("requestBodyRef", "request_body_ref", "TEXT"),
+    ("responseBodyRef", "response_body_ref", "TEXT"),
+]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    started_at TEXT,
+    stopped_at TEXT,
+    target_dir TEXT,
+    flow_sha256 TEXT,
+    request_count INTEGER NOT NULL,
+    ingested_at TEXT NOT NULL,
+    manifest TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS requests (
+    run_id TEXT NOT NULL,
+    {columns},
+    PRIMARY KEY (run_id, id)
+);
+CREATE INDEX IF NOT EXISTS requests_host ON requests (host);
+CREATE INDEX IF NOT EXISTS requests_path ON requests (path);
+CREATE INDEX IF NOT EXISTS requests_status ON requests (status);
+CREATE INDEX IF NOT EXISTS requests_started_at ON requests (started_at);
+""".format(columns=",\n    ".join(f"{column} {decl}" for _, column, decl in REQUEST_COLUMNS))
+
+GROUP_KEYS = {
+    "run": "run_id",
+    "host": "host",
+    "path": "path",
+    "method": "method",
+    "status": "status",
+    "endpoint": "method || ' ' || host || path",
+}
+
+ROW_COLUMNS = ["run_id", "id", "started_at", "method", "status", "duration_ms", "host", "path"]
+
+
+def catalog_path(captures_dir):
+    return os.path.join(captures_dir, CATALOG_NAME)
+
+
+def connect(captures_dir):
+    """Open the catalog read-write, creating it (0600) with the schema if needed."""
+    path = catalog_path(captures_dir)
+    if os.path.islink(path):
+        raise ValueError(f"catalog is a symlink, refusing to open: {path}")
+    if not os.path.exists(path):
+        os.close(os.open(path, os.O_WRONLY | os.O_CREAT, 0o600))
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version not in (0, SCHEMA_VERSION):
+        conn.close()
+        raise ValueError(f"catalog schema version {version} is not supported; run rebuild")
+    conn.executescript(SCHEMA)
+    conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    return conn
+
+
+def connect_readonly(captures_dir):
+    path = catalog_path(captures_dir)
+    if os.path.islink(path):
+        raise ValueError(f"catalog is a symlink, refusing to open: {path}")
+    return sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+
+
+def ingest(conn, manifest, index_file=None):
+    """Replace one session's rows; returns the number of requests ingested."""
+    run_id = manifest["runId"]
+    artifacts = manifest.get("artifacts") or {}
+    keys = [key for key, _, _ in REQUEST_COLUMNS]
+    insert = "INSERT INTO requests (run_id, {}) VALUES (?, {})".format(
+        ", ".join(column for _, column, _ in REQUEST_COLUMNS), ", ".join("?" for _ in keys))
+
+    with conn:
+        conn.execute("DELETE FROM requests WHERE run_id = ?", (run_id,))
+        count = 0
+        if index_file and os.path.isfile(index_file):
+            cursor = conn.executemany(insert, (
+                (run_id, *(row.get(key) for key in keys)) for row in iter_rows(index_file, keys)
+            ))
+            count = cursor.rowcount
+        conn.execute(
+            "INSERT OR REPLACE INTO runs VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                run_id,
+                manifest.get("startedAt"),
+                manifest.get("stoppedAt"),
+                manifest.get("targetDir"),
+                artifacts.get("flowSha256"),
+                count,
+                datetime.now(timezone.utc).isoformat(),
+                json.dumps(manifest, ensure_ascii=False),
+            ),
+        )
+    return count
+
+
+def ingest_session(conn, captures_dir, manifest_file, index_file=None):
+    with open(manifest_file, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if index_file is None:
+        index_file = os.path.join(captures_dir, f"capture_{manifest['runId']}.index.ndjson")
+    return ingest(conn, manifest, index_file)
+
+
+def remove_runs(captures_dir, run_ids):
+    """Drop deleted sessions from an existing catalog; returns rows removed."""
+    if not run_ids or not os.path.isfile(catalog_path(captures_dir)):
+        return 0
+    conn = connect(captures_dir)
+    try:
+        with conn:
+            removed = 0
+            for run_id in run_ids:
+                removed += conn.execute("DELETE FROM requests WHERE run_id = ?", (run_id,)).rowcount
+                conn.execute("DELETE FROM runs WHERE run_id = ?", (run_id,))
+        return removed
+    finally:
+        conn.close()
+
+
+def rebuild(captures_dir):
+    """Recreate the catalog from every capture_*.manifest.json; returns session count."""
+    path = catalog_path(captures_dir)
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.isfile(path + suffix) and not os.path.islink(path + suffix):
+            os.unlink(path + suffix)
+    conn = connect(captures_dir)
+    sessions = 0
+    try:
+        for manifest_file in sorted(glob.glob(os.path.join(captures_dir, "capture_*.manifest.json"))):
+            if os.path.islink(manifest_file):
+                continue
+            try:
+                ingest_session(conn, captures_dir, manifest_file)
+                sessions += 1
+            except (OSError, ValueError, KeyError) as exc:
+                print(f"Warning: skipped {manifest_file}: {exc}", file=sys.stderr)
+    finally:
+        conn.close()
+    return sessions
+
+
+def status_range(value):
+    """'404' -> (404, 404); '4xx' -> (400, 499)."""
+    text = value.lower()
+    if len(text) == 3 and text[0].isdigit() and text[1:] == "xx":
+        base = int(text[0]) * 100
+        return base, base + 99
+    code = int(text)
+    return code, code
+
+
+def glob_escape(text):
+    return "".join(f"[{ch}]" if ch in "*?[" else ch for ch in text)
+
+
+def build_query(args):
+    """Return (sql, params, headers) for the query filters in args."""
+    where = []
+    params = []
+    if args.run:
+        runs = []
+        for run_id in args.run:
+            if run_id == "latest":
+                runs.append("(SELECT run_id FROM runs ORDER BY started_at DESC LIMIT 1)")
+            else:
+                runs.append("?")
+                params.append(run_id)
+        where.append(f"run_id IN ({', '.join(runs)})")
+    if args.host:
+        where.append("host GLOB ?" if "*" in args.host else "host = ?")
+        params.append(args.host)
+    if args.path:
+        # Prefix match; GLOB 'prefix*' can use the path index
+        where.append("path GLOB ?")
+        params.append(args.path if "*" in args.path else glob_escape(args.path) + "*")
+    if args.method:
+        where.append("method = ?")
+        params.append(args.method.upper())
+    if args.status:
+        low, high = status_range(args.status)
+        where.append("status BETWEEN ? AND ?")
+        params.extend([low, high])
+    if args.since:
+        where.append("started_at >= ?")
+        params.append(args.since)
+    if args.until:
+        where.append("started_at < ?")
+        params.append(args.until)
+    if args.min_ms is not None:
+        where.append("duration_ms >= ?")
+        params.append(args.min_ms)
+
+    clause = f" WHERE {' AND '.join(where)}" if where else ""
+    if args.group_by:
+        key = GROUP_KEYS[args.group_by]
+        headers = [args.group_by, "requests", "errors", "avg_ms", "max_ms", "response_bytes"]
+        sql = (
+            f"SELECT {key} AS k, COUNT(*) AS requests, SUM(status >= 400) AS errors, "
+            "CAST(AVG(duration_ms) AS INTEGER), MAX(duration_ms), SUM(response_bytes) "
+            f"FROM requests{clause} GROUP BY k ORDER BY requests DESC, k LIMIT ?"
+        )
+    else:
+        headers = ROW_COLUMNS
+        order = "duration_ms DESC" if args.slowest else "started_at, run_id, id"
+        sql = f"SELECT {', '.join(ROW_COLUMNS)} FROM requests{clause} ORDER BY {order} LIMIT ?"
+    params.append(args.limit)
+    return sql, params, headers
+
+
+def main(argv=None):
+    """CLI interface for the capture catalog."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="SQLite catalog of capture sessions")
+    subparsers = parser.add_subparsers(dest="command", help="Commands")
+
+    ingest_parser = subparsers.add_parser("ingest", help="Add or replace one session")
+    ingest_parser.add_argument("captures_dir", help="Captures directory")
+    ingest_parser.add_argument("manifest", help="Session manifest JSON")
+    ingest_parser.add_argument("--index", help="Index NDJSON (default: capture_<RUN_ID>.index.ndjson)")
+
+    rebuild_parser = subparsers.add_parser("rebuild", help="Recreate the catalog from all sessions")
+    rebuild_parser.add_argument("captures_dir", help="Captures directory")
+
+    query_parser = subparsers.add_parser("query", help="Filter or aggregate requests across sessions")
+    query_parser.add_argument("captures_dir", help="Captures directory")
+    query_parser.add_argument("--run", action="append", help="RUN_ID or 'latest' (repeatable)")
+    query_parser.add_argument("--host", help="Host, '*' wildcards allowed")
+    query_parser.add_argument("--path", help="Path prefix, or a pattern with '*'")
+    query_parser.add_argument("--method", help="HTTP method")
+    query_parser.add_argument("--status", help="Status code or class (404, 5xx)")
+    query_parser.add_argument("--since", help="Started at or after (ISO 8601, UTC)")
+    query_parser.add_argument("--until", help="Started before (ISO 8601, UTC)")
+    query_parser.add_argument("--min-ms", type=int, help="Minimum duration in ms")
+    query_parser.add_argument("--group-by", choices=sorted(GROUP_KEYS), help="Aggregate by this key")
+    query_parser.add_argument("--slowest", action="store_true", help="Order rows by duration")
+    query_parser.add_argument("--limit", type=int, default=50, help="Maximum rows (default: 50)")
+    query_parser.add_argument("--sql", help="Run a read-only SQL statement instead of filters")
+    query_parser.add_argument("--json", action="store_true", help="Print JSON instead of a table")
+    query_parser.add_argument("-o", "--output", help="Output file (default: stdout)")
+
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == "ingest":
+            conn = connect(args.captures_dir)
+            try:
+                count = ingest_session(conn, args.captures_dir, args.manifest, args.index)
+            finally:
+                conn.close()
+            print(f"Ingested {count} requests into {catalog_path(args.captures_dir)}", file=sys.stderr)
+            return 0
+
+        if args.command == "rebuild":
+            sessions = rebuild(args.captures_dir)
+            print(f"Catalog rebuilt from {sessions} sessions: {catalog_path(args.captures_dir)}", file=sys.stderr)
+            return 0
+
+        if args.command == "query":
+            if not os.path.exists(catalog_path(args.captures_dir)):
+                sessions = rebuild(args.captures_dir)
+                print(f"Catalog created from {sessions} sessions", file=sys.stderr)
+            if args.sql:
+                sql, params, headers = args.sql, [], None
+            else:
+                try:
+                    sql, params, headers = build_query(args)
+                except ValueError as exc:
+                    print(f"Error: invalid filter: {exc}", file=sys.stderr)
+                    return 1
+            conn = connect_readonly(args.captures_dir)
+            try:
+                cursor = conn.execute(sql, params)
+                rows = cursor.fetchall()
+                headers = headers or [d[0] for d in cursor.description or []]
+            finally:
+                conn.close()
+            if args.json:
+                text = json.dumps([dict(zip(headers, row)) for row in rows], indent=2, ensure_ascii=False)
+            else:
+                text = to_markdown_table([["-" if v is None else v for v in row] for row in rows], headers)
+            if args.output:
+                fd = os.open(args.output, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    f.write(text + "\n")
+            else:
+                print(text)
+            return 0
+    except (OSError, ValueError, sqlite3.Error) as exc:
+        print(f"Error: {exc}", file=sys.stderr)
+        return 1
+
+    parser.print_help()
+    return 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -11,11 +11,26 @@ import re
 import json
 import os
 import shutil
+import sqlite3
 import subprocess
 import sys
 from datetime import datetime, timezone, timedelta
 from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).parent))
+from body_store import unreferenced_bodies
+from catalog import remove_runs
+from segments import (
+    SEGMENT_DIGITS,
+    SEGMENT_FILE_RE,
+    SEGMENTS_SUFFIX,
+    live_segments,
+    load_segments,
+    now_local,
+    segment_files,
+    write_segments,
+)
+
 
 def parse_size(size_str: str) -> int:
     """Parse human-readable size string to bytes.
@@ -124,7 +139,8 @@ def discover_sessions(captures_dir: str) -> list:
     flow_pattern = os.path.join(captures_dir, "capture_*.flow")
     for flow_path in sorted(glob.glob(flow_pattern)):
         bname = os.path.basename(flow_path)
-        rid = bname[len("capture_"):-len(".flow")]
+        segment = SEGMENT_FILE_RE.match(bname)
+        rid = segment.group(1) if segment else bname[len("capture_"):-len(".flow")]
         if not rid or rid in seen:
             continue
         seen.add(rid)
@@ -162,6 +178,51 @@ def session_files(captures_dir: str, run_id: str) -> list:
     return files
 
 
+def discover_segments(captures_dir: str, run_id: str) -> list:
+    """Retention units of a rotated session, one per segment not yet expired.
+
+    Returns [] for sessions without a segments file. Each unit is
+    {"seq", "timestamp", "size", "files"}; the timestamp is when the segment
+    was closed (the flow file mtime while it is still open).
+    """
+    path = os.path.join(captures_dir, f"capture_{run_id}{SEGMENTS_SUFFIX}")
+    if not os.path.isfile(path) or os.path.islink(path):
+        return []
+    try:
+        data = load_segments(path)
+    except (OSError, ValueError):
+        return []
+
+    units = []
+    for segment in live_segments(data):
+        seq = segment.get("seq")
+        if not isinstance(seq, int):
+            continue
+        files = segment_files(captures_dir, run_id, seq)
+        timestamp = segment.get("closedAt") or ""
+        flow = os.path.join(captures_dir, f"capture_{run_id}.{seq:0{SEGMENT_DIGITS}d}.flow")
+        if not timestamp and os.path.isfile(flow):
+            timestamp = datetime.fromtimestamp(os.path.getmtime(flow)).strftime("%Y-%m-%dT%H:%M:%S")
+        units.append({
+            "seq": seq,
+            "timestamp": timestamp or segment.get("openedAt") or "",
+            "size": sum(os.path.getsize(f) for f in files),
+            "files": files,
+        })
+    return units
+
+
+def expire_segments(captures_dir: str, run_id: str, seqs) -> None:
+    """Mark segments as expired in the session's segments file."""
+    path = os.path.join(captures_dir, f"capture_{run_id}{SEGMENTS_SUFFIX}")
+    data = load_segments(path)
+    for segment in data["segments"]:
+        if segment.get("seq") in seqs:
+            segment["expired"] = True
+            segment["expiredAt"] = now_local()
+    write_segments(path, data)
+
+
 def is_latest_target(captures_dir: str, run_id: str) -> bool:
     """Check if a RUN_ID is the target of any latest.* symlink."""
     pattern = os.path.join(captures_dir, "latest.*")
@@ -177,12 +238,12 @@ def is_latest_target(captures_dir: str, run_id: str) -> bool:
 def update_latest_links(captures_dir: str):
     """Update latest.* symlinks to point to the newest remaining session."""
     exts = [
-        "flow", "har", "log", "manifest.json", "index.ndjson",
+        "flow", "har", "har.gz", "har.zst", "log", "manifest.json", "index.ndjson",
         "summary.md", "ai.json", "ai.md", "navigation.ndjson",
     ]
     link_names = [
-        "latest.flow", "latest.har", "latest.log", "latest.manifest.json",
-        "latest.index.ndjson", "latest.summary.md", "latest.ai.json",
+        "latest.flow", "latest.har", "latest.har.gz", "latest.har.zst", "latest.log",
+        "latest.manifest.json", "latest.index.ndjson", "latest.summary.md", "latest.ai.json",
         "latest.ai.md", "latest.navigation.ndjson",
     ]
 
@@ -299,24 +360,42 @@ def run_cleanup(captures_dir: str, keep_days=None, keep_size=None,
             "deleted": 0, "kept": len(sessions), "files_removed": 0, "bytes_freed": 0,
         }
 
+    # Retention units: a whole session, or one segment of a rotated session.
+    # A rotated session's own files (manifest, merged index, ...) count
+    # towards its newest segment and go when its last segment goes.
+    units = []
+    segment_units = {}
+    for s in sessions:
+        rid = s["run_id"]
+        segs = discover_segments(captures_dir, rid)
+        if not segs:
+            units.append({"key": (rid, None), "timestamp": s["timestamp"], "size": s["total_size"]})
+            continue
+        segment_units[rid] = segs
+        session_only = s["total_size"] - sum(seg["size"] for seg in segs)
+        for i, seg in enumerate(segs):
+            size = seg["size"] + (session_only if i == len(segs) - 1 else 0)
+            units.append({"key": (rid, seg["seq"]), "timestamp": seg["timestamp"], "size": size})
+    units.sort(key=lambda u: u["timestamp"] or "0000")
+
     # Build lookup maps
-    ts_map = {s["run_id"]: s["timestamp"] for s in sessions}
-    sz_map = {s["run_id"]: s["total_size"] for s in sessions}
-    sorted_ids = [s["run_id"] for s in sessions]
+    ts_map = {u["key"]: u["timestamp"] for u in units}
+    sz_map = {u["key"]: u["size"] for u in units}
+    sorted_ids = [u["key"] for u in units]
 
     to_delete = set()
 
     # Apply keep-days filter
     if keep_days is not None:
         cutoff_ts = compute_cutoff(keep_days)
-        for rid in sorted_ids:
-            ts = ts_map[rid]
+        for key in sorted_ids:
+            ts = ts_map[key]
             if not ts:
-                to_delete.add(rid)
+                to_delete.add(key)
                 continue
             # <= comparison: not strictly after cutoff means delete
             if not (ts > cutoff_ts):
-                to_delete.add(rid)
+                to_delete.add(key)
 
     # Apply keep-size filter
     if keep_size is not None:
@@ -324,28 +403,38 @@ def run_cleanup(captures_dir: str, keep_days=None, keep_size=None,
         cumulative = 0
         budget_exceeded = False
 
-        # Walk from newest to oldest; always keep the newest session
+        # Walk from newest to oldest; always keep the newest unit
         reversed_ids = list(reversed(sorted_ids))
-        for i, rid in enumerate(reversed_ids):
-            sz = sz_map[rid]
+        for i, key in enumerate(reversed_ids):
+            sz = sz_map[key]
             if budget_exceeded:
-                to_delete.add(rid)
+                to_delete.add(key)
                 continue
             cumulative += sz
             if cumulative > max_bytes and i > 0:
-                # Only delete if not the newest session (i > 0)
-                to_delete.add(rid)
+                # Only delete if not the newest unit (i > 0)
+                to_delete.add(key)
                 budget_exceeded = True
 
-    if not to_delete:
+    # Whole sessions go when all their units do; otherwise only segments
+    session_ids = [s["run_id"] for s in sessions]
+    delete_runs = {rid for rid in session_ids
+                   if all(u["key"] in to_delete for u in units if u["key"][0] == rid)}
+    delete_segments = {}
+    for rid, seq in to_delete:
+        if seq is not None and rid not in delete_runs:
+            delete_segments.setdefault(rid, []).append(seq)
+
+    if not delete_runs and not delete_segments:
         return {
             "status": "nothing",
-            "message": f"Nothing to clean up ({len(sorted_ids)} sessions within retention policy)",
-            "deleted": 0, "kept": len(sorted_ids), "files_removed": 0, "bytes_freed": 0,
+            "message": f"Nothing to clean up ({len(session_ids)} sessions within retention policy)",
+            "deleted": 0, "kept": len(session_ids), "files_removed": 0, "bytes_freed": 0,
         }
 
     # Execute cleanup
     delete_count = 0
+    segment_count = 0
     delete_files = 0
     delete_bytes = 0
     kept_count = 0
@@ -355,13 +444,38 @@ def run_cleanup(captures_dir: str, keep_days=None, keep_size=None,
     # Detect shred once for all files
     shred_cmd = _detect_shred() if secure else ""
 
-    for rid in sorted_ids:
-        if rid not in to_delete:
+    ts_by_run = {s["run_id"]: s["timestamp"] for s in sessions}
+    size_by_run = {s["run_id"]: s["total_size"] for s in sessions}
+    for rid in session_ids:
+        if rid not in delete_runs:
             kept_count += 1
+            for seq in sorted(delete_segments.get(rid, [])):
+                seg = next(seg for seg in segment_units[rid] if seg["seq"] == seq)
+                if is_latest_target(captures_dir, f"{rid}.{seq:0{SEGMENT_DIGITS}d}"):
+                    needs_latest_update = True
+                if not dry_run:
+                    for f in seg["files"]:
+                        delete_file(f, secure, captures_dir, shred_cmd=shred_cmd)
+                details.append({
+                    "run_id": rid,
+                    "segment": seq,
+                    "timestamp": seg["timestamp"] or "unknown",
+                    "size": seg["size"],
+                    "size_human": format_size(seg["size"]),
+                    "files": len(seg["files"]),
+                })
+                segment_count += 1
+                delete_files += len(seg["files"])
+                delete_bytes += seg["size"]
+            if rid in delete_segments and not dry_run:
+                try:
+                    expire_segments(captures_dir, rid, set(delete_segments[rid]))
+                except (OSError, ValueError) as e:
+                    print(f"Warning: could not update segments of {rid}: {e}", file=sys.stderr)
             continue
 
-        ts = ts_map[rid] or "unknown"
-        sz = sz_map[rid]
+        ts = ts_by_run[rid] or "unknown"
+        sz = size_by_run[rid]
 
         if is_latest_target(captures_dir, rid):
             needs_latest_update = True
@@ -385,6 +499,30 @@ def run_cleanup(captures_dir: str, keep_days=None, keep_size=None,
         delete_files += file_count
         delete_bytes += sz
 
+    # Reference-count the shared body store: drop blobs that no remaining
+    # session (or segment) lists in its capture_<RUN_ID>[.<seq>].bodies.txt
+    excluded_refs = set(delete_runs)
+    for rid in delete_runs:
+        excluded_refs |= {f"{rid}.{seg['seq']:0{SEGMENT_DIGITS}d}" for seg in segment_units.get(rid, [])}
+    for rid, seqs in delete_segments.items():
+        excluded_refs |= {f"{rid}.{seq:0{SEGMENT_DIGITS}d}" for seq in seqs}
+    orphan_bodies = unreferenced_bodies(captures_dir, exclude_run_ids=excluded_refs)
+    body_bytes = sum(size for _, size in orphan_bodies)
+    if not dry_run:
+        for path, _ in orphan_bodies:
+            delete_file(path, secure, captures_dir, shred_cmd=shred_cmd)
+            try:
+                os.rmdir(os.path.dirname(path))
+            except OSError:
+                pass  # prefix directory still holds other bodies
+
+    catalog_rows = 0
+    if not dry_run:
+        try:
+            catalog_rows = remove_runs(captures_dir, delete_runs)
+        except (OSError, ValueError, sqlite3.Error) as e:
+            print(f"Warning: could not update capture catalog: {e}", file=sys.stderr)
+
     # Update symlinks
     if not dry_run and needs_latest_update:
         update_latest_links(captures_dir)
@@ -394,10 +532,14 @@ def run_cleanup(captures_dir: str, keep_days=None, keep_size=None,
         "dry_run": dry_run,
         "secure": secure,
         "deleted": delete_count,
+        "segments_deleted": segment_count,
         "kept": kept_count,
         "files_removed": delete_files,
-        "bytes_freed": delete_bytes,
-        "bytes_freed_human": format_size(delete_bytes),
+        "bytes_freed": delete_bytes + body_bytes,
+        "bytes_freed_human": format_size(delete_bytes + body_bytes),
+        "bodies_removed": len(orphan_bodies),
+        "body_bytes_freed": body_bytes,
+        "catalog_rows_removed": catalog_rows,
         "needs_latest_update": needs_latest_update,
         "details": details,
     }
@@ -143,6 +143,8 @@ print(data.get('kept', 0))
 print(data.get('files_removed', 0))
 print(data.get('bytes_freed_human', '0 B'))
 print(data.get('needs_latest_update', False))
+print(data.get('bodies_removed', 0))
+print(data.get('segments_deleted', 0))
 " <<< "$RESULT")"
 
 STATUS="$(sed -n '1p' <<< "$PARSED")"
@@ -161,6 +163,8 @@ KEPT_COUNT="$(sed -n '4p' <<< "$PARSED")"
 DELETE_FILES="$(sed -n '5p' <<< "$PARSED")"
 FREED_HUMAN="$(sed -n '6p' <<< "$PARSED")"
 NEEDS_UPDATE="$(sed -n '7p' <<< "$PARSED")"
+BODIES_REMOVED="$(sed -n '8p' <<< "$PARSED")"
+SEGMENTS_DELETED="$(sed -n '9p' <<< "$PARSED")"
 
 if [[ "$DRY_RUN" == "true" ]]; then
     echo "=== DRY RUN - No files will be deleted ==="
@@ -177,10 +181,11 @@ for d in data.get('details', []):
     ts = d['timestamp']
     sz = d['size_human']
     fc = d['files']
+    unit = f'session={rid}  segment={d[\"segment\"]}' if 'segment' in d else f'session={rid}'
     if dry:
-        print(f'  [DELETE] session={rid}  time={ts}  size={sz}  files={fc}')
+        print(f'  [DELETE] {unit}  time={ts}  size={sz}  files={fc}')
     else:
-        print(f'[cleanup] Deleted session={rid}  time={ts}  size={sz}  files={fc}')
+        print(f'[cleanup] Deleted {unit}  time={ts}  size={sz}  files={fc}')
 " <<< "$RESULT"
 
 # Symlinks update message
@@ -198,7 +203,13 @@ if [[ "$SECURE_DELETE" == "true" ]]; then
     echo "  Method:   Secure delete (shred)"
 fi
 echo "  Sessions: ${DELETE_COUNT} deleted, ${KEPT_COUNT} kept"
+if [[ "$SEGMENTS_DELETED" != "0" ]]; then
+    echo "  Segments: ${SEGMENTS_DELETED} expired from kept sessions"
+fi
 echo "  Files:    ${DELETE_FILES} removed"
+if [[ "$BODIES_REMOVED" != "0" ]]; then
+    echo "  Bodies:   ${BODIES_REMOVED} unreferenced bodies removed"
+fi
 echo "  Freed:    ${FREED_HUMAN}"
 if [[ -n "$KEEP_DAYS" ]]; then
     echo "  Policy:   keep-days=$KEEP_DAYS"
@@ -0,0 +1,381 @@
+#!/usr/bin/env python3
+"""Connection reuse and handshake cost of a capture index.
+
+Index rows carry the upstream connection they were sent on (``serverConnId``,
+``serverIp``, ``httpVersion``, ``alpn``, ``tlsVersion``) and that
+connection's setup (``connOpenedDateTime``, ``connTcpMs``, ``connTlsMs``).
+One streaming pass groups them into connections and reports, overall and
+per host:
+
+- new connections and requests per connection;
+- time spent in TCP and TLS setup (each connection counted once);
+- requests that paid a fresh handshake: the first request (earliest
+  ``startedDateTime``) on each connection. Its opening time cannot decide
+  this, because mitmproxy's default eager connection strategy opens HTTPS
+  connections at CONNECT, before the first request starts;
+- protocol mix (HTTP/1.x vs h2/h3, TLS versions).
+
+A connection belongs to the host of the first request sent on it; requests
+to other hosts on the same connection are coalesced (HTTP/2 connection
+reuse across hosts sharing a certificate and IP). Findings flag:
+
+- ``no-keepalive``: at least ``FRESH_RATIO`` of a host's requests paid a
+  fresh handshake;
+- ``many-connections``: a host opened more than ``HTTP1_CONNECTIONS``
+  HTTP/1.x connections (more than a browser's per-host pool, or no reuse);
+- ``no-coalescing``: hosts on one IP that each opened their own HTTP/2
+  connections, which a shared certificate would let the client coalesce.
+
+Hosts with fewer than ``MIN_REQUESTS`` requests are not flagged. Indexes
+written before connection metadata was recorded have no ``serverConnId``;
+re-run ``flow_report.py`` on the flow file to add it.
+"""
+
+import heapq
+import json
+import os
+import sys
+from collections import Counter
+from datetime import datetime, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+from index_columns import iter_rows
+from timeline import parse_time_us, write_text
+
+# Index fields the report reads
+CONNECTION_FIELDS = (
+    "id", "host", "startedDateTime", "durationMs", "httpVersion", "serverConnId", "serverIp",
+    "tlsVersion", "alpn", "connOpenedDateTime", "connTcpMs", "connTlsMs",
+)
+
+MIN_REQUESTS = 5
+FRESH_RATIO = 0.5
+HTTP1_CONNECTIONS = 6
+TOP_N = 20
+
+
+def protocol_of(row):
+    """h2/h3 from ALPN or the HTTP version, else http/1.x."""
+    alpn = row.get("alpn") or ""
+    version = (row.get("httpVersion") or "").upper()
+    if alpn == "h2" or version.startswith("HTTP/2"):
+        return "h2"
+    if alpn.startswith("h3") or version.startswith("HTTP/3"):
+        return "h3"
+    return "http/1.x"
+
+
+def is_multiplexed(protocol):
+    return protocol in ("h2", "h3")
+
+
+class HostStats:
+    __slots__ = ("requests", "connected", "fresh", "fresh_setup_ms", "fresh_duration_ms",
+                 "connections", "tcp_ms", "tls_ms", "protocols", "coalesced", "ips")
+
+    def __init__(self):
+        self.requests = 0
+        self.connected = 0  # requests sent on a known upstream connection
+        self.fresh = 0
+        self.fresh_setup_ms = 0
+        self.fresh_duration_ms = 0
+        self.connections = 0  # connections opened for this host
+        self.tcp_ms = 0
+        self.tls_ms = 0
+        self.protocols = Counter()  # connections by protocol
+        self.coalesced = 0  # requests sent on another host's connection
+        self.ips = set()
+
+
+class ConnStats:
+    __slots__ = ("hosts", "tcp_ms", "tls_ms", "protocol", "ip", "first_key", "first_host", "first_duration")
+
+    def __init__(self, row):
+        self.hosts = Counter()  # requests per host
+        self.tcp_ms = row.get("connTcpMs") or 0
+        self.tls_ms = row.get("connTlsMs") or 0
+        self.protocol = protocol_of(row)
+        self.ip = row.get("serverIp")
+        self.first_key = None  # (untimed, startedDateTime us) of the first request
+        self.first_host = None
+        self.first_duration = None
+
+    @property
+    def requests(self):
+        return sum(self.hosts.values())
+
+    @property
+    def setup_ms(self):
+        return self.tcp_ms + self.tls_ms
+
+
+class ConnectionReport:
+    """Per-connection and per-host accumulators, fed one index row at a time."""
+
+    def __init__(self):
+        self.rows = 0
+        self.hosts = {}
+        # serverConnId -> ConnStats
+        self.connections = {}
+        self.tls_versions = Counter()
+        self.protocols = Counter()
+        self.fresh = 0
+        self.fresh_setup_ms = 0
+        self.tcp_ms = 0
+        self.tls_ms = 0
+        # serverIp -> {host: multiplexed connections}
+        self.ip_hosts = {}
+
+    def host(self, name):
+        stats = self.hosts.get(name)
+        if stats is None:
+            stats = self.hosts[name] = HostStats()
+        return stats
+
+    def add(self, row):
+        self.rows += 1
+        host = row.get("host") or ""
+        stats = self.host(host)
+        stats.requests += 1
+        conn_id = row.get("serverConnId")
+        if not conn_id:
+            return
+        stats.connected += 1
+
+        conn = self.connections.get(conn_id)
+        if conn is None:
+            conn = self.connections[conn_id] = ConnStats(row)
+            self.tls_versions[row.get("tlsVersion") or "none"] += 1
+        conn.hosts[host] += 1
+        # Index rows follow flow-file order, not start order
+        started = parse_time_us(row.get("startedDateTime"))
+        key = (started is None, started or 0)
+        if conn.first_key is None or key < conn.first_key:
+            conn.first_key = key
+            conn.first_host = host
+            conn.first_duration = row.get("durationMs")
+
+    def assign_connections(self):
+        """Credit each connection, its setup and its handshake to the host of its first request."""
+        self.protocols = Counter()
+        self.ip_hosts = {}
+        self.fresh = self.fresh_setup_ms = self.tcp_ms = self.tls_ms = 0
+        for stats in self.hosts.values():
+            stats.fresh = stats.fresh_setup_ms = stats.fresh_duration_ms = 0
+            stats.connections = stats.tcp_ms = stats.tls_ms = stats.coalesced = 0
+            stats.protocols = Counter()
+            stats.ips = set()
+
+        for conn in self.connections.values():
+            host = conn.first_host
+            stats = self.hosts[host]
+            stats.connections += 1
+            stats.tcp_ms += conn.tcp_ms
+            stats.tls_ms += conn.tls_ms
+            stats.protocols[conn.protocol] += 1
+            self.tcp_ms += conn.tcp_ms
+            self.tls_ms += conn.tls_ms
+            self.protocols[conn.protocol] += 1
+            if conn.ip:
+                stats.ips.add(conn.ip)
+                if is_multiplexed(conn.protocol):
+                    self.ip_hosts.setdefault(conn.ip, Counter())[host] += 1
+            for other, count in conn.hosts.items():
+                if other != host:
+                    self.hosts[other].coalesced += count
+
+            # The first request on the connection waited for its setup
+            stats.fresh += 1
+            stats.fresh_setup_ms += conn.setup_ms
+            if isinstance(conn.first_duration, (int, float)):
+                stats.fresh_duration_ms += conn.first_duration
+            self.fresh += 1
+            self.fresh_setup_ms += conn.setup_ms
+
+    def add_many(self, rows):
+        for row in rows:
+            self.add(row)
+
+    def findings(self, min_requests=MIN_REQUESTS):
+        found = []
+        for name, stats in self.hosts.items():
+            if stats.connected < min_requests:
+                continue
+            fresh_ratio = stats.fresh / stats.connected
+            if fresh_ratio >= FRESH_RATIO:
+                found.append({
+                    "kind": "no-keepalive", "host": name,
+                    "message": f"{stats.fresh} of {stats.connected} requests paid a fresh handshake "
+                               f"({stats.fresh_setup_ms} ms of setup): connections are not kept alive",
+                })
+            http1 = stats.protocols.get("http/1.x", 0)
+            if http1 > HTTP1_CONNECTIONS:
+                found.append({
+                    "kind": "many-connections", "host": name,
+                    "message": f"{http1} HTTP/1.x connections for {stats.requests} requests: "
+                               "reuse connections or serve the host over HTTP/2",
+                })
+        for ip, per_host in self.ip_hosts.items():
+            hosts = sorted(h for h in per_host if self.hosts[h].connected >= min_requests)
+            if len(hosts) >= 2:
+                found.append({
+                    "kind": "no-coalescing", "host": ", ".join(hosts),
+                    "message": f"{len(hosts)} hosts on {ip} opened {sum(per_host[h] for h in hosts)} "
+                               "separate HTTP/2 connections: a certificate covering all of them "
+                               "lets clients coalesce onto one connection",
+                })
+        order = {"no-keepalive": 0, "many-connections": 1, "no-coalescing": 2}
+        found.sort(key=lambda item: (order[item["kind"]], item["host"]))
+        return found
+
+    def result(self, min_requests=MIN_REQUESTS):
+        self.assign_connections()
+        connected = sum(stats.connected for stats in self.hosts.values())
+        connections = len(self.connections)
+        busiest = heapq.nlargest(TOP_N, self.connections.items(), key=lambda kv: (kv[1].requests, kv[0]))
+        costliest = heapq.nlargest(TOP_N, self.connections.items(), key=lambda kv: (kv[1].setup_ms, kv[0]))
+
+        def conn_item(conn_id, conn):
+            return {"serverConnId": conn_id, "host": conn.first_host, "requests": conn.requests,
+                    "setupMs": conn.setup_ms, "protocol": conn.protocol,
+                    "otherHosts": sorted(host for host in conn.hosts if host != conn.first_host)}
+
+        def host_item(name, stats):
+            return {
+                "host": name,
+                "requests": stats.requests,
+                "connections": stats.connections,
+                "requestsPerConnection": round(stats.connected / stats.connections, 2) if stats.connections else None,
+                "freshHandshakes": stats.fresh,
+                "freshRatio": round(stats.fresh / stats.connected, 3) if stats.connected else None,
+                "tcpMs": stats.tcp_ms,
+                "tlsMs": stats.tls_ms,
+                "setupMsPaid": stats.fresh_setup_ms,
+                "setupShareOfFreshLatency": (round(stats.fresh_setup_ms / stats.fresh_duration_ms, 3)
+                                             if stats.fresh_duration_ms else None),
+                "protocols": dict(sorted(stats.protocols.items())),
+                "coalescedRequests": stats.coalesced,
+                "serverIps": sorted(stats.ips),
+            }
+
+        return {
+            "summary": {
+                "requests": self.rows,
+                "withConnection": connected,
+                "withoutConnection": self.rows - connected,
+                "connections": connections,
+                "requestsPerConnection": round(connected / connections, 2) if connections else None,
+                "freshHandshakes": self.fresh,
+                "freshRatio": round(self.fresh / connected, 3) if connected else None,
+                "tcpMs": self.tcp_ms,
+                "tlsMs": self.tls_ms,
+                "setupMsPaid": self.fresh_setup_ms,
+                "coalescedConnections": sum(1 for conn in self.connections.values() if len(conn.hosts) > 1),
+                "protocols": dict(sorted(self.protocols.items())),
+                "tlsVersions": dict(sorted(self.tls_versions.items())),
+            },
+            "hosts": sorted((host_item(name, stats) for name, stats in self.hosts.items()),
+                            key=lambda item: (-item["requests"], item["host"])),
+            "findings": self.findings(min_requests),
+            "busiestConnections": [conn_item(*kv) for kv in busiest],
+            "costliestHandshakes": [conn_item(*kv) for kv in costliest if kv[1].setup_ms > 0],
+        }
+
+
+def build_connections(index_file, min_requests=MIN_REQUESTS):
+    report = ConnectionReport()
+    report.add_many(iter_rows(index_file, CONNECTION_FIELDS))
+    return report.result(min_requests)
+
+
+def render_connections_json(result, index_file):
+    return {
+        "schemaVersion": "1",
+        "generatedAt": datetime.now(timezone.utc).isoformat(),
+        "index": index_file,
+        **result,
+    }
+
+
+def percent(ratio):
+    return "-" if ratio is None else f"{ratio * 100:.1f}%"
+
+
+def render_connections_markdown(result, index_file):
+    s = result["summary"]
+    lines = [
+        "# Connection Reuse",
+        "",
+        f"- Index: `{index_file}`",
+        f"- Requests: {s['requests']} ({s['withoutConnection']} without an upstream connection)",
+        f"- Connections: {s['connections']}, {s['requestsPerConnection'] or '-'} requests per connection, "
+        f"{s['coalescedConnections']} shared across hosts",
+        f"- Fresh handshakes: {s['freshHandshakes']} requests ({percent(s['freshRatio'])}), "
+        f"{s['setupMsPaid']} ms of setup on their critical path",
+        f"- Setup time: TCP {s['tcpMs']} ms, TLS {s['tlsMs']} ms",
+        "- Protocols: " + (", ".join(f"{k} {v}" for k, v in s["protocols"].items()) or "-")
+        + "; TLS: " + (", ".join(f"{k} {v}" for k, v in s["tlsVersions"].items()) or "-"),
+        "",
+    ]
+    if s["requests"] and not s["withConnection"]:
+        lines += ["No connection metadata in this index (captured before it was recorded); "
+                  "re-run `flow_report.py` on the flow file to add it.", ""]
+
+    if result["findings"]:
+        lines += ["## Findings", ""]
+        lines += [f"- **{f['kind']}** `{f['host']}`: {f['message']}" for f in result["findings"]]
+        lines.append("")
+
+    lines += ["## Hosts", "",
+              "| Host | Requests | Connections | Req/conn | Fresh | TCP ms | TLS ms | Protocols | Coalesced |",
+              "| --- | --- | --- | --- | --- | --- | --- | --- | --- |"]
+    for h in result["hosts"][:TOP_N]:
+        protocols = ", ".join(f"{k} {v}" for k, v in h["protocols"].items()) or "-"
+        lines.append(f"| `{h['host']}` | {h['requests']} | {h['connections']} | {h['requestsPerConnection'] or '-'} "
+                     f"| {h['freshHandshakes']} ({percent(h['freshRatio'])}) | {h['tcpMs']} | {h['tlsMs']} "
+                     f"| {protocols} | {h['coalescedRequests']} |")
+    lines.append("")
+
+    if result["costliestHandshakes"]:
+        lines += ["## Costliest Handshakes", "", "| Host | Setup ms | Requests | Protocol |",
+                  "| --- | --- | --- | --- |"]
+        for c in result["costliestHandshakes"][:10]:
+            lines.append(f"| `{c['host']}` | {c['setupMs']} | {c['requests']} | {c['protocol']} |")
+        lines.append("")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    """CLI interface: connection reuse report of an index file."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Connection reuse and handshake cost of a capture index")
+    parser.add_argument("index_file", help="capture_<RUN_ID>.index.ndjson")
+    parser.add_argument("--json", dest="json_out", help="Write the JSON report here")
+    parser.add_argument("--md", dest="md_out", help="Write the Markdown report here")
+    parser.add_argument("--stdout", action="store_true", help="Print the Markdown report (default without --json/--md)")
+    parser.add_argument("--min-requests", type=int, default=MIN_REQUESTS,
+                        help=f"Requests a host needs before it is flagged (default {MIN_REQUESTS})")
+    args = parser.parse_args(argv)
+
+    if not os.path.isfile(args.index_file):
+        print(f"Error: index file not found: {args.index_file}", file=sys.stderr)
+        return 1
+
+    result = build_connections(args.index_file, max(args.min_requests, 1))
+    if args.json_out:
+        write_text(args.json_out, json.dumps(render_connections_json(result, args.index_file), indent=2,
+                                              ensure_ascii=False))
+        print(f"JSON connections: {args.json_out}", file=sys.stderr)
+    md_text = render_connections_markdown(result, args.index_file)
+    if args.md_out:
+        write_text(args.md_out, md_text)
+        print(f"Markdown connections: {args.md_out}", file=sys.stderr)
+    if args.stdout or not (args.json_out or args.md_out):
+        print(md_text)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -3,28 +3,68 @@
 
 Reads two index.ndjson files (baseline and current), aggregates by endpoint,
 and outputs added/removed endpoints, status code changes, and latency shifts.
+Endpoints are compared by template (endpoint_templates.py), learned from both
+captures together, so ``/users/41`` and ``/users/42`` are one endpoint.
+
+A latency shift is only flagged as a regression or improvement when both
+captures have at least ``MIN_SAMPLES`` timed requests for the endpoint, the
+Mann-Whitney U test on their latency sketches is significant at ``ALPHA``,
+Cliff's delta is at least ``MIN_EFFECT_SIZE`` and the mean moved by more than
+the latency threshold. Each changed endpoint reports the test result.
+
+``diff_captures.py trend <index|glob>...`` aggregates many captures once
+each, in RUN_ID order, into per-endpoint count/avg/p95/error-ratio series
+and reports change points: the split of the runs where latency (the same
+rank test on the merged sketches of each side) or the error ratio
+(two-proportion z-test) shifts most, when it passes the same gates. The
+best of n-1 splits is picked, so its p-value is Bonferroni-adjusted
+(multiplied by n-1) before it is compared with alpha.
+
+Per-index aggregates are cached in ``<index>.agg.json`` (agg_cache.py), so a
+fixed baseline or an old nightly run is not parsed again.
 """
 
+import glob
 import json
+import math
+import re
 import sys
 import os
 from collections import Counter, defaultdict
 from datetime import datetime, timezone
+from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).parent))
+from agg_cache import cached_aggregate
+from endpoint_templates import load_templater
+from index_arrays import endpoint_groups, first_seen_counts, load_arrays
+from index_columns import INT_NULL, iter_ndjson, iter_rows, open_columns
+from quantiles import LatencySketch, effect_label, grouped_sketches, mann_whitney, merge_sketches
+from segments import SEGMENT_FILE_RE
 
-def load_index(path):
-    """Load an index.ndjson file into a list of dicts (capped at 100000 entries)."""
-    MAX_ENTRIES = 100000
-    entries = []
-    with open(path, "r", encoding="utf-8") as f:
-        for line in f:
-            text = line.strip()
-            if not text:
-                continue
-            entries.append(json.loads(text))
-            if len(entries) >= MAX_ENTRIES:
-                break
-    return entries
+# Index fields read by aggregate_endpoints
+DIFF_FIELDS = ("method", "host", "path", "status", "statusBucket", "durationMs")
+
+# Latency change detection defaults (see compute_diff)
+LATENCY_THRESHOLD = 0.20
+MIN_SAMPLES = 10
+ALPHA = 0.01
+MIN_EFFECT_SIZE = 0.147  # Cliff's delta below this is negligible
+MIN_ERROR_EFFECT = 0.2  # Cohen's h below this is negligible
+
+# Trend mode: RUN_ID timestamps order the runs; Markdown lists the busiest series
+RUN_ID_TIME_RE = re.compile(r"^(\d{8}_\d{6})(?:_|$)")
+TREND_MD_ENDPOINTS = 30
+
+
+def load_index(path, fields=None):
+    """Load an index file into a sequence of dicts (see index_columns.iter_rows to stream).
+
+    With a current .index.col sidecar the IndexColumns view is returned
+    as-is; its rows are decoded on access.
+    """
+    columns = open_columns(path, fields)
+    return columns if columns is not None else list(iter_ndjson(path))
 
 
 def endpoint_key(entry):
@@ -35,67 +75,158 @@ def endpoint_key(entry):
     return f"{method} {host}{path}"
 
 
-def aggregate_endpoints(entries):
+def aggregate_endpoints(entries, templater=None):
     """Aggregate entries by endpoint key.
 
+    With an endpoint_templates.EndpointTemplater, keys use the normalized
+    path; see collapse_endpoints for the learned templates.
+
     Returns dict: endpoint_key -> {
-        count, methods, hosts, statuses, durations,
-        avg_ms, p95_ms, status_buckets, error_count
+        count, avg_ms, p50_ms, p95_ms, p99_ms, error_count, status_buckets,
+        latency (a mergeable quantiles.LatencySketch)
     }
     """
     groups = defaultdict(lambda: {
         "count": 0,
-        "durations": [],
-        "statuses": [],
+        "latency": LatencySketch(),
         "status_buckets": Counter(),
     })
 
     for entry in entries:
-        key = endpoint_key(entry)
+        if templater is None:
+            key = endpoint_key(entry)
+        else:
+            key = templater.endpoint_key(entry.get("method") or "", entry.get("host") or "",
+                                         entry.get("path") or "")
         g = groups[key]
         g["count"] += 1
 
         duration = entry.get("durationMs")
         if isinstance(duration, (int, float)):
-            g["durations"].append(duration)
-
-        status = entry.get("status")
-        if status is not None:
-            g["statuses"].append(status)
+            g["latency"].add(duration)
 
         bucket = entry.get("statusBucket") or "unknown"
         g["status_buckets"][bucket] += 1
 
-    result = {}
-    for key, g in groups.items():
-        durations = g["durations"]
-        avg_ms = int(sum(durations) / len(durations)) if durations else 0
-        p95_ms = 0
-        if durations:
-            sorted_d = sorted(durations)
-            p95_idx = int((len(sorted_d) - 1) * 0.95)
-            p95_ms = sorted_d[p95_idx]
-
-        error_count = g["status_buckets"].get("4xx", 0) + g["status_buckets"].get("5xx", 0)
-
-        result[key] = {
-            "count": g["count"],
-            "avg_ms": avg_ms,
-            "p95_ms": p95_ms,
-            "error_count": error_count,
-            "status_buckets": dict(g["status_buckets"]),
-        }
+    return {key: endpoint_summary(g["count"], g["latency"], dict(g["status_buckets"]))
+            for key, g in groups.items()}
+
+
+def endpoint_summary(count, latency, status_buckets):
+    """The per-endpoint dict of aggregate_endpoints."""
+    p50_ms, p95_ms, p99_ms = latency.quantiles((0.5, 0.95, 0.99))
+    return {
+        "count": count,
+        "avg_ms": latency.mean(),
+        "p50_ms": p50_ms,
+        "p95_ms": p95_ms,
+        "p99_ms": p99_ms,
+        "error_count": status_buckets.get("4xx", 0) + status_buckets.get("5xx", 0),
+        "status_buckets": status_buckets,
+        "latency": latency,
+    }
+
+
+def aggregate_arrays(arrays, templater=None):
+    """aggregate_endpoints over an index_arrays.IndexArrays, vectorized."""
+    np = arrays.np
+    ep_ids, ep_keys = endpoint_groups(arrays, templater.normalize if templater is not None else None)
+    counts = np.bincount(ep_ids, minlength=len(ep_keys)).tolist()
+
+    duration = arrays.array("durationMs")
+    timed = duration != INT_NULL
+    sketches = grouped_sketches(np, ep_ids[timed], duration[timed], len(ep_keys))
 
+    bucket, bucket_labels = arrays.labels("statusBucket", "unknown")
+    status_buckets = [{} for _ in ep_keys]
+    for pair, count in first_seen_counts(np, ep_ids * len(bucket_labels) + bucket):
+        group, code = divmod(pair, len(bucket_labels))
+        status_buckets[group][bucket_labels[code]] = count
+
+    return {key: endpoint_summary(count, sketch, buckets)
+            for key, count, sketch, buckets in zip(ep_keys, counts, sketches, status_buckets)}
+
+
+def aggregate_index(path, templater=None):
+    """aggregate_endpoints for an index file, vectorized when NumPy is available."""
+    arrays = load_arrays(path, DIFF_FIELDS)
+    if arrays is None:
+        return aggregate_endpoints(iter_rows(path, DIFF_FIELDS), templater)
+    try:
+        return aggregate_arrays(arrays, templater)
+    finally:
+        arrays.close()
+
+
+def encode_aggregate(agg):
+    """aggregate_endpoints output as JSON (sketches serialized)."""
+    return {key: {"count": e["count"], "status_buckets": e["status_buckets"], "latency": e["latency"].to_dict()}
+            for key, e in agg.items()}
+
+
+def decode_aggregate(payload):
+    return {key: endpoint_summary(e["count"], LatencySketch.from_dict(e["latency"]), e["status_buckets"])
+            for key, e in payload.items()}
+
+
+def cached_aggregate_index(path, templater=None):
+    """aggregate_index, reusing the index's .agg.json cache (agg_cache.py)."""
+    return cached_aggregate(path, "diff", templater, lambda: aggregate_index(path, templater),
+                            encode_aggregate, decode_aggregate)
+
+
+def collapse_endpoints(templater, *aggregates):
+    """Re-key aggregates by the templates learned from all of them together.
+
+    Learning from every capture at once keeps the keys comparable: an ID
+    segment that is high-cardinality in only one capture still collapses in
+    both. Returns a list with one merged aggregate per argument.
+    """
+    templater.learn(key for agg in aggregates for key in agg)
+    result = []
+    for agg in aggregates:
+        merged = {}
+        for key, parts in templater.group(agg).items():
+            if len(parts) == 1:
+                merged[key] = parts[0]
+                continue
+            status_buckets = Counter()
+            for part in parts:
+                status_buckets.update(part["status_buckets"])
+            merged[key] = endpoint_summary(sum(part["count"] for part in parts),
+                                           merge_sketches(part["latency"] for part in parts),
+                                           dict(status_buckets))
+        result.append(merged)
     return result
 
 
-def compute_diff(baseline_agg, current_agg, latency_threshold=0.20):
+def latency_test(baseline, current, min_samples=MIN_SAMPLES):
+    """Mann-Whitney U result for two endpoint summaries, with sample sufficiency."""
+    b_sketch, c_sketch = baseline["latency"], current["latency"]
+    result = {
+        "method": "mann-whitney-u",
+        "samples": [b_sketch.count, c_sketch.count],
+        "sufficient": min(b_sketch.count, c_sketch.count) >= max(min_samples, 1),
+    }
+    test = mann_whitney(b_sketch, c_sketch)
+    if test is not None:
+        result.update(test)
+        result["effect"] = effect_label(test["effect_size"])
+    return result
+
+
+def compute_diff(baseline_agg, current_agg, latency_threshold=LATENCY_THRESHOLD,
+                 min_samples=MIN_SAMPLES, alpha=ALPHA, min_effect=MIN_EFFECT_SIZE):
     """Compute the diff between two aggregated endpoint dictionaries.
 
     Args:
         baseline_agg: aggregated endpoints from the baseline capture
         current_agg: aggregated endpoints from the current capture
-        latency_threshold: fractional change to flag (default 20%)
+        latency_threshold: fractional change of the mean to flag (default 20%)
+        min_samples: timed requests each capture needs before a latency
+            shift can be flagged
+        alpha: significance level of the Mann-Whitney U test
+        min_effect: smallest |Cliff's delta| that is flagged
 
     Returns a dict with:
         added, removed, changed, unchanged counts and details.
@@ -137,15 +268,19 @@ def compute_diff(baseline_agg, current_agg, latency_threshold=0.20):
         # Detect status bucket changes
         status_changed = b["status_buckets"] != c["status_buckets"]
 
-        # Detect latency regression/improvement
+        # Detect latency regression/improvement: large enough, in enough
+        # samples, and unlikely to be noise
         latency_flag = ""
         latency_delta_pct = 0.0
+        test = latency_test(b, c, min_samples)
         if b["avg_ms"] > 0:
             latency_delta_pct = (c["avg_ms"] - b["avg_ms"]) / b["avg_ms"]
-            if latency_delta_pct > latency_threshold:
-                latency_flag = "regression"
-            elif latency_delta_pct < -latency_threshold:
-                latency_flag = "improvement"
+        significant = (test["sufficient"] and test.get("p_value", 1.0) < alpha
+                       and abs(test.get("effect_size", 0.0)) >= min_effect)
+        if significant and latency_delta_pct > latency_threshold and test["effect_size"] > 0:
+            latency_flag = "regression"
+        elif significant and latency_delta_pct < -latency_threshold and test["effect_size"] < 0:
+            latency_flag = "improvement"
 
         # Detect error count changes
         error_delta = c["error_count"] - b["error_count"]
@@ -161,23 +296,30 @@ def compute_diff(baseline_agg, current_agg, latency_threshold=0.20):
                 "baseline": {
                     "count": b["count"],
                     "avg_ms": b["avg_ms"],
+                    "p50_ms": b["p50_ms"],
                     "p95_ms": b["p95_ms"],
+                    "p99_ms": b["p99_ms"],
                     "error_count": b["error_count"],
                     "status_buckets": b["status_buckets"],
                 },
                 "current": {
                     "count": c["count"],
                     "avg_ms": c["avg_ms"],
+                    "p50_ms": c["p50_ms"],
                     "p95_ms": c["p95_ms"],
+                    "p99_ms": c["p99_ms"],
                     "error_count": c["error_count"],
                     "status_buckets": c["status_buckets"],
                 },
                 "deltas": {
                     "count": count_delta,
                     "avg_ms": c["avg_ms"] - b["avg_ms"],
+                    "p50_ms": c["p50_ms"] - b["p50_ms"],
+                    "p95_ms": c["p95_ms"] - b["p95_ms"],
                     "error_count": error_delta,
                     "latency_pct": round(latency_delta_pct * 100, 1),
                 },
+                "latency_test": test,
                 "flags": [],
             }
             if latency_flag:
@@ -210,6 +352,13 @@ def compute_diff(baseline_agg, current_agg, latency_threshold=0.20):
             "removed": len(removed),
             "changed": len(changed),
             "unchanged": unchanged_count,
+            "regressions": sum("regression" in c["flags"] for c in changed),
+        },
+        "criteria": {
+            "latency_threshold": latency_threshold,
+            "min_samples": min_samples,
+            "alpha": alpha,
+            "min_effect": min_effect,
         },
     }
 
@@ -222,6 +371,7 @@ def render_diff_json(diff_result, baseline_path, current_path):
         "baseline": baseline_path,
         "current": current_path,
         "summary": diff_result["summary"],
+        "criteria": diff_result["criteria"],
         "added": diff_result["added"],
         "removed": diff_result["removed"],
         "changed": diff_result["changed"],
@@ -249,6 +399,13 @@ def render_diff_markdown(diff_result, baseline_path, current_path):
     lines.append(f"| Removed | {s['removed']} |")
     lines.append(f"| Changed | {s['changed']} |")
     lines.append(f"| Unchanged | {s['unchanged']} |")
+    lines.append(f"| Latency regressions | {s['regressions']} |")
+    lines.append("")
+    criteria = diff_result["criteria"]
+    lines.append(f"Latency shifts are flagged when the mean moves more than "
+                 f"{criteria['latency_threshold'] * 100:g}% with at least {criteria['min_samples']} samples "
+                 f"on each side, Mann-Whitney p < {criteria['alpha']:g} and |Cliff's delta| ≥ "
+                 f"{criteria['min_effect']:g}.")
     lines.append("")
 
     if diff_result["added"]:
@@ -274,8 +431,8 @@ def render_diff_markdown(diff_result, baseline_path, current_path):
     if diff_result["changed"]:
         lines.append("## Changed Endpoints")
         lines.append("")
-        lines.append("| Endpoint | Flags | Avg ms (B→C) | Latency Δ% | Errors (B→C) |")
-        lines.append("| --- | --- | --- | --- | --- |")
+        lines.append("| Endpoint | Flags | Avg ms (B→C) | p95 ms (B→C) | Latency Δ% | p-value | Effect | Errors (B→C) |")
+        lines.append("| --- | --- | --- | --- | --- | --- | --- | --- |")
         for item in diff_result["changed"]:
             flags = ", ".join(item["flags"]) if item["flags"] else "-"
             b_avg = item["baseline"]["avg_ms"]
@@ -291,7 +448,17 @@ def render_diff_markdown(diff_result, baseline_path, current_path):
             elif "improvement" in item["flags"]:
                 pct_str = f"**{pct_str}** ✓"
 
-            lines.append(f"| `{item['endpoint']}` | {flags} | {b_avg}→{c_avg} | {pct_str} | {b_err}→{c_err} |")
+            test = item["latency_test"]
+            if not test["sufficient"]:
+                p_str, effect_str = f"n<{diff_result['criteria']['min_samples']}", "-"
+            else:
+                p_str = f"{test['p_value']:.3g}"
+                effect_str = f"{test['effect_size']:+.2f} ({test['effect']})"
+            b_p95 = item["baseline"]["p95_ms"]
+            c_p95 = item["current"]["p95_ms"]
+
+            lines.append(f"| `{item['endpoint']}` | {flags} | {b_avg}→{c_avg} | {b_p95}→{c_p95} | {pct_str} "
+                         f"| {p_str} | {effect_str} | {b_err}→{c_err} |")
         lines.append("")
 
     if not diff_result["added"] and not diff_result["removed"] and not diff_result["changed"]:
@@ -301,9 +468,396 @@ def render_diff_markdown(diff_result, baseline_path, current_path):
     return "\n".join(lines)
 
 
+# ── Trend mode: many captures as a time series ────────────────────────
+
+
+def expand_index_paths(patterns):
+    """Index files named or matched by patterns, one entry per real file.
+
+    Glob matches are limited to .ndjson files and skip latest.* symlinks and
+    per-segment indexes (capture_<RUN_ID>.0001.index.ndjson) of rotated
+    captures, whose rows are already in the session index.
+    """
+    paths = []
+    seen = set()
+    for pattern in patterns:
+        if glob.has_magic(pattern):
+            matches = [path for path in sorted(glob.glob(pattern))
+                       if path.endswith(".ndjson") and not os.path.islink(path)
+                       and not SEGMENT_FILE_RE.match(os.path.basename(path))]
+        else:
+            matches = [pattern]
+        for path in matches:
+            real = os.path.realpath(path)
+            if real not in seen:
+                seen.add(real)
+                paths.append(path)
+    return paths
+
+
+def run_label(path):
+    """capture_<RUN_ID>.index.ndjson -> <RUN_ID>; other files keep their name."""
+    name = os.path.basename(path)
+    for suffix in (".index.ndjson", ".ndjson"):
+        if name.endswith(suffix):
+            name = name[:-len(suffix)]
+            break
+    return name[len("capture_"):] if name.startswith("capture_") else name
+
+
+def run_order_key(path):
+    """Chronological key: the RUN_ID timestamp, else the file mtime."""
+    match = RUN_ID_TIME_RE.match(run_label(path))
+    if match:
+        return datetime.strptime(match.group(1), "%Y%m%d_%H%M%S").timestamp()
+    return os.path.getmtime(path)
+
+
+def subtract_sketch(total, part):
+    """Bucket counts of total minus part (count and buckets only, for mann_whitney)."""
+    rest = LatencySketch()
+    for index, count in total.buckets.items():
+        remaining = count - part.buckets.get(index, 0)
+        if remaining:
+            rest.buckets[index] = remaining
+    rest.count = total.count - part.count
+    rest.sum = total.sum - part.sum
+    return rest
+
+
+def bonferroni(p_value, tests):
+    """p_value adjusted for picking the best of `tests` comparisons."""
+    return float(f"{min(1.0, p_value * max(tests, 1)):.4g}")
+
+
+def latency_change_point(sketches, latency_threshold=LATENCY_THRESHOLD, min_samples=MIN_SAMPLES,
+                         alpha=ALPHA, min_effect=MIN_EFFECT_SIZE):
+    """Strongest shift in a latency series, or None.
+
+    Every split of the runs into before/after is tested with the
+    Mann-Whitney U test on the merged sketches of each side; the split with
+    the largest |z| is reported when it passes the same gates as
+    compute_diff. Its p-value is Bonferroni-adjusted for the number of
+    splits tried. Returns {"index": first run after the change, ...}.
+    """
+    total = merge_sketches(sketches)
+    before = LatencySketch()
+    best = None
+    for k in range(1, len(sketches)):
+        before.merge(sketches[k - 1])
+        after = subtract_sketch(total, before)
+        if min(before.count, after.count) < max(min_samples, 1):
+            continue
+        test = mann_whitney(before, after)
+        if best is None or abs(test["z"]) > abs(best[1]["z"]):
+            best = (k, test, before.sum / before.count, after.sum / after.count)
+    if best is None:
+        return None
+    k, test, before_avg, after_avg = best
+    p_value = bonferroni(test["p_value"], len(sketches) - 1)
+    shift = (after_avg - before_avg) / before_avg if before_avg > 0 else 0.0
+    if p_value >= alpha or abs(test["effect_size"]) < min_effect or abs(shift) <= latency_threshold:
+        return None
+    if (shift > 0) != (test["effect_size"] > 0):
+        return None
+    return {
+        "metric": "latency",
+        "index": k,
+        "direction": "regression" if shift > 0 else "improvement",
+        "before_avg_ms": int(before_avg),
+        "after_avg_ms": int(after_avg),
+        "latency_pct": round(shift * 100, 1),
+        "p_value": p_value,
+        "effect_size": test["effect_size"],
+        "effect": effect_label(test["effect_size"]),
+    }
+
+
+def error_change_point(counts, errors, min_samples=MIN_SAMPLES, alpha=ALPHA, min_effect=MIN_ERROR_EFFECT):
+    """Strongest shift in an error-ratio series (two-proportion z-test), or None.
+
+    The effect size is Cohen's h between the before and after ratios; the
+    p-value is Bonferroni-adjusted like latency_change_point.
+    """
+    total_count, total_errors = sum(counts), sum(errors)
+    before_count = before_errors = 0
+    best = None
+    for k in range(1, len(counts)):
+        before_count += counts[k - 1]
+        before_errors += errors[k - 1]
+        after_count = total_count - before_count
+        after_errors = total_errors - before_errors
+        if min(before_count, after_count) < max(min_samples, 1):
+            continue
+        pooled = total_errors / total_count
+        variance = pooled * (1 - pooled) * (1 / before_count + 1 / after_count)
+        p1, p2 = before_errors / before_count, after_errors / after_count
+        z = (p2 - p1) / math.sqrt(variance) if variance > 0 else 0.0
+        if best is None or abs(z) > abs(best[1]):
+            best = (k, z, p1, p2)
+    if best is None:
+        return None
+    k, z, p1, p2 = best
+    p_value = bonferroni(math.erfc(abs(z) / math.sqrt(2)), len(counts) - 1)
+    h = 2 * math.asin(math.sqrt(p2)) - 2 * math.asin(math.sqrt(p1))
+    if p_value >= alpha or abs(h) < min_effect:
+        return None
+    return {
+        "metric": "error_ratio",
+        "index": k,
+        "direction": "regression" if p2 > p1 else "improvement",
+        "before_ratio": round(p1, 4),
+        "after_ratio": round(p2, 4),
+        "p_value": float(f"{p_value:.4g}"),
+        "effect_size": round(h, 4),
+    }
+
+
+def compute_trend(run_aggs, latency_threshold=LATENCY_THRESHOLD, min_samples=MIN_SAMPLES,
+                  alpha=ALPHA, min_effect=MIN_EFFECT_SIZE):
+    """Per-endpoint series across runs (oldest first) and their change points.
+
+    run_aggs is a list of aggregate_endpoints results, one per run. Series
+    hold None for runs in which the endpoint did not appear.
+    """
+    keys = {}
+    for agg in run_aggs:
+        for key in agg:
+            keys.setdefault(key, None)
+
+    endpoints = []
+    empty = LatencySketch()
+    for key in keys:
+        parts = [agg.get(key) for agg in run_aggs]
+        counts = [p["count"] if p else 0 for p in parts]
+        errors = [p["error_count"] if p else 0 for p in parts]
+        series = {
+            "count": counts,
+            "avg_ms": [p["avg_ms"] if p else None for p in parts],
+            "p95_ms": [p["p95_ms"] if p else None for p in parts],
+            "error_ratio": [round(p["error_count"] / p["count"], 4) if p and p["count"] else None for p in parts],
+        }
+        change_points = [point for point in (
+            latency_change_point([p["latency"] if p else empty for p in parts],
+                                 latency_threshold, min_samples, alpha, min_effect),
+            error_change_point(counts, errors, min_samples, alpha),
+        ) if point is not None]
+        endpoints.append({
+            "endpoint": key,
+            "runs_seen": sum(1 for p in parts if p),
+            "total_count": sum(counts),
+            "series": series,
+            "change_points": change_points,
+        })
+
+    # Endpoints with regressions first, then by traffic
+    endpoints.sort(key=lambda e: (
+        not any(p["direction"] == "regression" for p in e["change_points"]),
+        not e["change_points"],
+        -e["total_count"],
+        e["endpoint"],
+    ))
+    points = [p for e in endpoints for p in e["change_points"]]
+    return {
+        "endpoints": endpoints,
+        "summary": {
+            "runs": len(run_aggs),
+            "endpoints": len(endpoints),
+            "change_points": len(points),
+            "regressions": sum(p["direction"] == "regression" for p in points),
+        },
+        "criteria": {
+            "latency_threshold": latency_threshold,
+            "min_samples": min_samples,
+            "alpha": alpha,
+            "min_effect": min_effect,
+            "min_error_effect": MIN_ERROR_EFFECT,
+        },
+    }
+
+
+def render_trend_json(trend_result, runs):
+    """Wrap trend_result in a full JSON report; runs is [{"run", "path"}]."""
+    return {
+        "schemaVersion": "1",
+        "generatedAt": datetime.now(timezone.utc).isoformat(),
+        "runs": runs,
+        "summary": trend_result["summary"],
+        "criteria": trend_result["criteria"],
+        "endpoints": trend_result["endpoints"],
+    }
+
+
+def render_trend_markdown(trend_result, runs, max_endpoints=TREND_MD_ENDPOINTS):
+    """Render trend_result as Markdown: runs, change points and the busiest series."""
+    lines = []
+    s = trend_result["summary"]
+    labels = [run["run"] for run in runs]
+
+    lines.append("# Capture Trend Report")
+    lines.append("")
+    lines.append(f"- Runs: {s['runs']} (`{labels[0]}` … `{labels[-1]}`)" if labels else "- Runs: 0")
+    lines.append(f"- Endpoints: {s['endpoints']}")
+    lines.append(f"- Change points: {s['change_points']} ({s['regressions']} regressions)")
+    lines.append(f"- Generated: `{datetime.now(timezone.utc).isoformat()}`")
+    lines.append("")
+
+    changed = [e for e in trend_result["endpoints"] if e["change_points"]]
+    if changed:
+        lines.append("## Change Points")
+        lines.append("")
+        lines.append("| Endpoint | Metric | From run | Before → After | p-value | Effect | Direction |")
+        lines.append("| --- | --- | --- | --- | --- | --- | --- |")
+        for e in changed:
+            for p in e["change_points"]:
+                if p["metric"] == "latency":
+                    values = f"{p['before_avg_ms']}→{p['after_avg_ms']} ms ({p['latency_pct']:+.1f}%)"
+                    effect = f"{p['effect_size']:+.2f} ({p['effect']})"
+                else:
+                    values = f"{p['before_ratio']:.1%}→{p['after_ratio']:.1%} errors"
+                    effect = f"h={p['effect_size']:+.2f}"
+                marker = " ⚠" if p["direction"] == "regression" else ""
+                lines.append(f"| `{e['endpoint']}` | {p['metric']} | `{labels[p['index']]}` | {values} "
+                             f"| {p['p_value']:.3g} | {effect} | {p['direction']}{marker} |")
+        lines.append("")
+    else:
+        lines.append("**No change points detected.**")
+        lines.append("")
+
+    def fmt(values, pattern):
+        return " · ".join("-" if v is None else pattern.format(v) for v in values)
+
+    lines.append("## Endpoint Series")
+    lines.append("")
+    lines.append("| Endpoint | Count | Avg ms | p95 ms | Error ratio |")
+    lines.append("| --- | --- | --- | --- | --- |")
+    for e in trend_result["endpoints"][:max_endpoints]:
+        series = e["series"]
+        lines.append(f"| `{e['endpoint']}` | {fmt(series['count'], '{}')} | {fmt(series['avg_ms'], '{}')} "
+                     f"| {fmt(series['p95_ms'], '{}')} | {fmt(series['error_ratio'], '{:.0%}')} |")
+    if len(trend_result["endpoints"]) > max_endpoints:
+        lines.append("")
+        lines.append(f"_{len(trend_result['endpoints']) - max_endpoints} more endpoints in the JSON report._")
+    lines.append("")
+    return "\n".join(lines)
+
+
+def trend_main(argv):
+    """diff_captures.py trend <index|glob>... [options]"""
+    usage = (f"Usage: {argv[0]} trend <index.ndjson|glob>... [--json <out.json>] [--md <out.md>] [--stdout] "
+             "[--policy <policy.json>] [--raw-endpoints] [--min-samples N] [--alpha P] [--fail-on-regression] [--no-cache]")
+    if len(argv) < 3 or "--help" in argv or "-h" in argv:
+        print(usage)
+        print()
+        print("Aggregates each capture index once, in RUN_ID order, and reports per-endpoint")
+        print("count / avg / p95 / error-ratio series with latency and error change points.")
+        print("Quote globs (e.g. 'captures/capture_*.index.ndjson') to let the script expand them.")
+        print("Aggregates are cached in <index>.agg.json; --no-cache recomputes them.")
+        return 0 if "--help" in argv or "-h" in argv else 1
+
+    patterns = []
+    json_out = md_out = policy_file = None
+    to_stdout = raw_endpoints = fail_on_regression = no_cache = False
+    min_samples, alpha = MIN_SAMPLES, ALPHA
+
+    i = 2
+    while i < len(argv):
+        arg = argv[i]
+        if arg in ("--json", "--md", "--policy", "--min-samples", "--alpha") and i + 1 >= len(argv):
+            print(f"Missing value for {arg}", file=sys.stderr)
+            return 1
+        if arg == "--json":
+            json_out = argv[i + 1]
+        elif arg == "--md":
+            md_out = argv[i + 1]
+        elif arg == "--policy":
+            policy_file = argv[i + 1]
+        elif arg in ("--min-samples", "--alpha"):
+            try:
+                if arg == "--min-samples":
+                    min_samples = int(argv[i + 1])
+                else:
+                    alpha = float(argv[i + 1])
+            except ValueError:
+                print(f"Invalid value for {arg}: {argv[i + 1]}", file=sys.stderr)
+                return 1
+            if min_samples < 1 or not 0 < alpha < 1:
+                print(f"Out of range value for {arg}: {argv[i + 1]}", file=sys.stderr)
+                return 1
+        elif arg == "--stdout":
+            to_stdout = True
+            i += 1
+            continue
+        elif arg == "--raw-endpoints":
+            raw_endpoints = True
+            i += 1
+            continue
+        elif arg == "--fail-on-regression":
+            fail_on_regression = True
+            i += 1
+            continue
+        elif arg == "--no-cache":
+            no_cache = True
+            i += 1
+            continue
+        elif arg.startswith("--"):
+            print(f"Unknown option: {arg}", file=sys.stderr)
+            return 1
+        else:
+            patterns.append(arg)
+            i += 1
+            continue
+        i += 2
+
+    if not json_out and not md_out:
+        to_stdout = True
+
+    paths = expand_index_paths(patterns)
+    for path in paths:
+        if not os.path.isfile(path):
+            print(f"[ERROR] File not found: {path}", file=sys.stderr)
+            return 1
+    if len(paths) < 2:
+        print(f"[ERROR] trend needs at least two index files, got {len(paths)}", file=sys.stderr)
+        return 1
+    paths.sort(key=run_order_key)
+
+    # One aggregation per file (or its cached result); only the per-endpoint sketches are kept
+    templater = None if raw_endpoints else load_templater(policy_file)
+    aggregate = aggregate_index if no_cache else cached_aggregate_index
+    run_aggs = [aggregate(path, templater) for path in paths]
+    if templater is not None:
+        run_aggs = collapse_endpoints(templater, *run_aggs)
+
+    trend_result = compute_trend(run_aggs, min_samples=min_samples, alpha=alpha)
+    runs = [{"run": run_label(path), "path": path,
+             "rows": sum(e["count"] for e in agg.values())} for path, agg in zip(paths, run_aggs)]
+
+    if json_out:
+        fd = os.open(json_out, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(render_trend_json(trend_result, runs), f, indent=2, ensure_ascii=False)
+        print(f"JSON trend report: {json_out}", file=sys.stderr)
+
+    md_text = render_trend_markdown(trend_result, runs)
+    if md_out:
+        fd = os.open(md_out, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(md_text)
+        print(f"Markdown trend report: {md_out}", file=sys.stderr)
+    if to_stdout:
+        print(md_text)
+
+    if fail_on_regression and trend_result["summary"]["regressions"]:
+        return 2
+    return 0
+
+
 def main(argv):
+    if len(argv) > 1 and argv[1] == "trend":
+        return trend_main(argv)
     if len(argv) < 3 or "--help" in argv or "-h" in argv:
-        print(f"Usage: {argv[0]} <baseline.index.ndjson> <current.index.ndjson> [--json <out.json>] [--md <out.md>] [--stdout]")
+        print(f"Usage: {argv[0]} <baseline.index.ndjson> <current.index.ndjson> [--json <out.json>] [--md <out.md>] [--stdout] [--policy <policy.json>] [--raw-endpoints] [--min-samples N] [--alpha P] [--fail-on-regression] [--no-cache]")
         print()
         print("Compares two capture index files and reports endpoint differences.")
         print()
@@ -311,6 +865,14 @@ def main(argv):
         print("  --json <path>   Write JSON diff report to file")
         print("  --md <path>     Write Markdown diff report to file")
         print("  --stdout        Print Markdown report to stdout (default if no output specified)")
+        print("  --policy <path> Policy JSON whose endpoints section adds templates")
+        print("  --raw-endpoints Compare raw paths instead of endpoint templates")
+        print(f"  --min-samples N Timed requests per capture needed to flag latency (default {MIN_SAMPLES})")
+        print(f"  --alpha P       Significance level of the Mann-Whitney U test (default {ALPHA})")
+        print("  --fail-on-regression  Exit with status 2 when a latency regression is flagged")
+        print("  --no-cache      Aggregate both indexes even if their .agg.json cache is current")
+        print()
+        print(f"       {argv[0]} trend <index.ndjson|glob>... [options]  (see trend --help)")
         return 0 if "--help" in argv or "-h" in argv else 1
 
     baseline_path = argv[1]
@@ -319,6 +881,12 @@ def main(argv):
     json_out = None
     md_out = None
     to_stdout = False
+    policy_file = None
+    raw_endpoints = False
+    min_samples = MIN_SAMPLES
+    alpha = ALPHA
+    fail_on_regression = False
+    no_cache = False
 
     i = 3
     while i < len(argv):
@@ -331,6 +899,31 @@ def main(argv):
         elif argv[i] == "--stdout":
             to_stdout = True
             i += 1
+        elif argv[i] == "--policy" and i + 1 < len(argv):
+            policy_file = argv[i + 1]
+            i += 2
+        elif argv[i] == "--raw-endpoints":
+            raw_endpoints = True
+            i += 1
+        elif argv[i] in ("--min-samples", "--alpha") and i + 1 < len(argv):
+            try:
+                if argv[i] == "--min-samples":
+                    min_samples = int(argv[i + 1])
+                else:
+                    alpha = float(argv[i + 1])
+            except ValueError:
+                print(f"Invalid value for {argv[i]}: {argv[i + 1]}", file=sys.stderr)
+                return 1
+            if min_samples < 1 or not 0 < alpha < 1:
+                print(f"Out of range value for {argv[i]}: {argv[i + 1]}", file=sys.stderr)
+                return 1
+            i += 2
+        elif argv[i] == "--fail-on-regression":
+            fail_on_regression = True
+            i += 1
+        elif argv[i] == "--no-cache":
+            no_cache = True
+            i += 1
         else:
             print(f"Unknown option: {argv[i]}", file=sys.stderr)
             return 1
@@ -346,13 +939,14 @@ def main(argv):
             return 1
 
     # Load and process
-    baseline_entries = load_index(baseline_path)
-    current_entries = load_index(current_path)
-
-    baseline_agg = aggregate_endpoints(baseline_entries)
-    current_agg = aggregate_endpoints(current_entries)
+    templater = None if raw_endpoints else load_templater(policy_file)
+    aggregate = aggregate_index if no_cache else cached_aggregate_index
+    baseline_agg = aggregate(baseline_path, templater)
+    current_agg = aggregate(current_path, templater)
+    if templater is not None:
+        baseline_agg, current_agg = collapse_endpoints(templater, baseline_agg, current_agg)
 
-    diff_result = compute_diff(baseline_agg, current_agg)
+    diff_result = compute_diff(baseline_agg, current_agg, min_samples=min_samples, alpha=alpha)
 
     # Output
     if json_out:
@@ -373,6 +967,8 @@ def main(argv):
     if to_stdout:
         print(md_text)
 
+    if fail_on_regression and diff_result["summary"]["regressions"]:
+        return 2
     return 0
 
 
@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+"""Endpoint templating: collapse raw request paths into route templates.
+
+Endpoint keys (``METHOD host+path``) used to carry the raw path, so every
+numeric ID, UUID or cache-busting query value made a new endpoint. An
+``EndpointTemplater`` normalizes paths in three stages:
+
+1. Policy templates: ``"endpoints": {"templates": ["/users/{name}/repos"]}``
+   in the policy file. A template matches paths with the same number of
+   segments whose literal segments are equal; ``{...}`` segments match any
+   value. The first matching template wins and the built-in rules are
+   skipped for that path.
+2. Built-in rules, per path segment and query value: UUIDs -> ``{uuid}``,
+   digits -> ``{id}``, 16+ hex digits -> ``{hash}``, long mixed
+   letter/digit tokens -> ``{token}``. Query parameters are sorted by name.
+   This stage is stateless, so it runs inline while rows are aggregated and
+   keeps the per-endpoint state small.
+3. Learned collapses over the distinct keys of a capture (``learn``): where
+   one position under the same ``METHOD host/prefix`` holds ``min_distinct``
+   or more identifier-like values (a digit or a character other than
+   letters, ``_`` and ``-``), those values become ``{param}``; a query
+   parameter with that many identifier-like values under one path becomes
+   ``{value}``. Plain words are never learned, so static routes such as
+   ``/login`` and ``/checkout`` stay apart, and neither is the first path
+   segment. ``apply`` maps a stage-2 key to its final template, and
+   aggregates merge the records that land on the same key (latency sketches
+   are mergeable).
+
+Example: ``GET api.example.com/users/42/posts?page=3&_=1718000000`` ->
+``GET api.example.com/users/{id}/posts?_={id}&page={id}``.
+"""
+
+import json
+import re
+import sys
+from functools import lru_cache
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+SEGMENT_RULES = (
+    ("{uuid}", re.compile(r"[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}")),
+    ("{id}", re.compile(r"\d+")),
+    ("{hash}", re.compile(r"[0-9a-fA-F]{16,}")),
+    ("{token}", re.compile(r"(?=[A-Za-z_-]*\d)(?=[\d_-]*[A-Za-z])[A-Za-z0-9_-]{24,}")),
+)
+
+# Distinct identifier-like values at one position before it is learned as a parameter
+DEFAULT_MIN_DISTINCT = 20
+
+# Values with anything besides letters, "_" and "-" look like identifiers
+IDENTIFIER_LIKE = re.compile(r"[^A-Za-z_-]")
+
+# Path depth (1 = first segment) where learning starts
+MIN_LEARN_DEPTH = 2
+
+LEARNED_SEGMENT = "{param}"
+LEARNED_VALUE = "{value}"
+
+# Raw paths remembered by normalize(); bounds memory on high-cardinality input
+NORMALIZE_CACHE_SIZE = 65536
+
+# Bump when SEGMENT_RULES or the learning change what a path maps to; cached
+# aggregates (agg_cache.py) built with other rules are then ignored
+RULES_VERSION = 2
+
+
+def is_placeholder(segment):
+    return len(segment) > 2 and segment[0] == "{" and segment[-1] == "}"
+
+
+def is_literal(segment):
+    """True for a non-empty segment that is not already a placeholder."""
+    return bool(segment) and not is_placeholder(segment)
+
+
+def is_learnable(segment):
+    """True for a literal segment or query value that may be learned as a parameter."""
+    return is_literal(segment) and IDENTIFIER_LIKE.search(segment) is not None
+
+
+def normalize_segment(segment):
+    """Apply the built-in rules to one path segment or query value."""
+    for placeholder, pattern in SEGMENT_RULES:
+        if pattern.fullmatch(segment):
+            return placeholder
+    return segment
+
+
+def split_endpoint_key(key):
+    """Split ``METHOD host/path?query`` into (``METHOD host``, ``/path?query``)."""
+    method, _, rest = key.partition(" ")
+    cut = len(rest)
+    for mark in ("/", "?"):
+        index = rest.find(mark)
+        if index != -1:
+            cut = min(cut, index)
+    return f"{method} {rest[:cut]}", rest[cut:]
+
+
+def split_path(path):
+    """Return (segments, [(name, value-or-None), ...]) for a path with query."""
+    base, has_query, query = path.partition("?")
+    params = []
+    if has_query:
+        for part in query.split("&"):
+            if part:
+                name, has_value, value = part.partition("=")
+                params.append((name, value if has_value else None))
+    return base.split("/"), params
+
+
+def join_path(segments, params):
+    path = "/".join(segments)
+    if params:
+        path += "?" + "&".join(name if value is None else f"{name}={value}" for name, value in params)
+    return path
+
+
+class PathTemplate:
+    """A policy template such as ``/users/{name}/repos``."""
+
+    def __init__(self, template):
+        self.template = template
+        self.segments = template.partition("?")[0].split("/")
+
+    def match(self, segments):
+        if len(segments) != len(self.segments):
+            return False
+        for mine, theirs in zip(self.segments, segments):
+            if mine != theirs and not (is_placeholder(mine) and theirs):
+                return False
+        return True
+
+
+class EndpointTemplater:
+    """Normalizes endpoint paths (see module docstring)."""
+
+    def __init__(self, templates=(), learn=True, min_distinct=DEFAULT_MIN_DISTINCT):
+        self.templates = [PathTemplate(template) for template in templates]
+        self.learn_enabled = learn
+        self.min_distinct = max(int(min_distinct), 2)
+        # (scope, prefix segments) whose next segment is learned as {param}
+        self.collapsed_segments = set()
+        # (scope, path, parameter name) whose value is learned as {value}
+        self.collapsed_values = set()
+        self.normalize = lru_cache(maxsize=NORMALIZE_CACHE_SIZE)(self._normalize)
+
+    def _normalize(self, path):
+        """Stages 1 and 2 for a raw path (query string included)."""
+        segments, params = split_path(path)
+        for template in self.templates:
+            if template.match(segments):
+                segments = [mine if is_placeholder(mine) else theirs
+                            for mine, theirs in zip(template.segments, segments)]
+                break
+        else:
+            segments = [normalize_segment(segment) if segment else segment for segment in segments]
+        params = sorted({(name, value if value is None else normalize_segment(value)) for name, value in params},
+                        key=lambda item: (item[0], item[1] or ""))
+        return join_path(segments, params)
+
+    def fingerprint(self):
+        """Configuration identity: equal fingerprints template every capture alike."""
+        return json.dumps({
+            "rules": RULES_VERSION,
+            "templates": [template.template for template in self.templates],
+            "learn": self.learn_enabled,
+            "minDistinct": self.min_distinct,
+        }, sort_keys=True)
+
+    def endpoint_key(self, method, host, path):
+        return f"{method} {host}{self.normalize(path)}"
+
+    def learn(self, keys):
+        """Learn stage-3 collapses from stage-2 endpoint keys, replacing earlier ones."""
+        self.collapsed_segments = set()
+        self.collapsed_values = set()
+        if not self.learn_enabled:
+            return
+        parsed = []
+        for key in set(keys):
+            scope, path = split_endpoint_key(key)
+            segments, params = split_path(path)
+            parsed.append((scope, segments, params))
+
+        # Breadth first, so positions deeper down see the collapsed prefixes
+        depth = 1
+        while True:
+            children = {}
+            deeper = False
+            for scope, segments, _ in parsed:
+                if len(segments) > depth:
+                    deeper = True
+                    segment = segments[depth]
+                    if depth >= MIN_LEARN_DEPTH and is_learnable(segment):
+                        children.setdefault((scope, tuple(segments[:depth])), set()).add(segment)
+            if not deeper:
+                break
+            for node, values in children.items():
+                if len(values) >= self.min_distinct:
+                    self.collapsed_segments.add(node)
+            for scope, segments, _ in parsed:
+                if len(segments) > depth and is_learnable(segments[depth]) \
+                        and (scope, tuple(segments[:depth])) in self.collapsed_segments:
+                    segments[depth] = LEARNED_SEGMENT
+            depth += 1
+
+        values = {}
+        for scope, segments, params in parsed:
+            path = "/".join(segments)
+            for name, value in params:
+                if value is not None and is_learnable(value):
+                    values.setdefault((scope, path, name), set()).add(value)
+        self.collapsed_values = {node for node, seen in values.items() if len(seen) >= self.min_distinct}
+
+    def apply(self, key):
+        """Map a stage-2 endpoint key to its learned template."""
+        if not self.collapsed_segments and not self.collapsed_values:
+            return key
+        scope, path = split_endpoint_key(key)
+        segments, params = split_path(path)
+        for depth in range(MIN_LEARN_DEPTH, len(segments)):
+            if is_learnable(segments[depth]) and (scope, tuple(segments[:depth])) in self.collapsed_segments:
+                segments[depth] = LEARNED_SEGMENT
+        base = "/".join(segments)
+        if params and self.collapsed_values:
+            params = sorted({(name, LEARNED_VALUE if value is not None and is_learnable(value)
+                              and (scope, base, name) in self.collapsed_values else value)
+                             for name, value in params}, key=lambda item: (item[0], item[1] or ""))
+        return scope + join_path(segments, params)
+
+    def group(self, records):
+        """Group a {key: record} dict by apply(key): {template: [record, ...]}.
+
+        Templates come in first-seen order, so callers that merge each group
+        keep the tie ordering of the ungrouped dict.
+        """
+        groups = {}
+        for key, record in records.items():
+            groups.setdefault(self.apply(key), []).append(record)
+        return groups
+
+
+def templater_from_policy(policy):
+    """EndpointTemplater configured by a policy dict's ``endpoints`` section.
+
+    Returns None when the section sets ``"enabled": false``.
+    """
+    section = (policy or {}).get("endpoints") or {}
+    if not section.get("enabled", True):
+        return None
+    return EndpointTemplater(
+        templates=section.get("templates") or (),
+        learn=section.get("learn", True),
+        min_distinct=section.get("min_distinct", DEFAULT_MIN_DISTINCT),
+    )
+
+
+def load_templater(policy_file=None):
+    """EndpointTemplater for a policy file (built-in rules only without one)."""
+    if not policy_file:
+        return EndpointTemplater()
+    from policy import load_policy
+    return templater_from_policy(load_policy(policy_file))
+
+
+def main(argv=None):
+    """CLI interface: print the template of each path or endpoint key."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Show endpoint templates for raw paths")
+    parser.add_argument("paths", nargs="*", help="Paths or 'METHOD host/path' keys (default: read stdin)")
+    parser.add_argument("--policy", help="Policy JSON file with an endpoints section")
+    parser.add_argument("--json", action="store_true", help="Print a JSON object raw -> template")
+    args = parser.parse_args(argv)
+
+    templater = load_templater(args.policy) or EndpointTemplater(learn=False)
+    raw = args.paths or [line.strip() for line in sys.stdin if line.strip()]
+    # Bare paths become keys with an empty "METHOD host" scope
+    keys = []
+    for item in raw:
+        scope, path = split_endpoint_key(item if " " in item else f" {item}")
+        keys.append(scope + templater.normalize(path))
+    templater.learn(keys)
+    result = {item: templater.apply(key).strip() for item, key in zip(raw, keys)}
+    if args.json:
+        print(json.dumps(result, indent=2, ensure_ascii=False))
+    else:
+        for item, template in result.items():
+            print(f"{template}\t{item}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,11 +1,20 @@
 #!/usr/bin/env python3
 """Convert mitmproxy flow file to HAR format (filtered, AI-friendly)."""
 
+import gzip
+import io
 import json
 import sys
 import os
 import base64
 from datetime import datetime, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+from flow_report import flow_timings
+
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
 
 # Skip static resources
 SKIP_EXTENSIONS = {
@@ -52,8 +61,12 @@ def serialize_cookies(cookies):
     return result
 
 
-def flow_to_entry(flow):
-    """Convert a single flow to HAR entry."""
+def flow_to_entry(flow, body_refs=None):
+    """Convert a single flow to HAR entry.
+
+    body_refs is (request_ref, response_ref) from body_store.BodyStore.store_flow;
+    when given, bodies are referenced by hash (``_bodyRef``) instead of inlined.
+    """
     if not flow.response:
         return None
 
@@ -88,9 +101,20 @@ def flow_to_entry(flow):
                 "bodySize": len(flow.response.content) if flow.response.content else 0,
             },
             "cache": {},
-            "timings": {"send": 0, "wait": 0, "receive": 0},
+            "timings": flow_timings(flow),
         }
 
+        if body_refs is not None:
+            request_ref, response_ref = body_refs
+            if request_ref:
+                entry["request"]["postData"] = {
+                    "mimeType": flow.request.headers.get("content-type", ""),
+                    "_bodyRef": request_ref,
+                }
+            if response_ref:
+                entry["response"]["content"]["_bodyRef"] = response_ref
+            return entry
+
         # Add request body
         if flow.request.content:
             try:
@@ -122,27 +146,26 @@ def flow_to_entry(flow):
         return None
 
 
-def convert(flow_file, har_file):
-    """Convert flow file to HAR.
+def har_entry_or_none(flow, body_store=None):
+    """HAR entry for flow, or None if it is filtered out (flow_lookup.map_flows worker)."""
+    if should_skip(flow):
+        return None
+    body_refs = body_store.store_flow(flow) if body_store is not None else None
+    return flow_to_entry(flow, body_refs)
 
-    WARNING: FlowReader uses pickle internally. Only process .flow files
-    generated by your own mitmdump instances. Never open untrusted .flow files.
-    """
-    from mitmproxy.io import FlowReader
 
-    # Verify flow file is not a symlink and has restricted permissions
-    if os.path.islink(flow_file):
-        print(f"Error: flow file is a symlink, refusing to open: {flow_file}", file=sys.stderr)
-        sys.exit(1)
+def entry_body_refs(entry):
+    """Body hashes referenced by a HAR entry."""
+    refs = [
+        entry["request"].get("postData", {}).get("_bodyRef"),
+        entry["response"]["content"].get("_bodyRef"),
+    ]
+    return [ref for ref in refs if ref]
 
-    # Verify flow file does not escape its parent directory
-    real_flow = os.path.realpath(flow_file)
-    expected_dir = os.path.realpath(os.path.dirname(flow_file))
-    if expected_dir != os.sep and not real_flow.startswith(expected_dir + os.sep):
-        print(f"Error: flow file path escapes expected directory: {flow_file}", file=sys.stderr)
-        sys.exit(1)
 
-    har = {
+def new_har():
+    """Return an empty HAR envelope."""
+    return {
         "log": {
             "version": "1.2",
             "creator": {"name": "flow2har", "version": "1.0"},
@@ -150,30 +173,156 @@ def convert(flow_file, har_file):
         }
     }
 
-    MAX_ENTRIES = 100000
 
-    with open(flow_file, "rb") as f:
-        reader = FlowReader(f)
-        for flow in reader.stream():
-            if should_skip(flow):
-                continue
-            entry = flow_to_entry(flow)
-            if entry:
-                har["log"]["entries"].append(entry)
-                if len(har["log"]["entries"]) >= MAX_ENTRIES:
-                    print(f"Warning: truncated at {MAX_ENTRIES} entries", file=sys.stderr)
-                    break
+def zstd_module():
+    """Return a zstd module with a gzip-style ``open()``.
 
-    fd = os.open(har_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
-    with os.fdopen(fd, "w") as f:
-        json.dump(har, f, indent=2, ensure_ascii=False)
+    Prefers the stdlib ``compression.zstd`` (Python 3.14+) and falls back to
+    the optional ``zstandard`` package.
+    """
+    try:
+        from compression import zstd
+        return zstd
+    except ImportError:
+        pass
+    try:
+        import zstandard
+        return zstandard
+    except ImportError:
+        raise RuntimeError("zstd HAR needs Python 3.14+ or: pip install zstandard") from None
 
-    print(f"Converted {len(har['log']['entries'])} entries to {har_file}")
 
+def open_har(har_file):
+    """Open a HAR file for reading as UTF-8 text.
 
-if __name__ == "__main__":
-    if len(sys.argv) != 3:
-        print(f"Usage: {sys.argv[0]} <flow_file> <har_file>")
+    gzip and zstd compressed files (``.har.gz`` / ``.har.zst``) are detected by
+    their magic bytes and decompressed transparently.
+    """
+    with open(har_file, "rb") as f:
+        magic = f.read(len(ZSTD_MAGIC))
+    if magic.startswith(GZIP_MAGIC):
+        return gzip.open(har_file, "rt", encoding="utf-8")
+    if magic == ZSTD_MAGIC:
+        return zstd_module().open(har_file, "rt", encoding="utf-8")
+    return open(har_file, "r", encoding="utf-8")
+
+
+def load_har(har_file):
+    """Load a (possibly compressed) HAR document."""
+    with open_har(har_file) as f:
+        return json.load(f)
+
+
+class HarWriter:
+    """Write a HAR document incrementally, one entry at a time.
+
+    Memory stays constant regardless of entry count. The output is
+    byte-identical to ``json.dump(har, f, indent=2, ensure_ascii=False)``
+    of the full document (entries sit at nesting depth 3, 6 spaces), or to
+    ``separators=(",", ":")`` without indentation when compact=True.
+
+    A ``.gz`` or ``.zst`` suffix on har_file compresses the output.
+    """
+
+    def __init__(self, har_file, compact=False):
+        fd = os.open(har_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        self.raw = os.fdopen(fd, "wb")
+        try:
+            if har_file.endswith(".gz"):
+                stream = gzip.GzipFile(fileobj=self.raw, mode="wb")
+            elif har_file.endswith(".zst"):
+                stream = zstd_module().open(self.raw, "wb")
+            else:
+                stream = self.raw
+        except Exception:
+            self.raw.close()
+            raise
+        self.output = io.TextIOWrapper(stream, encoding="utf-8")
+
+        self.compact = compact
+        self.dump_kwargs = {"separators": (",", ":")} if compact else {"indent": 2}
+        self.entry_indent = "" if compact else "\n" + " " * 6
+        marker = '"entries":[]' if compact else '"entries": []'
+        envelope = json.dumps(new_har(), ensure_ascii=False, **self.dump_kwargs)
+        head, self.tail = envelope.split(marker)
+        self.output.write(head + marker[:-1])
+        self.count = 0
+
+    def add(self, entry):
+        text = json.dumps(entry, ensure_ascii=False, **self.dump_kwargs)
+        if not self.compact:
+            text = text.replace("\n", self.entry_indent)
+        self.output.write(("," if self.count else "") + self.entry_indent + text)
+        self.count += 1
+
+    def close(self):
+        closing = "\n    ]" if self.count and not self.compact else "]"
+        self.output.write(closing + self.tail)
+        self.output.close()
+        self.raw.close()  # compressor streams leave a passed-in file object open
+        return self.count
+
+
+def convert(flow_file, har_file, jobs=1, compact=False, body_dir=None, body_refs_file=None):
+    """Convert flow file to HAR.
+
+    WARNING: FlowReader uses pickle internally. Only process .flow files
+    generated by your own mitmdump instances. Never open untrusted .flow files.
+
+    jobs > 1 decodes byte-range shards in parallel processes; entry order is
+    unchanged. compact drops indentation; a .gz/.zst har_file is compressed.
+
+    With body_dir, bodies go to a body_store.BodyStore and entries carry
+    ``_bodyRef`` hashes; the referenced hashes are written to body_refs_file.
+    """
+    from flow_lookup import check_flow_path, map_flows
+
+    error = check_flow_path(flow_file)
+    if error:
+        print(f"Error: {error}", file=sys.stderr)
         sys.exit(1)
 
-    convert(sys.argv[1], sys.argv[2])
+    func = har_entry_or_none
+    body_refs = set()
+    if body_dir:
+        from functools import partial
+        from body_store import BodyStore, write_refs
+
+        func = partial(har_entry_or_none, body_store=BodyStore(body_dir))
+
+    writer = HarWriter(har_file, compact=compact)
+    for entry in map_flows(flow_file, func, jobs):
+        if entry:
+            writer.add(entry)
+            if body_dir:
+                body_refs.update(entry_body_refs(entry))
+    count = writer.close()
+
+    if body_dir and body_refs_file:
+        write_refs(body_refs_file, body_refs)
+
+    print(f"Converted {count} entries to {har_file}")
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Convert mitmproxy flow file to HAR")
+    parser.add_argument("flow_file", help="Path to .flow file")
+    parser.add_argument("har_file", help="HAR output file (.gz/.zst compresses)")
+    parser.add_argument("--jobs", type=int, default=1, help="Decode with N worker processes")
+    parser.add_argument("--compact", action="store_true", help="Write HAR without indentation")
+    parser.add_argument("--body-store", help="Store bodies in this directory and reference them by hash")
+    parser.add_argument("--body-refs", help="Write referenced body hashes here (one per line)")
+    args = parser.parse_args(argv)
+
+    if args.jobs < 1:
+        parser.error("--jobs must be >= 1")
+
+    convert(args.flow_file, args.har_file, args.jobs, compact=args.compact,
+            body_dir=args.body_store, body_refs_file=args.body_refs)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+"""Random access to individual flows in a mitmproxy .flow file.
+
+A ``.flow`` file is a plain concatenation of tnetstrings, one per flow, in
+the same order as the ids in ``index.ndjson``. The sidecar
+``capture_<RUN_ID>.flow.idx`` stores the byte offset and length of every flow:
+
+    b"FLOWIDX1" + N * struct("<QQ")  (offset, length), record i = flow id i+1
+
+so looking up flow N is one 16-byte read plus one seek, independent of
+capture size. Building the sidecar only parses tnetstring length prefixes and
+never deserializes flows.
+
+The same offsets split a capture into byte ranges on flow boundaries;
+``map_flows`` decodes those ranges in a process pool (``--jobs N`` in
+flow2har.py and flow_report.py) and yields results in file order.
+
+WARNING: FlowReader uses pickle internally. Only process .flow files
+generated by your own mitmdump instances. Never open untrusted .flow files.
+"""
+
+import io
+import json
+import os
+import struct
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+IDX_MAGIC = b"FLOWIDX1"
+IDX_RECORD = struct.Struct("<QQ")
+
+# Bytes read to find a record's ``<digits>:`` length prefix
+PREFIX_SIZE = 13
+
+# Shards per worker: smaller ranges balance uneven flow sizes across processes
+SHARDS_PER_JOB = 4
+
+
+def idx_path_for(flow_file):
+    """Default sidecar path: capture_<RUN_ID>.flow -> capture_<RUN_ID>.flow.idx."""
+    return f"{flow_file}.idx"
+
+
+def record_length(prefix, offset=0):
+    """Total length of the tnetstring whose first bytes (up to 13) are prefix.
+
+    Returns None while the ``<digits>:`` prefix is not complete yet (a flow
+    file still being written); raises ValueError if prefix cannot start a
+    tnetstring.
+    """
+    colon = prefix.find(b":")
+    if colon == -1 and len(prefix) < PREFIX_SIZE and (not prefix or prefix.isdigit()):
+        return None
+    if colon <= 0 or not prefix[:colon].isdigit():
+        raise ValueError(f"not a tnetstring at offset {offset}")
+    return colon + 1 + int(prefix[:colon]) + 1
+
+
+def scan_offsets(fo):
+    """Yield (offset, length) for each top-level tnetstring in a binary file.
+
+    Only the ``<digits>:`` prefix of each record is read; payloads are skipped
+    with seek().
+    """
+    offset = fo.tell()
+    while True:
+        prefix = fo.read(PREFIX_SIZE)
+        if not prefix:
+            return
+        length = record_length(prefix, offset)
+        if length is None:
+            raise ValueError(f"not a tnetstring at offset {offset}")
+        offset += length
+        fo.seek(offset)
+        yield offset - length, length
+
+
+class FlowIndexWriter:
+    """Stream (offset, length) records into a .flow.idx file."""
+
+    def __init__(self, idx_file):
+        self.idx_file = idx_file
+        self.tmp_file = f"{idx_file}.tmp.{os.getpid()}"
+        fd = os.open(self.tmp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        self.output = os.fdopen(fd, "wb")
+        self.output.write(IDX_MAGIC)
+        self.count = 0
+
+    def add(self, offset, length):
+        self.output.write(IDX_RECORD.pack(offset, length))
+        self.count += 1
+
+    def close(self):
+        self.output.close()
+        os.replace(self.tmp_file, self.idx_file)
+        return self.count
+
+    def abort(self):
+        self.output.close()
+        os.unlink(self.tmp_file)
+
+
+def check_flow_path(flow_file):
+    """Error message for a flow file path that must not be opened, else None.
+
+    FlowReader unpickles what it reads, so every CLI that decodes a flow file
+    refuses symlinks and paths resolving outside their directory first.
+    """
+    if os.path.islink(flow_file):
+        return f"flow file is a symlink, refusing to open: {flow_file}"
+    # Verify flow file does not escape its parent directory
+    real_flow = os.path.realpath(flow_file)
+    expected_dir = os.path.realpath(os.path.dirname(flow_file))
+    if expected_dir != os.sep and not real_flow.startswith(expected_dir + os.sep):
+        return f"flow file path escapes expected directory: {flow_file}"
+    return None
+
+
+def build_index(flow_file, idx_file=None):
+    """Write the .flow.idx sidecar for flow_file; returns the number of flows."""
+    writer = FlowIndexWriter(idx_file or idx_path_for(flow_file))
+    try:
+        with open(flow_file, "rb") as f:
+            for offset, length in scan_offsets(f):
+                writer.add(offset, length)
+    except Exception:
+        writer.abort()
+        raise
+    return writer.close()
+
+
+def idx_count(idx_file):
+    return (os.path.getsize(idx_file) - len(IDX_MAGIC)) // IDX_RECORD.size
+
+
+def read_idx_record(idx_file, flow_id):
+    """Return (offset, length) for index id flow_id, or None if not indexed."""
+    if flow_id < 1:
+        raise ValueError("flow id must be >= 1")
+    with open(idx_file, "rb") as f:
+        if f.read(len(IDX_MAGIC)) != IDX_MAGIC:
+            raise ValueError(f"not a flow index: {idx_file}")
+        f.seek(len(IDX_MAGIC) + (flow_id - 1) * IDX_RECORD.size)
+        record = f.read(IDX_RECORD.size)
+    if len(record) != IDX_RECORD.size:
+        return None
+    return IDX_RECORD.unpack(record)
+
+
+def idx_is_behind(flow_file, idx_file):
+    """True if flow_file has bytes past the last indexed flow (still growing)."""
+    count = idx_count(idx_file)
+    indexed_end = sum(read_idx_record(idx_file, count)) if count else 0
+    return os.path.getsize(flow_file) > indexed_end
+
+
+def lookup(flow_file, flow_id, idx_file=None):
+    """Return (offset, length) of flow_id, (re)building a missing or short sidecar."""
+    idx_file = idx_file or idx_path_for(flow_file)
+    if not os.path.isfile(idx_file):
+        build_index(flow_file, idx_file)
+    record = read_idx_record(idx_file, flow_id)
+    if record is None and idx_is_behind(flow_file, idx_file):
+        # The flow file grew after the sidecar was written (live capture)
+        build_index(flow_file, idx_file)
+        record = read_idx_record(idx_file, flow_id)
+    if record is None:
+        raise KeyError(f"flow id {flow_id} not found in {flow_file}")
+    return record
+
+
+def read_raw_flow(flow_file, flow_id, idx_file=None):
+    """Return the serialized bytes of a single flow."""
+    offset, length = lookup(flow_file, flow_id, idx_file)
+    with open(flow_file, "rb") as f:
+        f.seek(offset)
+        raw = f.read(length)
+    if len(raw) != length:
+        raise ValueError(f"flow index is stale for {flow_file}")
+    return raw
+
+
+def load_flow(flow_file, flow_id, idx_file=None):
+    """Decode and return flow flow_id (1-based, matching index.ndjson ids)."""
+    from mitmproxy.io import FlowReader
+
+    raw = read_raw_flow(flow_file, flow_id, idx_file)
+    return next(iter(FlowReader(io.BytesIO(raw)).stream()))
+
+
+def load_offsets(flow_file, idx_file=None):
+    """Return [(offset, length), ...] from a current sidecar, else by scanning."""
+    idx_file = idx_file or idx_path_for(flow_file)
+    if os.path.isfile(idx_file) and not idx_is_behind(flow_file, idx_file):
+        with open(idx_file, "rb") as f:
+            if f.read(len(IDX_MAGIC)) == IDX_MAGIC:
+                data = f.read()
+                return list(IDX_RECORD.iter_unpack(data[:len(data) - len(data) % IDX_RECORD.size]))
+    with open(flow_file, "rb") as f:
+        return list(scan_offsets(f))
+
+
+def shard_ranges(offsets, shards):
+    """Group consecutive flows into at most ~shards (start, end) byte ranges."""
+    if not offsets:
+        return []
+    file_end = offsets[-1][0] + offsets[-1][1]
+    target = max((file_end - offsets[0][0]) // max(shards, 1), 1)
+    ranges = []
+    start = offsets[0][0]
+    for offset, length in offsets:
+        if offset + length - start >= target:
+            ranges.append((start, offset + length))
+            start = offset + length
+    if start < file_end:
+        ranges.append((start, file_end))
+    return ranges
+
+
+class ByteRange:
+    """Binary reader over [current position, end) of an open file, for FlowReader."""
+
+    def __init__(self, fo, end):
+        self.fo = fo
+        self.end = end
+
+    def remaining(self):
+        return max(self.end - self.fo.tell(), 0)
+
+    def read(self, size=-1):
+        remaining = self.remaining()
+        return self.fo.read(remaining if size < 0 else min(size, remaining))
+
+    def peek(self, size=0):
+        return self.fo.peek(size)[:self.remaining()]
+
+
+def decode_range(flow_file, start, end, func):
+    """Decode flows in [start, end) and return [func(flow), ...] (pool worker)."""
+    from mitmproxy.io import FlowReader
+
+    with open(flow_file, "rb") as f:
+        f.seek(start)
+        return [func(flow) for flow in FlowReader(ByteRange(f, end)).stream()]
+
+
+def map_flows(flow_file, func, jobs=1):
+    """Yield func(flow) for every flow in file order.
+
+    With jobs > 1 the file is split on flow boundaries and decoded by a
+    ProcessPoolExecutor; func must be picklable (a module-level function).
+    """
+    from mitmproxy.io import FlowReader
+
+    ranges = None
+    if jobs > 1:
+        try:
+            ranges = shard_ranges(load_offsets(flow_file), jobs * SHARDS_PER_JOB)
+        except ValueError:
+            ranges = None  # not a tnetstring dump (e.g. HAR input): decode serially
+
+    if not ranges or len(ranges) == 1:
+        with open(flow_file, "rb") as f:
+            for flow in FlowReader(f).stream():
+                yield func(flow)
+        return
+
+    from collections import deque
+    from concurrent.futures import ProcessPoolExecutor
+
+    # Keep at most two shards per worker in flight so decoded results do not
+    # pile up in memory ahead of a slower consumer; yield in submission order.
+    pool = ProcessPoolExecutor(max_workers=jobs)
+    pending = deque()
+    try:
+        for start, end in ranges:
+            if len(pending) >= jobs * 2:
+                yield from pending.popleft().result()
+            pending.append(pool.submit(decode_range, flow_file, start, end, func))
+        while pending:
+            yield from pending.popleft().result()
+    finally:
+        pool.shutdown(cancel_futures=True)
+
+
+def parse_jobs_arg(argv):
+    """Split an optional ``--jobs N`` out of a positional argv list."""
+    argv = list(argv)
+    jobs = 1
+    if "--jobs" in argv:
+        pos = argv.index("--jobs")
+        try:
+            jobs = int(argv[pos + 1])
+        except (IndexError, ValueError):
+            raise ValueError("--jobs requires an integer") from None
+        if jobs < 1:
+            raise ValueError("--jobs must be >= 1")
+        del argv[pos:pos + 2]
+    return argv, jobs
+
+
+def main(argv=None):
+    """CLI interface for flow lookup."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Random access to flows in a .flow file")
+    subparsers = parser.add_subparsers(dest="command", help="Commands")
+
+    build_parser = subparsers.add_parser("build", help="Build the .flow.idx sidecar")
+    build_parser.add_argument("flow_file", help="Path to .flow file")
+    build_parser.add_argument("--idx", help="Sidecar path (default: <flow_file>.idx)")
+
+    show_parser = subparsers.add_parser("show", help="Decode a single flow by index id")
+    show_parser.add_argument("flow_file", help="Path to .flow file")
+    show_parser.add_argument("id", type=int, help="Flow id from index.ndjson")
+    show_parser.add_argument("--idx", help="Sidecar path (default: <flow_file>.idx)")
+    show_group = show_parser.add_mutually_exclusive_group()
+    show_group.add_argument("--har", action="store_true", help="Print the HAR entry")
+    show_group.add_argument("--body", choices=["request", "response"], help="Write the decoded body")
+    show_parser.add_argument("-o", "--output", help="Output file (default: stdout)")
+
+    args = parser.parse_args(argv)
+
+    if args.command in ("build", "show"):
+        error = check_flow_path(args.flow_file)
+        if error:
+            print(f"Error: {error}", file=sys.stderr)
+            return 1
+
+    if args.command == "build":
+        count = build_index(args.flow_file, args.idx)
+        print(f"Indexed {count} flows -> {args.idx or idx_path_for(args.flow_file)}", file=sys.stderr)
+        return 0
+
+    if args.command != "show":
+        parser.print_help()
+        return 1
+
+    try:
+        flow = load_flow(args.flow_file, args.id, args.idx)
+    except KeyError as exc:
+        print(f"Error: {exc.args[0]}", file=sys.stderr)
+        return 1
+
+    if args.body:
+        message = flow.request if args.body == "request" else flow.response
+        payload = (message.content or b"") if message is not None else b""
+    else:
+        if args.har:
+            import flow2har
+            record = flow2har.flow_to_entry(flow)
+        else:
+            from flow_report import flow_to_index_entry
+            record = flow_to_index_entry(args.id, flow)
+        payload = (json.dumps(record, indent=2, ensure_ascii=False) + "\n").encode("utf-8")
+
+    if args.output:
+        fd = os.open(args.output, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "wb") as f:
+            f.write(payload)
+    else:
+        sys.stdout.buffer.write(payload)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,12 +1,18 @@
 #!/usr/bin/env python3
 """Generate index and summary artifacts from mitmproxy flow file."""
 
+import heapq
+import io
 import json
 import sys
 import os
 from collections import Counter
 from datetime import datetime, timezone
 
+# --follow: seconds between summary.md rewrites, and between polls of the flow file
+FOLLOW_INTERVAL = 5.0
+FOLLOW_POLL = 0.5
+
 
 def iso_utc(timestamp):
     if timestamp is None:
@@ -36,6 +42,86 @@ def status_bucket(status):
     return "other"
 
 
+def to_ms(start, end):
+    if start is None or end is None:
+        return None
+    return max(round((end - start) * 1000), 0)
+
+
+def flow_timings(flow):
+    """Split a flow's elapsed time into HAR 1.2 phases (milliseconds).
+
+    Returns a dict with blocked/dns/connect/ssl/send/wait/receive, or None if
+    the flow has no response. As in HAR, unavailable phases are -1 and
+    connect includes ssl. mitmproxy does not record DNS separately, so name
+    resolution is part of connect.
+
+    connect/ssl are only attributed to the flow that opened the upstream
+    connection (setup between request start and response start); flows that
+    reuse a connection report -1. This needs mitmproxy's lazy connection
+    strategy, which startCaptures.sh sets: the default eager strategy opens
+    HTTPS connections at CONNECT, before any request starts, so captures
+    made with it have no connect/ssl for HTTPS flows.
+    """
+    request = flow.request
+    response = flow.response
+    if not response:
+        return None
+
+    connect = ssl = -1
+    server = flow.server_conn
+    if server is not None and server.timestamp_start is not None and server.timestamp_tcp_setup is not None:
+        setup_done = server.timestamp_tls_setup or server.timestamp_tcp_setup
+        if (request.timestamp_start <= server.timestamp_start
+                and response.timestamp_start is not None and setup_done <= response.timestamp_start):
+            connect = to_ms(server.timestamp_start, setup_done)
+            if server.timestamp_tls_setup is not None:
+                ssl = to_ms(server.timestamp_tcp_setup, server.timestamp_tls_setup)
+
+    # With the lazy strategy mitmproxy connects upstream once the request is
+    # read, so connection setup sits between the end of send and the first
+    # response byte
+    wait = to_ms(request.timestamp_end, response.timestamp_start)
+    if wait is not None and connect > 0:
+        wait = max(wait - connect, 0)
+
+    return {
+        "blocked": -1,
+        "dns": -1,
+        "connect": connect,
+        "ssl": ssl,
+        "send": to_ms(request.timestamp_start, request.timestamp_end) or 0,
+        "wait": wait or 0,
+        "receive": to_ms(response.timestamp_start, response.timestamp_end) or 0,
+    }
+
+
+def connection_fields(flow):
+    """Upstream/client connection metadata of a flow for the index.
+
+    Every flow sent over the same upstream connection has the same
+    serverConnId and connection timestamps; connTcpMs/connTlsMs are that
+    connection's setup cost whether or not this flow paid for it (the first
+    flow sent on the connection did). serverConnId is None when
+    no upstream connection was opened (blocked or failed requests).
+    """
+    server = flow.server_conn
+    client = flow.client_conn
+    opened = server is not None and server.timestamp_start is not None
+    alpn = server.alpn if opened else None
+    return {
+        "httpVersion": flow.request.http_version or None,
+        "clientConnId": client.id if client is not None else None,
+        "serverConnId": server.id if opened else None,
+        "serverIp": server.peername[0] if opened and server.peername else None,
+        "tlsVersion": server.tls_version if opened else None,
+        "alpn": alpn.decode("ascii", "replace") if alpn else None,
+        "connOpenedDateTime": iso_utc(server.timestamp_start) if opened else "",
+        "connTcpMs": to_ms(server.timestamp_start, server.timestamp_tcp_setup) if opened else None,
+        "connTlsMs": to_ms(server.timestamp_tcp_setup, server.timestamp_tls_setup) if opened else None,
+    }
+
+
 def flow_to_index_entry(index_id, flow):
     request = flow.request
     response = flow.response
@@ -47,6 +133,9 @@ def flow_to_index_entry(index_id, flow):
     status_code = response.status_code if response else None
     content_type = response.headers.get("content-type", "") if response else ""
     response_bytes = safe_len(response.content) if response else 0
+    timings = flow_timings(flow) or {}
+    connect = timings.get("connect", -1)
+    ssl = timings.get("ssl", -1)
 
     return {
         "id": index_id,
@@ -60,9 +149,15 @@ def flow_to_index_entry(index_id, flow):
         "status": status_code,
         "statusBucket": status_bucket(status_code),
         "durationMs": duration_ms,
+        "ttfbMs": timings.get("wait"),
+        # connectMs is TCP setup only; HAR's connect also includes TLS
+        "connectMs": connect - max(ssl, 0) if connect >= 0 else None,
+        "tlsMs": ssl if ssl >= 0 else None,
+        "receiveMs": timings.get("receive"),
         "requestBytes": safe_len(request.content),
         "responseBytes": response_bytes,
         "contentType": content_type,
+        **connection_fields(flow),
     }
 
 
@@ -79,23 +174,115 @@ def to_markdown_table(rows, headers):
     return "\n".join(lines)
 
 
-def write_summary(flow_file, summary_file, entries):
-    total = len(entries)
-    responded = [item for item in entries if item["status"] is not None]
-    no_response = total - len(responded)
-
-    error_count = sum(1 for item in responded if item["status"] >= 400)
-    durations = [item["durationMs"] for item in responded if item["durationMs"] is not None]
-    avg_duration = int(sum(durations) / len(durations)) if durations else 0
+class SummaryAccumulator:
+    """Aggregates shown in summary.md, fed one index row at a time.
+
+    Memory is bounded by the number of status buckets and hosts plus the
+    SLOWEST rows kept in a heap; the earliest row wins duration ties.
+    """
+
+    SLOWEST = 20
+
+    def __init__(self):
+        self.total = 0
+        self.responded = 0
+        self.errors = 0
+        self.duration_sum = 0
+        self.duration_count = 0
+        self.status_buckets = Counter()
+        self.hosts = Counter()
+        # min-heap of (durationMs, -seq, row)
+        self.slowest = []
+
+    def add(self, item):
+        seq = self.total
+        self.total += 1
+        self.status_buckets[item["statusBucket"]] += 1
+        if item["host"]:
+            self.hosts[item["host"]] += 1
+        duration = item["durationMs"]
+        if item["status"] is not None:
+            self.responded += 1
+            if item["status"] >= 400:
+                self.errors += 1
+            if duration is not None:
+                self.duration_sum += duration
+                self.duration_count += 1
+        if duration is not None:
+            if len(self.slowest) < self.SLOWEST:
+                heapq.heappush(self.slowest, (duration, -seq, item))
+            elif (duration, -seq) > self.slowest[0][:2]:
+                heapq.heapreplace(self.slowest, (duration, -seq, item))
+
+    def counts(self):
+        return {
+            "total": self.total,
+            "responded": self.responded,
+            "errors": self.errors,
+            "avgDuration": int(self.duration_sum / self.duration_count) if self.duration_count else 0,
+            "statusBuckets": self.status_buckets,
+            "topHosts": self.hosts.most_common(15),
+            "slowest": [item for _, _, item in sorted(self.slowest, key=lambda entry: entry[:2], reverse=True)],
+        }
+
+
+def summary_counts(entries):
+    """Aggregates shown in summary.md, in one pass over index rows."""
+    summary = SummaryAccumulator()
+    for item in entries:
+        summary.add(item)
+    return summary.counts()
+
+
+def summary_counts_arrays(arrays):
+    """summary_counts over an index_arrays.IndexArrays, vectorized."""
+    from index_arrays import first_seen_counts, top_rows
+    from index_columns import INT_NULL
+
+    np = arrays.np
+    status = arrays.array("status")
+    duration = arrays.array("durationMs")
+    responded = status != INT_NULL
+    timed = duration != INT_NULL
+    durations = duration[responded & timed]
+
+    bucket, bucket_labels = arrays.labels("statusBucket")
+    host, host_labels = arrays.labels("host")
+    named = np.array([bool(label) for label in host_labels])[host]
+    hosts = [(host_labels[code], count) for code, count in first_seen_counts(np, host[named])]
+    rows = np.flatnonzero(timed)
+    return {
+        "total": len(arrays),
+        "responded": int(responded.sum()),
+        "errors": int((responded & (status >= 400)).sum()),
+        "avgDuration": int(int(durations.sum()) / len(durations)) if len(durations) else 0,
+        "statusBuckets": {bucket_labels[code]: count for code, count in first_seen_counts(np, bucket)},
+        "topHosts": sorted(hosts, key=lambda item: item[1], reverse=True)[:15],
+        "slowest": [arrays.row(row) for row in top_rows(np, rows, duration[rows], 20)],
+    }
 
-    status_buckets = Counter(item["statusBucket"] for item in entries)
-    top_hosts = Counter(item["host"] for item in entries if item["host"]).most_common(15)
 
-    slowest = sorted(
-        [item for item in entries if item["durationMs"] is not None],
-        key=lambda item: item["durationMs"],
-        reverse=True,
-    )[:20]
+def write_summary(flow_file, summary_file, entries):
+    """Write summary.md.
+
+    entries is an iterable of index rows, a SummaryAccumulator that already
+    consumed them, or an index_arrays.IndexArrays.
+    """
+    from index_arrays import IndexArrays
+
+    if isinstance(entries, SummaryAccumulator):
+        counts = entries.counts()
+    elif isinstance(entries, IndexArrays):
+        counts = summary_counts_arrays(entries)
+    else:
+        counts = summary_counts(entries)
+    total = counts["total"]
+    no_response = total - counts["responded"]
+    error_count = counts["errors"]
+    avg_duration = counts["avgDuration"]
+    status_buckets = counts["statusBuckets"]
+    top_hosts = counts["topHosts"]
+    slowest = counts["slowest"]
 
     status_rows = [(key, value) for key, value in sorted(status_buckets.items(), key=lambda item: item[0])]
     host_rows = [(host, count) for host, count in top_hosts]
@@ -117,7 +304,7 @@ def write_summary(flow_file, summary_file, entries):
     lines.append(f"- Flow file: `{flow_file}`")
     lines.append(f"- Generated at: `{datetime.now(timezone.utc).isoformat()}`")
     lines.append(f"- Total requests: `{total}`")
-    lines.append(f"- Responses received: `{len(responded)}`")
+    lines.append(f"- Responses received: `{counts['responded']}`")
     lines.append(f"- No response: `{no_response}`")
     lines.append(f"- 4xx/5xx count: `{error_count}`")
     lines.append(f"- Average duration (responded): `{avg_duration} ms`")
@@ -135,14 +322,232 @@ def write_summary(flow_file, summary_file, entries):
     lines.append(to_markdown_table(slow_rows, ["ID", "ms", "Status", "Method", "Host", "Path"]))
     lines.append("")
 
-    fd = os.open(summary_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    # Replaced atomically: --follow rewrites it while readers may have it open
+    tmp_file = f"{summary_file}.tmp.{os.getpid()}"
+    fd = os.open(tmp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
     with os.fdopen(fd, "w", encoding="utf-8") as output:
         output.write("\n".join(lines))
+    os.replace(tmp_file, summary_file)
+
+
+def index_row(flow):
+    """Index row with a placeholder id (flow_lookup.map_flows worker)."""
+    return flow_to_index_entry(0, flow)
+
+
+def follow_state_path(index_file):
+    """Resume state of --follow: capture_<RUN_ID>.index.ndjson.follow.json."""
+    return f"{index_file}.follow.json"
+
+
+class FlowFollower:
+    """Tail a growing flow file into index rows and summary counters.
+
+    Each poll decodes only the complete flows appended since the last one;
+    ``offset`` is the end of the last decoded flow, so a flow still being
+    written is picked up by a later poll. Rows are appended to the index and
+    fed to a SummaryAccumulator, so rewriting summary.md never re-reads the
+    flow file.
+
+    The offset is saved next to the index (``follow_state_path``). A
+    restarted follower whose index still matches the saved state continues
+    from there and rebuilds its counters from the index rows; otherwise it
+    starts over.
+    """
+
+    def __init__(self, flow_file, index_file, summary_file):
+        self.flow_file = flow_file
+        self.index_file = index_file
+        self.summary_file = summary_file
+        self.state_file = follow_state_path(index_file)
+        self.reset()
+
+        resumed = self.resume()
+        flags = os.O_WRONLY | os.O_CREAT | (os.O_APPEND if resumed else os.O_TRUNC)
+        self.output = os.fdopen(os.open(index_file, flags, 0o600), "w", encoding="utf-8")
+
+    def reset(self):
+        from index_columns import ColumnWriter, col_path_for
+
+        self.offset = 0
+        self.summary = SummaryAccumulator()
+        self.columns = ColumnWriter(col_path_for(self.index_file))
+
+    def resume(self):
+        """Load saved state and counters; False if there is nothing to resume."""
+        from index_columns import iter_ndjson
+
+        try:
+            with open(self.state_file, "r", encoding="utf-8") as f:
+                state = json.load(f)
+            valid = (state["flowFile"] == os.path.realpath(self.flow_file)
+                     and os.path.getsize(self.index_file) == state["indexBytes"]
+                     and os.path.getsize(self.flow_file) >= state["offset"])
+        except (OSError, ValueError, KeyError, TypeError):
+            return False
+        if not valid:
+            return False
+        for entry in iter_ndjson(self.index_file):
+            self.count(entry)
+        if self.summary.total != state["rows"]:
+            self.reset()
+            return False
+        self.offset = state["offset"]
+        return True
+
+    def count(self, entry):
+        self.summary.add(entry)
+        if self.columns is not None:
+            try:
+                self.columns.add(entry)
+            except ValueError as exc:
+                print(f"Warning: skipped columnar index: {exc}", file=sys.stderr)
+                self.columns = None
+
+    def poll(self):
+        """Index the complete flows appended since the last poll; returns how many."""
+        from mitmproxy.io import FlowReader
+        from flow_lookup import PREFIX_SIZE, record_length
+
+        added = 0
+        with open(self.flow_file, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < self.offset:
+                raise ValueError(f"flow file shrank below the followed offset {self.offset}: {self.flow_file}")
+            while True:
+                f.seek(self.offset)
+                length = record_length(f.read(PREFIX_SIZE), self.offset)
+                if length is None or self.offset + length > size:
+                    break
+                f.seek(self.offset)
+                for flow in FlowReader(io.BytesIO(f.read(length))).stream():
+                    entry = index_row(flow)
+                    entry["id"] = self.summary.total + 1
+                    self.output.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                    self.count(entry)
+                    added += 1
+                self.offset += length
+        self.output.flush()
+        return added
+
+    def save_state(self):
+        state = {
+            "flowFile": os.path.realpath(self.flow_file),
+            "offset": self.offset,
+            "rows": self.summary.total,
+            "indexBytes": os.path.getsize(self.index_file),
+            "updatedAt": datetime.now(timezone.utc).isoformat(),
+        }
+        tmp_file = f"{self.state_file}.tmp.{os.getpid()}"
+        fd = os.open(tmp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(tmp_file, self.state_file)
+
+    def write_summary(self):
+        """Rewrite summary.md from the counters and save the resume state."""
+        write_summary(self.flow_file, self.summary_file, self.summary)
+        self.save_state()
+
+    def close(self):
+        """Index the remaining tail, write the summary and the columnar sidecar."""
+        self.poll()
+        self.output.close()
+        self.write_summary()
+        if self.columns is not None:
+            self.columns.close(self.index_file)
+
+
+def follow(flow_file, index_file, summary_file, interval=FOLLOW_INTERVAL, idle_exit=None,
+           poll_interval=FOLLOW_POLL):
+    """Follow flow_file until SIGINT/SIGTERM, or idle_exit seconds without new flows.
+
+    Waits for flow_file to appear; returns the closed FlowFollower, or None
+    if stopped before it did. summary.md is rewritten every interval seconds while new flows arrive.
+    On exit the tail is indexed once more, so stopping the follower after
+    the capture costs only the flows written since the last poll.
+    """
+    import signal
+    import time
+
+    stopping = []
+
+    def stop(signum, frame):
+        stopping.append(signum)
+
+    previous = {signum: signal.signal(signum, stop) for signum in (signal.SIGINT, signal.SIGTERM)}
+    try:
+        while not os.path.exists(flow_file):
+            if stopping:
+                return None
+            time.sleep(poll_interval)
+        follower = FlowFollower(flow_file, index_file, summary_file)
+        follower.write_summary()
+        last_write = last_flow = time.monotonic()
+        dirty = False
+        while not stopping:
+            now = time.monotonic()
+            if follower.poll():
+                dirty = True
+                last_flow = now
+            if dirty and now - last_write >= interval:
+                follower.write_summary()
+                last_write, dirty = now, False
+            if idle_exit is not None and now - last_flow >= idle_exit:
+                break
+            time.sleep(poll_interval)
+        follower.close()
+    finally:
+        for signum, handler in previous.items():
+            signal.signal(signum, handler)
+    return follower
+
+
+def parse_follow_args(argv):
+    """Split ``--follow``, ``--interval S`` and ``--idle-exit S`` out of argv.
+
+    Returns (argv, options) with options None when --follow is absent.
+    """
+    argv = list(argv)
+    options = {"interval": FOLLOW_INTERVAL, "idle_exit": None}
+    following = "--follow" in argv
+    if following:
+        argv.remove("--follow")
+    for flag, key in (("--interval", "interval"), ("--idle-exit", "idle_exit")):
+        if flag in argv:
+            pos = argv.index(flag)
+            try:
+                value = float(argv[pos + 1])
+            except (IndexError, ValueError):
+                raise ValueError(f"{flag} requires a number of seconds") from None
+            if value <= 0:
+                raise ValueError(f"{flag} must be > 0")
+            if not following:
+                raise ValueError(f"{flag} requires --follow")
+            options[key] = value
+            del argv[pos:pos + 2]
+    return argv, options if following else None
 
 
 def main(argv):
+    from flow_lookup import check_flow_path, map_flows, parse_jobs_arg
+    from index_arrays import writer_arrays
+    from index_columns import ColumnWriter, col_path_for, iter_ndjson
+    from quantiles import numpy_module
+
+    try:
+        argv, jobs = parse_jobs_arg(argv)
+        argv, follow_options = parse_follow_args(argv)
+    except ValueError as exc:
+        print(f"Error: {exc}", file=sys.stderr)
+        return 1
     if len(argv) != 4:
-        print(f"Usage: {argv[0]} <flow_file> <index_ndjson_file> <summary_md_file>")
+        print(f"Usage: {argv[0]} <flow_file> <index_ndjson_file> <summary_md_file> [--jobs N]\n"
+              f"       {argv[0]} <flow_file> <index_ndjson_file> <summary_md_file> "
+              f"--follow [--interval SECONDS] [--idle-exit SECONDS]")
+        return 1
+    if follow_options is not None and jobs > 1:
+        print("Error: --jobs cannot be combined with --follow", file=sys.stderr)
         return 1
 
     flow_file = argv[1]
@@ -157,34 +562,50 @@ def main(argv):
 
     # WARNING: FlowReader uses pickle internally. Only process .flow files
     # generated by your own mitmdump instances. Never open untrusted .flow files.
-    if os.path.islink(flow_file):
-        print(f"Error: flow file is a symlink, refusing to open: {flow_file}", file=sys.stderr)
-        return 3
-
-    # Verify flow file does not escape its parent directory
-    real_flow = os.path.realpath(flow_file)
-    expected_dir = os.path.realpath(os.path.dirname(flow_file))
-    if expected_dir != os.sep and not real_flow.startswith(expected_dir + os.sep):
-        print(f"Error: flow file path escapes expected directory: {flow_file}", file=sys.stderr)
+    error = check_flow_path(flow_file)
+    if error:
+        print(f"Error: {error}", file=sys.stderr)
         return 3
 
-    MAX_ENTRIES = 100000
-    entries = []
-    with open(flow_file, "rb") as flow_stream:
-        reader = FlowReader(flow_stream)
-        for index_id, flow in enumerate(reader.stream(), start=1):
-            entry = flow_to_index_entry(index_id, flow)
-            entries.append(entry)
-            if len(entries) >= MAX_ENTRIES:
-                print(f"Warning: truncated at {MAX_ENTRIES} entries", file=sys.stderr)
-                break
+    if follow_options is not None:
+        try:
+            follower = follow(flow_file, index_file, summary_file, **follow_options)
+        except ValueError as exc:
+            print(f"Error: {exc}", file=sys.stderr)
+            return 2
+        if follower is None:
+            print(f"Error: flow file never appeared: {flow_file}", file=sys.stderr)
+            return 2
+        print(f"Followed {flow_file} to byte {follower.offset}: "
+              f"{follower.summary.total} rows in {index_file} and {summary_file}")
+        return 0
 
+    # Rows are streamed to the NDJSON file and the column writer; the summary
+    # comes from the writer's arrays with NumPy, else from a bounded accumulator.
+    columns = ColumnWriter(col_path_for(index_file))
+    summary = None if numpy_module() is not None else SummaryAccumulator()
     fd = os.open(index_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
     with os.fdopen(fd, "w", encoding="utf-8") as output:
-        for entry in entries:
+        # jobs > 1 decodes byte-range shards in parallel; rows come back in file order
+        for index_id, entry in enumerate(map_flows(flow_file, index_row, jobs), start=1):
+            entry["id"] = index_id
             output.write(json.dumps(entry, ensure_ascii=False) + "\n")
-
-    write_summary(flow_file, summary_file, entries)
+            if summary is not None:
+                summary.add(entry)
+            if columns is not None:
+                try:
+                    columns.add(entry)
+                except ValueError as exc:
+                    print(f"Warning: skipped columnar index: {exc}", file=sys.stderr)
+                    columns = None
+
+    if columns is not None:
+        columns.close(index_file)
+    if summary is None:
+        arrays = writer_arrays(columns, min_rows=1) if columns is not None else None
+        # Without arrays (no sidecar rows), read the rows just written back
+        summary = arrays if arrays is not None else iter_ndjson(index_file)
+    write_summary(flow_file, summary_file, summary)
     print(f"Generated {index_file} and {summary_file}")
     return 0
 
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""NumPy arrays over index rows for vectorized aggregation.
+
+When NumPy is installed, ai_brief.py, diff_captures.py and flow_report.py
+load the index as one array per field instead of a list of dicts and group
+with ``np.unique`` / ``np.bincount`` / ``np.lexsort``. Arrays view the mmap of
+a current .index.col sidecar without copying, or the in-memory arrays of an
+``index_columns.ColumnWriter`` (the capture pipeline).
+
+Integer fields are int64 with ``INT_NULL`` for null, string fields are uint32
+codes into a table. Every helper numbers groups in first-seen row order, the
+order the Counter/dict based pure-Python paths produce, so both backends
+return identical results. Callers fall back to those paths when
+``load_arrays`` returns None: no NumPy, no current sidecar (packing NDJSON
+into arrays costs more than the vectorized grouping saves), or an index too
+small to be worth importing NumPy for.
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+from index_columns import INT_NULL, STR_NULL, column_kind, decode_time, open_columns
+from quantiles import NUMPY_MIN_BATCH, numpy_module
+
+
+class IndexArrays:
+    """Columns of an index as NumPy arrays, plus decoding of single rows."""
+
+    def __init__(self, np, rows, kinds, data, tables, owner=None):
+        self.np = np
+        self.rows = rows
+        self.kinds = kinds
+        self.names = list(kinds)
+        self.data = data
+        self.tables = tables
+        # IndexColumns whose mmap backs the arrays; kept open while they are used
+        self.owner = owner
+        self.cache = {}
+
+    def __len__(self):
+        return self.rows
+
+    def array(self, name):
+        """int64 values (INT_NULL for null) or uint32 string codes (STR_NULL)."""
+        dtype = self.np.uint32 if self.kinds[name] == "str" else self.np.int64
+        return self.np.frombuffer(self.data[name], dtype=dtype)[:self.rows]
+
+    def labels(self, name, default=None):
+        """Return (codes, labels) for a string column, codes as dense int64.
+
+        With default, values are taken as ``value or default`` (how the
+        endpoint and bucket keys treat None and ""), so equal keys share a
+        code. Without it labels are the raw values, None included.
+        """
+        key = (name, default)
+        if key not in self.cache:
+            np = self.np
+            table = self.tables[name]
+            translate = np.empty(len(table) + 1, dtype=np.int64)
+            seen = {}
+            for code, value in enumerate(table + [None]):
+                if default is not None:
+                    value = value or default
+                translate[code] = seen.setdefault(value, len(seen))
+            codes = self.array(name).astype(np.int64)
+            codes[codes == STR_NULL] = len(table)
+            self.cache[key] = (translate[codes], list(seen))
+        return self.cache[key]
+
+    def row(self, i):
+        """Decode row i into the dict its NDJSON line holds."""
+        result = {}
+        for name, kind in self.kinds.items():
+            value = self.data[name][i]
+            if kind == "str":
+                result[name] = None if value == STR_NULL else self.tables[name][value]
+            elif kind == "time":
+                result[name] = decode_time(value)
+            else:
+                result[name] = None if value == INT_NULL else value
+        return result
+
+    def close(self):
+        self.cache = {}
+        self.data = {}
+        if self.owner is not None:
+            self.owner.close()
+            self.owner = None
+
+
+def from_columns(np, columns):
+    """Wrap an open index_columns.IndexColumns (zero-copy)."""
+    kinds = {name: columns.kinds[name] for name in columns.names}
+    data = {name: columns.column(name) for name in kinds}
+    tables = {name: columns.strings(name) for name in kinds if kinds[name] == "str"}
+    return IndexArrays(np, len(columns), kinds, data, tables, owner=columns)
+
+
+def from_writer(np, writer):
+    """Wrap the in-memory arrays of an index_columns.ColumnWriter."""
+    if not writer.names:
+        return None
+    kinds = {name: column_kind(name) for name in writer.names}
+    tables = {name: list(writer.strings[name]) for name in kinds if kinds[name] == "str"}
+    return IndexArrays(np, writer.rows, kinds, dict(writer.data), tables)
+
+
+def writer_arrays(writer, min_rows=NUMPY_MIN_BATCH):
+    """IndexArrays over a ColumnWriter's rows, or None for the Python path."""
+    np = numpy_module() if writer.rows >= max(min_rows, 1) else None
+    return from_writer(np, writer) if np is not None else None
+
+
+def load_arrays(index_file, fields=None, min_rows=NUMPY_MIN_BATCH):
+    """Return IndexArrays over index_file's sidecar, or None for the Python path.
+
+    fields limits which columns are exposed.
+    """
+    columns = open_columns(index_file, fields)
+    if columns is None:
+        return None
+    np = numpy_module() if len(columns) >= max(min_rows, 1) else None
+    if np is None:
+        columns.close()
+        return None
+    return from_columns(np, columns)
+
+
+def combine_keys(np, *code_arrays):
+    """One int64 key per row that is equal exactly when all codes are equal."""
+    key = code_arrays[0].astype(np.int64)
+    for codes in code_arrays[1:]:
+        _, dense = np.unique(key, return_inverse=True)
+        span = int(codes.max()) + 1 if len(codes) else 1
+        key = dense.reshape(-1).astype(np.int64) * span + codes
+    return key
+
+
+def first_seen_groups(np, keys):
+    """Number the distinct keys in order of first appearance.
+
+    Returns (group id per row, first row of each group, rows per group).
+    """
+    _, first, inverse, counts = np.unique(keys, return_index=True, return_inverse=True, return_counts=True)
+    order = np.argsort(first, kind="stable")
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = np.arange(len(order))
+    return rank[inverse.reshape(-1)], first[order], counts[order]
+
+
+def first_seen_counts(np, codes):
+    """[(code, rows)] for the distinct codes, in order of first appearance."""
+    if not len(codes):
+        return []
+    _, first, counts = np.unique(codes, return_index=True, return_counts=True)
+    order = np.argsort(first, kind="stable")
+    return list(zip(codes[first[order]].tolist(), counts[order].tolist()))
+
+
+def top_rows(np, rows, values, limit):
+    """The limit rows (ascending row numbers) with the largest values.
+
+    Ties keep row order, like ``sorted(..., reverse=True)`` and the heaps in
+    the pure-Python paths.
+    """
+    order = np.lexsort((rows, -values))[:limit]
+    return rows[order].tolist()
+
+
+def endpoint_groups(arrays, normalize=None):
+    """Group rows by ``METHOD host+path``.
+
+    normalize (e.g. ``EndpointTemplater.normalize``) maps each distinct path
+    to its template first. Returns (group id per row, endpoint keys in
+    first-seen order).
+    """
+    np = arrays.np
+    method, method_labels = arrays.labels("method", "")
+    host, host_labels = arrays.labels("host", "")
+    path, path_labels = arrays.labels("path", "")
+    if normalize is not None:
+        path_labels = [normalize(label) for label in path_labels]
+    ids, first, _ = first_seen_groups(np, combine_keys(np, method, host, path))
+
+    # Different (method, host, path) can still spell the same key string,
+    # and different paths can share a template
+    keys = []
+    remap = np.empty(len(first), dtype=np.int64)
+    seen = {}
+    parts = zip(method[first].tolist(), host[first].tolist(), path[first].tolist())
+    for group, (m, h, p) in enumerate(parts):
+        key = f"{method_labels[m]} {host_labels[h]}{path_labels[p]}"
+        if key not in seen:
+            seen[key] = len(keys)
+            keys.append(key)
+        remap[group] = seen[key]
+    if len(keys) < len(first):
+        ids = remap[ids]
+    return ids, keys
@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+"""Columnar, memory-mappable sidecar for index.ndjson.
+
+``capture_<RUN_ID>.index.col`` holds the same rows as ``index.ndjson``, one
+array per field:
+
+    b"IDXCOL01" + struct("<Q") header length + JSON header + column data
+
+Integer fields (status, durationMs, bytes, ...) are int64 arrays and
+``startedDateTime``/``connOpenedDateTime`` are int64 microseconds since the
+epoch, with INT_NULL for missing values. Every other field is dictionary-encoded: a uint32 code per row
+into a string table kept in the header (STR_NULL for null). Columns start on
+8-byte boundaries so they can be cast straight out of an mmap.
+
+The header records the size, mtime and SHA-256 of the NDJSON file the
+sidecar was built from, like agg_cache.py: ``open_columns`` trusts a matching
+size and mtime, compares the hash when only the mtime changed (a copied or
+touched index), and ignores any other sidecar (for example a live index that
+kept growing or was rewritten in place), so callers fall back to parsing NDJSON;
+``iter_rows`` does both and closes the sidecar when iteration ends.
+"""
+
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from datetime import datetime, timedelta, timezone
+
+from agg_cache import file_sha256
+
+COL_MAGIC = b"IDXCOL01"
+HEADER_LEN = struct.Struct("<Q")
+
+INT_COLUMNS = {
+    "id", "port", "status", "durationMs", "ttfbMs", "connectMs", "tlsMs",
+    "receiveMs", "requestBytes", "responseBytes", "connTcpMs", "connTlsMs",
+}
+TIME_COLUMNS = {"startedDateTime", "connOpenedDateTime"}
+
+INT_NULL = -(1 << 63)
+STR_NULL = 0xFFFFFFFF
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def col_path_for(index_file):
+    """capture_<RUN_ID>.index.ndjson -> capture_<RUN_ID>.index.col."""
+    base = index_file[:-len(".ndjson")] if index_file.endswith(".ndjson") else index_file
+    return f"{base}.col"
+
+
+def column_kind(name):
+    if name in TIME_COLUMNS:
+        return "time"
+    if name in INT_COLUMNS:
+        return "int"
+    return "str"
+
+
+def encode_time(value):
+    if value == "":
+        return INT_NULL
+    if not isinstance(value, str):
+        raise ValueError(f"timestamp must be a string, got {value!r}")
+    delta = datetime.fromisoformat(value) - EPOCH
+    micros = (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+    # Only store what decodes back to the same text (UTC isoformat from flow_report)
+    if decode_time(micros) != value:
+        raise ValueError(f"timestamp is not a UTC isoformat string: {value!r}")
+    return micros
+
+
+def decode_time(micros):
+    if micros == INT_NULL:
+        return ""
+    return (EPOCH + timedelta(microseconds=micros)).isoformat()
+
+
+class ColumnWriter:
+    """Accumulate index rows column by column and write a .index.col file.
+
+    Every row must have the keys of the first row, in the same order, so rows
+    read back identical to their NDJSON form. Raises ValueError otherwise.
+    """
+
+    def __init__(self, col_file):
+        self.col_file = col_file
+        self.names = None
+        self.data = {}
+        self.strings = {}
+        self.rows = 0
+
+    def add(self, row):
+        if self.names is None:
+            self.names = list(row)
+            for name in self.names:
+                self.data[name] = array("I" if column_kind(name) == "str" else "q")
+                self.strings[name] = {}
+        elif list(row) != self.names:
+            raise ValueError(f"index row {self.rows + 1} has different fields than row 1")
+
+        for name in self.names:
+            value = row[name]
+            kind = column_kind(name)
+            if kind == "time":
+                self.data[name].append(encode_time(value))
+            elif kind == "int":
+                if value is None:
+                    value = INT_NULL
+                elif type(value) is not int:
+                    raise ValueError(f"{name} must be an integer, got {value!r}")
+                self.data[name].append(value)
+            else:
+                if value is None:
+                    self.data[name].append(STR_NULL)
+                    continue
+                if not isinstance(value, str):
+                    raise ValueError(f"{name} must be a string, got {value!r}")
+                table = self.strings[name]
+                code = table.get(value)
+                if code is None:
+                    code = table[value] = len(table)
+                self.data[name].append(code)
+        self.rows += 1
+
+    def close(self, index_file):
+        """Write the sidecar atomically, stamped with index_file's size, mtime and hash."""
+        st = os.stat(index_file)
+        columns = []
+        blobs = []
+        offset = 0
+        for name in self.names or []:
+            blob = self.data[name].tobytes()
+            columns.append({"name": name, "kind": column_kind(name), "offset": offset})
+            blobs.append(blob + b"\0" * (-len(blob) % 8))
+            offset += len(blobs[-1])
+
+        header = json.dumps({
+            "rows": self.rows,
+            "sourceSize": st.st_size,
+            "sourceMtimeNs": st.st_mtime_ns,
+            "sourceSha256": file_sha256(index_file),
+            "byteorder": sys.byteorder,
+            "columns": columns,
+            "strings": {name: list(table) for name, table in self.strings.items() if column_kind(name) == "str"},
+        }, ensure_ascii=False).encode("utf-8")
+        prefix = COL_MAGIC + HEADER_LEN.pack(len(header)) + header
+        prefix += b"\0" * (-len(prefix) % 8)
+
+        tmp_file = f"{self.col_file}.tmp.{os.getpid()}"
+        fd = os.open(tmp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(prefix)
+                for blob in blobs:
+                    f.write(blob)
+        except Exception:
+            os.unlink(tmp_file)
+            raise
+        os.replace(tmp_file, self.col_file)
+        return self.rows
+
+
+class IndexColumns:
+    """Read-only view of a .index.col file.
+
+    ``column(name)`` is a memoryview over the mmapped int64/uint32 array
+    (raw codes, INT_NULL/STR_NULL for nulls); ``strings(name)`` is the
+    dictionary for a string column. The object is also a sequence of row
+    dicts, decoded on access, so it can stand in for a list of NDJSON rows.
+    """
+
+    def __init__(self, col_file):
+        with open(col_file, "rb") as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.mm[:len(COL_MAGIC)] != COL_MAGIC:
+            raise ValueError(f"not an index column file: {col_file}")
+        start = len(COL_MAGIC) + HEADER_LEN.size
+        (header_len,) = HEADER_LEN.unpack(self.mm[len(COL_MAGIC):start])
+        self.header = json.loads(self.mm[start:start + header_len].decode("utf-8"))
+        if self.header["byteorder"] != sys.byteorder:
+            raise ValueError(f"index column file has {self.header['byteorder']}-endian data: {col_file}")
+
+        self.rows = self.header["rows"]
+        self.names = [column["name"] for column in self.header["columns"]]
+        self.kinds = {column["name"]: column["kind"] for column in self.header["columns"]}
+        self.tables = self.header["strings"]
+        data_start = start + header_len + (-(start + header_len) % 8)
+        view = memoryview(self.mm)
+        self.columns = {}
+        for column in self.header["columns"]:
+            fmt = "I" if column["kind"] == "str" else "q"
+            offset = data_start + column["offset"]
+            size = self.rows * struct.calcsize(fmt)
+            if offset + size > len(self.mm):
+                raise ValueError(f"index column file is truncated: {col_file}")
+            self.columns[column["name"]] = view[offset:offset + size].cast(fmt)
+
+    def column(self, name):
+        return self.columns[name]
+
+    def strings(self, name):
+        return self.tables[name]
+
+    def values(self, name):
+        """Yield decoded values of one column (None for nulls)."""
+        data = self.columns[name]
+        kind = self.kinds[name]
+        if kind == "str":
+            table = self.tables[name]
+            return (None if code == STR_NULL else table[code] for code in data)
+        if kind == "time":
+            return map(decode_time, data)
+        return (None if value == INT_NULL else value for value in data)
+
+    def row(self, i):
+        result = {}
+        for name in self.names:
+            value = self.columns[name][i]
+            kind = self.kinds[name]
+            if kind == "str":
+                result[name] = None if value == STR_NULL else self.tables[name][value]
+            elif kind == "time":
+                result[name] = decode_time(value)
+            else:
+                result[name] = None if value == INT_NULL else value
+        return result
+
+    def __len__(self):
+        return self.rows
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self.row(j) for j in range(*i.indices(self.rows))]
+        if i < 0:
+            i += self.rows
+        if not 0 <= i < self.rows:
+            raise IndexError("index row out of range")
+        return self.row(i)
+
+    def __iter__(self):
+        # Decoding column by column is several times faster than row(i) per row
+        names = self.names
+        for values in zip(*(self.values(name) for name in names)):
+            yield dict(zip(names, values))
+
+    def close(self):
+        for data in self.columns.values():
+            data.release()
+        self.columns = {}
+        self.mm.close()
+
+
+def write_columns(col_file, rows, index_file):
+    """Write rows (an iterable of index dicts) read from index_file to col_file."""
+    writer = ColumnWriter(col_file)
+    for row in rows:
+        writer.add(row)
+    return writer.close(index_file)
+
+
+def iter_ndjson(index_file):
+    with open(index_file, "r", encoding="utf-8") as f:
+        for line in f:
+            text = line.strip()
+            if text:
+                yield json.loads(text)
+
+
+def build(index_file, col_file=None):
+    """(Re)build the sidecar for index_file; returns the number of rows."""
+    return write_columns(col_file or col_path_for(index_file), iter_ndjson(index_file), index_file)
+
+
+def source_matches(header, index_file):
+    """True if the sidecar header still describes index_file's content."""
+    st = os.stat(index_file)
+    if header.get("sourceSize") != st.st_size:
+        return False
+    if header.get("sourceMtimeNs") == st.st_mtime_ns:
+        return True
+    # Same size, new mtime: only the content decides
+    return header.get("sourceSha256") is not None and header["sourceSha256"] == file_sha256(index_file)
+
+
+def open_columns(index_file, fields=None):
+    """Return IndexColumns for index_file's sidecar, or None if missing or stale.
+
+    With fields, decoded rows only carry those keys (the others are never read).
+    """
+    real_index = os.path.realpath(index_file)
+    col_file = col_path_for(real_index)
+    if not os.path.isfile(col_file):
+        return None
+    try:
+        columns = IndexColumns(col_file)
+    except (OSError, ValueError, KeyError) as exc:
+        print(f"Warning: ignoring {col_file}: {exc}", file=sys.stderr)
+        return None
+    if not source_matches(columns.header, real_index):
+        columns.close()
+        return None
+    if fields:
+        columns.names = [name for name in columns.names if name in fields]
+    return columns
+
+
+def iter_rows(index_file, fields=None):
+    """Yield index_file's rows, from a current .index.col sidecar when present.
+
+    fields limits which keys sidecar rows decode; the sidecar is closed once
+    iteration ends (or the generator is closed early).
+    """
+    columns = open_columns(index_file, fields)
+    if columns is None:
+        yield from iter_ndjson(index_file)
+        return
+    try:
+        yield from columns
+    finally:
+        columns.close()
+
+
+def main(argv=None):
+    """CLI interface for the columnar index."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Columnar sidecar for index.ndjson")
+    subparsers = parser.add_subparsers(dest="command", help="Commands")
+
+    build_parser = subparsers.add_parser("build", help="Build the .index.col sidecar")
+    build_parser.add_argument("index_file", help="Path to index.ndjson")
+    build_parser.add_argument("-o", "--output", help="Sidecar path (default: <index>.col)")
+
+    info_parser = subparsers.add_parser("info", help="Show rows and columns of a sidecar")
+    info_parser.add_argument("col_file", help="Path to .index.col")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        try:
+            count = build(args.index_file, args.output)
+        except ValueError as exc:
+            print(f"Error: {exc}", file=sys.stderr)
+            return 1
+        print(f"Wrote {count} rows -> {args.output or col_path_for(args.index_file)}", file=sys.stderr)
+        return 0
+
+    if args.command == "info":
+        columns = IndexColumns(args.col_file)
+        print(f"rows: {len(columns)}")
+        for name in columns.names:
+            kind = columns.kinds[name]
+            extra = f" ({len(columns.strings(name))} distinct)" if kind == "str" else ""
+            print(f"{name}: {kind}{extra}")
+        return 0
+
+    parser.print_help()
+    return 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -9,6 +9,7 @@ import json
 import os
 import re
 import sys
+from functools import lru_cache
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple
 from urllib.parse import urlparse
@@ -202,6 +203,95 @@ def is_host_allowed(host: str, allow_hosts: List[str], deny_hosts: List[str]) ->
     return False, 'not_in_whitelist'
 
 
+# Distinct hosts whose verdict CompiledPolicy remembers
+VERDICT_CACHE_SIZE = 65536
+
+
+class HostMatcher:
+    """A list of wildcard host patterns compiled once for repeated matching.
+
+    ``*.domain`` patterns (no other wildcard) go into a trie of reversed
+    labels, so a host is checked against all of them in one walk over its
+    labels. The remaining patterns are joined into a single anchored
+    alternation regex. ``matches`` gives the same answer as
+    ``host_matches_any`` (case-insensitive).
+    """
+
+    # Marks a trie node where a ``*.`` pattern ends; not a string, so it
+    # cannot collide with a label (an empty label included)
+    SUFFIX_END = None
+
+    def __init__(self, patterns: List[str]):
+        self.trie: Dict = {}
+        self.has_suffixes = False
+        others = []
+        for pattern in patterns:
+            domain = pattern[2:]
+            if pattern.startswith('*.') and domain and '*' not in domain:
+                node = self.trie
+                for label in reversed(domain.lower().split('.')):
+                    node = node.setdefault(label, {})
+                node[self.SUFFIX_END] = True
+                self.has_suffixes = True
+            else:
+                others.append(wildcard_to_regex(pattern))
+        self.regex = re.compile(f'^(?:{"|".join(others)})$', re.IGNORECASE) if others else None
+
+    def matches_suffix(self, host: str) -> bool:
+        """True if host is ``<one or more chars>.<domain>`` for a trie domain."""
+        labels = host.lower().split('.')
+        node = self.trie
+        # Stop before the first label: the wildcard needs something to cover
+        for depth in range(len(labels) - 1, 0, -1):
+            node = node.get(labels[depth])
+            if node is None:
+                return False
+            if self.SUFFIX_END in node:
+                return True
+        return False
+
+    def matches(self, host: str) -> bool:
+        if self.has_suffixes and self.matches_suffix(host):
+            return True
+        return self.regex is not None and self.regex.match(host) is not None
+
+
+class CompiledPolicy:
+    """Allow/deny lists compiled once, with the verdict memoized per host.
+
+    ``check`` returns what ``is_host_allowed`` returns for the same lists;
+    use it wherever many hosts (index rows, live flows) are checked against
+    one policy.
+    """
+
+    def __init__(self, allow_hosts: List[str], deny_hosts: List[str]):
+        self.allow_hosts = list(allow_hosts or [])
+        self.deny_hosts = list(deny_hosts or [])
+        self.allow = HostMatcher(self.allow_hosts)
+        self.deny = HostMatcher(self.deny_hosts)
+        self.check = lru_cache(maxsize=VERDICT_CACHE_SIZE)(self._check)
+
+    @classmethod
+    def from_policy(cls, policy: Dict) -> 'CompiledPolicy':
+        """Compile the scope section of a load_policy() dict."""
+        scope = policy.get('scope') or {}
+        return cls(scope.get('allow_hosts', []), scope.get('deny_hosts', []))
+
+    def _check(self, host: str) -> Tuple[bool, str]:
+        if not host:
+            return False, 'empty_host'
+        if self.deny_hosts and self.deny.matches(host):
+            return False, 'denied_by_blacklist'
+        if not self.allow_hosts:
+            return True, 'no_whitelist'
+        if self.allow.matches(host):
+            return True, 'allowed_by_whitelist'
+        return False, 'not_in_whitelist'
+
+    def is_allowed(self, host: str) -> bool:
+        return self.check(host)[0]
+
+
 def generate_default_policy(target_url: str) -> Dict:
     """Generate default policy from target URL.
 
@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+"""Mergeable latency quantile sketch.
+
+``LatencySketch`` is a log-linear (HDR-style) histogram of non-negative
+integer milliseconds. Values below ``2 * SUB_BUCKETS`` get a bucket each and
+are kept exactly; above that every power of two is split into SUB_BUCKETS
+buckets, so a reported quantile is within 1 / (2 * SUB_BUCKETS) (about 0.4%)
+of the true value. Count, sum, min and max are exact.
+
+Sketches merge by adding bucket counts, so per-shard or per-session sketches
+combine into the sketch of the whole without the raw durations. ``to_dict``
+and ``from_dict`` give the JSON form stored in ai.json:
+
+    {"count": N, "sum": S, "min": a, "max": b, "subBuckets": 128,
+     "buckets": [[bucket, count], ...]}
+
+``quantile(q)`` uses the same rank as the old ``sorted(d)[int((n-1) * q)]``
+code, so small latencies report exactly what they always did. When NumPy is
+installed ``add_many`` bins large batches vectorized.
+
+``mann_whitney(a, b)`` compares two sketches with the Mann-Whitney U test
+and Cliff's delta in one walk over their buckets; values sharing a bucket
+count as ties, which only makes the test more conservative.
+"""
+
+import json
+import math
+import sys
+
+SUB_BUCKET_BITS = 7
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+EXACT_LIMIT = SUB_BUCKETS * 2
+
+# Quantiles reported per endpoint and for the whole capture
+QUANTILES = (0.5, 0.9, 0.95, 0.99, 0.999)
+
+# Below this batch size the NumPy round trip costs more than it saves
+NUMPY_MIN_BATCH = 4096
+
+# Bucket indexes of int64 values stay below this (keys of grouped_sketches)
+BUCKET_SPAN = 64 * SUB_BUCKETS
+
+
+def numpy_module():
+    """Return numpy, or None when it is not installed."""
+    try:
+        import numpy
+        return numpy
+    except ImportError:
+        return None
+
+
+def quantile_label(q):
+    """0.95 -> "p95", 0.999 -> "p99.9"."""
+    return "p" + f"{q * 100:.3f}".rstrip("0").rstrip(".")
+
+
+def bucket_index(value):
+    if value < EXACT_LIMIT:
+        return value
+    shift = value.bit_length() - SUB_BUCKET_BITS - 1
+    return (shift + 1) * SUB_BUCKETS + (value >> shift) - SUB_BUCKETS
+
+
+def bucket_indexes(np, data):
+    """Vectorized bucket_index over a non-negative int64 array."""
+    # frexp's exponent is the bit length for integers below 2**53
+    shift = np.maximum(np.frexp(data.astype(np.float64))[1] - SUB_BUCKET_BITS - 1, 0)
+    return np.where(data < EXACT_LIMIT, data, (shift + 1) * SUB_BUCKETS + (data >> shift) - SUB_BUCKETS)
+
+
+def clean_values(np, values):
+    """Durations as a non-negative int64 array, rounded like add()."""
+    data = np.asarray(values)
+    if data.dtype.kind != "i":
+        data = np.rint(data.astype(np.float64)).astype(np.int64)
+    return np.maximum(data.astype(np.int64, copy=False), 0)
+
+
+def bucket_bounds(index):
+    """Return (lowest, highest) value that falls into bucket index."""
+    if index < EXACT_LIMIT:
+        return index, index
+    shift = index // SUB_BUCKETS - 1
+    low = (index % SUB_BUCKETS + SUB_BUCKETS) << shift
+    return low, low + (1 << shift) - 1
+
+
+class LatencySketch:
+    """Streaming, mergeable histogram of durations in milliseconds."""
+
+    def __init__(self):
+        self.buckets = {}
+        self.count = 0
+        self.sum = 0
+        self.min = None
+        self.max = None
+
+    def add(self, value):
+        value = max(int(round(value)), 0)
+        index = value if value < EXACT_LIMIT else bucket_index(value)
+        buckets = self.buckets
+        buckets[index] = buckets.get(index, 0) + 1
+        self.count += 1
+        self.sum += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def add_many(self, values):
+        """Add a sequence of durations (vectorized with NumPy for large batches)."""
+        np = numpy_module() if len(values) >= NUMPY_MIN_BATCH else None
+        if np is None:
+            for value in values:
+                self.add(value)
+            return
+        data = clean_values(np, values)
+        buckets = self.buckets
+        for bucket, count in zip(*(part.tolist() for part in np.unique(bucket_indexes(np, data), return_counts=True))):
+            buckets[bucket] = buckets.get(bucket, 0) + count
+        self.count += len(data)
+        self.sum += int(data.sum())
+        low, high = int(data.min()), int(data.max())
+        self.min = low if self.min is None else min(self.min, low)
+        self.max = high if self.max is None else max(self.max, high)
+
+    def merge(self, other):
+        """Fold other (a LatencySketch) into this sketch; returns self."""
+        if other.count == 0:
+            return self
+        buckets = self.buckets
+        for index, count in other.buckets.items():
+            buckets[index] = buckets.get(index, 0) + count
+        self.count += other.count
+        self.sum += other.sum
+        self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = other.max if self.max is None else max(self.max, other.max)
+        return self
+
+    def __len__(self):
+        return self.count
+
+    def __eq__(self, other):
+        if not isinstance(other, LatencySketch):
+            return NotImplemented
+        return self.to_dict() == other.to_dict()
+
+    def mean(self):
+        """Integer mean, as the reports have always shown it (0 when empty)."""
+        return int(self.sum / self.count) if self.count else 0
+
+    def quantiles(self, qs=QUANTILES):
+        """Return [value, ...] for each q in qs (0 when empty), in one walk."""
+        if not self.count:
+            return [0 for _ in qs]
+        ranks = sorted((int((self.count - 1) * q), i) for i, q in enumerate(qs))
+        result = [0] * len(qs)
+        pos = 0
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            while pos < len(ranks) and ranks[pos][0] < seen:
+                low, high = bucket_bounds(index)
+                value = (low + high) // 2
+                result[ranks[pos][1]] = min(max(value, self.min), self.max)
+                pos += 1
+            if pos == len(ranks):
+                break
+        return result
+
+    def quantile(self, q):
+        return self.quantiles((q,))[0]
+
+    def percentiles(self, qs=QUANTILES):
+        """Return {"p50": ms, ...} for each q in qs."""
+        return {quantile_label(q): value for q, value in zip(qs, self.quantiles(qs))}
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "min": self.min,
+            "max": self.max,
+            "subBuckets": SUB_BUCKETS,
+            "buckets": [[index, self.buckets[index]] for index in sorted(self.buckets)],
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """Rebuild a sketch from to_dict() output; raises ValueError if incompatible."""
+        if data.get("subBuckets") != SUB_BUCKETS:
+            raise ValueError(f"sketch uses {data.get('subBuckets')} sub-buckets, expected {SUB_BUCKETS}")
+        sketch = cls()
+        for index, count in data["buckets"]:
+            sketch.buckets[index] = sketch.buckets.get(index, 0) + count
+        sketch.count = data["count"]
+        sketch.sum = data["sum"]
+        sketch.min = data["min"]
+        sketch.max = data["max"]
+        if sum(sketch.buckets.values()) != sketch.count:
+            raise ValueError("sketch bucket counts do not add up to its count")
+        return sketch
+
+
+def merge_sketches(sketches):
+    """Merge an iterable of LatencySketch into a new sketch."""
+    merged = LatencySketch()
+    for sketch in sketches:
+        merged.merge(sketch)
+    return merged
+
+
+def mann_whitney(baseline, current):
+    """Mann-Whitney U test of current against baseline (two LatencySketch).
+
+    Returns {"u", "z", "p_value", "effect_size"} where u counts the
+    (baseline, current) pairs in which current is slower (ties count half),
+    p_value is two-sided from the tie-corrected normal approximation, and
+    effect_size is Cliff's delta, 2u / (n1 * n2) - 1: +1 when every current
+    value is slower, -1 when every one is faster. None when either is empty.
+    """
+    n1, n2 = baseline.count, current.count
+    if not n1 or not n2:
+        return None
+    u = 0.0
+    below = 0  # baseline values in lower buckets than the current position
+    ties = 0
+    for index in sorted(set(baseline.buckets) | set(current.buckets)):
+        b = baseline.buckets.get(index, 0)
+        c = current.buckets.get(index, 0)
+        u += c * (below + b / 2)
+        below += b
+        t = b + c
+        ties += t ** 3 - t
+
+    n = n1 + n2
+    mean = n1 * n2 / 2
+    variance = n1 * n2 / 12 * ((n + 1) - ties / (n * (n - 1))) if n > 1 else 0.0
+    if variance > 0:
+        # Continuity correction towards the mean
+        z = (u - mean - math.copysign(0.5, u - mean)) / math.sqrt(variance) if u != mean else 0.0
+        p_value = math.erfc(abs(z) / math.sqrt(2))
+    else:
+        z, p_value = 0.0, 1.0
+    return {
+        "u": u,
+        "z": round(z, 4),
+        "p_value": float(f"{min(p_value, 1.0):.4g}"),
+        "effect_size": round(2 * u / (n1 * n2) - 1, 4),
+    }
+
+
+def effect_label(delta):
+    """Conventional magnitude of a Cliff's delta (Romano et al. thresholds)."""
+    delta = abs(delta)
+    if delta < 0.147:
+        return "negligible"
+    if delta < 0.33:
+        return "small"
+    if delta < 0.474:
+        return "medium"
+    return "large"
+
+
+def grouped_sketches(np, groups, values, n_groups):
+    """Return [LatencySketch] for group ids 0..n_groups-1 (NumPy arrays in)."""
+    sketches = [LatencySketch() for _ in range(n_groups)]
+    if not len(values):
+        return sketches
+    data = clean_values(np, values)
+    groups = np.asarray(groups, dtype=np.int64)
+
+    keys, counts = np.unique(groups * BUCKET_SPAN + bucket_indexes(np, data), return_counts=True)
+    for key, count in zip(keys.tolist(), counts.tolist()):
+        group, index = divmod(key, BUCKET_SPAN)
+        sketches[group].buckets[index] = count
+
+    order = np.argsort(groups, kind="stable")
+    groups, data = groups[order], data[order]
+    starts = np.flatnonzero(np.concatenate(([True], groups[1:] != groups[:-1])))
+    ends = np.append(starts[1:], len(groups))
+    stats = zip(groups[starts].tolist(), (ends - starts).tolist(), np.add.reduceat(data, starts).tolist(),
+                np.minimum.reduceat(data, starts).tolist(), np.maximum.reduceat(data, starts).tolist())
+    for group, count, total, low, high in stats:
+        sketch = sketches[group]
+        sketch.count, sketch.sum, sketch.min, sketch.max = count, total, low, high
+    return sketches
+
+
+def main(argv=None):
+    """CLI interface: merge sketches from ai.json files and print percentiles."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Merge latency sketches from ai.json files")
+    parser.add_argument("ai_json", nargs="+", help="ai.json files written by ai_brief.py")
+    parser.add_argument("--endpoint", help="Merge one endpoint's sketches instead of the whole capture")
+    args = parser.parse_args(argv)
+
+    merged = LatencySketch()
+    for path in args.ai_json:
+        with open(path, "r", encoding="utf-8") as f:
+            stats = json.load(f).get("stats", {})
+        if args.endpoint:
+            data = (stats.get("endpointLatency") or {}).get(args.endpoint, {}).get("sketch")
+        else:
+            data = stats.get("latencySketch")
+        if not data:
+            continue
+        try:
+            merged.merge(LatencySketch.from_dict(data))
+        except (KeyError, TypeError, ValueError) as exc:
+            print(f"Error: {path}: invalid sketch: {exc}", file=sys.stderr)
+            return 1
+
+    print(f"count: {merged.count}")
+    print(f"avg: {merged.mean()}ms")
+    for label, value in merged.percentiles().items():
+        print(f"{label}: {value}ms")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
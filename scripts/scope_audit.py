@@ -10,32 +10,23 @@ import sys
 from collections import Counter
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, Iterable, List, Optional, Tuple
 
 # Import policy module
 sys.path.insert(0, str(Path(__file__).parent))
-from policy import is_host_allowed, load_policy
+from index_columns import iter_rows
+from policy import CompiledPolicy, load_policy
 
+# Index fields read by audit_entries
+AUDIT_FIELDS = ('id', 'host', 'url', 'method')
 
-def load_index(index_file: str) -> List[Dict]:
-    """Load index entries from NDJSON file.
+# Violations listed in the audit result; the rest are only counted
+MAX_VIOLATIONS = 50
 
-    Args:
-        index_file: Path to .index.ndjson file
 
-    Returns:
-        List of index entry dicts (capped at 100000 entries)
-    """
-    MAX_ENTRIES = 100000
-    entries = []
-    with open(index_file, 'r', encoding='utf-8') as f:
-        for line in f:
-            line = line.strip()
-            if line:
-                entries.append(json.loads(line))
-                if len(entries) >= MAX_ENTRIES:
-                    break
-    return entries
+def load_index(index_file: str, fields: Optional[Tuple[str, ...]] = None) -> List[Dict]:
+    """Load all index entries into a list (see index_columns.iter_rows to stream them)."""
+    return list(iter_rows(index_file, fields))
 
 
 def run_scope_audit(
@@ -51,52 +42,152 @@ def run_scope_audit(
         deny_hosts: Blacklist patterns
 
     Returns:
-        Audit result dict with:
-            - status: 'pass' | 'violation'
-            - total_requests: int
-            - in_scope_count: int
-            - out_of_scope_count: int
-            - violations: list of violation details
-            - host_summary: Counter of hosts
+        Audit result dict (see audit_entries)
     """
-    entries = load_index(index_file)
+    return audit_entries(iter_rows(index_file, AUDIT_FIELDS), allow_hosts, deny_hosts)
 
-    total = len(entries)
-    in_scope = 0
-    out_of_scope = 0
-    violations = []
-    host_counter = Counter()
 
-    for entry in entries:
+class ScopeAuditor:
+    """Streaming scope audit: feed index entries with add(), then result().
+
+    Only counters, per-host counts and the first MAX_VIOLATIONS violations
+    are kept, so memory does not grow with the number of entries. Host
+    verdicts come from a policy.CompiledPolicy, so the patterns are compiled
+    once and each distinct host is matched once.
+    """
+
+    def __init__(self, allow_hosts: List[str], deny_hosts: List[str]):
+        self.allow_hosts = allow_hosts
+        self.deny_hosts = deny_hosts
+        self.policy = CompiledPolicy(allow_hosts, deny_hosts)
+        self.total = 0
+        self.in_scope = 0
+        self.out_of_scope = 0
+        self.violations = []
+        self.host_counter = Counter()
+
+    def add(self, entry: Dict) -> Tuple[bool, str]:
+        """Count one entry; returns its (allowed, reason) verdict."""
         host = entry.get('host', '')
-        host_counter[host] += 1
+        self.total += 1
+        self.host_counter[host] += 1
 
-        allowed, reason = is_host_allowed(host, allow_hosts, deny_hosts)
+        allowed, reason = self.policy.check(host)
 
         if allowed:
-            in_scope += 1
-        else:
-            out_of_scope += 1
-            violations.append({
+            self.in_scope += 1
+            return allowed, reason
+        self.out_of_scope += 1
+        if len(self.violations) < MAX_VIOLATIONS:
+            self.violations.append({
                 'id': entry.get('id'),
                 'host': host,
                 'url': entry.get('url', ''),
                 'method': entry.get('method', ''),
                 'reason': reason,
             })
+        return allowed, reason
+
+    def result(self) -> Dict:
+        """Audit result dict (see audit_entries)."""
+        return {
+            'status': 'pass' if self.out_of_scope == 0 else 'violation',
+            'auditedAt': datetime.now(timezone.utc).isoformat(),
+            'totalRequests': self.total,
+            'inScopeCount': self.in_scope,
+            'outOfScopeCount': self.out_of_scope,
+            'violations': self.violations,
+            'violationsTruncated': self.out_of_scope > MAX_VIOLATIONS,
+            'hostSummary': dict(self.host_counter.most_common(20)),
+        }
+
+
+def audit_entries(
+    entries: Iterable[Dict],
+    allow_hosts: List[str],
+    deny_hosts: List[str]
+) -> Dict:
+    """Audit index entries against scope policy in one streaming pass.
+
+    Args:
+        entries: Iterable of index entry dicts
+        allow_hosts: Whitelist patterns
+        deny_hosts: Blacklist patterns
+
+    Returns:
+        Audit result dict with:
+            - status: 'pass' | 'violation'
+            - auditedAt: ISO 8601 timestamp
+            - totalRequests: int
+            - inScopeCount: int
+            - outOfScopeCount: int
+            - violations: list of violation details (first MAX_VIOLATIONS)
+            - violationsTruncated: bool
+            - hostSummary: {host: count} for the 20 busiest hosts
+    """
+    auditor = ScopeAuditor(allow_hosts, deny_hosts)
+    for entry in entries:
+        auditor.add(entry)
+    return auditor.result()
+
+
+def write_audit_result(output_file: str, result: Dict) -> None:
+    """Write audit result JSON with owner-only permissions.
+
+    Args:
+        output_file: Destination path
+        result: Audit result dict
+    """
+    fd = os.open(output_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump(result, f, indent=2, ensure_ascii=False)
+
+
+def resolve_scope_hosts(
+    policy_file: Optional[str],
+    allow_csv: Optional[str],
+    deny_csv: Optional[str]
+) -> Tuple[List[str], List[str]]:
+    """Resolve allow/deny lists from a policy file and CLI overrides.
+
+    Args:
+        policy_file: Optional policy JSON path
+        allow_csv: Comma-separated allow hosts (overrides policy)
+        deny_csv: Comma-separated deny hosts (overrides policy)
+
+    Returns:
+        Tuple of (allow_hosts, deny_hosts)
+    """
+    allow_hosts = []
+    deny_hosts = []
+
+    if policy_file:
+        policy = load_policy(policy_file)
+        allow_hosts = policy['scope'].get('allow_hosts', [])
+        deny_hosts = policy['scope'].get('deny_hosts', [])
+
+    if allow_csv:
+        allow_hosts = [h.strip() for h in allow_csv.split(',') if h.strip()]
+    if deny_csv:
+        deny_hosts = [h.strip() for h in deny_csv.split(',') if h.strip()]
 
-    status = 'pass' if out_of_scope == 0 else 'violation'
+    return allow_hosts, deny_hosts
 
-    return {
-        'status': status,
-        'auditedAt': datetime.now(timezone.utc).isoformat(),
-        'totalRequests': total,
-        'inScopeCount': in_scope,
-        'outOfScopeCount': out_of_scope,
-        'violations': violations[:50],  # Limit to first 50
-        'violationsTruncated': len(violations) > 50,
-        'hostSummary': dict(host_counter.most_common(20)),
-    }
+
+def load_guard_result(guard_file: str) -> Dict:
+    """Load the live counters written by the ScopeGuard capture addon.
+
+    The file already has the audit result layout (plus source, mode,
+    actions and complete), so stop can use it instead of auditing the index.
+
+    Raises:
+        ValueError: If the file is not a scope guard result
+    """
+    with open(guard_file, 'r', encoding='utf-8') as f:
+        result = json.load(f)
+    if result.get('source') != 'scope-guard' or 'outOfScopeCount' not in result:
+        raise ValueError(f'not a scope guard result: {guard_file}')
+    return result
 
 
 def render_audit_summary(result: Dict) -> str:
@@ -116,6 +207,9 @@ def render_audit_summary(result: Dict) -> str:
     lines.append(f'- **Total requests**: `{result["totalRequests"]}`')
     lines.append(f'- **In-scope**: `{result["inScopeCount"]}`')
     lines.append(f'- **Out-of-scope**: `{result["outOfScopeCount"]}`')
+    if result.get('source') == 'scope-guard':
+        actions = ', '.join(f'{k}={v}' for k, v in result.get('actions', {}).items())
+        lines.append(f'- **Enforced at capture**: `{result.get("mode", "")}` ({actions})')
     lines.append('')
 
     if result['status'] == 'violation':
@@ -146,7 +240,8 @@ def main():
     import argparse
 
     parser = argparse.ArgumentParser(description='Audit captured traffic against scope policy')
-    parser.add_argument('index_file', help='Path to index.ndjson file')
+    parser.add_argument('index_file', nargs='?', help='Path to index.ndjson file')
+    parser.add_argument('--guard', help='Use the live counters of the ScopeGuard capture addon instead of an index')
     parser.add_argument('-p', '--policy', help='Policy JSON file')
     parser.add_argument('--allow-hosts', help='Comma-separated allow hosts (overrides policy)')
     parser.add_argument('--deny-hosts', help='Comma-separated deny hosts (overrides policy)')
@@ -155,28 +250,24 @@ def main():
 
     args = parser.parse_args()
 
-    # Load policy or use CLI args
-    allow_hosts = []
-    deny_hosts = []
-
-    if args.policy:
-        policy = load_policy(args.policy)
-        allow_hosts = policy['scope'].get('allow_hosts', [])
-        deny_hosts = policy['scope'].get('deny_hosts', [])
-
-    if args.allow_hosts:
-        allow_hosts = [h.strip() for h in args.allow_hosts.split(',') if h.strip()]
-    if args.deny_hosts:
-        deny_hosts = [h.strip() for h in args.deny_hosts.split(',') if h.strip()]
-
-    # Run audit
-    result = run_scope_audit(args.index_file, allow_hosts, deny_hosts)
+    if args.guard:
+        try:
+            result = load_guard_result(args.guard)
+        except (OSError, ValueError) as exc:
+            print(f'Error: {exc}', file=sys.stderr)
+            sys.exit(1)
+    elif args.index_file:
+        # Load policy or use CLI args
+        allow_hosts, deny_hosts = resolve_scope_hosts(args.policy, args.allow_hosts, args.deny_hosts)
+
+        # Run audit
+        result = run_scope_audit(args.index_file, allow_hosts, deny_hosts)
+    else:
+        parser.error('index_file or --guard is required')
 
     # Output
     if args.output:
-        fd = os.open(args.output, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
-        with os.fdopen(fd, 'w', encoding='utf-8') as f:
-            json.dump(result, f, indent=2, ensure_ascii=False)
+        write_audit_result(args.output, result)
         print(f'Audit result written to {args.output}', file=sys.stderr)
 
     if args.summary:
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""Segmented captures: size/time rotated flow files of one session.
+
+With ``startCaptures.sh --rotate-size 512M`` / ``--rotate-interval 10m`` the
+SegmentRotator addon (capture_addons.py) writes
+
+    capture_<RUN_ID>.0001.flow, capture_<RUN_ID>.0002.flow, ...
+
+and keeps the session-level list in ``capture_<RUN_ID>.segments.json``:
+
+    {"schemaVersion": "1", "runId": ..., "rotateSize": bytes, "rotateInterval": seconds,
+     "complete": bool, "segments": [{"seq": 1, "flow": path, "openedAt": ..., "closedAt": ...,
+                                     "bytes": n, "flows": n, "liveIndex": path}, ...]}
+
+Every per-segment artifact is named after its segment the way session
+artifacts are named after the session (``segment_artifact``):
+``capture_<RUN_ID>.0001.index.ndjson``, ``.0001.flow.idx``, ``.0001.har`` and so
+on. ``capture_pipeline.py --segments`` post-processes the segments in
+parallel, merges their index rows into the session index and records the
+segment artifacts in the list; ``cleanup.py`` expires segments one by one
+and marks them ``"expired": true``.
+"""
+
+import json
+import os
+import re
+import sys
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+SEGMENTS_SUFFIX = ".segments.json"
+SEGMENT_DIGITS = 4
+
+# capture_<RUN_ID>.<seq>.<rest>: files that belong to one segment
+SEGMENT_FILE_RE = re.compile(r"^capture_([0-9_]+)\.(\d{%d,})\.(.+)$" % SEGMENT_DIGITS)
+
+DURATION_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def now_local():
+    """Local timestamp in the format of STARTED_AT and RUN_IDs."""
+    return datetime.now().strftime("%Y-%m-%dT%H:%M:%S")
+
+
+def segments_path_for(session_base):
+    """capture_<RUN_ID> -> capture_<RUN_ID>.segments.json."""
+    return session_base + SEGMENTS_SUFFIX
+
+
+def session_base_for(segments_file):
+    """capture_<RUN_ID>.segments.json -> capture_<RUN_ID>."""
+    if not segments_file.endswith(SEGMENTS_SUFFIX):
+        raise ValueError(f"not a segments file: {segments_file}")
+    return segments_file[:-len(SEGMENTS_SUFFIX)]
+
+
+def segment_flow_path(session_base, seq):
+    return f"{session_base}.{seq:0{SEGMENT_DIGITS}d}.flow"
+
+
+def segment_artifact(session_base, segment_flow, session_path):
+    """Name of the segment's counterpart of a session artifact.
+
+    ``capture_X.index.ndjson`` -> ``capture_X.0002.index.ndjson`` for segment
+    ``capture_X.0002.flow``. Returns None for paths not named after the
+    session.
+    """
+    if not session_path or not session_path.startswith(session_base + "."):
+        return None
+    return segment_flow[:-len(".flow")] + session_path[len(session_base):]
+
+
+def parse_rotate_size(text):
+    """``512M`` / ``1G`` / ``4096`` -> bytes (> 0)."""
+    from cleanup import parse_size
+
+    size = parse_size(str(text))
+    if size <= 0:
+        raise ValueError(f"Rotate size must be positive: {text}")
+    return size
+
+
+def parse_duration(text):
+    """``90`` / ``90s`` / ``10m`` / ``2h`` / ``1d`` -> seconds (> 0)."""
+    text = str(text).strip().lower()
+    unit = DURATION_UNITS.get(text[-1:]) if text else None
+    number = text[:-1] if unit else text
+    try:
+        seconds = float(number) * (unit or 1)
+    except ValueError:
+        raise ValueError(f"Invalid duration: {text}") from None
+    if seconds <= 0:
+        raise ValueError(f"Duration must be positive: {text}")
+    return seconds
+
+
+def load_segments(segments_file):
+    with open(segments_file, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if not isinstance(data, dict) or not isinstance(data.get("segments"), list):
+        raise ValueError(f"not a segments file: {segments_file}")
+    return data
+
+
+def write_segments(segments_file, data):
+    """Replace segments_file atomically (owner-only permissions)."""
+    tmp_file = f"{segments_file}.tmp.{os.getpid()}"
+    fd = os.open(tmp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_file, segments_file)
+
+
+def live_segments(data):
+    """Segments not expired by cleanup, in capture order."""
+    return [segment for segment in data["segments"] if not segment.get("expired")]
+
+
+def segment_files(captures_dir, run_id, seq):
+    """Files of one segment (capture_<RUN_ID>.<seq>.*), symlinks skipped."""
+    prefix = f"capture_{run_id}.{seq:0{SEGMENT_DIGITS}d}."
+    files = []
+    for name in sorted(os.listdir(captures_dir)):
+        path = os.path.join(captures_dir, name)
+        if name.startswith(prefix) and os.path.isfile(path) and not os.path.islink(path):
+            files.append(path)
+    return files
+
+
+def main(argv=None):
+    """CLI interface: list the segments of a session."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="List the segments of a rotated capture")
+    parser.add_argument("segments_file", help="capture_<RUN_ID>.segments.json")
+    parser.add_argument("--json", action="store_true", help="Print the segments file")
+    args = parser.parse_args(argv)
+
+    try:
+        data = load_segments(args.segments_file)
+    except (OSError, ValueError) as exc:
+        print(f"Error: {exc}", file=sys.stderr)
+        return 1
+    if args.json:
+        print(json.dumps(data, indent=2, ensure_ascii=False))
+        return 0
+    for segment in data["segments"]:
+        state = "expired" if segment.get("expired") else ("open" if not segment.get("closedAt") else "closed")
+        print(f"{segment['seq']:>5}  {state:<7}  {segment.get('openedAt', '')}  "
+              f"{segment.get('bytes', 0):>12}  {segment.get('flows', 0):>7}  {segment['flow']}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -25,13 +25,30 @@ Options:
       --allow-hosts <list>  Comma-separated allowed hosts (supports wildcards)
       --deny-hosts <list>   Comma-separated denied hosts (supports wildcards)
       --policy <file>       Policy JSON file for scope control
+      --scope-mode <mode>   Enforce the scope while capturing: off (default), block,
+                            passthrough-without-recording, record-and-flag
       --force-recover       Clean stale state file automatically
+      --no-live-index       Do not write index.ndjson while capturing
+      --rotate-size <size>  Start a new flow file segment at this size (e.g. 512M, 1G)
+      --rotate-interval <t> Start a new flow file segment after this long (e.g. 90s, 10m, 2h)
   -h, --help                Show this help
 
 Scope Control:
   By default, all hosts are captured. Use --allow-hosts or --policy to restrict.
   Deny list takes precedence over allow list.
 
+  --scope-mode enforces the policy per request with the ScopeGuard addon:
+    block                          answer out-of-scope requests with 403, record nothing
+    passthrough-without-recording  proxy them, but keep them out of flow and index
+    record-and-flag                record them with a scope-guard comment and marker
+  Live violation counters replace the scope audit at stop.
+
+Rotation:
+  --rotate-size / --rotate-interval write capture_<RUN_ID>.0001.flow,
+  .0002.flow, ... (each with its own index) listed in
+  capture_<RUN_ID>.segments.json. Stop processes the segments in parallel
+  and merges their rows into the session index and reports.
+
   Examples:
     --allow-hosts "example.com,*.example.com"
     --deny-hosts "*.google.com,accounts.*"
@@ -42,6 +59,7 @@ Examples:
   ./startCaptures.sh --program --port 18081
   ./startCaptures.sh --dir /path/to/project
   ./startCaptures.sh --allow-hosts "example.com,*.example.com"
+  ./startCaptures.sh --program --rotate-size 512M --rotate-interval 10m
 EOF
 }
 
@@ -77,6 +95,10 @@ FORCE_RECOVER=false
 ALLOW_HOSTS=""
 DENY_HOSTS=""
 POLICY_FILE=""
+SCOPE_GUARD_MODE="off"
+LIVE_INDEX=true
+ROTATE_SIZE=""
+ROTATE_INTERVAL=""
 
 MITM_PID=""
 TMP_ENV_FILE=""
@@ -154,6 +176,10 @@ while [[ $# -gt 0 ]]; do
             FORCE_RECOVER=true
             shift
             ;;
+        --no-live-index)
+            LIVE_INDEX=false
+            shift
+            ;;
         --allow-hosts)
             require_value_arg "$1" "${2:-}"
             ALLOW_HOSTS="${2:-}"
@@ -169,6 +195,21 @@ while [[ $# -gt 0 ]]; do
             POLICY_FILE="${2:-}"
             shift 2
             ;;
+        --scope-mode)
+            require_value_arg "$1" "${2:-}"
+            SCOPE_GUARD_MODE="${2:-}"
+            shift 2
+            ;;
+        --rotate-size)
+            require_value_arg "$1" "${2:-}"
+            ROTATE_SIZE="${2:-}"
+            shift 2
+            ;;
+        --rotate-interval)
+            require_value_arg "$1" "${2:-}"
+            ROTATE_INTERVAL="${2:-}"
+            shift 2
+            ;;
         -h|--help)
             usage
             exit 0
@@ -181,6 +222,38 @@ while [[ $# -gt 0 ]]; do
     esac
 done
 
+case "$SCOPE_GUARD_MODE" in
+    off|block|passthrough-without-recording|record-and-flag) ;;
+    *)
+        err "Invalid --scope-mode: $SCOPE_GUARD_MODE"
+        usage
+        exit 1
+        ;;
+esac
+if [[ "$SCOPE_GUARD_MODE" != "off" ]]; then
+    if [[ -z "$POLICY_FILE" && -z "$ALLOW_HOSTS" && -z "$DENY_HOSTS" ]]; then
+        err "--scope-mode $SCOPE_GUARD_MODE needs --policy, --allow-hosts or --deny-hosts"
+        exit 1
+    fi
+    if [[ ! -f "$SCRIPT_DIR/capture_addons.py" ]]; then
+        err "--scope-mode needs capture_addons.py next to startCaptures.sh"
+        exit 1
+    fi
+fi
+
+if [[ -n "$ROTATE_SIZE" ]] && ! [[ "$ROTATE_SIZE" =~ ^[0-9]+(\.[0-9]+)?[kKmMgG]?[bB]?$ && "$ROTATE_SIZE" =~ [1-9] ]]; then
+    err "Invalid --rotate-size: $ROTATE_SIZE (e.g. 512M, 1G)"
+    exit 1
+fi
+if [[ -n "$ROTATE_INTERVAL" ]] && ! [[ "$ROTATE_INTERVAL" =~ ^[0-9]+[smhd]?$ && "$ROTATE_INTERVAL" =~ [1-9] ]]; then
+    err "Invalid --rotate-interval: $ROTATE_INTERVAL (e.g. 90s, 10m, 2h)"
+    exit 1
+fi
+if [[ -n "$ROTATE_SIZE$ROTATE_INTERVAL" && ! -f "$SCRIPT_DIR/capture_addons.py" ]]; then
+    err "--rotate-size/--rotate-interval need capture_addons.py next to startCaptures.sh"
+    exit 1
+fi
+
 if [[ -z "$LISTEN_HOST" ]]; then
     err "Listen host cannot be empty"
     exit 1
@@ -240,6 +313,12 @@ fi
 
 RUN_ID="$(date +%Y%m%d_%H%M%S)_$$"
 FLOW_FILE="$CAPTURES_DIR/capture_${RUN_ID}.flow"
+SEGMENTS_FILE=""
+if [[ -n "$ROTATE_SIZE$ROTATE_INTERVAL" ]]; then
+    # Rotated captures start in segment 0001; the addon lists every segment
+    FLOW_FILE="$CAPTURES_DIR/capture_${RUN_ID}.0001.flow"
+    SEGMENTS_FILE="$CAPTURES_DIR/capture_${RUN_ID}.segments.json"
+fi
 HAR_FILE="$CAPTURES_DIR/capture_${RUN_ID}.har"
 LOG_FILE="$CAPTURES_DIR/capture_${RUN_ID}.log"
 MANIFEST_FILE="$CAPTURES_DIR/capture_${RUN_ID}.manifest.json"
@@ -248,6 +327,9 @@ SUMMARY_FILE="$CAPTURES_DIR/capture_${RUN_ID}.summary.md"
 AI_JSON_FILE="$CAPTURES_DIR/capture_${RUN_ID}.ai.json"
 AI_MD_FILE="$CAPTURES_DIR/capture_${RUN_ID}.ai.md"
 NAVLOG_FILE="$CAPTURES_DIR/capture_${RUN_ID}.navigation.ndjson"
+LIVE_STATE_FILE=""
+COUNTERS_FILE=""
+SCOPE_GUARD_FILE=""
 
 # Initialize empty navlog for browser navigation tracking
 : > "$NAVLOG_FILE"
@@ -327,12 +409,42 @@ fi
 # P0-2.1 Fix: Use array instead of eval to prevent command injection
 MITM_CMD=(mitmdump -q --listen-host "$LISTEN_HOST" --listen-port "$LISTEN_PORT")
 MITM_CMD+=(--set block_global=false --set flow_detail=0)
-
-if [[ -n "$ALLOW_HOSTS_REGEX" ]]; then
-    MITM_CMD+=(--set "allow_hosts=$ALLOW_HOSTS_REGEX")
+# Open upstream connections when the first request needs them, not at CONNECT
+# (mitmproxy's default eager strategy), so TCP/TLS setup falls inside that
+# request and HAR connect/ssl and the index's connectMs/tlsMs can be recorded
+MITM_CMD+=(--set connection_strategy=lazy)
+
+# block and record-and-flag must see out-of-scope requests, so mitmproxy may not
+# tunnel those hosts past the addons; passthrough keeps the cheaper tunnels
+if [[ "$SCOPE_GUARD_MODE" == "off" || "$SCOPE_GUARD_MODE" == "passthrough-without-recording" ]]; then
+    if [[ -n "$ALLOW_HOSTS_REGEX" ]]; then
+        MITM_CMD+=(--set "allow_hosts=$ALLOW_HOSTS_REGEX")
+    fi
+    if [[ -n "$IGNORE_HOSTS_REGEX" ]]; then
+        MITM_CMD+=(--set "ignore_hosts=$IGNORE_HOSTS_REGEX")
+    fi
 fi
-if [[ -n "$IGNORE_HOSTS_REGEX" ]]; then
-    MITM_CMD+=(--set "ignore_hosts=$IGNORE_HOSTS_REGEX")
+
+# Capture addons: live counters (for progress) and live index.ndjson rows
+if [[ -f "$SCRIPT_DIR/capture_addons.py" ]]; then
+    COUNTERS_FILE="$CAPTURES_DIR/capture_${RUN_ID}.counters.json"
+    MITM_CMD+=(-s "$SCRIPT_DIR/capture_addons.py" --set "live_counters_file=$COUNTERS_FILE")
+    if [[ "$LIVE_INDEX" == "true" ]]; then
+        LIVE_STATE_FILE="$CAPTURES_DIR/capture_${RUN_ID}.live.json"
+        LIVE_INDEX_FILE="$INDEX_FILE"
+        # Rotated captures index each segment; stop merges them into INDEX_FILE
+        [[ -n "$SEGMENTS_FILE" ]] && LIVE_INDEX_FILE="$CAPTURES_DIR/capture_${RUN_ID}.0001.index.ndjson"
+        MITM_CMD+=(--set "live_index_file=$LIVE_INDEX_FILE" --set "live_index_state=$LIVE_STATE_FILE")
+    fi
+    if [[ -n "$SEGMENTS_FILE" ]]; then
+        MITM_CMD+=(--set "rotate_segments_file=$SEGMENTS_FILE" --set "rotate_size=$ROTATE_SIZE"
+            --set "rotate_interval=$ROTATE_INTERVAL")
+    fi
+    if [[ "$SCOPE_GUARD_MODE" != "off" ]]; then
+        SCOPE_GUARD_FILE="$CAPTURES_DIR/capture_${RUN_ID}.scope.json"
+        MITM_CMD+=(--set "scope_guard_policy=$SCOPE_POLICY_FILE" --set "scope_guard_mode=$SCOPE_GUARD_MODE"
+            --set "scope_guard_file=$SCOPE_GUARD_FILE")
+    fi
 fi
 
 # Start mitmproxy with scope filtering (no eval)
@@ -392,12 +504,19 @@ SUMMARY_FILE="$SUMMARY_FILE"
 AI_JSON_FILE="$AI_JSON_FILE"
 AI_MD_FILE="$AI_MD_FILE"
 NAVLOG_FILE="$NAVLOG_FILE"
+LIVE_STATE_FILE="$LIVE_STATE_FILE"
+COUNTERS_FILE="$COUNTERS_FILE"
 LISTEN_HOST="$LISTEN_HOST"
 LISTEN_PORT="$LISTEN_PORT"
 STARTED_AT="$STARTED_AT"
 ALLOW_HOSTS="$ALLOW_HOSTS"
 DENY_HOSTS="$DENY_HOSTS"
 SCOPE_POLICY_FILE="$SCOPE_POLICY_FILE"
+SCOPE_GUARD_MODE="$SCOPE_GUARD_MODE"
+SCOPE_GUARD_FILE="$SCOPE_GUARD_FILE"
+SEGMENTS_FILE="$SEGMENTS_FILE"
+ROTATE_SIZE="$ROTATE_SIZE"
+ROTATE_INTERVAL="$ROTATE_INTERVAL"
 PROXY_BACKEND="$PROXY_BACKEND"
 PREV_PROXY_MODE="$PREV_PROXY_MODE"
 PREV_PROXY_HTTP_HOST="$PREV_PROXY_HTTP_HOST"
@@ -442,7 +561,10 @@ data = {
         'aiMd': sys.argv[15],
         'navlog': sys.argv[16],
         'stateEnv': sys.argv[17],
-        'flowSha256AtStart': sys.argv[18]
+        'flowSha256AtStart': sys.argv[18],
+        'liveState': sys.argv[19],
+        'counters': sys.argv[20],
+        'segments': sys.argv[21]
     },
     'rawDataPolicy': {
         'immutable': True,
@@ -454,6 +576,7 @@ json.dump(data, sys.stdout, indent=2, ensure_ascii=False)
   "$LISTEN_HOST" "$LISTEN_PORT" "$MITM_PID" \
   "$FLOW_FILE" "$HAR_FILE" "$LOG_FILE" "$INDEX_FILE" "$SUMMARY_FILE" \
   "$AI_JSON_FILE" "$AI_MD_FILE" "$NAVLOG_FILE" "$ENV_FILE" "$FLOW_SHA256" \
+  "$LIVE_STATE_FILE" "$COUNTERS_FILE" "$SEGMENTS_FILE" \
   > "${MANIFEST_FILE}.tmp.$$"
 chmod 600 "${MANIFEST_FILE}.tmp.$$" 2>/dev/null || true
 mv "${MANIFEST_FILE}.tmp.$$" "$MANIFEST_FILE"
@@ -464,6 +587,9 @@ echo "================================================"
 echo " PID:          $MITM_PID"
 echo " Listen:       $LISTEN_HOST:$LISTEN_PORT"
 echo " Flow file:    $FLOW_FILE"
+if [[ -n "$SEGMENTS_FILE" ]]; then
+    echo " Segments:     $SEGMENTS_FILE (rotate at ${ROTATE_SIZE:-any size}, ${ROTATE_INTERVAL:-any age})"
+fi
 echo " HAR file:     $HAR_FILE"
 echo " Log file:     $LOG_FILE"
 echo " Manifest:     $MANIFEST_FILE"
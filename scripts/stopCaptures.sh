@@ -14,12 +14,20 @@ Options:
       --keep-env            Keep proxy_info.env for debugging
       --har-backend <name>  HAR backend: auto|mitmdump|python (default: auto)
       --no-har              Skip HAR conversion
+      --har-format <fmt>    HAR output: pretty|compact|gzip|zstd (default: pretty)
+      --body-store          Store bodies once in captures/bodies/ and reference them by hash
+      --catalog             Ingest into captures/catalog.sqlite (automatic once it exists)
+      --pipeline <mode>     Post-processing: auto|fused|legacy (default: auto)
   -h, --help                Show this help
 
 Examples:
   ./stopCaptures.sh
   ./stopCaptures.sh --har-backend python
   ./stopCaptures.sh --har-backend python --no-har
+  ./stopCaptures.sh --pipeline legacy
+  ./stopCaptures.sh --har-format gzip
+  ./stopCaptures.sh --body-store
+  ./stopCaptures.sh --catalog
 EOF
 }
 
@@ -88,14 +96,23 @@ har_convert_with_python() {
     local har_file="$2"
     local script_dir
     script_dir="$(cd "$(dirname "$0")" && pwd)"
+    local format_args=()
+    [[ "$HAR_FORMAT" != "pretty" ]] && format_args=(--compact)
+    if [[ "$BODY_STORE" == "true" ]]; then
+        format_args+=(--body-store "$BODY_STORE_DIR" --body-refs "$BODY_REFS_FILE")
+    fi
 
-    python3 "$script_dir/flow2har.py" "$flow_file" "$har_file" 9>&- >/dev/null 2>&1
+    python3 "$script_dir/flow2har.py" "$flow_file" "$har_file" ${format_args[@]+"${format_args[@]}"} 9>&- >/dev/null 2>&1
 }
 
 TARGET_DIR="$DEFAULT_BASE_DIR"
 KEEP_ENV=false
 HAR_BACKEND="auto"
 DO_HAR=true
+HAR_FORMAT="pretty"
+BODY_STORE=false
+USE_CATALOG=false
+PIPELINE_MODE="auto"
 
 while [[ $# -gt 0 ]]; do
     case "$1" in
@@ -117,6 +134,24 @@ while [[ $# -gt 0 ]]; do
             DO_HAR=false
             shift
             ;;
+        --pipeline)
+            require_value_arg "$1" "${2:-}"
+            PIPELINE_MODE="${2:-}"
+            shift 2
+            ;;
+        --har-format)
+            require_value_arg "$1" "${2:-}"
+            HAR_FORMAT="${2:-}"
+            shift 2
+            ;;
+        --body-store)
+            BODY_STORE=true
+            shift
+            ;;
+        --catalog)
+            USE_CATALOG=true
+            shift
+            ;;
         -h|--help)
             usage
             exit 0
@@ -139,6 +174,30 @@ if [[ "$HAR_BACKEND" != "auto" && "$HAR_BACKEND" != "mitmdump" && "$HAR_BACKEND"
     exit 1
 fi
 
+if [[ "$PIPELINE_MODE" != "auto" && "$PIPELINE_MODE" != "fused" && "$PIPELINE_MODE" != "legacy" ]]; then
+    err "Invalid --pipeline: $PIPELINE_MODE"
+    exit 1
+fi
+
+HAR_SUFFIX=""
+case "$HAR_FORMAT" in
+    pretty|compact) ;;
+    gzip) HAR_SUFFIX=".gz" ;;
+    zstd) HAR_SUFFIX=".zst" ;;
+    *)
+        err "Invalid --har-format: $HAR_FORMAT"
+        exit 1
+        ;;
+esac
+if [[ "$HAR_FORMAT" != "pretty" && "$HAR_BACKEND" == "mitmdump" ]]; then
+    err "--har-format $HAR_FORMAT requires --har-backend auto or python"
+    exit 1
+fi
+if [[ "$BODY_STORE" == "true" && "$HAR_BACKEND" == "mitmdump" ]]; then
+    err "--body-store requires --har-backend auto or python"
+    exit 1
+fi
+
 CAPTURES_DIR="$TARGET_DIR/captures"
 ENV_FILE="$CAPTURES_DIR/proxy_info.env"
 LOCK_FILE="$CAPTURES_DIR/.capture.lock"
@@ -174,6 +233,9 @@ PROGRAM_MODE="$(read_kv "PROGRAM_MODE" "$ENV_FILE")"
 RUN_ID="$(read_kv "RUN_ID" "$ENV_FILE")"
 FLOW_FILE="$(read_kv "FLOW_FILE" "$ENV_FILE")"
 HAR_FILE="$(read_kv "HAR_FILE" "$ENV_FILE")"
+if [[ -n "$HAR_FILE" ]]; then
+    HAR_FILE="${HAR_FILE}${HAR_SUFFIX}"
+fi
 LOG_FILE="$(read_kv "LOG_FILE" "$ENV_FILE")"
 MANIFEST_FILE="$(read_kv "MANIFEST_FILE" "$ENV_FILE")"
 INDEX_FILE="$(read_kv "INDEX_FILE" "$ENV_FILE")"
@@ -181,12 +243,17 @@ SUMMARY_FILE="$(read_kv "SUMMARY_FILE" "$ENV_FILE")"
 AI_JSON_FILE="$(read_kv "AI_JSON_FILE" "$ENV_FILE")"
 AI_MD_FILE="$(read_kv "AI_MD_FILE" "$ENV_FILE")"
 NAVLOG_FILE="$(read_kv "NAVLOG_FILE" "$ENV_FILE")"
+LIVE_STATE_FILE="$(read_kv "LIVE_STATE_FILE" "$ENV_FILE")"
+COUNTERS_FILE="$(read_kv "COUNTERS_FILE" "$ENV_FILE")"
 LISTEN_HOST="$(read_kv "LISTEN_HOST" "$ENV_FILE")"
 LISTEN_PORT="$(read_kv "LISTEN_PORT" "$ENV_FILE")"
 STARTED_AT="$(read_kv "STARTED_AT" "$ENV_FILE")"
 ALLOW_HOSTS="$(read_kv "ALLOW_HOSTS" "$ENV_FILE")"
 DENY_HOSTS="$(read_kv "DENY_HOSTS" "$ENV_FILE")"
 SCOPE_POLICY_FILE="$(read_kv "SCOPE_POLICY_FILE" "$ENV_FILE")"
+SCOPE_GUARD_MODE="$(read_kv "SCOPE_GUARD_MODE" "$ENV_FILE")"
+SCOPE_GUARD_FILE="$(read_kv "SCOPE_GUARD_FILE" "$ENV_FILE")"
+SEGMENTS_FILE="$(read_kv "SEGMENTS_FILE" "$ENV_FILE")"
 PREV_PROXY_MODE="$(read_kv "PREV_PROXY_MODE" "$ENV_FILE")"
 PREV_PROXY_HTTP_HOST="$(read_kv "PREV_PROXY_HTTP_HOST" "$ENV_FILE")"
 PREV_PROXY_HTTP_PORT="$(read_kv "PREV_PROXY_HTTP_PORT" "$ENV_FILE")"
@@ -194,7 +261,10 @@ PREV_PROXY_HTTPS_HOST="$(read_kv "PREV_PROXY_HTTPS_HOST" "$ENV_FILE")"
 PREV_PROXY_HTTPS_PORT="$(read_kv "PREV_PROXY_HTTPS_PORT" "$ENV_FILE")"
 
 BASE_NO_EXT=""
-if [[ -n "$FLOW_FILE" ]]; then
+if [[ -n "$SEGMENTS_FILE" ]]; then
+    # Rotated capture: session artifacts are named after the run, not segment 0001
+    BASE_NO_EXT="${SEGMENTS_FILE%.segments.json}"
+elif [[ -n "$FLOW_FILE" ]]; then
     BASE_NO_EXT="${FLOW_FILE%.flow}"
 fi
 if [[ -z "$BASE_NO_EXT" ]]; then
@@ -220,6 +290,10 @@ fi
 if [[ -z "$AI_MD_FILE" ]]; then
     AI_MD_FILE="${BASE_NO_EXT}.ai.md"
 fi
+FLOW_IDX_FILE="${BASE_NO_EXT}.flow.idx"
+INDEX_COL_FILE="${INDEX_FILE%.ndjson}.col"
+BODY_STORE_DIR="$CAPTURES_DIR/bodies"
+BODY_REFS_FILE="${BASE_NO_EXT}.bodies.txt"
 
 # ── P0-2 Fix: Validate all file paths are within CAPTURES_DIR ──
 # This prevents proxy_info.env tampering from causing arbitrary file operations
@@ -234,6 +308,13 @@ validate_capture_paths() {
         "$AI_JSON_FILE"
         "$AI_MD_FILE"
         "$NAVLOG_FILE"
+        "$LIVE_STATE_FILE"
+        "$COUNTERS_FILE"
+        "$SCOPE_GUARD_FILE"
+        "$SEGMENTS_FILE"
+        "$FLOW_IDX_FILE"
+        "$INDEX_COL_FILE"
+        "$BODY_REFS_FILE"
     )
 
     for p in "${paths_to_check[@]}"; do
@@ -273,35 +354,174 @@ fi
 
 HAR_STATUS="skipped"
 HAR_BACKEND_USED="none"
+REPORT_STATUS="skipped"
+AI_BRIEF_STATUS="skipped"
+SCOPE_AUDIT_STATUS="skipped"
+SCOPE_AUDIT_FILE="${BASE_NO_EXT}.scope_audit.json"
+SCOPE_AUDIT_VIOLATIONS=0
+# ScopeGuard enforced the policy during capture; its counters replace the index audit
+SCOPE_GUARD_ACTIVE=false
+if [[ -n "$SCOPE_GUARD_MODE" && "$SCOPE_GUARD_MODE" != "off" && -n "$SCOPE_GUARD_FILE" && -f "$SCOPE_GUARD_FILE" ]]; then
+    SCOPE_GUARD_ACTIVE=true
+fi
+FLOW_SHA256=""
+INDEX_SOURCE="flow"
+
+# Rotated capture: capture_pipeline.py processes the segments in parallel and
+# merges their rows into the session index, summary, AI brief and scope audit
+SEGMENTED=false
+SEGMENT_COUNT=0
+PIPELINE_STATUS="skipped"
+PIPELINE_ERROR_LOG="$CAPTURES_DIR/pipeline_error.log"
+if [[ -n "$SEGMENTS_FILE" && -f "$SEGMENTS_FILE" ]]; then
+    SEGMENTED=true
+    if [[ "$PIPELINE_MODE" == "legacy" || "$HAR_BACKEND" == "mitmdump" ]]; then
+        warn "Rotated capture: segments are always processed by capture_pipeline.py"
+    fi
+    if [[ "$DO_HAR" == "true" && -z "$HAR_FILE" ]]; then
+        HAR_FILE="${BASE_NO_EXT}.har${HAR_SUFFIX}"
+    fi
+    PIPELINE_STATUS_FILE="$CAPTURES_DIR/.pipeline_status.$$"
+    PIPELINE_CMD=(python3 "$SCRIPT_DIR/capture_pipeline.py" --segments "$SEGMENTS_FILE"
+        --index "$INDEX_FILE" --summary "$SUMMARY_FILE" --flow-idx "$FLOW_IDX_FILE"
+        --index-col "$INDEX_COL_FILE"
+        --manifest "$MANIFEST_FILE" --ai-json "$AI_JSON_FILE" --ai-md "$AI_MD_FILE"
+        --status-file "$PIPELINE_STATUS_FILE")
+    [[ "$DO_HAR" == "true" ]] && PIPELINE_CMD+=(--har "$HAR_FILE")
+    [[ "$DO_HAR" == "true" && "$HAR_FORMAT" != "pretty" ]] && PIPELINE_CMD+=(--har-compact)
+    if [[ "$BODY_STORE" == "true" ]]; then
+        PIPELINE_CMD+=(--body-store "$BODY_STORE_DIR" --body-refs "$BODY_REFS_FILE")
+    fi
+    if [[ -n "$SCOPE_POLICY_FILE" && -f "$SCOPE_POLICY_FILE" ]]; then
+        PIPELINE_CMD+=(--policy "$SCOPE_POLICY_FILE")
+    fi
+    if [[ "$SCOPE_GUARD_ACTIVE" != "true" && ( -n "$ALLOW_HOSTS" || -n "$DENY_HOSTS" || -n "$SCOPE_POLICY_FILE" ) ]]; then
+        PIPELINE_CMD+=(--scope-audit "$SCOPE_AUDIT_FILE")
+        if [[ -z "$SCOPE_POLICY_FILE" || ! -f "$SCOPE_POLICY_FILE" ]]; then
+            [[ -n "$ALLOW_HOSTS" ]] && PIPELINE_CMD+=(--allow-hosts "$ALLOW_HOSTS")
+            [[ -n "$DENY_HOSTS" ]] && PIPELINE_CMD+=(--deny-hosts "$DENY_HOSTS")
+        fi
+    fi
 
-if [[ "$DO_HAR" == "true" ]]; then
-    if [[ -n "$FLOW_FILE" && -f "$FLOW_FILE" && -s "$FLOW_FILE" ]]; then
-        if [[ -z "$HAR_FILE" ]]; then
-            HAR_FILE="$CAPTURES_DIR/capture_$(date +%Y%m%d_%H%M%S)_stop.har"
+    if "${PIPELINE_CMD[@]}" 9>&- 2>"$PIPELINE_ERROR_LOG"; then
+        PIPELINE_STATUS="ok"
+        HAR_STATUS="$(read_kv "HAR_STATUS" "$PIPELINE_STATUS_FILE")"
+        REPORT_STATUS="$(read_kv "REPORT_STATUS" "$PIPELINE_STATUS_FILE")"
+        AI_BRIEF_STATUS="$(read_kv "AI_BRIEF_STATUS" "$PIPELINE_STATUS_FILE")"
+        SCOPE_AUDIT_STATUS="$(read_kv "SCOPE_AUDIT_STATUS" "$PIPELINE_STATUS_FILE")"
+        SCOPE_AUDIT_VIOLATIONS="$(read_kv "SCOPE_AUDIT_VIOLATIONS" "$PIPELINE_STATUS_FILE")"
+        INDEX_SOURCE="$(read_kv "INDEX_SOURCE" "$PIPELINE_STATUS_FILE")"
+        SEGMENT_COUNT="$(read_kv "SEGMENTS" "$PIPELINE_STATUS_FILE")"
+        [[ "$HAR_STATUS" != "skipped" ]] && HAR_BACKEND_USED="pipeline"
+        rm -f "$PIPELINE_ERROR_LOG"
+    else
+        PIPELINE_STATUS="failed"
+        REPORT_STATUS="failed"
+        [[ "$DO_HAR" == "true" ]] && HAR_STATUS="failed"
+    fi
+    rm -f "$PIPELINE_STATUS_FILE" 2>/dev/null || true
+    # Session HAR, flow offsets and body refs are per segment (see the segments file)
+    HAR_FILE=""
+    FLOW_FILE="$(python3 -c "import json,sys; s=[x for x in json.load(open(sys.argv[1]))['segments'] if not x.get('expired')]; print(s[-1]['flow'] if s else '')" "$SEGMENTS_FILE" 9>&- 2>/dev/null || true)"
+fi
+
+# Fused pipeline: decode the flow file once and produce HAR, index, summary,
+# AI brief, scope audit and SHA-256 in a single pass (capture_pipeline.py).
+# The mitmdump HAR backend still needs the legacy per-stage path.
+if [[ "$SEGMENTED" != "true" && "$PIPELINE_MODE" != "legacy" && "$HAR_BACKEND" != "mitmdump" \
+      && -n "$FLOW_FILE" && -f "$FLOW_FILE" && -s "$FLOW_FILE" ]]; then
+    if [[ "$DO_HAR" == "true" && -z "$HAR_FILE" ]]; then
+        HAR_FILE="$CAPTURES_DIR/capture_$(date +%Y%m%d_%H%M%S)_stop.har${HAR_SUFFIX}"
+    fi
+    PIPELINE_STATUS_FILE="$CAPTURES_DIR/.pipeline_status.$$"
+    PIPELINE_CMD=(python3 "$SCRIPT_DIR/capture_pipeline.py" "$FLOW_FILE"
+        --index "$INDEX_FILE" --summary "$SUMMARY_FILE" --flow-idx "$FLOW_IDX_FILE"
+        --index-col "$INDEX_COL_FILE"
+        --manifest "$MANIFEST_FILE" --ai-json "$AI_JSON_FILE" --ai-md "$AI_MD_FILE"
+        --status-file "$PIPELINE_STATUS_FILE")
+    [[ "$DO_HAR" == "true" ]] && PIPELINE_CMD+=(--har "$HAR_FILE")
+    [[ "$DO_HAR" == "true" && "$HAR_FORMAT" != "pretty" ]] && PIPELINE_CMD+=(--har-compact)
+    if [[ "$BODY_STORE" == "true" ]]; then
+        PIPELINE_CMD+=(--body-store "$BODY_STORE_DIR" --body-refs "$BODY_REFS_FILE")
+    fi
+    # Without HAR, a cleanly closed live index saves decoding the flow file at all
+    if [[ "$DO_HAR" != "true" && -n "$LIVE_STATE_FILE" && -f "$LIVE_STATE_FILE" && -s "$INDEX_FILE" ]] \
+        && python3 -c "import json,sys; sys.exit(0 if json.load(open(sys.argv[1])).get('complete') else 1)" "$LIVE_STATE_FILE" 9>&- 2>/dev/null; then
+        PIPELINE_CMD+=(--reuse-index)
+    fi
+    if [[ -n "$SCOPE_POLICY_FILE" && -f "$SCOPE_POLICY_FILE" ]]; then
+        PIPELINE_CMD+=(--policy "$SCOPE_POLICY_FILE")
+    fi
+    if [[ "$SCOPE_GUARD_ACTIVE" != "true" && ( -n "$ALLOW_HOSTS" || -n "$DENY_HOSTS" || -n "$SCOPE_POLICY_FILE" ) ]]; then
+        PIPELINE_CMD+=(--scope-audit "$SCOPE_AUDIT_FILE")
+        if [[ -z "$SCOPE_POLICY_FILE" || ! -f "$SCOPE_POLICY_FILE" ]]; then
+            [[ -n "$ALLOW_HOSTS" ]] && PIPELINE_CMD+=(--allow-hosts "$ALLOW_HOSTS")
+            [[ -n "$DENY_HOSTS" ]] && PIPELINE_CMD+=(--deny-hosts "$DENY_HOSTS")
         fi
+    fi
 
-        case "$HAR_BACKEND" in
-            mitmdump)
-                HAR_BACKEND_USED="mitmdump"
-                if har_convert_with_mitmdump "$FLOW_FILE" "$HAR_FILE"; then
-                    HAR_STATUS="ok"
-                else
-                    HAR_STATUS="failed"
-                fi
-                ;;
-            python)
-                HAR_BACKEND_USED="python"
-                if har_convert_with_python "$FLOW_FILE" "$HAR_FILE"; then
-                    HAR_STATUS="ok"
-                else
-                    HAR_STATUS="failed"
-                fi
-                ;;
-            auto)
-                if command -v mitmdump >/dev/null 2>&1; then
+    if command -v python3 >/dev/null 2>&1 && [[ -f "$SCRIPT_DIR/capture_pipeline.py" ]] \
+        && "${PIPELINE_CMD[@]}" 9>&- 2>"$PIPELINE_ERROR_LOG"; then
+        PIPELINE_STATUS="ok"
+        HAR_STATUS="$(read_kv "HAR_STATUS" "$PIPELINE_STATUS_FILE")"
+        REPORT_STATUS="$(read_kv "REPORT_STATUS" "$PIPELINE_STATUS_FILE")"
+        AI_BRIEF_STATUS="$(read_kv "AI_BRIEF_STATUS" "$PIPELINE_STATUS_FILE")"
+        SCOPE_AUDIT_STATUS="$(read_kv "SCOPE_AUDIT_STATUS" "$PIPELINE_STATUS_FILE")"
+        SCOPE_AUDIT_VIOLATIONS="$(read_kv "SCOPE_AUDIT_VIOLATIONS" "$PIPELINE_STATUS_FILE")"
+        FLOW_SHA256="$(read_kv "FLOW_SHA256" "$PIPELINE_STATUS_FILE")"
+        INDEX_SOURCE="$(read_kv "INDEX_SOURCE" "$PIPELINE_STATUS_FILE")"
+        [[ "$HAR_STATUS" != "skipped" ]] && HAR_BACKEND_USED="pipeline"
+        rm -f "$PIPELINE_ERROR_LOG"
+    else
+        PIPELINE_STATUS="failed"
+        if [[ "$PIPELINE_MODE" == "fused" ]]; then
+            REPORT_STATUS="failed"
+        fi
+    fi
+    rm -f "$PIPELINE_STATUS_FILE" 2>/dev/null || true
+fi
+
+# Legacy per-stage path (mitmdump HAR backend, --pipeline legacy, or fused fallback)
+if [[ "$SEGMENTED" != "true" && "$PIPELINE_STATUS" != "ok" && ! ( "$PIPELINE_MODE" == "fused" && "$PIPELINE_STATUS" == "failed" ) ]]; then
+    if [[ "$DO_HAR" == "true" ]]; then
+        if [[ -n "$FLOW_FILE" && -f "$FLOW_FILE" && -s "$FLOW_FILE" ]]; then
+            if [[ -z "$HAR_FILE" ]]; then
+                HAR_FILE="$CAPTURES_DIR/capture_$(date +%Y%m%d_%H%M%S)_stop.har${HAR_SUFFIX}"
+            fi
+
+            case "$HAR_BACKEND" in
+                mitmdump)
                     HAR_BACKEND_USED="mitmdump"
                     if har_convert_with_mitmdump "$FLOW_FILE" "$HAR_FILE"; then
                         HAR_STATUS="ok"
+                    else
+                        HAR_STATUS="failed"
+                    fi
+                    ;;
+                python)
+                    HAR_BACKEND_USED="python"
+                    if har_convert_with_python "$FLOW_FILE" "$HAR_FILE"; then
+                        HAR_STATUS="ok"
+                    else
+                        HAR_STATUS="failed"
+                    fi
+                    ;;
+                auto)
+                    # mitmdump hardump only writes indented, uncompressed, inline-body HAR
+                    if [[ "$HAR_FORMAT" == "pretty" && "$BODY_STORE" != "true" ]] && command -v mitmdump >/dev/null 2>&1; then
+                        HAR_BACKEND_USED="mitmdump"
+                        if har_convert_with_mitmdump "$FLOW_FILE" "$HAR_FILE"; then
+                            HAR_STATUS="ok"
+                        elif command -v python3 >/dev/null 2>&1; then
+                            HAR_BACKEND_USED="python"
+                            if har_convert_with_python "$FLOW_FILE" "$HAR_FILE"; then
+                                HAR_STATUS="ok"
+                            else
+                                HAR_STATUS="failed"
+                            fi
+                        else
+                            HAR_STATUS="failed"
+                        fi
                     elif command -v python3 >/dev/null 2>&1; then
                         HAR_BACKEND_USED="python"
                         if har_convert_with_python "$FLOW_FILE" "$HAR_FILE"; then
@@ -312,107 +532,113 @@ if [[ "$DO_HAR" == "true" ]]; then
                     else
                         HAR_STATUS="failed"
                     fi
-                elif command -v python3 >/dev/null 2>&1; then
-                    HAR_BACKEND_USED="python"
-                    if har_convert_with_python "$FLOW_FILE" "$HAR_FILE"; then
-                        HAR_STATUS="ok"
-                    else
-                        HAR_STATUS="failed"
-                    fi
-                else
-                    HAR_STATUS="failed"
-                fi
-                ;;
-        esac
-    else
-        HAR_STATUS="no-flow"
+                    ;;
+            esac
+        else
+            HAR_STATUS="no-flow"
+        fi
     fi
-fi
 
-REPORT_STATUS="skipped"
-REPORT_ERROR_LOG="$CAPTURES_DIR/report_error.log"
-if [[ -n "$FLOW_FILE" && -f "$FLOW_FILE" && -s "$FLOW_FILE" ]]; then
-    if command -v python3 >/dev/null 2>&1 && [[ -f "$SCRIPT_DIR/flow_report.py" ]]; then
-        # P1-3: Check Python mitmproxy module
-        if ! python3 -c "from mitmproxy.io import FlowReader" 9>&- 2>/dev/null; then
-            REPORT_STATUS="missing-mitmproxy-module"
-            echo "Python mitmproxy module not found. Install with: pip install mitmproxy" > "$REPORT_ERROR_LOG"
-        # P1-4: Preserve error output for debugging
-        elif python3 "$SCRIPT_DIR/flow_report.py" "$FLOW_FILE" "$INDEX_FILE" "$SUMMARY_FILE" 9>&- 2>"$REPORT_ERROR_LOG"; then
-            REPORT_STATUS="ok"
-            rm -f "$REPORT_ERROR_LOG"
+    REPORT_STATUS="skipped"
+    REPORT_ERROR_LOG="$CAPTURES_DIR/report_error.log"
+    if [[ -n "$FLOW_FILE" && -f "$FLOW_FILE" && -s "$FLOW_FILE" ]]; then
+        if command -v python3 >/dev/null 2>&1 && [[ -f "$SCRIPT_DIR/flow_report.py" ]]; then
+            # P1-3: Check Python mitmproxy module
+            if ! python3 -c "from mitmproxy.io import FlowReader" 9>&- 2>/dev/null; then
+                REPORT_STATUS="missing-mitmproxy-module"
+                echo "Python mitmproxy module not found. Install with: pip install mitmproxy" > "$REPORT_ERROR_LOG"
+            # P1-4: Preserve error output for debugging
+            elif python3 "$SCRIPT_DIR/flow_report.py" "$FLOW_FILE" "$INDEX_FILE" "$SUMMARY_FILE" 9>&- 2>"$REPORT_ERROR_LOG"; then
+                REPORT_STATUS="ok"
+                rm -f "$REPORT_ERROR_LOG"
+            else
+                REPORT_STATUS="failed"
+            fi
         else
-            REPORT_STATUS="failed"
+            REPORT_STATUS="missing-tool"
         fi
     else
-        REPORT_STATUS="missing-tool"
+        REPORT_STATUS="no-flow"
     fi
-else
-    REPORT_STATUS="no-flow"
-fi
 
-AI_BRIEF_STATUS="skipped"
-AI_BRIEF_ERROR_LOG="$CAPTURES_DIR/ai_brief_error.log"
-if [[ "$REPORT_STATUS" == "ok" && -f "$MANIFEST_FILE" && -f "$INDEX_FILE" ]]; then
-    if command -v python3 >/dev/null 2>&1 && [[ -f "$SCRIPT_DIR/ai_brief.py" ]]; then
-        # P1-4: Preserve error output for debugging
-        if python3 "$SCRIPT_DIR/ai_brief.py" "$MANIFEST_FILE" "$INDEX_FILE" "$AI_JSON_FILE" "$AI_MD_FILE" 9>&- 2>"$AI_BRIEF_ERROR_LOG"; then
-            AI_BRIEF_STATUS="ok"
-            rm -f "$AI_BRIEF_ERROR_LOG"
+    AI_BRIEF_STATUS="skipped"
+    AI_BRIEF_ERROR_LOG="$CAPTURES_DIR/ai_brief_error.log"
+    if [[ "$REPORT_STATUS" == "ok" && -f "$MANIFEST_FILE" && -f "$INDEX_FILE" ]]; then
+        if command -v python3 >/dev/null 2>&1 && [[ -f "$SCRIPT_DIR/ai_brief.py" ]]; then
+            # P1-4: Preserve error output for debugging
+            AI_BRIEF_CMD=(python3 "$SCRIPT_DIR/ai_brief.py" "$MANIFEST_FILE" "$INDEX_FILE" "$AI_JSON_FILE" "$AI_MD_FILE")
+            [[ -n "$SCOPE_POLICY_FILE" && -f "$SCOPE_POLICY_FILE" ]] && AI_BRIEF_CMD+=(--policy "$SCOPE_POLICY_FILE")
+            if "${AI_BRIEF_CMD[@]}" 9>&- 2>"$AI_BRIEF_ERROR_LOG"; then
+                AI_BRIEF_STATUS="ok"
+                rm -f "$AI_BRIEF_ERROR_LOG"
+            else
+                AI_BRIEF_STATUS="failed"
+            fi
         else
-            AI_BRIEF_STATUS="failed"
+            AI_BRIEF_STATUS="missing-tool"
         fi
+    elif [[ "$REPORT_STATUS" == "failed" || "$REPORT_STATUS" == "missing-tool" || "$REPORT_STATUS" == "missing-mitmproxy-module" ]]; then
+        AI_BRIEF_STATUS="blocked-by-report"
     else
-        AI_BRIEF_STATUS="missing-tool"
+        AI_BRIEF_STATUS="no-index"
     fi
-elif [[ "$REPORT_STATUS" == "failed" || "$REPORT_STATUS" == "missing-tool" || "$REPORT_STATUS" == "missing-mitmproxy-module" ]]; then
-    AI_BRIEF_STATUS="blocked-by-report"
-else
-    AI_BRIEF_STATUS="no-index"
-fi
-
-# P0-2.1 Fix: Run scope audit independently of report status
-# Audit can run directly on flow file if index is missing
-SCOPE_AUDIT_STATUS="skipped"
-SCOPE_AUDIT_FILE="${BASE_NO_EXT}.scope_audit.json"
-SCOPE_AUDIT_VIOLATIONS=0
 
-if [[ -n "$ALLOW_HOSTS" || -n "$DENY_HOSTS" || -n "$SCOPE_POLICY_FILE" ]]; then
-    if command -v python3 >/dev/null 2>&1 && [[ -f "$SCRIPT_DIR/scope_audit.py" ]]; then
-        # Try to use index file if available, otherwise skip audit
-        if [[ -f "$INDEX_FILE" ]]; then
-            # P0-2.1 Fix: Use array instead of eval to prevent command injection
-            AUDIT_CMD=(python3 "$SCRIPT_DIR/scope_audit.py" "$INDEX_FILE" -o "$SCOPE_AUDIT_FILE")
-            if [[ -n "$SCOPE_POLICY_FILE" && -f "$SCOPE_POLICY_FILE" ]]; then
-                AUDIT_CMD+=(--policy "$SCOPE_POLICY_FILE")
-            else
-                [[ -n "$ALLOW_HOSTS" ]] && AUDIT_CMD+=(--allow-hosts "$ALLOW_HOSTS")
-                [[ -n "$DENY_HOSTS" ]] && AUDIT_CMD+=(--deny-hosts "$DENY_HOSTS")
-            fi
+    # P0-2.1 Fix: Run scope audit independently of report status
+    # Audit can run directly on flow file if index is missing
+    SCOPE_AUDIT_STATUS="skipped"
+
+    if [[ "$SCOPE_GUARD_ACTIVE" == "true" ]]; then
+        :
+    elif [[ -n "$ALLOW_HOSTS" || -n "$DENY_HOSTS" || -n "$SCOPE_POLICY_FILE" ]]; then
+        if command -v python3 >/dev/null 2>&1 && [[ -f "$SCRIPT_DIR/scope_audit.py" ]]; then
+            # Try to use index file if available, otherwise skip audit
+            if [[ -f "$INDEX_FILE" ]]; then
+                # P0-2.1 Fix: Use array instead of eval to prevent command injection
+                AUDIT_CMD=(python3 "$SCRIPT_DIR/scope_audit.py" "$INDEX_FILE" -o "$SCOPE_AUDIT_FILE")
+                if [[ -n "$SCOPE_POLICY_FILE" && -f "$SCOPE_POLICY_FILE" ]]; then
+                    AUDIT_CMD+=(--policy "$SCOPE_POLICY_FILE")
+                else
+                    [[ -n "$ALLOW_HOSTS" ]] && AUDIT_CMD+=(--allow-hosts "$ALLOW_HOSTS")
+                    [[ -n "$DENY_HOSTS" ]] && AUDIT_CMD+=(--deny-hosts "$DENY_HOSTS")
+                fi
 
-            if "${AUDIT_CMD[@]}" 9>&- 2>/dev/null; then
-                SCOPE_AUDIT_STATUS="pass"
-            else
-                SCOPE_AUDIT_STATUS="violation"
-                # Count violations from audit file
-                if [[ -f "$SCOPE_AUDIT_FILE" ]]; then
-                    SCOPE_AUDIT_VIOLATIONS="$(python3 -c "import json,sys; print(json.load(open(sys.argv[1]))['outOfScopeCount'])" "$SCOPE_AUDIT_FILE" 9>&- 2>/dev/null || echo 0)"
+                if "${AUDIT_CMD[@]}" 9>&- 2>/dev/null; then
+                    SCOPE_AUDIT_STATUS="pass"
+                else
+                    SCOPE_AUDIT_STATUS="violation"
+                    # Count violations from audit file
+                    if [[ -f "$SCOPE_AUDIT_FILE" ]]; then
+                        SCOPE_AUDIT_VIOLATIONS="$(python3 -c "import json,sys; print(json.load(open(sys.argv[1]))['outOfScopeCount'])" "$SCOPE_AUDIT_FILE" 9>&- 2>/dev/null || echo 0)"
+                    fi
                 fi
+            else
+                SCOPE_AUDIT_STATUS="no-index"
             fi
         else
-            SCOPE_AUDIT_STATUS="no-index"
+            SCOPE_AUDIT_STATUS="missing-tool"
         fi
     else
-        SCOPE_AUDIT_STATUS="missing-tool"
+        SCOPE_AUDIT_STATUS="no-policy"
     fi
-else
-    SCOPE_AUDIT_STATUS="no-policy"
+fi
+
+if [[ "$SCOPE_GUARD_ACTIVE" == "true" ]]; then
+    GUARD_RC=0
+    python3 "$SCRIPT_DIR/scope_audit.py" --guard "$SCOPE_GUARD_FILE" -o "$SCOPE_AUDIT_FILE" 9>&- >/dev/null 2>&1 || GUARD_RC=$?
+    case "$GUARD_RC" in
+        0) SCOPE_AUDIT_STATUS="pass" ;;
+        2)
+            SCOPE_AUDIT_STATUS="violation"
+            SCOPE_AUDIT_VIOLATIONS="$(python3 -c "import json,sys; print(json.load(open(sys.argv[1]))['outOfScopeCount'])" "$SCOPE_AUDIT_FILE" 9>&- 2>/dev/null || echo 0)"
+            ;;
+        *) SCOPE_AUDIT_STATUS="failed" ;;
+    esac
 fi
 
 STOPPED_AT="$(date +%Y-%m-%dT%H:%M:%S)"
 
-FLOW_SHA256=""
-if [[ -n "$FLOW_FILE" && -f "$FLOW_FILE" ]]; then
+# Rotated captures record a digest per segment in the segments file
+if [[ "$SEGMENTED" != "true" && -z "$FLOW_SHA256" && -n "$FLOW_FILE" && -f "$FLOW_FILE" ]]; then
     FLOW_SHA256="$(compute_sha256 "$FLOW_FILE" || true)"
 fi
 
@@ -436,15 +662,19 @@ data = {
         'policyFile': sys.argv[13],
         'auditStatus': sys.argv[14],
         'auditFile': sys.argv[15],
-        'violations': int(sys.argv[16])
+        'violations': int(sys.argv[16]),
+        'guardMode': sys.argv[37] if sys.argv[38] == 'true' else 'off'
     },
     'artifacts': {
-        'flow': sys.argv[17], 'flowSha256': sys.argv[18],
+        'flow': '' if sys.argv[39] else sys.argv[17], 'flowSha256': sys.argv[18],
         'har': sys.argv[19], 'harStatus': sys.argv[20], 'harBackend': sys.argv[21],
         'log': sys.argv[22], 'manifest': sys.argv[23],
         'index': sys.argv[24], 'summary': sys.argv[25], 'reportStatus': sys.argv[26],
         'aiJson': sys.argv[27], 'aiMd': sys.argv[28], 'aiBriefStatus': sys.argv[29],
-        'navlog': sys.argv[30], 'scopeAudit': sys.argv[31]
+        'navlog': sys.argv[30], 'scopeAudit': sys.argv[31],
+        'liveState': sys.argv[32], 'indexSource': sys.argv[33],
+        'flowIdx': sys.argv[34], 'bodyRefs': sys.argv[35], 'indexCol': sys.argv[36],
+        'segments': sys.argv[39], 'segmentCount': int(sys.argv[40] or 0)
     },
     'rawDataPolicy': {
         'immutable': True,
@@ -458,6 +688,11 @@ json.dump(data, sys.stdout, indent=2, ensure_ascii=False)
   "$FLOW_FILE" "$FLOW_SHA256" "$HAR_FILE" "$HAR_STATUS" "$HAR_BACKEND_USED" \
   "$LOG_FILE" "$MANIFEST_FILE" "$INDEX_FILE" "$SUMMARY_FILE" "$REPORT_STATUS" \
   "$AI_JSON_FILE" "$AI_MD_FILE" "$AI_BRIEF_STATUS" "$NAVLOG_FILE" "$SCOPE_AUDIT_FILE" \
+  "$LIVE_STATE_FILE" "$INDEX_SOURCE" "$([[ -f "$FLOW_IDX_FILE" ]] && echo "$FLOW_IDX_FILE")" \
+  "$([[ -f "$BODY_REFS_FILE" ]] && echo "$BODY_REFS_FILE")" \
+  "$([[ -f "$INDEX_COL_FILE" ]] && echo "$INDEX_COL_FILE")" \
+  "$SCOPE_GUARD_MODE" "$SCOPE_GUARD_ACTIVE" \
+  "$([[ "$SEGMENTED" == "true" ]] && echo "$SEGMENTS_FILE")" "$SEGMENT_COUNT" \
   9>&- > "$MANIFEST_TMP"
 then
     MANIFEST_STATUS="failed"
@@ -467,8 +702,30 @@ else
 fi
 rm -f "$MANIFEST_TMP" 2>/dev/null || true
 
+# Cross-session catalog: opt-in with --catalog, then kept current on every stop
+CATALOG_FILE="$CAPTURES_DIR/catalog.sqlite"
+CATALOG_STATUS="skipped"
+CATALOG_ERROR_LOG="$CAPTURES_DIR/catalog_error.log"
+if [[ "$USE_CATALOG" == "true" || -f "$CATALOG_FILE" ]]; then
+    if [[ "$MANIFEST_STATUS" != "ok" ]]; then
+        CATALOG_STATUS="no-manifest"
+    elif python3 "$SCRIPT_DIR/catalog.py" ingest "$CAPTURES_DIR" "$MANIFEST_FILE" --index "$INDEX_FILE" \
+            9>&- 2>"$CATALOG_ERROR_LOG"; then
+        CATALOG_STATUS="ok"
+        rm -f "$CATALOG_ERROR_LOG"
+    else
+        CATALOG_STATUS="failed"
+    fi
+fi
+
 LATEST_FLOW_LINK="$CAPTURES_DIR/latest.flow"
-LATEST_HAR_LINK="$CAPTURES_DIR/latest.har"
+LATEST_HAR_LINK="$CAPTURES_DIR/latest.har${HAR_SUFFIX}"
+# Drop latest HAR links of the other formats so only the current one remains
+for har_link in "$CAPTURES_DIR/latest.har" "$CAPTURES_DIR/latest.har.gz" "$CAPTURES_DIR/latest.har.zst"; do
+    if [[ "$har_link" != "$LATEST_HAR_LINK" ]]; then
+        rm -f "$har_link" 2>/dev/null || true
+    fi
+done
 LATEST_LOG_LINK="$CAPTURES_DIR/latest.log"
 LATEST_MANIFEST_LINK="$CAPTURES_DIR/latest.manifest.json"
 LATEST_INDEX_LINK="$CAPTURES_DIR/latest.index.ndjson"
@@ -501,17 +758,38 @@ echo " Stop status:    $STOP_STATUS"
 if [[ -n "$LISTEN_HOST" || -n "$LISTEN_PORT" ]]; then
     echo " Listen:         ${LISTEN_HOST:-?}:${LISTEN_PORT:-?}"
 fi
-echo " Flow file:      ${FLOW_FILE:-<unknown>}"
+if [[ "$SEGMENTED" == "true" ]]; then
+    echo " Segments:       $SEGMENTS_FILE ($SEGMENT_COUNT segments, last: ${FLOW_FILE:-<none>})"
+else
+    echo " Flow file:      ${FLOW_FILE:-<unknown>}"
+fi
 echo " HAR file:       ${HAR_FILE:-<none>}"
 echo " HAR status:     $HAR_STATUS"
 echo " HAR backend:    $HAR_BACKEND_USED"
 echo " Index status:   $REPORT_STATUS"
+echo " Index source:   $INDEX_SOURCE"
 echo " Index file:     $INDEX_FILE"
+if [[ -f "$INDEX_COL_FILE" ]]; then
+    echo " Index columns:  $INDEX_COL_FILE"
+fi
+if [[ -f "$FLOW_IDX_FILE" ]]; then
+    echo " Flow offsets:   $FLOW_IDX_FILE"
+fi
+if [[ "$BODY_STORE" == "true" && -f "$BODY_REFS_FILE" ]]; then
+    echo " Body refs:      $BODY_REFS_FILE ($(wc -l < "$BODY_REFS_FILE" | tr -d ' ') bodies in $BODY_STORE_DIR)"
+fi
 echo " Summary file:   $SUMMARY_FILE"
 echo " AI JSON file:   $AI_JSON_FILE"
 echo " AI MD file:     $AI_MD_FILE"
 echo " AI brief:       $AI_BRIEF_STATUS"
-echo " Scope audit:    $SCOPE_AUDIT_STATUS"
+if [[ "$CATALOG_STATUS" != "skipped" ]]; then
+    echo " Catalog:        $CATALOG_STATUS ($CATALOG_FILE)"
+fi
+if [[ "$SCOPE_GUARD_ACTIVE" == "true" ]]; then
+    echo " Scope audit:    $SCOPE_AUDIT_STATUS (enforced at capture: $SCOPE_GUARD_MODE)"
+else
+    echo " Scope audit:    $SCOPE_AUDIT_STATUS"
+fi
 if [[ "$SCOPE_AUDIT_STATUS" == "violation" ]]; then
     echo " [!] Violations:  $SCOPE_AUDIT_VIOLATIONS out-of-scope requests detected!"
 fi
@@ -542,7 +820,10 @@ if [[ -n "$FLOW_FILE" && -f "$FLOW_FILE" ]]; then
     echo " To inspect flow:"
     echo "   mitmweb -r $FLOW_FILE"
 fi
-if [[ "$HAR_STATUS" == "ok" ]]; then
+if [[ "$HAR_STATUS" == "ok" && "$SEGMENTED" == "true" ]]; then
+    echo " HAR ready for AI (one per segment):"
+    echo "   ${BASE_NO_EXT}.*.har"
+elif [[ "$HAR_STATUS" == "ok" ]]; then
     echo " HAR ready for AI:"
     echo "   $HAR_FILE"
 fi
@@ -569,7 +850,7 @@ if [[ -f "$SCRIPT_DIR/ai.sh" && -x "$SCRIPT_DIR/ai.sh" ]]; then
 fi
 echo "================================================"
 
-if [[ "$STOP_STATUS" == "kill-failed" || "$PROXY_STATUS" == "restore-failed" || "$HAR_STATUS" == "failed" || "$REPORT_STATUS" == "failed" || "$AI_BRIEF_STATUS" == "failed" || "$MANIFEST_STATUS" == "failed" ]]; then
+if [[ "$STOP_STATUS" == "kill-failed" || "$PROXY_STATUS" == "restore-failed" || "$HAR_STATUS" == "failed" || "$REPORT_STATUS" == "failed" || "$AI_BRIEF_STATUS" == "failed" || "$MANIFEST_STATUS" == "failed" || "$CATALOG_STATUS" == "failed" ]]; then
     exit 2
 fi
 
@@ -0,0 +1,534 @@
+#!/usr/bin/env python3
+"""Concurrency and waterfall timeline of a capture index.
+
+Each timed index row is an interval ``[startedDateTime, + durationMs)``. One
+sweep over the start and end events (ends first on ties, so back-to-back
+requests do not overlap) yields:
+
+- in-flight requests over time: peak, time-weighted mean, time spent at
+  each level, and a bucketed series for plotting;
+- per-host concurrency: peak, mean while busy, and time at or above the
+  saturation limit (default 6, the usual HTTP/1.1 per-host connection cap);
+- idle gaps, when nothing was in flight for at least ``gap_ms``.
+
+Serialized chains are runs of at least ``MIN_CHAIN`` requests to one host
+where each starts within ``gap_ms`` after the previous one ended, with
+nothing else in flight to that host: the client waited for every response
+before sending the next request. Slow requests (``durationMs`` at or above
+the threshold, default the capture's p90 but at least ``SLOW_FLOOR_MS``)
+get a cause:
+
+- ``saturated``: its host was at the saturation limit when it started, so
+  time may have been spent queued behind other requests;
+- ``serialized``: part of a serialized chain, so the latency adds up
+  end to end instead of overlapping;
+- ``server``: neither, so the server (or network) was slow on its own.
+
+Rows are read twice, streaming: once into compact arrays (start, end, host
+code, id), once more for the slow request details and the optional
+waterfall NDJSON (one row per index row, index order, with offsets and
+concurrency added; sort by ``startMs`` for display). Rows without a start
+time or duration are counted as untimed.
+"""
+
+import heapq
+import json
+import os
+import sys
+from array import array
+from datetime import datetime, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+from index_columns import EPOCH, iter_rows
+from quantiles import LatencySketch
+
+# Index fields the timeline reads
+TIMELINE_FIELDS = (
+    "id", "method", "host", "path", "status", "startedDateTime", "durationMs",
+    "ttfbMs", "connectMs", "tlsMs",
+)
+
+DEFAULT_SATURATION = 6
+DEFAULT_GAP_MS = 100
+SLOW_QUANTILE = 0.9
+SLOW_FLOOR_MS = 100
+MIN_CHAIN = 3
+SERIES_BUCKETS = 200
+TOP_N = 20
+
+SPARK_BARS = "▁▂▃▄▅▆▇█"
+
+
+def parse_time_us(value):
+    """ISO 8601 startedDateTime -> microseconds since the epoch (None if unusable)."""
+    if not value or not isinstance(value, str):
+        return None
+    try:
+        moment = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    delta = moment - EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+
+def zeros(typecode, n):
+    return array(typecode, bytes(n * array(typecode).itemsize))
+
+
+def push_top(heap, item, n=TOP_N):
+    """Keep the n largest items in a min-heap."""
+    if len(heap) < n:
+        heapq.heappush(heap, item)
+    elif item > heap[0]:
+        heapq.heapreplace(heap, item)
+
+
+class Timeline:
+    """Request intervals of one index and their concurrency.
+
+    Rows are added with ``add``; ``sweep`` fills the per-request
+    ``concurrency``/``host_concurrency``/``chained`` arrays and returns the
+    report dict (without slow request details, see ``build_timeline``).
+    """
+
+    def __init__(self, saturation=DEFAULT_SATURATION, gap_ms=DEFAULT_GAP_MS):
+        self.saturation = max(int(saturation), 1)
+        self.gap_us = int(gap_ms * 1000)
+        self.rows = 0
+        # Per timed row, in index order
+        self.positions = array("q")  # row number in the index
+        self.ids = array("q")
+        self.starts = array("q")
+        self.ends = array("q")
+        self.hosts = array("l")
+        self.host_names = []
+        self.host_codes = {}
+        self.latency = LatencySketch()
+        self.origin = 0
+        self.concurrency = array("l")
+        self.host_concurrency = array("l")
+        self.chained = array("b")
+
+    def add(self, row):
+        """Record one index row; returns False if it has no usable timing."""
+        position = self.rows
+        self.rows += 1
+        start = parse_time_us(row.get("startedDateTime"))
+        duration = row.get("durationMs")
+        if start is None or not isinstance(duration, (int, float)) or duration < 0:
+            return False
+        host = row.get("host") or ""
+        code = self.host_codes.get(host)
+        if code is None:
+            code = self.host_codes[host] = len(self.host_names)
+            self.host_names.append(host)
+        row_id = row.get("id")
+        self.positions.append(position)
+        self.ids.append(row_id if isinstance(row_id, int) else position + 1)
+        self.starts.append(start)
+        self.ends.append(start + int(round(duration * 1000)))
+        self.hosts.append(code)
+        self.latency.add(duration)
+        return True
+
+    def offset_ms(self, t, digits=1):
+        return round((t - self.origin) / 1000, digits)
+
+    def sweep(self):
+        n = len(self.starts)
+        starts, ends, hosts = self.starts, self.ends, self.hosts
+        by_start = sorted(range(n), key=starts.__getitem__)
+        # Zero-length requests end after the starts at their instant (their own included)
+        by_end = sorted(range(n), key=lambda i: (ends[i], ends[i] == starts[i]))
+        self.origin = origin = starts[by_start[0]] if n else 0
+        span_us = (max(ends) - origin) if n else 0
+        self.concurrency = zeros("l", n)
+        self.host_concurrency = zeros("l", n)
+
+        host_count = len(self.host_names)
+        host_inflight = [0] * host_count
+        host_peak = [0] * host_count
+        host_area = [0] * host_count
+        host_busy = [0] * host_count
+        host_saturated = [0] * host_count
+        host_since = [0] * host_count  # last time host_inflight[h] changed
+        host_requests = [0] * host_count
+
+        level_time = {}
+        inflight = peak = 0
+        peak_at = origin
+        area = busy = 0
+        last_t = origin
+        idle_since, last_ended = origin, None
+        gaps, gap_count, gap_total = [], 0, 0
+
+        bucket_us = max(-(-span_us // SERIES_BUCKETS), 1000)
+        buckets = span_us // bucket_us + 1 if n else 0
+        series_max = [0] * buckets
+        series_area = [0] * buckets
+
+        si = ei = 0
+        while si < n or ei < n:
+            if ei < n and si < n:
+                e, next_start = by_end[ei], starts[by_start[si]]
+                is_end = ends[e] < next_start or (ends[e] == next_start and starts[e] < ends[e])
+            else:
+                is_end = ei < n
+            if is_end:
+                i = by_end[ei]
+                ei += 1
+            else:
+                i = by_start[si]
+                si += 1
+            t, h = (ends[i] if is_end else starts[i]), hosts[i]
+
+            # Account the time since the previous event at the old levels
+            dt = t - last_t
+            if dt > 0:
+                level_time[inflight] = level_time.get(inflight, 0) + dt
+                if inflight:
+                    area += inflight * dt
+                    busy += dt
+                    b = (last_t - origin) // bucket_us
+                    while b < buckets and origin + b * bucket_us < t:
+                        low = max(last_t, origin + b * bucket_us)
+                        high = min(t, origin + (b + 1) * bucket_us)
+                        series_area[b] += inflight * (high - low)
+                        series_max[b] = max(series_max[b], inflight)
+                        b += 1
+                last_t = t
+            host_dt = t - host_since[h]
+            if host_inflight[h]:
+                host_area[h] += host_inflight[h] * host_dt
+                host_busy[h] += host_dt
+                if host_inflight[h] >= self.saturation:
+                    host_saturated[h] += host_dt
+            host_since[h] = t
+
+            if is_end:
+                inflight -= 1
+                host_inflight[h] -= 1
+                if inflight == 0:
+                    idle_since, last_ended = t, i
+                continue
+
+            if inflight == 0 and last_ended is not None and t - idle_since >= self.gap_us:
+                gap_count += 1
+                gap_total += t - idle_since
+                push_top(gaps, (t - idle_since, -idle_since, last_ended, i))
+            inflight += 1
+            host_inflight[h] += 1
+            host_requests[h] += 1
+            self.concurrency[i] = inflight
+            self.host_concurrency[i] = host_inflight[h]
+            if inflight > peak:
+                peak, peak_at = inflight, t
+            host_peak[h] = max(host_peak[h], host_inflight[h])
+
+        chains, host_serialized = self.find_chains(by_start)
+
+        return {
+            "summary": {
+                "requests": self.rows,
+                "timed": n,
+                "untimed": self.rows - n,
+                "startedAt": datetime.fromtimestamp(origin / 1e6, timezone.utc).isoformat() if n else "",
+                "spanMs": round(span_us / 1000, 1),
+                "busyMs": round(busy / 1000, 1),
+                "idleMs": round((span_us - busy) / 1000, 1),
+                "peakConcurrency": peak,
+                "peakAtMs": self.offset_ms(peak_at),
+                "meanConcurrency": round(area / span_us, 3) if span_us else float(peak),
+                "meanBusyConcurrency": round(area / busy, 3) if busy else float(peak),
+                "saturation": self.saturation,
+                "gapMs": self.gap_us / 1000,
+            },
+            "concurrencyHistogram": [
+                {"inFlight": level, "ms": round(level_time[level] / 1000, 1)} for level in sorted(level_time)
+            ],
+            "hosts": sorted((
+                {
+                    "host": self.host_names[h],
+                    "requests": host_requests[h],
+                    "peakConcurrency": host_peak[h],
+                    "meanBusyConcurrency": round(host_area[h] / host_busy[h], 3) if host_busy[h] else 0.0,
+                    "busyMs": round(host_busy[h] / 1000, 1),
+                    "saturatedMs": round(host_saturated[h] / 1000, 1),
+                    "serializedRequests": host_serialized[h],
+                }
+                for h in range(host_count)
+            ), key=lambda item: (-item["requests"], item["host"])),
+            "gaps": {
+                "count": gap_count,
+                "totalMs": round(gap_total / 1000, 1),
+                "largest": [
+                    {"startMs": self.offset_ms(-neg_start), "gapMs": round(gap / 1000, 1),
+                     "afterId": self.ids[after], "beforeId": self.ids[before]}
+                    for gap, neg_start, after, before in sorted(gaps, reverse=True)
+                ],
+            },
+            "serializedChains": chains,
+            "series": {
+                "bucketMs": bucket_us / 1000,
+                "maxInFlight": series_max,
+                "meanInFlight": [round(a / bucket_us, 3) for a in series_area],
+            },
+        }
+
+    def find_chains(self, by_start):
+        """Flag serialized requests; returns (longest chains, serialized count per host)."""
+        starts, ends, hosts = self.starts, self.ends, self.hosts
+        self.chained = zeros("b", len(starts))
+        host_serialized = [0] * len(self.host_names)
+        last_end = {}
+        runs = {}
+        top = []
+
+        def close(members):
+            if len(members) < MIN_CHAIN:
+                return
+            for i in members:
+                self.chained[i] = 1
+            first = members[0]
+            total = max(ends[i] for i in members) - starts[first]
+            host_serialized[hosts[first]] += len(members)
+            push_top(top, (total, -starts[first], len(members), first))
+
+        for i in by_start:
+            h = hosts[i]
+            # Alone on its host: every earlier request to it has ended
+            follows = (self.host_concurrency[i] == 1 and h in last_end
+                       and starts[i] - last_end[h] <= self.gap_us)
+            if follows:
+                runs[h].append(i)
+            else:
+                if h in runs:
+                    close(runs[h])
+                runs[h] = [i]
+            last_end[h] = max(last_end.get(h, ends[i]), ends[i])
+        for members in runs.values():
+            close(members)
+
+        chains = [
+            {"host": self.host_names[hosts[first]], "length": length, "firstId": self.ids[first],
+             "startMs": self.offset_ms(starts[first]), "totalMs": round(total / 1000, 1)}
+            for total, _, length, first in sorted(top, reverse=True)
+        ]
+        return chains, host_serialized
+
+    def cause(self, i):
+        if self.host_concurrency[i] >= self.saturation:
+            return "saturated"
+        if self.chained[i]:
+            return "serialized"
+        return "server"
+
+
+def build_timeline(index_file, saturation=DEFAULT_SATURATION, gap_ms=DEFAULT_GAP_MS, slow_ms=None,
+                   waterfall_file=None):
+    """Sweep index_file; returns the timeline report dict.
+
+    With waterfall_file, one NDJSON row per index row is written there (index
+    order) with startMs/endMs offsets and the concurrency at its start.
+    """
+    timeline = Timeline(saturation, gap_ms)
+    for row in iter_rows(index_file, TIMELINE_FIELDS):
+        timeline.add(row)
+    result = timeline.sweep()
+
+    if slow_ms is None:
+        slow_ms = max(timeline.latency.quantile(SLOW_QUANTILE), SLOW_FLOOR_MS) if timeline.starts else SLOW_FLOOR_MS
+    slow_us = slow_ms * 1000
+    causes = {"saturated": 0, "serialized": 0, "server": 0}
+    top = []
+    for i in range(len(timeline.starts)):
+        duration = timeline.ends[i] - timeline.starts[i]
+        if duration >= slow_us:
+            causes[timeline.cause(i)] += 1
+            push_top(top, (duration, -i), TOP_N * 2)
+    ranked = [-neg_i for _, neg_i in sorted(top, reverse=True)]
+    wanted = {timeline.positions[i]: rank for rank, i in enumerate(ranked)}
+
+    details = [None] * len(ranked)
+    if wanted or waterfall_file:
+        out = None
+        if waterfall_file:
+            fd = os.open(waterfall_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            out = os.fdopen(fd, "w", encoding="utf-8")
+        try:
+            timed = 0
+            for position, row in enumerate(iter_rows(index_file, TIMELINE_FIELDS)):
+                i = None
+                if timed < len(timeline.positions) and timeline.positions[timed] == position:
+                    i, timed = timed, timed + 1
+                if out is not None:
+                    out.write(json.dumps(waterfall_row(timeline, row, i), ensure_ascii=False) + "\n")
+                if position in wanted:
+                    details[wanted[position]] = slow_request(timeline, row, i)
+        finally:
+            if out is not None:
+                out.close()
+
+    result["summary"]["slowThresholdMs"] = slow_ms
+    result["slowCauses"] = causes
+    result["slowRequests"] = [item for item in details if item is not None]
+    return result
+
+
+def row_fields(row):
+    return {key: row.get(key) for key in ("id", "method", "host", "path", "status", "durationMs", "ttfbMs")}
+
+
+def waterfall_row(timeline, row, i):
+    item = row_fields(row)
+    item.update({"connectMs": row.get("connectMs"), "tlsMs": row.get("tlsMs"), "startMs": None,
+                 "endMs": None, "concurrency": None, "hostConcurrency": None, "serialized": False})
+    if i is not None:
+        item.update({
+            "startMs": timeline.offset_ms(timeline.starts[i], 3),
+            "endMs": timeline.offset_ms(timeline.ends[i], 3),
+            "concurrency": timeline.concurrency[i],
+            "hostConcurrency": timeline.host_concurrency[i],
+            "serialized": bool(timeline.chained[i]),
+        })
+    return item
+
+
+def slow_request(timeline, row, i):
+    item = row_fields(row)
+    duration, ttfb = item["durationMs"], item["ttfbMs"]
+    item.update({
+        "waitShare": round(ttfb / duration, 3) if isinstance(ttfb, (int, float)) and duration else None,
+        "startMs": timeline.offset_ms(timeline.starts[i]),
+        "concurrency": timeline.concurrency[i],
+        "hostConcurrency": timeline.host_concurrency[i],
+        "cause": timeline.cause(i),
+    })
+    return item
+
+
+def sparkline(values):
+    top = max(values, default=0)
+    if not top:
+        return ""
+    last = len(SPARK_BARS) - 1
+    return "".join(SPARK_BARS[min(last, (v * len(SPARK_BARS) - 1) // top)] if v else " " for v in values)
+
+
+def render_timeline_json(result, index_file):
+    return {
+        "schemaVersion": "1",
+        "generatedAt": datetime.now(timezone.utc).isoformat(),
+        "index": index_file,
+        **result,
+    }
+
+
+def render_timeline_markdown(result, index_file):
+    s = result["summary"]
+    lines = [
+        "# Capture Timeline",
+        "",
+        f"- Index: `{index_file}`",
+        f"- Requests: {s['requests']} ({s['untimed']} without timing)",
+        f"- Span: {s['spanMs']} ms, busy {s['busyMs']} ms, idle {s['idleMs']} ms",
+        f"- Peak concurrency: {s['peakConcurrency']} at +{s['peakAtMs']} ms; "
+        f"mean {s['meanConcurrency']} overall, {s['meanBusyConcurrency']} while busy",
+        f"- Slow requests (≥ {s['slowThresholdMs']:g} ms): "
+        + ", ".join(f"{count} {cause}" for cause, count in result["slowCauses"].items()),
+        "",
+    ]
+    series = result["series"]
+    if any(series["maxInFlight"]):
+        lines += [f"In flight (max per {series['bucketMs']:g} ms bucket):", "", "```",
+                  sparkline(series["maxInFlight"]), "```", ""]
+
+    lines += ["## Hosts", "", "| Host | Requests | Peak | Mean busy | Saturated ms | Serialized |",
+              "| --- | --- | --- | --- | --- | --- |"]
+    for h in result["hosts"][:TOP_N]:
+        lines.append(f"| `{h['host']}` | {h['requests']} | {h['peakConcurrency']} | {h['meanBusyConcurrency']} "
+                     f"| {h['saturatedMs']} | {h['serializedRequests']} |")
+    lines.append("")
+
+    if result["slowRequests"]:
+        lines += ["## Slow Requests", "",
+                  f"`saturated`: its host had ≥ {s['saturation']} requests in flight; `serialized`: part of a "
+                  "chain sent one after another; `server`: slow without either.", "",
+                  "| ID | Endpoint | ms | TTFB ms | Start ms | In flight (host) | Cause |",
+                  "| --- | --- | --- | --- | --- | --- | --- |"]
+        for r in result["slowRequests"]:
+            ttfb = r["ttfbMs"] if r["ttfbMs"] is not None else "-"
+            lines.append(f"| {r['id']} | `{r['method']} {r['host']}{r['path']}` | {r['durationMs']} | {ttfb} "
+                         f"| {r['startMs']} | {r['concurrency']} ({r['hostConcurrency']}) | {r['cause']} |")
+        lines.append("")
+
+    if result["serializedChains"]:
+        lines += ["## Serialized Chains", "", "| Host | Requests | First ID | Start ms | Total ms |",
+                  "| --- | --- | --- | --- | --- |"]
+        for c in result["serializedChains"]:
+            lines.append(f"| `{c['host']}` | {c['length']} | {c['firstId']} | {c['startMs']} | {c['totalMs']} |")
+        lines.append("")
+
+    gaps = result["gaps"]
+    if gaps["largest"]:
+        lines += [f"## Idle Gaps (≥ {s['gapMs']:g} ms)", "",
+                  f"{gaps['count']} gaps, {gaps['totalMs']} ms in total.", "",
+                  "| Start ms | Gap ms | After ID | Before ID |", "| --- | --- | --- | --- |"]
+        for g in gaps["largest"]:
+            lines.append(f"| {g['startMs']} | {g['gapMs']} | {g['afterId']} | {g['beforeId']} |")
+        lines.append("")
+    return "\n".join(lines)
+
+
+def write_text(path, text):
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(text)
+
+
+def main(argv=None):
+    """CLI interface: timeline report and waterfall of an index file."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Concurrency timeline and waterfall of a capture index")
+    parser.add_argument("index_file", help="capture_<RUN_ID>.index.ndjson")
+    parser.add_argument("--json", dest="json_out", help="Write the JSON report here")
+    parser.add_argument("--md", dest="md_out", help="Write the Markdown report here")
+    parser.add_argument("--waterfall", help="Write one NDJSON row per request with offsets and concurrency")
+    parser.add_argument("--stdout", action="store_true", help="Print the Markdown report (default without --json/--md)")
+    parser.add_argument("--saturation", type=int, default=DEFAULT_SATURATION,
+                        help=f"Per-host in-flight requests counted as saturated (default {DEFAULT_SATURATION})")
+    parser.add_argument("--gap-ms", type=float, default=DEFAULT_GAP_MS,
+                        help=f"Idle gap and serialization tolerance in ms (default {DEFAULT_GAP_MS})")
+    parser.add_argument("--slow-ms", type=float,
+                        help=f"Slow request threshold in ms (default p90, at least {SLOW_FLOOR_MS})")
+    args = parser.parse_args(argv)
+
+    if not os.path.isfile(args.index_file):
+        print(f"Error: index file not found: {args.index_file}", file=sys.stderr)
+        return 1
+    if args.saturation < 1 or args.gap_ms < 0 or (args.slow_ms is not None and args.slow_ms < 0):
+        print("Error: --saturation must be >= 1, --gap-ms and --slow-ms >= 0", file=sys.stderr)
+        return 1
+
+    result = build_timeline(args.index_file, args.saturation, args.gap_ms, args.slow_ms, args.waterfall)
+    if args.json_out:
+        write_text(args.json_out, json.dumps(render_timeline_json(result, args.index_file), indent=2,
+                                              ensure_ascii=False))
+        print(f"JSON timeline: {args.json_out}", file=sys.stderr)
+    if args.waterfall:
+        print(f"Waterfall: {args.waterfall}", file=sys.stderr)
+    md_text = render_timeline_markdown(result, args.index_file)
+    if args.md_out:
+        write_text(args.md_out, md_text)
+        print(f"Markdown timeline: {args.md_out}", file=sys.stderr)
+    if args.stdout or not (args.json_out or args.md_out):
+        print(md_text)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""Tests for the per-index aggregate cache."""
+
+import sys
+import os
+import json
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+
+import ai_brief
+import diff_captures
+from agg_cache import agg_path_for, cached_aggregate, read_cache
+from endpoint_templates import EndpointTemplater
+
+
+def write_index(path, rows=30, base=100):
+    with open(path, 'w') as f:
+        for i in range(rows):
+            status = 500 if i % 7 == 0 else 200
+            f.write(json.dumps({"id": i + 1, "method": "GET", "host": "api.example.com",
+                                "path": f"/users/{i}", "status": status,
+                                "statusBucket": "5xx" if status == 500 else "2xx",
+                                "durationMs": base + i}) + "\n")
+
+
+def test_diff_aggregate_is_reused_until_the_index_changes():
+    """A cached aggregate decodes to what aggregate_index returns; content changes invalidate it."""
+    with tempfile.TemporaryDirectory() as tmp:
+        index = os.path.join(tmp, 'capture_1.index.ndjson')
+        write_index(index)
+        templater = EndpointTemplater()
+
+        fresh = diff_captures.cached_aggregate_index(index, templater)
+        assert os.path.isfile(agg_path_for(index))
+        assert agg_path_for(index) == os.path.join(tmp, 'capture_1.index.agg.json')
+
+        def no_parse(*args, **kwargs):
+            raise AssertionError('index parsed despite a current cache')
+
+        aggregate_index = diff_captures.aggregate_index
+        diff_captures.aggregate_index = no_parse
+        try:
+            cached = diff_captures.cached_aggregate_index(index, templater)
+            assert list(cached) == list(fresh)
+            for key in fresh:
+                assert cached[key] == fresh[key]
+
+            # Same content, new mtime: validated by SHA-256 and still used
+            os.utime(index, ns=(1, 1))
+            assert diff_captures.cached_aggregate_index(index, templater) == fresh
+            assert read_cache(index)[0]['source']['mtimeNs'] == 1
+        finally:
+            diff_captures.aggregate_index = aggregate_index
+
+        # Another templating config is another entry
+        raw = diff_captures.cached_aggregate_index(index, None)
+        assert len(raw) == 30
+        with open(agg_path_for(index)) as f:
+            assert len(json.load(f)['entries']) == 2
+
+        # New rows: the cache is stale and rebuilt
+        with open(index, 'a') as f:
+            f.write(json.dumps({"id": 31, "method": "GET", "host": "api.example.com", "path": "/users/99",
+                                "status": 200, "statusBucket": "2xx", "durationMs": 5}) + "\n")
+        grown = diff_captures.cached_aggregate_index(index, templater)
+        assert sum(e["count"] for e in grown.values()) == 31
+        with open(agg_path_for(index)) as f:
+            assert len(json.load(f)['entries']) == 1
+    print('✓ test_diff_aggregate_is_reused_until_the_index_changes passed')
+
+
+def test_ai_brief_stats_cached():
+    """ai_brief writes the same stats from the cache as from the index."""
+    with tempfile.TemporaryDirectory() as tmp:
+        index = os.path.join(tmp, 'capture_1.index.ndjson')
+        write_index(index)
+        manifest = os.path.join(tmp, 'capture_1.manifest.json')
+        with open(manifest, 'w') as f:
+            json.dump({"runId": "1"}, f)
+
+        outputs = []
+        for run in range(2):
+            ai_json = os.path.join(tmp, f'ai{run}.json')
+            assert ai_brief.main(['ai_brief.py', manifest, index, ai_json, os.path.join(tmp, f'ai{run}.md')]) == 0
+            with open(ai_json) as f:
+                outputs.append(json.load(f)['stats'])
+        assert outputs[0] == outputs[1]
+        assert outputs[0] == ai_brief.index_stats(index, EndpointTemplater())
+        assert 'ai_brief|' in ''.join(read_cache(index)[0]['entries'])
+    print('✓ test_ai_brief_stats_cached passed')
+
+
+def test_unusable_cache_is_recomputed():
+    """A corrupt cache file is ignored and replaced."""
+    with tempfile.TemporaryDirectory() as tmp:
+        index = os.path.join(tmp, 'capture_1.index.ndjson')
+        write_index(index, rows=3)
+        with open(agg_path_for(index), 'w') as f:
+            f.write('{not json')
+        calls = []
+        result = cached_aggregate(index, 'test', None, lambda: calls.append(1) or {"rows": 3})
+        assert result == {"rows": 3} and calls == [1]
+        assert cached_aggregate(index, 'test', None, lambda: calls.append(1)) == {"rows": 3}
+        assert calls == [1]
+    print('✓ test_unusable_cache_is_recomputed passed')
+
+
+if __name__ == '__main__':
+    print('Running agg_cache tests...')
+    print()
+
+    test_diff_aggregate_is_reused_until_the_index_changes()
+    test_ai_brief_stats_cached()
+    test_unusable_cache_is_recomputed()
+
+    print()
+    print('✓ All agg_cache tests passed!')
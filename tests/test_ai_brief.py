@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""Tests for ai_brief statistics."""
+
+import sys
+import os
+import json
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+
+import ai_brief
+
+
+def entry(i, path, status, duration, host="api.example.com"):
+    buckets = {None: "no-response", 200: "2xx", 404: "4xx", 500: "5xx"}
+    return {"id": i, "method": "GET", "host": host, "path": path, "url": f"https://{host}{path}",
+            "status": status, "statusBucket": buckets[status], "durationMs": duration}
+
+
+def test_calc_stats_totals_and_percentile():
+    """Counts, average and p95 over responded requests."""
+    entries = [entry(i, "/ok", 200, i * 10) for i in range(1, 21)]
+    entries.append(entry(21, "/gone", None, None))
+    stats = ai_brief.calc_stats(entries)
+
+    assert stats["totalRequests"] == 21
+    assert stats["respondedRequests"] == 20
+    assert stats["noResponseRequests"] == 1
+    assert stats["avgDurationMs"] == 105
+    assert stats["p95DurationMs"] == 190
+    assert stats["latencyPercentilesMs"] == {"p50": 100, "p90": 180, "p95": 190, "p99": 190, "p99.9": 190}
+    ok = stats["endpointLatency"]["GET api.example.com/ok"]
+    assert (ok["count"], ok["p50"], ok["sketch"]["sum"]) == (20, 100, 2100)
+    assert "GET api.example.com/gone" not in stats["endpointLatency"]
+    assert stats["statusBuckets"] == {"2xx": 20, "no-response": 1}
+    assert stats["topHosts"] == [{"host": "api.example.com", "count": 21}]
+    print('✓ test_calc_stats_totals_and_percentile passed')
+
+
+def test_ties_keep_first_seen_order():
+    """Equal counts and durations rank in the order rows were first seen."""
+    entries = [
+        entry(1, "/b", 500, 50),
+        entry(2, "/a", 404, 50),
+        entry(3, "/a", 200, 70),
+        entry(4, "/b", 200, 50),
+    ]
+    entries += [entry(5 + i, f"/fast{i}", 200, 1) for i in range(40)]
+    stats = ai_brief.calc_stats(entries)
+
+    assert [e["endpoint"] for e in stats["topEndpoints"][:2]] == ["GET api.example.com/b", "GET api.example.com/a"]
+    assert [e["endpoint"] for e in stats["topErrorEndpoints"]] == ["GET api.example.com/b", "GET api.example.com/a"]
+    assert [r["id"] for r in stats["slowestRequests"][:4]] == [3, 1, 2, 4]
+    assert len(stats["slowestRequests"]) == ai_brief.StatsAccumulator.SLOWEST
+    assert [r["id"] for r in stats["slowestRequests"][4:6]] == [5, 6]
+    assert [(e["endpoint"], e["errorRatio"]) for e in stats["errorProneEndpoints"]] == [
+        ("GET api.example.com/b", 0.5), ("GET api.example.com/a", 0.5)]
+    print('✓ test_ties_keep_first_seen_order passed')
+
+
+def test_main_streams_index_file():
+    """main() streams rows from NDJSON into the same stats as calc_stats."""
+    entries = [entry(i, f"/p{i % 3}", 200 if i % 4 else 500, i) for i in range(1, 50)]
+    with tempfile.TemporaryDirectory() as tmp:
+        manifest = os.path.join(tmp, 'm.json')
+        index_file = os.path.join(tmp, 'capture_1.index.ndjson')
+        ai_json = os.path.join(tmp, 'ai.json')
+        with open(manifest, 'w') as f:
+            json.dump({"runId": "1"}, f)
+        with open(index_file, 'w') as f:
+            for row in entries:
+                f.write(json.dumps(row) + "\n")
+
+        assert ai_brief.main(['ai_brief.py', manifest, index_file, ai_json, os.path.join(tmp, 'ai.md')]) == 0
+        with open(ai_json) as f:
+            assert json.load(f)["stats"] == ai_brief.calc_stats(entries)
+    print('✓ test_main_streams_index_file passed')
+
+
+if __name__ == '__main__':
+    print('Running ai_brief tests...')
+    print()
+
+    test_calc_stats_totals_and_percentile()
+    test_ties_keep_first_seen_order()
+    test_main_streams_index_file()
+
+    print()
+    print('✓ All ai_brief tests passed!')
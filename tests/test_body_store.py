@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""Tests for the content-addressed body store."""
+
+import sys
+import os
+import hashlib
+import json
+import tempfile
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+
+import body_store
+
+
+def test_put_deduplicates_by_content():
+    """Equal bodies share one blob under bodies/<hash[:2]>/<hash>."""
+    with tempfile.TemporaryDirectory() as tmp:
+        store = body_store.BodyStore(os.path.join(tmp, 'bodies'))
+        first = store.put(b'{"ok": true}')
+        second = store.put(b'{"ok": true}')
+        other = store.put(b'other')
+
+        assert first == second == hashlib.sha256(b'{"ok": true}').hexdigest()
+        assert store.refs == {first, other}
+        path = store.path_for(first)
+        assert path == os.path.join(tmp, 'bodies', first[:2], first)
+        assert os.stat(path).st_mode & 0o777 == 0o600
+        assert store.get(first) == b'{"ok": true}'
+
+        with pytest.raises(ValueError):
+            store.path_for('../escape')
+        print('✓ test_put_deduplicates_by_content passed')
+
+
+def test_unreferenced_bodies_respects_refs_and_grace():
+    """Only old blobs that no refs file lists are collectable."""
+    with tempfile.TemporaryDirectory() as tmp:
+        store = body_store.BodyStore(os.path.join(tmp, 'bodies'))
+        kept = store.put(b'kept')
+        dropped = store.put(b'dropped')
+        fresh = store.put(b'fresh')
+        body_store.write_refs(os.path.join(tmp, 'capture_1.bodies.txt'), {kept})
+        body_store.write_refs(os.path.join(tmp, 'capture_2.bodies.txt'), {dropped})
+
+        old = time.time() - 2 * body_store.GC_GRACE_SECONDS
+        for digest in (kept, dropped):
+            os.utime(store.path_for(digest), (old, old))
+
+        assert body_store.unreferenced_bodies(tmp) == []
+        orphans = body_store.unreferenced_bodies(tmp, exclude_run_ids={'2'})
+        assert orphans == [(store.path_for(dropped), len(b'dropped'))]
+        assert fresh not in {os.path.basename(p) for p, _ in orphans}
+        print('✓ test_unreferenced_bodies_respects_refs_and_grace passed')
+
+
+def test_convert_and_pipeline_reference_stored_bodies():
+    """HAR entries carry _bodyRef and index rows *BodyRef instead of inline text."""
+    pytest.importorskip('mitmproxy')
+    from mitmproxy.io import FlowWriter
+    from mitmproxy.test import tflow
+
+    import capture_pipeline
+    import flow2har
+
+    with tempfile.TemporaryDirectory() as tmp:
+        flow_file = os.path.join(tmp, 'capture_1.flow')
+        with open(flow_file, 'wb') as f:
+            writer = FlowWriter(f)
+            for i in range(4):
+                flow = tflow.tflow(resp=True)
+                flow.request.path = f'/items/{i}'
+                flow.response.content = b'shared-body'
+                writer.add(flow)
+
+        bodies = os.path.join(tmp, 'bodies')
+        refs_file = os.path.join(tmp, 'capture_1.bodies.txt')
+        har_file = os.path.join(tmp, 'capture_1.har')
+        flow2har.convert(flow_file, har_file, body_dir=bodies, body_refs_file=refs_file)
+
+        digest = hashlib.sha256(b'shared-body').hexdigest()
+        entries = flow2har.load_har(har_file)['log']['entries']
+        assert {e['response']['content']['_bodyRef'] for e in entries} == {digest}
+        assert all('text' not in e['response']['content'] for e in entries)
+        assert digest in body_store.read_refs(refs_file)
+
+        index_file = os.path.join(tmp, 'capture_1.index.ndjson')
+        assert capture_pipeline.main([
+            flow_file, '--index', index_file, '--summary', os.path.join(tmp, 'capture_1.summary.md'),
+            '--body-store', bodies, '--body-refs', refs_file,
+        ]) == 0
+        with open(index_file) as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+        assert {row['responseBodyRef'] for row in rows} == {digest}
+        assert body_store.BodyStore(bodies).get(digest) == b'shared-body'
+        print('✓ test_convert_and_pipeline_reference_stored_bodies passed')
+
+
+if __name__ == '__main__':
+    print('Running body_store tests...')
+    print()
+
+    test_put_deduplicates_by_content()
+    test_unreferenced_bodies_respects_refs_and_grace()
+    test_convert_and_pipeline_reference_stored_bodies()
+
+    print()
+    print('✓ All body_store tests passed!')
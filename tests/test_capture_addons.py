@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+"""Tests for the mitmproxy capture addons."""
+
+import sys
+import os
+import json
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+
+pytest.importorskip('mitmproxy')
+
+from mitmproxy.test import taddons, tflow
+
+import capture_addons
+import cleanup
+from flow_report import flow_to_index_entry
+
+
+def read_ndjson(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def test_live_index_rows_match_flow_report():
+    """Live rows use flow_to_index_entry and sequential ids."""
+    with tempfile.TemporaryDirectory() as tmp:
+        index_file = os.path.join(tmp, 'capture_1.index.ndjson')
+        state_file = os.path.join(tmp, 'capture_1.live.json')
+        addon = capture_addons.LiveIndex()
+        flows = [tflow.tflow(resp=True) for _ in range(3)]
+
+        with taddons.context(addon) as tctx:
+            tctx.configure(addon, live_index_file=index_file, live_index_state=state_file)
+            for flow in flows:
+                addon.request(flow)
+                addon.response(flow)
+            addon.done()
+
+        rows = read_ndjson(index_file)
+        assert rows == [json.loads(json.dumps(flow_to_index_entry(i, f))) for i, f in enumerate(flows, start=1)]
+        with open(state_file) as f:
+            state = json.load(f)
+        assert state['rows'] == 3
+        assert state['complete'] is True
+        print('✓ test_live_index_rows_match_flow_report passed')
+
+
+def test_live_index_batches_and_marks_open_flows_incomplete():
+    """Rows are written per batch; flows still open at shutdown leave the index incomplete."""
+    with tempfile.TemporaryDirectory() as tmp:
+        index_file = os.path.join(tmp, 'capture_1.index.ndjson')
+        state_file = os.path.join(tmp, 'capture_1.live.json')
+        addon = capture_addons.LiveIndex()
+
+        with taddons.context(addon) as tctx:
+            tctx.configure(
+                addon,
+                live_index_file=index_file,
+                live_index_state=state_file,
+                live_index_batch=2,
+                live_index_flush_ms=60000,
+            )
+            for _ in range(3):
+                flow = tflow.tflow(resp=True)
+                addon.request(flow)
+                addon.response(flow)
+            assert len(read_ndjson(index_file)) == 2
+
+            failed = tflow.tflow(err=True)
+            addon.request(failed)
+            addon.error(failed)
+            addon.request(tflow.tflow())
+            addon.done()
+
+        rows = read_ndjson(index_file)
+        assert [row['id'] for row in rows] == [1, 2, 3, 4]
+        assert rows[-1]['statusBucket'] == 'no-response'
+        with open(state_file) as f:
+            state = json.load(f)
+        assert state['rows'] == 4
+        assert state['complete'] is False
+        print('✓ test_live_index_batches_and_marks_open_flows_incomplete passed')
+
+
+def test_live_counters_totals_and_previous_sample():
+    """Counters track totals; each write carries the previous sample for rates."""
+    with tempfile.TemporaryDirectory() as tmp:
+        counters_file = os.path.join(tmp, 'capture_1.counters.json')
+        addon = capture_addons.LiveCounters()
+
+        with taddons.context(addon) as tctx:
+            tctx.configure(addon, live_counters_file=counters_file)
+            ok = tflow.tflow(resp=True)
+            failed = tflow.tflow(err=True)
+            for flow in (ok, failed):
+                addon.request(flow)
+            addon.response(ok)
+            addon.error(failed)
+            addon.done()
+
+        with open(counters_file) as f:
+            counters = json.load(f)
+        assert counters['requests'] == 2
+        assert counters['responses'] == 1
+        assert counters['errors'] == 1
+        assert counters['bytesIn'] == len(ok.response.raw_content)
+        assert counters['statusBuckets'] == {'2xx': 1}
+        assert counters['hosts'] == {ok.request.host: 2}
+        assert counters['previous']['requests'] == 0
+        assert counters['complete'] is True
+        print('✓ test_live_counters_totals_and_previous_sample passed')
+
+
+def scope_flow(host):
+    flow = tflow.tflow(resp=True)
+    flow.request.host = host
+    flow.response = None
+    return flow
+
+
+def run_scope_guard(tmp, mode):
+    """Send one in-scope and two out-of-scope flows through ScopeGuard, LiveIndex and Save."""
+    from mitmproxy import io
+    from mitmproxy.addons.save import Save
+
+    policy_file = os.path.join(tmp, 'policy.json')
+    with open(policy_file, 'w') as f:
+        json.dump({'scope': {'allow_hosts': ['*.example.com'], 'deny_hosts': ['ads.example.com']}}, f)
+    flow_file = os.path.join(tmp, f'{mode}.flow')
+    guard_file = os.path.join(tmp, f'{mode}.scope.json')
+    index_file = os.path.join(tmp, f'{mode}.index.ndjson')
+    guard, index, save = capture_addons.ScopeGuard(), capture_addons.LiveIndex(), Save()
+
+    with taddons.context(save, guard, index) as tctx:
+        tctx.configure(save, save_stream_file=flow_file)
+        tctx.configure(guard, scope_guard_policy=policy_file, scope_guard_mode=mode, scope_guard_file=guard_file)
+        tctx.configure(index, live_index_file=index_file)
+        flows = [scope_flow(host) for host in ('api.example.com', 'ads.example.com', 'tracker.net')]
+        for flow in flows:
+            guard.requestheaders(flow)
+            for addon in (save, index):
+                addon.request(flow)
+            if flow.response is None:
+                flow.response = tflow.tresp()
+                guard.responseheaders(flow)
+            for addon in (save, index):
+                addon.response(flow)
+        for addon in (save, guard, index):
+            addon.done()
+
+    with open(flow_file, 'rb') as f:
+        recorded = [flow.request.host for flow in io.FlowReader(f).stream()]
+    with open(guard_file) as f:
+        result = json.load(f)
+    return flows, recorded, [row['host'] for row in read_ndjson(index_file)], result
+
+
+def test_scope_guard_modes():
+    """block/passthrough keep violations out of the capture; record-and-flag marks them."""
+    with tempfile.TemporaryDirectory() as tmp:
+        flows, recorded, indexed, result = run_scope_guard(tmp, 'block')
+        assert recorded == indexed == ['api.example.com']
+        assert [f.response.status_code for f in flows] == [200, 403, 403]
+        assert result['source'] == 'scope-guard' and result['complete'] is True
+        assert (result['totalRequests'], result['outOfScopeCount'], result['status']) == (3, 2, 'violation')
+        assert result['actions'] == {'blocked': 2}
+        assert [v['reason'] for v in result['violations']] == ['denied_by_blacklist', 'not_in_whitelist']
+
+        # CONNECT: only a refused tunnel is counted; allowed ones are judged per request
+        guard = capture_addons.ScopeGuard()
+        with taddons.context(guard) as tctx:
+            tctx.configure(guard, scope_guard_policy=os.path.join(tmp, 'policy.json'), scope_guard_mode='block')
+            allowed, denied = scope_flow('api.example.com'), scope_flow('tracker.net')
+            for flow in (allowed, denied):
+                guard.http_connect(flow)
+            assert allowed.response is None and denied.response.status_code == 403
+            assert (guard.audit.total, guard.audit.in_scope, guard.audit.out_of_scope) == (1, 0, 1)
+
+        flows, recorded, indexed, result = run_scope_guard(tmp, 'passthrough-without-recording')
+        assert recorded == indexed == ['api.example.com']
+        assert flows[2].request.stream and flows[2].response.stream
+        assert result['actions'] == {'dropped': 2}
+
+        flows, recorded, indexed, result = run_scope_guard(tmp, 'record-and-flag')
+        assert recorded == indexed == ['api.example.com', 'ads.example.com', 'tracker.net']
+        assert flows[1].comment.startswith(capture_addons.SCOPE_FLAG_COMMENT) and flows[1].marked
+        assert not flows[0].comment
+        assert result['actions'] == {'flagged': 2}
+        print('✓ test_scope_guard_modes passed')
+
+
+def test_segment_rotator_splits_flows_across_segments():
+    """Each flow lands in the segment open when it is saved; the list tracks them."""
+    from mitmproxy import io
+    from mitmproxy.addons.save import Save
+
+    with tempfile.TemporaryDirectory() as tmp:
+        base = os.path.join(tmp, 'capture_1')
+        segments_file = base + '.segments.json'
+        rotator, index, save = capture_addons.SegmentRotator(), capture_addons.LiveIndex(), Save()
+
+        with taddons.context(save, rotator, index) as tctx:
+            tctx.configure(save, save_stream_file=base + '.0001.flow')
+            tctx.configure(index, live_index_file=base + '.0001.index.ndjson')
+            tctx.configure(rotator, rotate_segments_file=segments_file, rotate_size='1')
+            flows = [tflow.tflow(resp=True) for _ in range(3)]
+            for i, flow in enumerate(flows):
+                if i == 2:
+                    # cleanup expires the closed first segment while capturing
+                    cleanup.expire_segments(tmp, '1', {1})
+                for addon in (save, index):
+                    addon.request(flow)
+                for addon in (rotator, save, index):
+                    addon.response(flow)
+            for addon in (rotator, save, index):
+                addon.done()
+
+        with open(segments_file) as f:
+            data = json.load(f)
+        assert data['complete'] is True and data['rotateSize'] == 1
+        assert [s['seq'] for s in data['segments']] == [1, 2, 3]
+        assert [s['flows'] for s in data['segments']] == [1, 1, 1]
+        assert all(s['closedAt'] for s in data['segments'])
+        assert [s.get('expired', False) for s in data['segments']] == [True, False, False]
+        for i, segment in enumerate(data['segments'], start=1):
+            assert segment['flow'] == f'{base}.{i:04d}.flow'
+            assert segment['liveIndex'] == f'{base}.{i:04d}.index.ndjson'
+            with open(segment['flow'], 'rb') as f:
+                assert [flow.id for flow in io.FlowReader(f).stream()] == [flows[i - 1].id]
+            assert len(read_ndjson(segment['liveIndex'])) == 1
+        print('✓ test_segment_rotator_splits_flows_across_segments passed')
+
+
+def test_segment_rotator_rejects_bad_options():
+    """Rotation needs a limit and the first segment as the save file."""
+    from mitmproxy import exceptions
+    from mitmproxy.addons.save import Save
+
+    with tempfile.TemporaryDirectory() as tmp:
+        segments_file = os.path.join(tmp, 'capture_1.segments.json')
+        rotator = capture_addons.SegmentRotator()
+        with taddons.context(Save(), rotator) as tctx:
+            tctx.options.update(save_stream_file=os.path.join(tmp, 'capture_1.0001.flow'))
+            with pytest.raises(exceptions.OptionsError):
+                tctx.configure(rotator, rotate_segments_file=segments_file)
+            with pytest.raises(exceptions.OptionsError):
+                tctx.configure(rotator, rotate_segments_file=os.path.join(tmp, 'capture_2.segments.json'),
+                               rotate_size='1M')
+            with pytest.raises(exceptions.OptionsError):
+                tctx.configure(rotator, rotate_segments_file=segments_file, rotate_size='lots')
+        print('✓ test_segment_rotator_rejects_bad_options passed')
+
+
+if __name__ == '__main__':
+    print('Running capture_addons tests...')
+    print()
+
+    test_live_index_rows_match_flow_report()
+    test_live_index_batches_and_marks_open_flows_incomplete()
+    test_live_counters_totals_and_previous_sample()
+    test_scope_guard_modes()
+    test_segment_rotator_splits_flows_across_segments()
+    test_segment_rotator_rejects_bad_options()
+
+    print()
+    print('✓ All capture_addons tests passed!')
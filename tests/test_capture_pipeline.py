@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""Tests for the single-pass capture pipeline."""
+
+import sys
+import os
+import json
+import hashlib
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+
+pytest.importorskip('mitmproxy')
+
+from mitmproxy.io import FlowWriter
+from mitmproxy.test import tflow
+
+import capture_pipeline
+import flow2har
+import flow_report
+import index_columns
+
+
+def read_artifact(path):
+    """File content to compare; a sidecar's source mtime depends on when it was written."""
+    if not path.endswith('.index.col'):
+        with open(path, 'rb') as f:
+            return f.read()
+    columns = index_columns.IndexColumns(path)
+    header = {key: value for key, value in columns.header.items() if key != 'sourceMtimeNs'}
+    rows = list(columns)
+    columns.close()
+    return header, rows
+
+
+def write_flows(path, count=12):
+    """Write a small synthetic capture with a mix of hosts and statuses."""
+    with open(path, 'wb') as f:
+        writer = FlowWriter(f)
+        for i in range(count):
+            flow = tflow.tflow(resp=(i % 5 != 4))
+            flow.request.host = 'api.example.com' if i % 3 else 'tracker.other.net'
+            flow.request.path = f'/items/{i}'
+            if flow.response:
+                flow.response.status_code = 500 if i % 4 == 0 else 200
+                flow.response.headers['content-type'] = 'application/json'
+                flow.response.content = b'{"ok": true}'
+            writer.add(flow)
+
+
+def test_pipeline_matches_separate_tools():
+    """Fused outputs match flow_report/flow2har and the file digest."""
+    with tempfile.TemporaryDirectory() as tmp:
+        flow_file = os.path.join(tmp, 'capture_1.flow')
+        write_flows(flow_file)
+
+        status_file = os.path.join(tmp, 'status.env')
+        rc = capture_pipeline.main([
+            flow_file,
+            '--har', os.path.join(tmp, 'fused.har'),
+            '--index', os.path.join(tmp, 'fused.index.ndjson'),
+            '--summary', os.path.join(tmp, 'fused.summary.md'),
+            '--index-col', os.path.join(tmp, 'fused.index.col'),
+            '--scope-audit', os.path.join(tmp, 'fused.scope_audit.json'),
+            '--allow-hosts', '*.example.com',
+            '--status-file', status_file,
+        ])
+        assert rc == 0
+
+        assert flow_report.main([
+            'flow_report.py', flow_file,
+            os.path.join(tmp, 'legacy.index.ndjson'),
+            os.path.join(tmp, 'legacy.summary.md'),
+        ]) == 0
+        flow2har.convert(flow_file, os.path.join(tmp, 'legacy.har'))
+
+        for name in ('index.ndjson', 'index.col', 'har'):
+            assert read_artifact(os.path.join(tmp, f'fused.{name}')) == \
+                read_artifact(os.path.join(tmp, f'legacy.{name}')), f'{name} differs'
+
+        with open(flow_file, 'rb') as f:
+            expected_sha = hashlib.sha256(f.read()).hexdigest()
+        with open(status_file) as f:
+            status = dict(line.strip().split('=', 1) for line in f if line.strip())
+
+        assert status['FLOW_SHA256'] == f'"{expected_sha}"'
+        assert status['REPORT_STATUS'] == '"ok"'
+        assert status['HAR_STATUS'] == '"ok"'
+        assert status['INDEX_COL_STATUS'] == '"ok"'
+        assert status['SCOPE_AUDIT_STATUS'] == '"violation"'
+        assert status['SCOPE_AUDIT_VIOLATIONS'] == '"4"'
+        print('✓ test_pipeline_matches_separate_tools passed')
+
+
+def test_failing_sink_does_not_stop_others():
+    """A sink raising during add() is marked failed; others still finish."""
+
+    class BrokenSink(capture_pipeline.Sink):
+        name = 'broken'
+
+        def add(self, flow, entry):
+            raise RuntimeError('boom')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        flow_file = os.path.join(tmp, 'capture_1.flow')
+        write_flows(flow_file, count=3)
+        index_file = os.path.join(tmp, 'out.index.ndjson')
+        index_sink = capture_pipeline.IndexSink(index_file)
+
+        _, statuses = capture_pipeline.run_pipeline(flow_file, [BrokenSink(), index_sink])
+
+        assert statuses == {'broken': 'failed', 'index': 'ok'}
+        with open(index_file) as f:
+            assert [json.loads(line)['id'] for line in f] == [1, 2, 3]
+        print('✓ test_failing_sink_does_not_stop_others passed')
+
+
+def test_segments_merge_like_one_capture():
+    """Segments processed in parallel merge into the single-file session outputs."""
+    from mitmproxy.io import FlowReader
+
+    with tempfile.TemporaryDirectory() as tmp:
+        whole = os.path.join(tmp, 'whole.flow')
+        write_flows(whole)
+        with open(whole, 'rb') as f:
+            flows = list(FlowReader(f).stream())
+
+        base = os.path.join(tmp, 'capture_1')
+        listed = []
+        for seq, chunk in enumerate((flows[:5], flows[5:9], flows[9:]), start=1):
+            path = f'{base}.{seq:04d}.flow'
+            with open(path, 'wb') as f:
+                writer = FlowWriter(f)
+                for flow in chunk:
+                    writer.add(flow)
+            listed.append({'seq': seq, 'flow': path, 'closedAt': '2026-01-01T00:00:00'})
+        listed[1]['expired'] = False
+        segments_file = base + '.segments.json'
+        with open(segments_file, 'w') as f:
+            json.dump({'schemaVersion': '1', 'runId': '1', 'segments': listed}, f)
+
+        assert capture_pipeline.main([
+            whole, '--index', os.path.join(tmp, 'whole.index.ndjson'),
+            '--summary', os.path.join(tmp, 'whole.summary.md'),
+            '--index-col', os.path.join(tmp, 'whole.index.col'),
+        ]) == 0
+        status_file = os.path.join(tmp, 'status.env')
+        assert capture_pipeline.main([
+            '--segments', segments_file, '--jobs', '2',
+            '--index', base + '.index.ndjson',
+            '--summary', base + '.summary.md',
+            '--index-col', base + '.index.col',
+            '--har', base + '.har',
+            '--status-file', status_file,
+        ]) == 0
+
+        for name in ('index.ndjson', 'index.col'):
+            assert read_artifact(os.path.join(tmp, f'whole.{name}')) == read_artifact(f'{base}.{name}'), \
+                f'{name} differs'
+        with open(status_file) as f:
+            status = dict(line.strip().split('=', 1) for line in f if line.strip())
+        assert status['SEGMENTS'] == '"3"'
+        assert status['REPORT_STATUS'] == status['HAR_STATUS'] == '"ok"'
+
+        with open(segments_file) as f:
+            merged = json.load(f)['segments']
+        assert [(s['firstId'], s['rows']) for s in merged] == [(1, 5), (6, 4), (10, 3)]
+        assert merged[1]['index'] == base + '.0002.index.ndjson'
+        assert merged[2]['har'] == base + '.0003.har'
+        with open(merged[0]['flow'], 'rb') as f:
+            assert merged[0]['sha256'] == hashlib.sha256(f.read()).hexdigest()
+        assert all(os.path.isfile(s['flowIdx']) for s in merged)
+        print('✓ test_segments_merge_like_one_capture passed')
+
+
+if __name__ == '__main__':
+    print('Running capture_pipeline tests...')
+    print()
+
+    test_pipeline_matches_separate_tools()
+    test_failing_sink_does_not_stop_others()
+    test_segments_merge_like_one_capture()
+
+    print()
+    print('✓ All capture_pipeline tests passed!')
@@ -124,6 +124,15 @@ def test_start_captures_default_target_dir_is_project_root() -> None:
     )
 
 
+def test_start_captures_opens_upstream_connections_lazily() -> None:
+    script = _read("scripts/startCaptures.sh")
+
+    assert "--set connection_strategy=lazy" in script, (
+        "startCaptures.sh should open upstream connections per request so "
+        "connection setup is attributed to the request that paid it"
+    )
+
+
 def test_stop_captures_default_target_dir_is_project_root() -> None:
     script = _read("scripts/stopCaptures.sh")
 
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""Tests for the SQLite capture catalog."""
+
+import sys
+import os
+import json
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+
+import catalog
+from cleanup import run_cleanup
+
+
+def write_session(captures_dir, run_id, started_at, rows):
+    manifest = {"schemaVersion": "1", "runId": run_id, "startedAt": started_at,
+                "artifacts": {"flowSha256": "ab" * 32}}
+    with open(os.path.join(captures_dir, f"capture_{run_id}.manifest.json"), 'w') as f:
+        json.dump(manifest, f)
+    with open(os.path.join(captures_dir, f"capture_{run_id}.index.ndjson"), 'w') as f:
+        for row in rows:
+            f.write(json.dumps(row) + "\n")
+    with open(os.path.join(captures_dir, f"capture_{run_id}.flow"), 'wb') as f:
+        f.write(b"\0" * 10)
+
+
+def row(i, host, path, status, duration, day="2026-01-01"):
+    return {"id": i, "startedDateTime": f"{day}T00:00:{i:02d}+00:00", "method": "GET",
+            "host": host, "path": path, "status": status, "durationMs": duration,
+            "responseBytes": 100}
+
+
+def query(captures_dir, *args):
+    out = os.path.join(captures_dir, 'out.json')
+    assert catalog.main(['query', captures_dir, '--json', '-o', out, *args]) == 0
+    with open(out) as f:
+        return json.load(f)
+
+
+def sample_captures(tmp):
+    write_session(tmp, "20200101_120000_1", "2020-01-01T12:00:00", [
+        row(1, "api.example.com", "/v1/users", 200, 40, day="2020-01-01"),
+        row(2, "api.example.com", "/v1/orders", 500, 900, day="2020-01-01"),
+    ])
+    write_session(tmp, "20260101_120000_2", "2026-01-01T12:00:00", [
+        row(1, "api.example.com", "/v1/orders", 502, 700),
+        row(2, "cdn.example.net", "/img/a.png", 200, 5),
+        row(3, "api.example.com", "/v1/users", 200, 60),
+    ])
+
+
+def test_query_builds_catalog_and_filters():
+    """The first query ingests all sessions; filters combine across runs."""
+    with tempfile.TemporaryDirectory() as tmp:
+        sample_captures(tmp)
+
+        rows = query(tmp, '--status', '5xx', '--path', '/v1/')
+        assert [(r['run_id'], r['id']) for r in rows] == [("20200101_120000_1", 2), ("20260101_120000_2", 1)]
+        assert os.stat(catalog.catalog_path(tmp)).st_mode & 0o777 == 0o600
+
+        rows = query(tmp, '--run', 'latest', '--host', '*.example.*', '--slowest', '--limit', '1')
+        assert [(r['host'], r['duration_ms']) for r in rows] == [("api.example.com", 700)]
+
+        groups = query(tmp, '--group-by', 'endpoint')
+        assert groups[0] == {"endpoint": "GET api.example.com/v1/orders", "requests": 2, "errors": 2,
+                             "avg_ms": 800, "max_ms": 900, "response_bytes": 200}
+        print('✓ test_query_builds_catalog_and_filters passed')
+
+
+def test_ingest_replaces_run_and_cleanup_prunes_it():
+    """Re-ingesting a run replaces its rows; cleanup drops deleted sessions."""
+    with tempfile.TemporaryDirectory() as tmp:
+        sample_captures(tmp)
+        assert catalog.rebuild(tmp) == 2
+
+        conn = catalog.connect(tmp)
+        assert catalog.ingest_session(conn, tmp, os.path.join(tmp, "capture_20260101_120000_2.manifest.json")) == 3
+        assert conn.execute("SELECT COUNT(*) FROM requests").fetchone()[0] == 5
+        conn.close()
+
+        result = run_cleanup(tmp, keep_days=1000)
+        assert result["deleted"] == 1
+        assert result["catalog_rows_removed"] == 2
+        assert [r['run'] for r in query(tmp, '--group-by', 'run')] == ["20260101_120000_2"]
+        print('✓ test_ingest_replaces_run_and_cleanup_prunes_it passed')
+
+
+def test_sql_queries_are_read_only():
+    """--sql runs against a read-only connection."""
+    with tempfile.TemporaryDirectory() as tmp:
+        sample_captures(tmp)
+        assert query(tmp, '--sql', 'SELECT COUNT(*) AS n FROM requests') == [{"n": 5}]
+        assert catalog.main(['query', tmp, '--sql', 'DELETE FROM requests']) == 1
+        assert query(tmp, '--sql', 'SELECT COUNT(*) AS n FROM requests') == [{"n": 5}]
+        print('✓ test_sql_queries_are_read_only passed')
+
+
+if __name__ == '__main__':
+    print('Running catalog tests...')
+    print()
+
+    test_query_builds_catalog_and_filters()
+    test_ingest_replaces_run_and_cleanup_prunes_it()
+    test_sql_queries_are_read_only()
+
+    print()
+    print('✓ All catalog tests passed!')
@@ -20,6 +20,7 @@ from cleanup import (
     session_files,
     update_latest_links,
 )
+from body_store import BodyStore, write_refs
 
 
 def create_session(captures_dir, run_id, file_size=100):
@@ -276,3 +277,77 @@ def test_cleanup_nothing_to_delete():
         result = run_cleanup(tmpdir, keep_days=365)
         assert result["status"] == "nothing"
         assert result["deleted"] == 0
+
+
+def test_cleanup_removes_unreferenced_bodies():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        create_session(tmpdir, "20200101_120000_111")
+        recent = datetime.now() - timedelta(hours=1)
+        recent_id = recent.strftime("%Y%m%d_%H%M%S") + "_222"
+        create_session(tmpdir, recent_id)
+
+        store = BodyStore(os.path.join(tmpdir, "bodies"))
+        shared = store.put(b"shared")
+        old_only = store.put(b"old only")
+        write_refs(os.path.join(tmpdir, "capture_20200101_120000_111.bodies.txt"),
+                   {shared, old_only})
+        write_refs(os.path.join(tmpdir, f"capture_{recent_id}.bodies.txt"), {shared})
+        for digest in (shared, old_only):
+            os.utime(store.path_for(digest), (0, 0))
+
+        result = run_cleanup(tmpdir, keep_days=7, dry_run=True)
+        assert result["bodies_removed"] == 1
+        assert os.path.exists(store.path_for(old_only))
+
+        result = run_cleanup(tmpdir, keep_days=7)
+        assert result["deleted"] == 1
+        assert result["bodies_removed"] == 1
+        assert not os.path.exists(store.path_for(old_only))
+        assert os.path.exists(store.path_for(shared))
+
+
+def create_segmented_session(captures_dir, run_id, closed_at, file_size=100):
+    """Create a rotated session: manifest, segments file and one flow/index per segment."""
+    create_session(captures_dir, run_id, file_size)
+    os.remove(os.path.join(captures_dir, f"capture_{run_id}.flow"))
+    segments = []
+    for seq, ts in enumerate(closed_at, start=1):
+        for ext in ("flow", "index.ndjson"):
+            path = os.path.join(captures_dir, f"capture_{run_id}.{seq:04d}.{ext}")
+            with open(path, "wb") as f:
+                f.write(b"\x00" * file_size)
+        segments.append({"seq": seq, "flow": os.path.join(captures_dir, f"capture_{run_id}.{seq:04d}.flow"),
+                         "closedAt": ts})
+    with open(os.path.join(captures_dir, f"capture_{run_id}.segments.json"), "w") as f:
+        json.dump({"schemaVersion": "1", "runId": run_id, "segments": segments}, f)
+
+
+def test_cleanup_expires_old_segments_of_a_session():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        recent = datetime.now() - timedelta(hours=1)
+        run_id = (recent - timedelta(days=30)).strftime("%Y%m%d_%H%M%S") + "_111"
+        old = (recent - timedelta(days=20)).strftime("%Y-%m-%dT%H:%M:%S")
+        create_segmented_session(tmpdir, run_id, [old, old, recent.strftime("%Y-%m-%dT%H:%M:%S")])
+        segments_file = os.path.join(tmpdir, f"capture_{run_id}.segments.json")
+
+        assert [s["run_id"] for s in discover_sessions(tmpdir)] == [run_id]
+
+        result = run_cleanup(tmpdir, keep_days=7, dry_run=True)
+        assert (result["deleted"], result["segments_deleted"]) == (0, 2)
+        assert os.path.exists(os.path.join(tmpdir, f"capture_{run_id}.0001.flow"))
+
+        result = run_cleanup(tmpdir, keep_days=7)
+        assert (result["deleted"], result["segments_deleted"], result["kept"]) == (0, 2, 1)
+        assert [d["segment"] for d in result["details"]] == [1, 2]
+        assert not os.path.exists(os.path.join(tmpdir, f"capture_{run_id}.0002.index.ndjson"))
+        assert os.path.exists(os.path.join(tmpdir, f"capture_{run_id}.0003.flow"))
+        assert os.path.exists(os.path.join(tmpdir, f"capture_{run_id}.manifest.json"))
+        with open(segments_file) as f:
+            data = json.load(f)
+        assert [bool(s.get("expired")) for s in data["segments"]] == [True, True, False]
+
+        # Expired segments are not counted again; the last one takes the session with it
+        assert run_cleanup(tmpdir, keep_days=7)["status"] == "nothing"
+        result = run_cleanup(tmpdir, keep_days=0)
+        assert (result["deleted"], result["segments_deleted"]) == (1, 0)
+        assert not os.path.exists(segments_file)
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""Tests for connection metadata in the index and the connection reuse report."""
+
+import sys
+import os
+import json
+import tempfile
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+
+from connections import build_connections, main
+from index_columns import build as build_columns
+
+T0 = datetime(2026, 10, 17, 4, 0, 0, tzinfo=timezone.utc)
+
+
+def at(ms):
+    return (T0 + timedelta(milliseconds=ms)).isoformat()
+
+
+def row(i, host, conn, start_ms, opened_ms, tcp=10, tls=30, ip='10.0.0.1', alpn=None, version='HTTP/1.1'):
+    return {"id": i, "host": host, "startedDateTime": at(start_ms), "durationMs": 100,
+            "httpVersion": version, "clientConnId": "c1", "serverConnId": conn, "serverIp": ip,
+            "tlsVersion": "TLSv1.3", "alpn": alpn, "connOpenedDateTime": at(opened_ms),
+            "connTcpMs": tcp, "connTlsMs": tls}
+
+
+def sample_rows():
+    rows = []
+
+    def add(*args, **kwargs):
+        rows.append(row(len(rows) + 1, *args, **kwargs))
+
+    # a.example.com: a new HTTP/1.1 connection for each of 8 requests
+    for k in range(8):
+        add('a.example.com', f'a{k}', k * 200, k * 200 + 1)
+    # b.example.com: 10 requests on one kept-alive connection
+    for k in range(10):
+        add('b.example.com', 'b0', k * 200, 1, ip='10.0.0.2')
+    # c and d share an IP but open their own HTTP/2 connections
+    for k in range(5):
+        add('c.example.com', 'c0', k * 50, 1, ip='10.0.0.3', alpn='h2', version='HTTP/2.0')
+        add('d.example.com', 'd0', k * 50, 1, ip='10.0.0.3', alpn='h2', version='HTTP/2.0')
+    # e rides on c's connection (coalesced)
+    add('e.example.com', 'c0', 300, 1, ip='10.0.0.3', alpn='h2', version='HTTP/2.0')
+    # Blocked request: no upstream connection
+    rows.append({**row(len(rows) + 1, 'a.example.com', None, 2000, 0), "connOpenedDateTime": "",
+                 "serverIp": None, "connTcpMs": None, "connTlsMs": None})
+    return rows
+
+
+def write_index(path, rows):
+    with open(path, 'w') as f:
+        for r in rows:
+            f.write(json.dumps(r) + "\n")
+
+
+def test_index_rows_record_connection_metadata():
+    """flow_to_index_entry keeps the upstream connection id, protocol and setup timestamps."""
+    pytest.importorskip('mitmproxy')
+    from mitmproxy.test import tflow
+    from flow_report import flow_to_index_entry
+
+    flow = tflow.tflow(resp=True)
+    flow.request.timestamp_start, flow.request.timestamp_end = 100.0, 100.01
+    flow.server_conn.timestamp_start = 100.02
+    flow.server_conn.timestamp_tcp_setup = 100.05
+    flow.server_conn.timestamp_tls_setup = 100.09
+    flow.server_conn.alpn = b'h2'
+    flow.response.timestamp_start, flow.response.timestamp_end = 100.3, 100.35
+
+    entry = flow_to_index_entry(1, flow)
+    assert entry["serverConnId"] == flow.server_conn.id
+    assert entry["clientConnId"] == flow.client_conn.id
+    assert (entry["serverIp"], entry["tlsVersion"], entry["alpn"]) == ("192.168.0.1", "TLSv1.2", "h2")
+    assert entry["httpVersion"] == "HTTP/1.1"
+    assert (entry["connTcpMs"], entry["connTlsMs"]) == (30, 40)
+    assert entry["connOpenedDateTime"] == datetime.fromtimestamp(100.02, timezone.utc).isoformat()
+
+    # Never connected upstream: no connection fields
+    flow.server_conn.timestamp_start = None
+    entry = flow_to_index_entry(1, flow)
+    assert entry["serverConnId"] is None and entry["connOpenedDateTime"] == ""
+    assert entry["connTcpMs"] is None and entry["alpn"] is None
+    print('✓ test_index_rows_record_connection_metadata passed')
+
+
+def test_reuse_handshakes_and_findings():
+    """Connections, fresh handshakes and the three findings come out of one pass."""
+    with tempfile.TemporaryDirectory() as tmp:
+        index = os.path.join(tmp, 'capture_1.index.ndjson')
+        write_index(index, sample_rows())
+        result = build_connections(index)
+
+        s = result['summary']
+        assert (s['requests'], s['withConnection'], s['withoutConnection']) == (30, 29, 1)
+        assert s['connections'] == 11
+        # a: all 8 fresh; b, c, d: only the request before the connection opened
+        assert s['freshHandshakes'] == 11
+        assert s['tcpMs'] == 110 and s['tlsMs'] == 330
+        assert s['setupMsPaid'] == 11 * 40
+        assert s['coalescedConnections'] == 1
+        assert s['protocols'] == {"h2": 2, "http/1.x": 9}
+
+        hosts = {h['host']: h for h in result['hosts']}
+        assert hosts['a.example.com']['connections'] == 8
+        assert hosts['a.example.com']['freshRatio'] == 1.0
+        assert hosts['a.example.com']['setupShareOfFreshLatency'] == 0.4
+        assert hosts['b.example.com']['requestsPerConnection'] == 10.0
+        assert hosts['b.example.com']['freshHandshakes'] == 1
+        assert hosts['e.example.com']['connections'] == 0
+        assert hosts['e.example.com']['coalescedRequests'] == 1
+
+        findings = [(f['kind'], f['host']) for f in result['findings']]
+        assert findings == [
+            ('no-keepalive', 'a.example.com'),
+            ('many-connections', 'a.example.com'),
+            ('no-coalescing', 'c.example.com, d.example.com'),
+        ]
+        busiest = result['busiestConnections'][0]
+        assert (busiest['serverConnId'], busiest['requests']) == ('b0', 10)
+        assert result['busiestConnections'][1]['otherHosts'] == ['e.example.com']
+
+        # The columnar sidecar gives the same report
+        build_columns(index)
+        assert build_connections(index) == result
+    print('✓ test_reuse_handshakes_and_findings passed')
+
+
+def test_eager_connections_opened_before_the_first_request():
+    """Connections opened at CONNECT (before any request) still charge their first request."""
+    rows = []
+    # No keep-alive: every request gets a connection opened 5 ms before it starts
+    for k in range(6):
+        rows.append(row(len(rows) + 1, 'a.example.com', f'a{k}', k * 200, k * 200 - 5))
+    # Keep-alive: one connection opened before the first of 6 requests, listed out of start order
+    for k in (3, 0, 1, 2, 4, 5):
+        rows.append({**row(len(rows) + 1, 'b.example.com', 'b0', k * 200, -5, ip='10.0.0.2'),
+                     "durationMs": 500 if k == 0 else 100})
+    rows[7]["host"] = 'c.example.com'
+
+    with tempfile.TemporaryDirectory() as tmp:
+        index = os.path.join(tmp, 'capture_1.index.ndjson')
+        write_index(index, rows)
+        result = build_connections(index)
+
+    s = result['summary']
+    assert (s['connections'], s['freshHandshakes'], s['setupMsPaid']) == (7, 7, 7 * 40)
+    hosts = {h['host']: h for h in result['hosts']}
+    assert hosts['a.example.com']['freshRatio'] == 1.0
+    # b0 belongs to c.example.com, whose request started first; b rides on it
+    assert hosts['c.example.com']['freshHandshakes'] == 1
+    assert hosts['c.example.com']['setupShareOfFreshLatency'] == 0.08
+    assert hosts['b.example.com']['freshHandshakes'] == 0
+    assert hosts['b.example.com']['coalescedRequests'] == 5
+    assert [(f['kind'], f['host']) for f in result['findings']] == [('no-keepalive', 'a.example.com')]
+    print('✓ test_eager_connections_opened_before_the_first_request passed')
+
+
+def test_cli_and_index_without_metadata():
+    """The CLI writes reports; an older index without connection fields is explained, not an error."""
+    with tempfile.TemporaryDirectory() as tmp:
+        index = os.path.join(tmp, 'capture_1.index.ndjson')
+        write_index(index, sample_rows())
+        json_out = os.path.join(tmp, 'connections.json')
+        md_out = os.path.join(tmp, 'connections.md')
+        assert main([index, '--json', json_out, '--md', md_out]) == 0
+        with open(json_out) as f:
+            assert json.load(f)['summary']['connections'] == 11
+        with open(md_out) as f:
+            md = f.read()
+        assert '# Connection Reuse' in md and '**no-keepalive** `a.example.com`' in md
+
+        old = os.path.join(tmp, 'capture_0.index.ndjson')
+        write_index(old, [{"id": 1, "host": "a.example.com", "startedDateTime": at(0), "durationMs": 5}])
+        assert main([old, '--md', md_out]) == 0
+        with open(md_out) as f:
+            assert 'No connection metadata in this index' in f.read()
+        assert main([os.path.join(tmp, 'missing.ndjson')]) == 1
+    print('✓ test_cli_and_index_without_metadata passed')
+
+
+if __name__ == '__main__':
+    print('Running connections tests...')
+    print()
+
+    test_index_rows_record_connection_metadata()
+    test_reuse_handshakes_and_findings()
+    test_eager_connections_opened_before_the_first_request()
+    test_cli_and_index_without_metadata()
+
+    print()
+    print('✓ All connections tests passed!')
@@ -10,6 +10,7 @@ import tempfile
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'scripts'))
 
 from diff_captures import (
+    aggregate_index,
     load_index,
     endpoint_key,
     aggregate_endpoints,
@@ -17,6 +18,8 @@ from diff_captures import (
     render_diff_json,
     render_diff_markdown,
 )
+from diff_captures import main as diff_main
+from diff_captures import compute_trend, error_change_point, expand_index_paths, render_trend_markdown
 
 
 def make_entry(method="GET", host="api.example.com", path="/users", status=200,
@@ -142,10 +145,10 @@ def test_diff_status_change():
 def test_diff_latency_regression():
     """Test detection of latency regression (>20%)."""
     baseline = [
-        make_entry(duration_ms=100),
+        make_entry(duration_ms=90 + i) for i in range(21)
     ]
     current = [
-        make_entry(duration_ms=150),  # 50% increase
+        make_entry(duration_ms=140 + i) for i in range(21)  # 50% increase
     ]
 
     b_agg = aggregate_endpoints(baseline)
@@ -156,16 +159,21 @@ def test_diff_latency_regression():
     change = result["changed"][0]
     assert "regression" in change["flags"]
     assert change["deltas"]["latency_pct"] == 50.0
+    assert change["latency_test"]["sufficient"] is True
+    assert change["latency_test"]["effect_size"] == 1.0
+    assert change["latency_test"]["effect"] == "large"
+    assert change["latency_test"]["p_value"] < 0.001
+    assert result["summary"]["regressions"] == 1
     print('✓ test_diff_latency_regression passed')
 
 
 def test_diff_latency_improvement():
     """Test detection of latency improvement (>20% decrease)."""
     baseline = [
-        make_entry(duration_ms=200),
+        make_entry(duration_ms=200 + i % 7) for i in range(30)
     ]
     current = [
-        make_entry(duration_ms=100),  # 50% decrease
+        make_entry(duration_ms=100 + i % 7) for i in range(30)  # 50% decrease
     ]
 
     b_agg = aggregate_endpoints(baseline)
@@ -289,10 +297,10 @@ def test_load_and_diff_files():
         assert result["summary"]["removed"] == 1
         # GET /products was added
         assert result["summary"]["added"] == 1
-        # GET /users latency went from 100 to 300 (200% increase)
-        assert result["summary"]["changed"] == 1
-        change = result["changed"][0]
-        assert "regression" in change["flags"]
+        # GET /users latency went from 100 to 300, but one request per
+        # capture is not evidence of a regression
+        assert result["summary"]["changed"] == 0
+        assert result["summary"]["regressions"] == 0
 
         print('✓ test_load_and_diff_files passed')
     finally:
@@ -310,6 +318,151 @@ def test_empty_captures():
     print('✓ test_empty_captures passed')
 
 
+def test_aggregate_index_reads_whole_file():
+    """Indexes beyond the old 100,000-row cap are aggregated completely."""
+    count = 100005
+    row = json.dumps({"method": "GET", "host": "h", "path": "/", "status": 200,
+                      "statusBucket": "2xx", "durationMs": 7})
+    with tempfile.TemporaryDirectory() as tmp:
+        index_file = os.path.join(tmp, 'capture_1.index.ndjson')
+        with open(index_file, 'w') as f:
+            f.write((row + "\n") * count)
+        agg = aggregate_index(index_file)
+    assert agg["GET h/"]["count"] == count
+    assert agg["GET h/"]["latency"].count == count
+    print('✓ test_aggregate_index_reads_whole_file passed')
+
+
+def test_diff_few_samples_not_flagged():
+    """A large mean shift over two samples each is not a regression."""
+    baseline = [make_entry(duration_ms=d) for d in (100, 110)]
+    current = [make_entry(duration_ms=d) for d in (300, 320)]
+
+    result = compute_diff(aggregate_endpoints(baseline), aggregate_endpoints(current))
+    assert result["summary"]["changed"] == 0
+    assert result["summary"]["regressions"] == 0
+
+    result = compute_diff(aggregate_endpoints(baseline), aggregate_endpoints(current), min_samples=2, alpha=0.5)
+    assert result["changed"][0]["latency_test"]["samples"] == [2, 2]
+    assert "regression" in result["changed"][0]["flags"]
+    print('✓ test_diff_few_samples_not_flagged passed')
+
+
+def test_diff_noisy_shift_not_flagged():
+    """A mean moved by one outlier is not significant; the test result is still reported."""
+    baseline = [make_entry(duration_ms=100 + i % 10) for i in range(40)]
+    current = [make_entry(duration_ms=100 + i % 10) for i in range(39)]
+    current.append(make_entry(duration_ms=2000, status=500, status_bucket="5xx"))
+
+    result = compute_diff(aggregate_endpoints(baseline), aggregate_endpoints(current))
+    change = result["changed"][0]
+    assert change["deltas"]["latency_pct"] > 20
+    assert change["flags"] == ["status-changed", "more-errors"]
+    assert change["latency_test"]["p_value"] > 0.01
+    assert change["latency_test"]["effect"] == "negligible"
+
+    md = render_diff_markdown(result, "b", "c")
+    assert "| p-value | Effect |" in md
+    assert "(negligible)" in md
+    print('✓ test_diff_noisy_shift_not_flagged passed')
+
+
+def test_main_fail_on_regression():
+    """--fail-on-regression exits 2 only when a regression is flagged."""
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = {}
+        for name, base in (("b", 100), ("c", 200)):
+            paths[name] = os.path.join(tmp, f"{name}.index.ndjson")
+            with open(paths[name], "w") as f:
+                for i in range(15):
+                    f.write(json.dumps(make_entry(duration_ms=base + i)) + "\n")
+        out = os.path.join(tmp, "diff.json")
+        argv = ["diff_captures.py", paths["b"], paths["c"], "--json", out, "--fail-on-regression"]
+        assert diff_main(argv) == 2
+        assert diff_main(argv + ["--min-samples", "20"]) == 0
+        with open(out) as f:
+            assert json.load(f)["criteria"]["min_samples"] == 20
+        assert diff_main(argv + ["--alpha", "2"]) == 1
+    print('✓ test_main_fail_on_regression passed')
+
+
+def write_run(path, durations, errors=0, endpoint_path="/users"):
+    with open(path, "w") as f:
+        for i, duration in enumerate(durations):
+            bucket = "5xx" if i < errors else "2xx"
+            f.write(json.dumps(make_entry(path=endpoint_path, duration_ms=duration,
+                                          status=500 if i < errors else 200, status_bucket=bucket)) + "\n")
+
+
+def test_trend_series_and_change_points():
+    """Series line up by run; a step in latency or errors becomes one change point."""
+    runs = []
+    for day in range(6):
+        shift = 80 if day >= 3 else 0
+        runs.append(aggregate_endpoints(
+            [make_entry(duration_ms=100 + shift + i % 9) for i in range(30)]
+            + [make_entry(path="/flaky", duration_ms=50, status=500 if i < (12 if day >= 4 else 0) else 200,
+                          status_bucket="5xx" if i < (12 if day >= 4 else 0) else "2xx") for i in range(40)]
+            + ([make_entry(path="/new", duration_ms=10)] if day == 5 else [])))
+
+    trend = compute_trend(runs)
+    by_key = {e["endpoint"]: e for e in trend["endpoints"]}
+    users = by_key["GET api.example.com/users"]
+    assert users["series"]["count"] == [30] * 6
+    assert users["series"]["avg_ms"][2] < 110 < users["series"]["avg_ms"][3]
+    [point] = users["change_points"]
+    assert (point["metric"], point["index"], point["direction"]) == ("latency", 3, "regression")
+    assert point["effect"] == "large"
+
+    [point] = by_key["GET api.example.com/flaky"]["change_points"]
+    assert (point["metric"], point["index"], point["after_ratio"]) == ("error_ratio", 4, 0.3)
+
+    assert by_key["GET api.example.com/new"]["series"]["avg_ms"] == [None] * 5 + [10]
+    assert by_key["GET api.example.com/new"]["change_points"] == []
+    assert trend["summary"] == {"runs": 6, "endpoints": 3, "change_points": 2, "regressions": 2}
+    assert trend["endpoints"][2]["endpoint"] == "GET api.example.com/new"
+
+    md = render_trend_markdown(trend, [{"run": f"r{i}"} for i in range(6)])
+    assert "## Change Points" in md and "`r3`" in md
+    assert "- · - · - · - · - · 10" in md
+    print('✓ test_trend_series_and_change_points passed')
+
+
+def test_change_point_p_value_is_adjusted_for_splits():
+    """The best of n-1 splits is judged on a Bonferroni-adjusted p-value."""
+    counts, errors = [100] * 6, [0, 0, 0, 3, 3, 3]
+    # Unadjusted p is 0.0025; five splits were tried
+    assert error_change_point(counts, errors) is None
+    point = error_change_point(counts, errors, alpha=0.02)
+    assert point["index"] == 3 and point["p_value"] == 0.01252
+    assert error_change_point(counts[:2], [0, 9], alpha=0.02)["p_value"] < 0.01
+    print('✓ test_change_point_p_value_is_adjusted_for_splits passed')
+
+
+def test_trend_main_orders_runs_and_skips_segments():
+    """Globs skip latest.* links and segment indexes; runs are ordered by RUN_ID."""
+    with tempfile.TemporaryDirectory() as tmp:
+        for run_id, base in (("20260103_010000_1", 300), ("20260101_010000_1", 100), ("20260102_010000_1", 100)):
+            write_run(os.path.join(tmp, f"capture_{run_id}.index.ndjson"), [base + i for i in range(20)])
+        write_run(os.path.join(tmp, "capture_20260103_010000_1.0001.index.ndjson"), [5] * 20)
+        os.symlink(os.path.join(tmp, "capture_20260103_010000_1.index.ndjson"),
+                   os.path.join(tmp, "latest.index.ndjson"))
+        pattern = os.path.join(tmp, "*.index.ndjson")
+        assert len(expand_index_paths([pattern, os.path.join(tmp, "capture_20260101_010000_1.index.ndjson")])) == 3
+
+        out = os.path.join(tmp, "trend.json")
+        assert diff_main(["diff_captures.py", "trend", pattern, "--json", out, "--fail-on-regression"]) == 2
+        with open(out) as f:
+            report = json.load(f)
+        assert [r["run"] for r in report["runs"]] == ["20260101_010000_1", "20260102_010000_1", "20260103_010000_1"]
+        assert report["endpoints"][0]["series"]["avg_ms"] == [109, 109, 309]
+        assert report["endpoints"][0]["change_points"][0]["index"] == 2
+
+        assert diff_main(["diff_captures.py", "trend", os.path.join(tmp, "capture_2026010[12]*")]) == 0
+        assert diff_main(["diff_captures.py", "trend", os.path.join(tmp, "capture_20260101*")]) == 1
+    print('✓ test_trend_main_orders_runs_and_skips_segments passed')
+
+
 if __name__ == "__main__":
     print("Running diff_captures module tests...")
     print()
@@ -328,6 +481,13 @@ if __name__ == "__main__":
     test_render_markdown()
     test_load_and_diff_files()
     test_empty_captures()
+    test_aggregate_index_reads_whole_file()
+    test_diff_few_samples_not_flagged()
+    test_diff_noisy_shift_not_flagged()
+    test_main_fail_on_regression()
+    test_trend_series_and_change_points()
+    test_change_point_p_value_is_adjusted_for_splits()
+    test_trend_main_orders_runs_and_skips_segments()
 
     print()
     print("✓ All diff_captures tests passed!")
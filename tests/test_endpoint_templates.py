@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""Tests for endpoint templating."""
+
+import sys
+import os
+import json
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+
+import ai_brief
+import diff_captures
+from endpoint_templates import (
+    EndpointTemplater,
+    load_templater,
+    normalize_segment,
+    split_endpoint_key,
+    templater_from_policy,
+)
+
+
+def row(i, path, status=200, duration=10, host="api.example.com"):
+    bucket = {200: "2xx", 404: "4xx", 500: "5xx"}[status]
+    return {"id": i, "method": "GET", "host": host, "path": path, "url": f"https://{host}{path}",
+            "status": status, "statusBucket": bucket, "durationMs": duration}
+
+
+def test_builtin_rules():
+    """IDs, UUIDs, hashes and tokens collapse; query parameters are sorted."""
+    templater = EndpointTemplater()
+    assert templater.normalize("/users/42/posts?page=3&_=1718000000") == "/users/{id}/posts?_={id}&page={id}"
+    assert templater.normalize("/o/550e8400-e29b-41d4-a716-446655440000") == "/o/{uuid}"
+    assert templater.normalize("/blob/0123456789abcdef0123") == "/blob/{hash}"
+    assert templater.normalize("/s/Zm9vYmFyYmF6cXV4MTIzNDU2Nzg") == "/s/{token}"
+    assert templater.normalize("/v2/users/") == "/v2/users/"
+    assert templater.normalize("/search?q=shoes&flag&q=shoes") == "/search?flag&q=shoes"
+    assert normalize_segment("profile") == "profile"
+    assert split_endpoint_key("GET api.example.com/a?b=1") == ("GET api.example.com", "/a?b=1")
+    assert split_endpoint_key("GET host") == ("GET host", "")
+    print('✓ test_builtin_rules passed')
+
+
+def test_policy_templates_and_switches():
+    """Policy templates win over the rules; enabled=false turns templating off."""
+    templater = templater_from_policy({"endpoints": {"templates": ["/users/{name}/repos"]}})
+    assert templater.normalize("/users/alice/repos") == "/users/{name}/repos"
+    assert templater.normalize("/users/alice/repos/7") == "/users/alice/repos/{id}"
+    assert templater_from_policy({"endpoints": {"enabled": False}}) is None
+
+    with tempfile.TemporaryDirectory() as tmp:
+        policy_file = os.path.join(tmp, 'policy.json')
+        with open(policy_file, 'w') as f:
+            json.dump({"endpoints": {"templates": ["/t/{x}"], "learn": False}}, f)
+        templater = load_templater(policy_file)
+    assert templater.normalize("/t/abc") == "/t/{x}"
+    templater.learn(f"GET h/u/user{i}" for i in range(50))
+    assert templater.apply("GET h/u/user1") == "GET h/u/user1"
+    print('✓ test_policy_templates_and_switches passed')
+
+
+def test_learned_templates_merge_endpoints():
+    """High-cardinality segments and query values become {param}/{value}."""
+    rows = [row(i, f"/users/user{i}/repos?sort=v{i}", 500 if i == 3 else 200, i) for i in range(25)]
+    rows += [row(100 + i, f"/about/{name}") for i, name in enumerate(["team", "jobs"])]
+    stats = ai_brief.calc_stats(rows, EndpointTemplater())
+
+    key = "GET api.example.com/users/{param}/repos?sort={value}"
+    assert stats["topEndpoints"][0] == {"endpoint": key, "count": 25}
+    assert [e["endpoint"] for e in stats["topEndpoints"][1:]] == [
+        "GET api.example.com/about/team", "GET api.example.com/about/jobs"]
+    assert stats["topErrorEndpoints"] == [{"endpoint": key, "count": 1}]
+    assert stats["endpointLatency"][key]["sketch"]["sum"] == sum(range(25))
+    # Raw keys are still the default for the library functions
+    assert len(ai_brief.calc_stats(rows)["topEndpoints"]) == 27
+
+    templater = EndpointTemplater(min_distinct=30)
+    assert len(ai_brief.calc_stats(rows, templater)["topEndpoints"]) == 27
+    print('✓ test_learned_templates_merge_endpoints passed')
+
+
+def test_static_routes_are_not_learned():
+    """Many distinct plain-word routes stay separate endpoints."""
+    words = ["login", "logout", "checkout", "admin", "cart", "search", "help", "about", "terms",
+             "privacy", "account", "orders", "settings", "profile", "signup", "reset-password",
+             "blog", "news", "contact", "pricing", "docs", "status"]
+    keys = [f"GET app.example.com/{word}" for word in words]
+    keys += [f"GET app.example.com/{word}/users" for word in words]
+    keys += [f"GET app.example.com/api/{word}?view={word}" for word in words]
+    templater = EndpointTemplater()
+    templater.learn(keys)
+    assert [templater.apply(key) for key in keys] == keys
+    assert templater.apply("GET app.example.com/api/users") == "GET app.example.com/api/users"
+
+    # The first segment is never learned, even when it looks like an ID
+    templater.learn([f"GET app.example.com/v{i}" for i in range(30)])
+    assert templater.apply("GET app.example.com/v7") == "GET app.example.com/v7"
+
+    # Identifier-like values next to static routes: only the identifiers collapse
+    templater.learn([f"GET app.example.com/users/u{i}" for i in range(25)] + ["GET app.example.com/users/me"])
+    assert templater.apply("GET app.example.com/users/u3") == "GET app.example.com/users/{param}"
+    assert templater.apply("GET app.example.com/users/me") == "GET app.example.com/users/me"
+    print('✓ test_static_routes_are_not_learned passed')
+
+
+def test_diff_compares_templates():
+    """Different IDs in two captures diff as one endpoint."""
+    baseline = [row(i, f"/items/{i}", duration=100) for i in range(10)]
+    baseline += [row(20 + i, f"/u/name{i}", duration=50) for i in range(20)]
+    current = [row(i, f"/items/{i + 1000}", duration=300) for i in range(10)]
+    current += [row(20 + i, "/u/name0", duration=50) for i in range(3)]
+
+    templater = EndpointTemplater()
+    b_agg, c_agg = diff_captures.collapse_endpoints(
+        templater,
+        diff_captures.aggregate_endpoints(baseline, templater),
+        diff_captures.aggregate_endpoints(current, templater))
+    assert list(b_agg) == ["GET api.example.com/items/{id}", "GET api.example.com/u/{param}"]
+    assert list(c_agg) == list(b_agg)
+    assert b_agg["GET api.example.com/u/{param}"]["count"] == 20
+    assert b_agg["GET api.example.com/u/{param}"]["latency"].count == 20
+
+    diff = diff_captures.compute_diff(b_agg, c_agg)
+    assert diff["summary"]["added"] == diff["summary"]["removed"] == 0
+    assert diff["changed"][0]["endpoint"] == "GET api.example.com/items/{id}"
+    assert "regression" in diff["changed"][0]["flags"]
+
+    raw = diff_captures.compute_diff(diff_captures.aggregate_endpoints(baseline),
+                                     diff_captures.aggregate_endpoints(current))
+    assert raw["summary"]["added"] == 10
+    print('✓ test_diff_compares_templates passed')
+
+
+if __name__ == '__main__':
+    print('Running endpoint_templates tests...')
+    print()
+
+    test_builtin_rules()
+    test_policy_templates_and_switches()
+    test_learned_templates_merge_endpoints()
+    test_static_routes_are_not_learned()
+    test_diff_compares_templates()
+
+    print()
+    print('✓ All endpoint_templates tests passed!')
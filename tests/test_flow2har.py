@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""Tests for flow2har HAR output."""
+
+import sys
+import os
+import gzip
+import json
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+
+import flow2har
+
+
+def sample_entry(i):
+    return {
+        "startedDateTime": "2026-01-01T00:00:00+00:00",
+        "time": i,
+        "request": {"method": "GET", "url": f"https://example.com/{i}", "headers": []},
+        "response": {"status": 200, "content": {"text": "line1\nlíne2", "size": 11}},
+        "timings": {},
+    }
+
+
+def test_har_writer_matches_json_dump():
+    """Streamed output is byte-identical to json.dump of the whole document."""
+    for count in (0, 1, 5):
+        har = flow2har.new_har()
+        har["log"]["entries"] = [sample_entry(i) for i in range(count)]
+
+        with tempfile.TemporaryDirectory() as tmp:
+            har_file = os.path.join(tmp, 'out.har')
+            writer = flow2har.HarWriter(har_file)
+            for entry in har["log"]["entries"]:
+                writer.add(entry)
+            assert writer.close() == count
+
+            with open(har_file, encoding='utf-8') as f:
+                assert f.read() == json.dumps(har, indent=2, ensure_ascii=False)
+    print('✓ test_har_writer_matches_json_dump passed')
+
+
+def test_compact_and_compressed_har_round_trip():
+    """--compact drops whitespace; .gz/.zst outputs load back transparently."""
+    har = flow2har.new_har()
+    har["log"]["entries"] = [sample_entry(i) for i in range(3)]
+    outputs = ['out.har', 'out.har.gz']
+    try:
+        flow2har.zstd_module()
+        outputs.append('out.har.zst')
+    except RuntimeError:
+        pass
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in outputs:
+            har_file = os.path.join(tmp, name)
+            writer = flow2har.HarWriter(har_file, compact=True)
+            for entry in har["log"]["entries"]:
+                writer.add(entry)
+            writer.close()
+            assert flow2har.load_har(har_file) == har, name
+
+        with open(os.path.join(tmp, 'out.har'), encoding='utf-8') as f:
+            assert f.read() == json.dumps(har, separators=(',', ':'), ensure_ascii=False)
+        with gzip.open(os.path.join(tmp, 'out.har.gz'), 'rt', encoding='utf-8') as f:
+            assert json.load(f) == har
+    print('✓ test_compact_and_compressed_har_round_trip passed')
+
+
+def test_timings_split_connection_setup_from_wait():
+    """HAR timings and index columns come from flow and connection timestamps."""
+    pytest.importorskip('mitmproxy')
+    from mitmproxy.test import tflow
+    from flow_report import flow_to_index_entry
+
+    flow = tflow.tflow(resp=True)
+    flow.request.timestamp_start, flow.request.timestamp_end = 100.0, 100.01
+    flow.server_conn.timestamp_start = 100.02
+    flow.server_conn.timestamp_tcp_setup = 100.05
+    flow.server_conn.timestamp_tls_setup = 100.09
+    flow.response.timestamp_start, flow.response.timestamp_end = 100.3, 100.35
+
+    timings = flow2har.flow_to_entry(flow)["timings"]
+    assert timings == {"blocked": -1, "dns": -1, "connect": 70, "ssl": 40,
+                       "send": 10, "wait": 220, "receive": 50}
+    row = flow_to_index_entry(1, flow)
+    assert (row["ttfbMs"], row["connectMs"], row["tlsMs"], row["receiveMs"]) == (220, 30, 40, 50)
+
+    # Set up before this request started: a reused connection, or one opened
+    # at CONNECT by the eager strategy (startCaptures.sh uses lazy to avoid it)
+    flow.server_conn.timestamp_start = 90.0
+    flow.server_conn.timestamp_tcp_setup = 90.1
+    flow.server_conn.timestamp_tls_setup = 90.2
+    timings = flow2har.flow_to_entry(flow)["timings"]
+    assert (timings["connect"], timings["ssl"], timings["wait"]) == (-1, -1, 290)
+    assert flow_to_index_entry(1, flow)["connectMs"] is None
+    print('✓ test_timings_split_connection_setup_from_wait passed')
+
+
+if __name__ == '__main__':
+    print('Running flow2har tests...')
+    print()
+
+    test_har_writer_matches_json_dump()
+    test_compact_and_compressed_har_round_trip()
+    test_timings_split_connection_setup_from_wait()
+
+    print()
+    print('✓ All flow2har tests passed!')
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""Tests for flow_lookup byte-offset sidecar and random access."""
+
+import sys
+import os
+import io
+import json
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+
+pytest.importorskip('mitmproxy')
+
+from mitmproxy.io import FlowReader, FlowWriter
+from mitmproxy.test import tflow
+
+import capture_pipeline
+import flow2har
+import flow_lookup
+import flow_report
+import index_columns
+
+
+def write_flows(path, count):
+    with open(path, 'wb') as f:
+        writer = FlowWriter(f)
+        for i in range(count):
+            flow = tflow.tflow(resp=True)
+            flow.request.path = f'/items/{i + 1}'
+            flow.response.content = f'body-{i + 1}'.encode() * (i + 1)
+            writer.add(flow)
+
+
+def test_lookup_matches_sequential_read():
+    """Every id decodes to the same flow as the N-th flow of a full read."""
+    with tempfile.TemporaryDirectory() as tmp:
+        flow_file = os.path.join(tmp, 'capture_1.flow')
+        write_flows(flow_file, 20)
+
+        assert flow_lookup.build_index(flow_file) == 20
+        with open(flow_file, 'rb') as f:
+            expected = list(FlowReader(f).stream())
+
+        for flow_id in (1, 7, 20):
+            flow = flow_lookup.load_flow(flow_file, flow_id)
+            assert flow.id == expected[flow_id - 1].id
+            assert flow.request.path == f'/items/{flow_id}'
+
+        with pytest.raises(KeyError):
+            flow_lookup.lookup(flow_file, 21)
+        print('✓ test_lookup_matches_sequential_read passed')
+
+
+def test_pipeline_sidecar_matches_scan_and_grows():
+    """The pipeline writes the same sidecar as a scan; a grown file is re-indexed."""
+    with tempfile.TemporaryDirectory() as tmp:
+        flow_file = os.path.join(tmp, 'capture_1.flow')
+        write_flows(flow_file, 5)
+        pipeline_idx = os.path.join(tmp, 'pipeline.flow.idx')
+        index_sink = capture_pipeline.IndexSink(os.path.join(tmp, 'out.index.ndjson'))
+        capture_pipeline.run_pipeline(flow_file, [index_sink], pipeline_idx)
+
+        flow_lookup.build_index(flow_file)
+        with open(pipeline_idx, 'rb') as a, open(flow_lookup.idx_path_for(flow_file), 'rb') as b:
+            assert a.read() == b.read()
+
+        write_flows(os.path.join(tmp, 'more.flow'), 7)
+        with open(os.path.join(tmp, 'more.flow'), 'rb') as src, open(flow_file, 'ab') as dst:
+            dst.write(src.read())
+        assert flow_lookup.load_flow(flow_file, 12).request.path == '/items/7'
+        print('✓ test_pipeline_sidecar_matches_scan_and_grows passed')
+
+
+def test_cli_show_body_and_index_row():
+    """CLI writes the index row by default and raw body bytes with --body."""
+    with tempfile.TemporaryDirectory() as tmp:
+        flow_file = os.path.join(tmp, 'capture_1.flow')
+        write_flows(flow_file, 3)
+
+        row_file = os.path.join(tmp, 'row.json')
+        assert flow_lookup.main(['show', flow_file, '2', '-o', row_file]) == 0
+        with open(row_file) as f:
+            row = json.load(f)
+        assert row['id'] == 2 and row['path'] == '/items/2'
+
+        out_file = os.path.join(tmp, 'body.bin')
+        assert flow_lookup.main(['show', flow_file, '3', '--body', 'response', '-o', out_file]) == 0
+        with open(out_file, 'rb') as f:
+            assert f.read() == b'body-3' * 3
+
+        # Symlinked flow files are refused before anything is decoded
+        link = os.path.join(tmp, 'link.flow')
+        os.symlink(flow_file, link)
+        assert flow_lookup.main(['build', link]) == 1
+        assert flow_lookup.main(['show', link, '1']) == 1
+        assert not os.path.exists(link + '.idx')
+        print('✓ test_cli_show_body_and_index_row passed')
+
+
+def test_shard_ranges_cover_file_on_flow_boundaries():
+    """Shards are contiguous, start on flow offsets and cover every byte."""
+    offsets = [(0, 10), (10, 50), (60, 5), (65, 30), (95, 5)]
+    ranges = flow_lookup.shard_ranges(offsets, 3)
+    starts = {offset for offset, _ in offsets}
+    assert ranges[0][0] == 0 and ranges[-1][1] == 100
+    assert all(a[1] == b[0] for a, b in zip(ranges, ranges[1:]))
+    assert all(start in starts for start, _ in ranges)
+    assert flow_lookup.shard_ranges([], 4) == []
+    print('✓ test_shard_ranges_cover_file_on_flow_boundaries passed')
+
+
+def test_parallel_jobs_match_serial_output():
+    """--jobs N produces byte-identical index and HAR output."""
+    with tempfile.TemporaryDirectory() as tmp:
+        flow_file = os.path.join(tmp, 'capture_1.flow')
+        write_flows(flow_file, 40)
+
+        for jobs in (1, 3):
+            assert flow_report.main([
+                'flow_report.py', flow_file,
+                os.path.join(tmp, f'j{jobs}.index.ndjson'), os.path.join(tmp, f'j{jobs}.summary.md'),
+                '--jobs', str(jobs),
+            ]) == 0
+            flow2har.convert(flow_file, os.path.join(tmp, f'j{jobs}.har'), jobs=jobs)
+
+        for name in ('index.ndjson', 'har'):
+            with open(os.path.join(tmp, f'j1.{name}'), 'rb') as a, open(os.path.join(tmp, f'j3.{name}'), 'rb') as b:
+                assert a.read() == b.read(), f'{name} differs'
+        print('✓ test_parallel_jobs_match_serial_output passed')
+
+
+def test_follow_indexes_only_complete_flows():
+    """--follow appends rows as flows land, waits on partial ones and resumes."""
+    assert flow_lookup.record_length(b'12') is None
+    assert flow_lookup.record_length(b'5:hello,') == 8
+    with pytest.raises(ValueError):
+        flow_lookup.record_length(b'x:')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, 'source.flow')
+        write_flows(source, 7)
+        with open(source, 'rb') as f:
+            data = f.read()
+            offsets = list(flow_lookup.scan_offsets(io.BytesIO(data)))
+        flow_file = os.path.join(tmp, 'capture_1.flow')
+        index_file = os.path.join(tmp, 'follow.index.ndjson')
+        summary_file = os.path.join(tmp, 'follow.summary.md')
+
+        def grow(end):
+            with open(flow_file, 'wb') as f:
+                f.write(data[:end])
+
+        grow(offsets[3][0] + 4)
+        follower = flow_report.FlowFollower(flow_file, index_file, summary_file)
+        assert follower.poll() == 3
+        assert follower.offset == offsets[3][0]
+        grow(offsets[3][0] + offsets[3][1] - 1)
+        assert follower.poll() == 0
+        grow(offsets[5][0])
+        assert follower.poll() == 2
+        follower.write_summary()
+        with open(summary_file, encoding='utf-8') as f:
+            assert '- Total requests: `5`' in f.read()
+        follower.output.close()
+
+        # A restarted follower picks up at the saved offset
+        grow(len(data))
+        follower = flow_report.FlowFollower(flow_file, index_file, summary_file)
+        assert follower.offset == offsets[5][0] and follower.summary.total == 5
+        assert follower.poll() == 2
+        follower.close()
+
+        batch_index = os.path.join(tmp, 'batch.index.ndjson')
+        assert flow_report.main(['flow_report.py', flow_file, batch_index, os.path.join(tmp, 'batch.md')]) == 0
+        with open(index_file, 'rb') as a, open(batch_index, 'rb') as b:
+            assert a.read() == b.read()
+        assert index_columns.open_columns(index_file) is not None
+
+        # An index that no longer matches the state is rebuilt from byte 0
+        with open(index_file, 'a', encoding='utf-8') as f:
+            f.write('{}\n')
+        assert flow_report.main(['flow_report.py', flow_file, index_file, summary_file,
+                                 '--follow', '--interval', '0.05', '--idle-exit', '0.2']) == 0
+        with open(index_file, 'rb') as a, open(batch_index, 'rb') as b:
+            assert a.read() == b.read()
+        with open(flow_report.follow_state_path(index_file), encoding='utf-8') as f:
+            assert json.load(f)['offset'] == len(data)
+        assert flow_report.main(['flow_report.py', flow_file, index_file, summary_file, '--idle-exit', '1']) == 1
+        print('✓ test_follow_indexes_only_complete_flows passed')
+
+
+if __name__ == '__main__':
+    print('Running flow_lookup tests...')
+    print()
+
+    test_lookup_matches_sequential_read()
+    test_pipeline_sidecar_matches_scan_and_grows()
+    test_cli_show_body_and_index_row()
+    test_shard_ranges_cover_file_on_flow_boundaries()
+    test_parallel_jobs_match_serial_output()
+    test_follow_indexes_only_complete_flows()
+
+    print()
+    print('✓ All flow_lookup tests passed!')
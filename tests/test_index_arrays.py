@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""Tests that the NumPy aggregation backend matches the pure-Python paths."""
+
+import sys
+import os
+import json
+import random
+import tempfile
+
+import pytest
+
+pytest.importorskip('numpy')
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+
+import ai_brief
+import diff_captures
+import endpoint_templates
+import flow_report
+import index_arrays
+import index_columns
+
+BUCKETS = {None: "no-response", 200: "2xx", 302: "3xx", 404: "4xx", 500: "5xx"}
+
+
+def random_rows(count, seed):
+    rng = random.Random(seed)
+    rows = []
+    for i in range(1, count + 1):
+        status = rng.choice([200, 200, 200, 302, 404, 500, None])
+        host = rng.choice(["api.example.com", "cdn.example.com", "a", "a/b", "", None])
+        # "a" + "/b/c" and "a/b" + "/c" spell the same endpoint key
+        path = rng.choice(["/users", "/items", "/b/c", "/c", None])
+        rows.append({
+            "id": i,
+            "startedDateTime": "2026-01-01T00:00:00+00:00",
+            "method": rng.choice(["GET", "POST", None]),
+            "host": host,
+            "path": path,
+            "url": f"https://{host}{path}",
+            "status": status,
+            "statusBucket": BUCKETS[status] if rng.random() > 0.05 else None,
+            "durationMs": rng.choice([5, 10, 10, 250, 1200, rng.randrange(5000)]) if status else None,
+        })
+    return rows
+
+
+def write_index(tmp, rows):
+    index_file = os.path.join(tmp, 'capture_1.index.ndjson')
+    with open(index_file, 'w', encoding='utf-8') as f:
+        for row in rows:
+            f.write(json.dumps(row) + "\n")
+    index_columns.build(index_file)
+    return index_file
+
+
+def test_ai_brief_stats_match_python():
+    """add_arrays gives the same stats, tie order included, as add_many."""
+    rows = random_rows(3000, 1)
+    with tempfile.TemporaryDirectory() as tmp:
+        index_file = write_index(tmp, rows)
+        arrays = index_arrays.load_arrays(index_file, min_rows=1)
+        assert arrays is not None
+        stats = ai_brief.StatsAccumulator()
+        stats.add_many(rows[:10])
+        stats.add_arrays(arrays)
+        arrays.close()
+        assert stats.result() == ai_brief.calc_stats(rows[:10] + rows)
+
+        # Below min_rows (and without a sidecar) the Python path is used
+        assert index_arrays.load_arrays(index_file) is None
+        os.unlink(index_columns.col_path_for(index_file))
+        assert index_arrays.load_arrays(index_file, min_rows=1) is None
+    print('✓ test_ai_brief_stats_match_python passed')
+
+
+def test_diff_aggregates_match_python():
+    """aggregate_arrays equals aggregate_endpoints, including dict order."""
+    rows = random_rows(2000, 2)
+    with tempfile.TemporaryDirectory() as tmp:
+        index_file = write_index(tmp, rows)
+        arrays = index_arrays.load_arrays(index_file, diff_captures.DIFF_FIELDS, min_rows=1)
+        vectorized = diff_captures.aggregate_arrays(arrays)
+        arrays.close()
+    expected = diff_captures.aggregate_endpoints(rows)
+    assert vectorized == expected
+    assert list(vectorized) == list(expected)
+    for key, agg in expected.items():
+        assert list(vectorized[key]["status_buckets"]) == list(agg["status_buckets"])
+    print('✓ test_diff_aggregates_match_python passed')
+
+
+def test_templated_endpoints_match_python():
+    """With endpoint templates both backends merge the same endpoints."""
+    rows = random_rows(2500, 4)
+    rng = random.Random(5)
+    for row in rows:
+        if row["path"] == "/users":
+            row["path"] = rng.choice([f"/users/{rng.randrange(100)}", f"/users/u{rng.randrange(40)}?v={rng.randrange(9)}"])
+    with tempfile.TemporaryDirectory() as tmp:
+        index_file = write_index(tmp, rows)
+        arrays = index_arrays.load_arrays(index_file, min_rows=1)
+        stats = ai_brief.StatsAccumulator(endpoint_templates.EndpointTemplater(min_distinct=5))
+        stats.add_arrays(arrays)
+        arrays.close()
+        expected = ai_brief.calc_stats(rows, endpoint_templates.EndpointTemplater(min_distinct=5))
+        assert stats.result() == expected
+        assert any("{param}" in key for key in expected["endpointLatency"])
+
+        arrays = index_arrays.load_arrays(index_file, diff_captures.DIFF_FIELDS, min_rows=1)
+        vectorized = diff_captures.aggregate_arrays(arrays, endpoint_templates.EndpointTemplater(min_distinct=5))
+        arrays.close()
+    assert vectorized == diff_captures.aggregate_endpoints(rows, endpoint_templates.EndpointTemplater(min_distinct=5))
+    print('✓ test_templated_endpoints_match_python passed')
+
+
+def test_summary_from_writer_arrays_matches_rows():
+    """write_summary renders the same report from ColumnWriter arrays."""
+    rows = random_rows(1500, 3)
+    for row in rows:
+        row["statusBucket"] = row["statusBucket"] or "unknown"
+    writer = index_columns.ColumnWriter(None)
+    for row in rows:
+        writer.add(row)
+    arrays = index_arrays.writer_arrays(writer, min_rows=1)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        outputs = []
+        for name, entries in (('rows.md', rows), ('arrays.md', arrays)):
+            summary = os.path.join(tmp, name)
+            flow_report.write_summary('capture.flow', summary, entries)
+            with open(summary, encoding='utf-8') as f:
+                outputs.append([line for line in f if 'Generated at' not in line])
+    assert outputs[0] == outputs[1]
+    print('✓ test_summary_from_writer_arrays_matches_rows passed')
+
+
+if __name__ == '__main__':
+    print('Running index_arrays tests...')
+    print()
+
+    test_ai_brief_stats_match_python()
+    test_diff_aggregates_match_python()
+    test_templated_endpoints_match_python()
+    test_summary_from_writer_arrays_matches_rows()
+
+    print()
+    print('✓ All index_arrays tests passed!')
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""Tests for the columnar index sidecar."""
+
+import sys
+import os
+import json
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+
+import diff_captures
+import index_columns
+
+
+def sample_rows(count):
+    rows = []
+    for i in range(1, count + 1):
+        rows.append({
+            "id": i,
+            "startedDateTime": f"2026-01-01T00:00:{i % 60:02d}.{i:06d}+00:00",
+            "method": "GET" if i % 3 else "POST",
+            "host": f"api{i % 2}.example.com",
+            "path": f"/items/{i % 5}",
+            "status": None if i % 7 == 0 else 200,
+            "statusBucket": "no-response" if i % 7 == 0 else "2xx",
+            "durationMs": None if i % 7 == 0 else i * 3,
+            "contentType": "application/json",
+            "responseBodyRef": None if i % 2 else "ab" * 32,
+        })
+    return rows
+
+
+def write_index(path, rows):
+    with open(path, 'w', encoding='utf-8') as f:
+        for row in rows:
+            f.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+
+def test_columns_round_trip_ndjson_rows():
+    """Decoded rows equal the NDJSON rows, nulls and key order included."""
+    with tempfile.TemporaryDirectory() as tmp:
+        index_file = os.path.join(tmp, 'capture_1.index.ndjson')
+        rows = sample_rows(50)
+        write_index(index_file, rows)
+        assert index_columns.build(index_file) == 50
+        assert os.path.isfile(os.path.join(tmp, 'capture_1.index.col'))
+
+        columns = index_columns.open_columns(index_file)
+        assert len(columns) == 50
+        assert list(columns) == rows
+        assert columns[6] == rows[6] and columns[-1] == rows[-1]
+        assert columns.column("status")[6] == index_columns.INT_NULL
+        assert sorted(columns.strings("host")) == ["api0.example.com", "api1.example.com"]
+        assert list(columns.values("durationMs"))[:2] == [3, 6]
+        columns.close()
+        print('✓ test_columns_round_trip_ndjson_rows passed')
+
+
+def test_stale_sidecar_is_ignored():
+    """An index that changed after the sidecar was built is read from NDJSON."""
+    with tempfile.TemporaryDirectory() as tmp:
+        index_file = os.path.join(tmp, 'capture_1.index.ndjson')
+        rows = sample_rows(10)
+        write_index(index_file, rows[:5])
+        index_columns.build(index_file)
+        write_index(index_file, rows)
+
+        assert index_columns.open_columns(index_file) is None
+        assert diff_captures.load_index(index_file) == rows
+
+        # Same size, rewritten in place: the mtime and hash no longer match
+        index_columns.build(index_file)
+        edited = [dict(row, host=row["host"].replace("api", "web")) for row in rows]
+        write_index(index_file, edited)
+        assert index_columns.open_columns(index_file) is None
+        assert diff_captures.load_index(index_file) == edited
+
+        # Only the mtime changed (touched or copied): the hash decides
+        index_columns.build(index_file)
+        st = os.stat(index_file)
+        os.utime(index_file, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+        columns = index_columns.open_columns(index_file)
+        assert columns is not None and list(columns) == edited
+        columns.close()
+        print('✓ test_stale_sidecar_is_ignored passed')
+
+
+def test_fields_limit_decoded_keys_and_diff_matches():
+    """Consumers decoding a field subset get the same aggregates as from NDJSON."""
+    with tempfile.TemporaryDirectory() as tmp:
+        index_file = os.path.join(tmp, 'capture_1.index.ndjson')
+        write_index(index_file, sample_rows(40))
+        from_ndjson = diff_captures.aggregate_endpoints(diff_captures.load_index(index_file))
+
+        index_columns.build(index_file)
+        entries = diff_captures.load_index(index_file, diff_captures.DIFF_FIELDS)
+        assert isinstance(entries, index_columns.IndexColumns)
+        assert set(entries[0]) == set(diff_captures.DIFF_FIELDS)
+        assert diff_captures.aggregate_endpoints(entries) == from_ndjson
+        print('✓ test_fields_limit_decoded_keys_and_diff_matches passed')
+
+
+def test_iter_rows_closes_the_sidecar():
+    """iter_rows reads the sidecar when current and closes it when iteration ends."""
+    with tempfile.TemporaryDirectory() as tmp:
+        index_file = os.path.join(tmp, 'capture_1.index.ndjson')
+        rows = sample_rows(20)
+        write_index(index_file, rows)
+        assert list(index_columns.iter_rows(index_file)) == rows
+
+        index_columns.build(index_file)
+        for stop in (None, 3):
+            it = index_columns.iter_rows(index_file, ("id", "host"))
+            assert next(it) == {"id": 1, "host": "api1.example.com"}
+            columns = it.gi_frame.f_locals["columns"]
+            if stop is None:
+                assert len(list(it)) == 19
+            else:
+                it.close()
+            assert columns.mm.closed and columns.columns == {}
+        print('✓ test_iter_rows_closes_the_sidecar passed')
+
+
+def test_writer_rejects_mismatched_rows():
+    """Rows with different fields or non-integer numbers are refused."""
+    with tempfile.TemporaryDirectory() as tmp:
+        col_file = os.path.join(tmp, 'out.index.col')
+        for bad in ({"id": 2}, {"id": 2.5, "host": "x"}):
+            writer = index_columns.ColumnWriter(col_file)
+            writer.add({"id": 1, "host": "x"})
+            with pytest.raises(ValueError):
+                writer.add(bad)
+        assert not os.path.exists(col_file)
+        print('✓ test_writer_rejects_mismatched_rows passed')
+
+
+if __name__ == '__main__':
+    print('Running index_columns tests...')
+    print()
+
+    test_columns_round_trip_ndjson_rows()
+    test_stale_sidecar_is_ignored()
+    test_fields_limit_decoded_keys_and_diff_matches()
+    test_iter_rows_closes_the_sidecar()
+    test_writer_rejects_mismatched_rows()
+
+    print()
+    print('✓ All index_columns tests passed!')
@@ -4,11 +4,13 @@
 import sys
 import os
 import json
+import random
 import tempfile
 
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'scripts'))
 
 from policy import (
+    CompiledPolicy,
     extract_target_host,
     wildcard_to_regex,
     compile_hosts_regex,
@@ -103,6 +105,44 @@ def test_is_host_allowed():
     print('✓ test_is_host_allowed passed')
 
 
+def test_compiled_policy_matches_is_host_allowed():
+    """CompiledPolicy gives is_host_allowed's verdict for every host."""
+    allow = ['example.com', '*.example.com', '*.Cdn.NET', 'svc-*.internal', '*', '*.']
+    deny = ['*.google.com', 'accounts.*', '*.bad.example.com', 'a*b.com']
+    hosts = ['example.com', 'api.example.com', '.example.com', 'x.y.example.com', 'example.com.evil',
+             'IMG.cdn.net', 'cdn.net', 'svc-1.internal', 'svc.internal', 'www.google.com', 'google.com',
+             'accounts.example.com', 'deep.bad.example.com', 'bad.example.com', 'ab.com', 'axxb.com',
+             'other.org', 'a.', '', None]
+    for allow_hosts in (allow, allow[:4], []):
+        compiled = CompiledPolicy(allow_hosts, deny)
+        for host in hosts:
+            expected = is_host_allowed(host, allow_hosts, deny)
+            assert compiled.check(host) == expected, (allow_hosts, host)
+            assert compiled.is_allowed(host) == expected[0]
+
+    compiled = CompiledPolicy(['*.example.com', '*..example.com'], [])
+    assert compiled.check('a.example.com') == (True, 'allowed_by_whitelist')
+    assert CompiledPolicy(['*..x-y'], []).check('.x-y.x-y') == (False, 'not_in_whitelist')
+
+    # Randomized parity, empty labels (typos such as '*..example.com') included
+    rng = random.Random(17)
+
+    def name(max_labels):
+        return '.'.join(rng.choice(['', 'a', 'b', 'a-b', 'ab']) for _ in range(rng.randint(1, max_labels)))
+
+    for _ in range(300):
+        patterns = [rng.choice(['*.', '*', '', 'a*']) + name(3) for _ in range(rng.randint(1, 4))]
+        compiled = CompiledPolicy(patterns, patterns[:1])
+        for host in [name(4) for _ in range(20)] + ['.' + patterns[-1].lstrip('*')]:
+            assert compiled.check(host) == is_host_allowed(host, patterns, patterns[:1]), (patterns, host)
+
+    compiled = CompiledPolicy.from_policy({'scope': {'allow_hosts': ['*.example.com'], 'deny_hosts': []}})
+    assert compiled.check('api.example.com') == (True, 'allowed_by_whitelist')
+    assert compiled.check('example.com') == (False, 'not_in_whitelist')
+
+    print('✓ test_compiled_policy_matches_is_host_allowed passed')
+
+
 def test_compile_hosts_regex():
     """Test regex compilation."""
     hosts = ['example.com', '*.google.com']
@@ -169,6 +209,7 @@ def run_all_tests():
     test_host_matches_pattern()
     test_host_matches_any()
     test_is_host_allowed()
+    test_compiled_policy_matches_is_host_allowed()
     test_compile_hosts_regex()
     test_generate_default_policy()
     test_load_policy()
@@ -53,10 +53,50 @@ EOF
     fi
 }
 
+test_progress_reads_live_counters() {
+    local temp_dir real_flow counters output
+    temp_dir="$(mktemp -d)"
+
+    mkdir -p "$temp_dir/captures"
+    real_flow="$temp_dir/captures/capture_20260210_000000_1.flow"
+    counters="$temp_dir/captures/capture_20260210_000000_1.counters.json"
+    # not a valid flow file: progress must not need to decode it
+    printf 'not-a-flow' > "$real_flow"
+    cat > "$counters" <<EOF
+{"requests": 120, "responses": 110, "errors": 2, "bytesIn": 4096, "bytesOut": 512, "at": 110.0,
+ "statusBuckets": {"2xx": 100, "5xx": 10}, "hosts": {"api.example.com": 90, "cdn.example.com": 30},
+ "previous": {"requests": 100, "responses": 95, "errors": 2, "bytesIn": 2048, "bytesOut": 512, "at": 100.0},
+ "complete": false}
+EOF
+
+    cat > "$temp_dir/captures/proxy_info.env" <<EOF
+MITM_PID="$$"
+STARTED_AT="$(date +%Y-%m-%dT%H:%M:%S)"
+LISTEN_PORT="18080"
+FLOW_FILE="$real_flow"
+COUNTERS_FILE="$counters"
+EOF
+
+    output="$($CAPTURE_SCRIPT progress -d "$temp_dir" 2>&1 || true)"
+    rm -rf "$temp_dir"
+
+    if echo "$output" | grep -q "Requests:  120 (110 responses, 2 errors)" \
+        && echo "$output" | grep -q "Rate:      2.0 req/s" \
+        && echo "$output" | grep -q "api.example.com (90)"; then
+        report "test_progress_reads_live_counters" "pass"
+    else
+        echo "--- output ---"
+        echo "$output"
+        echo "--------------"
+        report "test_progress_reads_live_counters" "fail"
+    fi
+}
+
 echo "Running progress command tests..."
 echo ""
 
 test_progress_uses_flow_file_from_env
+test_progress_reads_live_counters
 
 echo ""
 echo "Results: $PASS passed, $FAIL failed (total $((PASS + FAIL)))"
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""Tests for the mergeable latency sketch."""
+
+import sys
+import os
+import json
+import random
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+
+from quantiles import (
+    EXACT_LIMIT,
+    QUANTILES,
+    SUB_BUCKETS,
+    LatencySketch,
+    bucket_bounds,
+    bucket_index,
+    effect_label,
+    mann_whitney,
+    merge_sketches,
+    quantile_label,
+)
+
+
+def exact_quantile(values, q):
+    ordered = sorted(values)
+    return ordered[int((len(ordered) - 1) * q)]
+
+
+def test_buckets_cover_every_value_once():
+    """Bucket bounds are contiguous and each value lands inside its bucket."""
+    previous_high = -1
+    for index in range(0, 40 * SUB_BUCKETS):
+        low, high = bucket_bounds(index)
+        assert low == previous_high + 1
+        assert bucket_index(low) == index and bucket_index(high) == index
+        previous_high = high
+    assert [quantile_label(q) for q in QUANTILES] == ["p50", "p90", "p95", "p99", "p99.9"]
+    print('✓ test_buckets_cover_every_value_once passed')
+
+
+def test_quantiles_match_sorted_rank():
+    """Small values are exact; large ones stay within the relative error bound."""
+    rng = random.Random(7)
+    small = [rng.randrange(EXACT_LIMIT) for _ in range(500)]
+    sketch = LatencySketch()
+    for value in small:
+        sketch.add(value)
+    assert sketch.quantiles() == [exact_quantile(small, q) for q in QUANTILES]
+    assert sketch.mean() == int(sum(small) / len(small))
+
+    large = [int(rng.lognormvariate(7, 1.5)) for _ in range(5000)]
+    sketch = LatencySketch()
+    for value in large:
+        sketch.add(value)
+    for q, value in zip(QUANTILES, sketch.quantiles()):
+        expected = exact_quantile(large, q)
+        assert abs(value - expected) <= expected / (2 * SUB_BUCKETS) + 1, (q, value, expected)
+    assert (sketch.min, sketch.max, sketch.sum) == (min(large), max(large), sum(large))
+    assert LatencySketch().quantiles() == [0] * len(QUANTILES)
+    print('✓ test_quantiles_match_sorted_rank passed')
+
+
+def test_merge_and_round_trip():
+    """Merged shard sketches equal one sketch over all values, also via JSON."""
+    rng = random.Random(11)
+    shards = [[rng.randrange(20000) for _ in range(300)] for _ in range(4)]
+    whole = LatencySketch()
+    parts = []
+    for shard in shards:
+        part = LatencySketch()
+        for value in shard:
+            whole.add(value)
+            part.add(value)
+        parts.append(LatencySketch.from_dict(json.loads(json.dumps(part.to_dict()))))
+
+    merged = merge_sketches(parts)
+    assert merged.to_dict() == whole.to_dict()
+    assert merged.percentiles() == whole.percentiles()
+
+    bad = whole.to_dict()
+    bad["subBuckets"] = 64
+    with pytest.raises(ValueError):
+        LatencySketch.from_dict(bad)
+    print('✓ test_merge_and_round_trip passed')
+
+
+def test_numpy_batches_match_python():
+    """add_many's vectorized path bins exactly like add()."""
+    pytest.importorskip('numpy')
+    rng = random.Random(3)
+    values = [int(rng.lognormvariate(6, 2)) for _ in range(10000)] + [0, EXACT_LIMIT - 1, EXACT_LIMIT, 2 ** 40]
+    batched = LatencySketch()
+    batched.add_many(values)
+    single = LatencySketch()
+    for value in values:
+        single.add(value)
+    assert batched.to_dict() == single.to_dict()
+    print('✓ test_numpy_batches_match_python passed')
+
+
+def test_mann_whitney_matches_pair_counts():
+    """U from buckets equals counting (baseline, current) pairs over raw values."""
+    rng = random.Random(7)
+    baseline = [rng.randint(0, 200) for _ in range(40)]
+    current = [rng.randint(20, 230) for _ in range(55)]
+    b_sketch, c_sketch = LatencySketch(), LatencySketch()
+    for value in baseline:
+        b_sketch.add(value)
+    for value in current:
+        c_sketch.add(value)
+
+    result = mann_whitney(b_sketch, c_sketch)
+    pairs = sum((c > b) + 0.5 * (c == b) for b in baseline for c in current)
+    assert result["u"] == pairs
+    assert result["effect_size"] == round(2 * pairs / (40 * 55) - 1, 4)
+    assert 0 < result["p_value"] < 0.05 and result["z"] > 0
+
+    assert mann_whitney(b_sketch, b_sketch)["p_value"] == 1.0
+    assert mann_whitney(LatencySketch(), c_sketch) is None
+    assert [effect_label(d) for d in (0.1, -0.2, 0.4, -0.9)] == ["negligible", "small", "medium", "large"]
+    print('✓ test_mann_whitney_matches_pair_counts passed')
+
+
+if __name__ == '__main__':
+    print('Running quantiles tests...')
+    print()
+
+    test_buckets_cover_every_value_once()
+    test_quantiles_match_sorted_rank()
+    test_merge_and_round_trip()
+    test_numpy_batches_match_python()
+    test_mann_whitney_matches_pair_counts()
+
+    print()
+    print('✓ All quantiles tests passed!')
@@ -8,7 +8,7 @@ import tempfile
 
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'scripts'))
 
-from scope_audit import run_scope_audit, render_audit_summary
+from scope_audit import MAX_VIOLATIONS, audit_entries, run_scope_audit, render_audit_summary
 
 
 def create_test_index(entries):
@@ -147,6 +147,24 @@ def test_audit_host_summary():
         os.unlink(index_file)
 
 
+def test_audit_streams_all_entries():
+    """Every entry of a generator is audited; only the first violations are listed."""
+    count = 150000
+    entries = (
+        {'id': i, 'host': 'example.com' if i % 2 else 'tracker.net', 'method': 'GET', 'url': f'https://x/{i}'}
+        for i in range(1, count + 1)
+    )
+    result = audit_entries(entries, allow_hosts=['example.com'], deny_hosts=[])
+
+    assert result['totalRequests'] == count
+    assert result['outOfScopeCount'] == count // 2
+    assert len(result['violations']) == MAX_VIOLATIONS
+    assert result['violations'][0]['id'] == 2
+    assert result['violationsTruncated'] is True
+
+    print('✓ test_audit_streams_all_entries passed')
+
+
 def test_render_audit_summary():
     """Test human-readable summary rendering."""
     result = {
@@ -180,6 +198,7 @@ def run_all_tests():
     test_audit_deny_takes_precedence()
     test_audit_empty_allowlist()
     test_audit_host_summary()
+    test_audit_streams_all_entries()
     test_render_audit_summary()
 
     print('\n✓ All scope_audit tests passed!')
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""Tests for the concurrency timeline."""
+
+import sys
+import os
+import json
+import tempfile
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+
+from index_columns import build as build_columns
+from timeline import build_timeline, main
+
+T0 = datetime(2026, 10, 17, 4, 0, 0, tzinfo=timezone.utc)
+
+
+def row(i, host, start_ms, duration_ms, path='/x', ttfb=None):
+    return {"id": i, "method": "GET", "host": host, "path": path, "status": 200,
+            "startedDateTime": (T0 + timedelta(milliseconds=start_ms)).isoformat(),
+            "durationMs": duration_ms, "ttfbMs": ttfb, "connectMs": None, "tlsMs": None}
+
+
+def write_index(path, rows):
+    with open(path, 'w') as f:
+        for r in rows:
+            f.write(json.dumps(r) + "\n")
+
+
+def sample_rows():
+    rows = []
+    # 0-1000 ms: 8 parallel requests to cdn (saturated at 6), the last ones slow
+    for k in range(8):
+        rows.append(row(len(rows) + 1, 'cdn.example.com', k * 10, 300 + (600 if k >= 6 else 0)))
+    # 1500 ms on: api called one after another (serialized), 200 ms each, 10 ms apart
+    for k in range(4):
+        rows.append(row(len(rows) + 1, 'api.example.com', 1500 + k * 210, 200, path=f'/step/{k}', ttfb=180))
+    # 3000 ms: one slow request alone
+    rows.append(row(len(rows) + 1, 'slow.example.com', 3000, 1200, ttfb=1150))
+    # Back-to-back with the previous one, and a zero-length one
+    rows.append(row(len(rows) + 1, 'other.example.com', 4200, 50))
+    rows.append(row(len(rows) + 1, 'other.example.com', 4250, 0))
+    # No response: untimed
+    untimed = row(len(rows) + 1, 'api.example.com', 4300, None)
+    rows.append(untimed)
+    return rows
+
+
+def test_sweep_concurrency_gaps_and_chains():
+    """Peak, per-host saturation, idle gaps and serialized chains come out of one sweep."""
+    with tempfile.TemporaryDirectory() as tmp:
+        index = os.path.join(tmp, 'capture_1.index.ndjson')
+        write_index(index, sample_rows())
+        result = build_timeline(index, slow_ms=800)
+
+        s = result['summary']
+        assert (s['requests'], s['timed'], s['untimed']) == (16, 15, 1)
+        assert s['peakConcurrency'] == 8 and s['peakAtMs'] == 70.0
+        assert s['spanMs'] == 4250.0
+        assert s['busyMs'] + s['idleMs'] == s['spanMs']
+        # Back-to-back requests do not overlap: never two in flight after 1500 ms
+        histogram = {h['inFlight']: h['ms'] for h in result['concurrencyHistogram']}
+        assert max(histogram) == 8 and sum(histogram.values()) == s['spanMs']
+
+        hosts = {h['host']: h for h in result['hosts']}
+        assert hosts['cdn.example.com']['peakConcurrency'] == 8
+        assert hosts['cdn.example.com']['saturatedMs'] > 0
+        assert hosts['api.example.com']['peakConcurrency'] == 1
+        assert hosts['api.example.com']['serializedRequests'] == 4
+        assert hosts['other.example.com']['serializedRequests'] == 0
+
+        chains = result['serializedChains']
+        assert len(chains) == 1
+        assert chains[0]['host'] == 'api.example.com' and chains[0]['length'] == 4
+        assert chains[0]['firstId'] == 9 and chains[0]['totalMs'] == 830.0
+
+        # Idle: 900->1500 and 2330->3000 (back-to-back at 4200 is no gap)
+        assert result['gaps']['count'] == 2
+        assert result['gaps']['largest'][0] == {"startMs": 2330.0, "gapMs": 670.0, "afterId": 12, "beforeId": 13}
+
+        causes = {r['id']: r['cause'] for r in result['slowRequests']}
+        assert causes == {7: 'saturated', 8: 'saturated', 13: 'server'}
+        assert result['slowCauses'] == {"saturated": 2, "serialized": 0, "server": 1}
+        assert result['slowRequests'][0]['id'] == 13
+        assert result['slowRequests'][0]['waitShare'] == round(1150 / 1200, 3)
+
+        # A lower threshold takes in the serialized api calls
+        result = build_timeline(index, slow_ms=200)
+        assert result['slowCauses']['serialized'] == 4
+    print('✓ test_sweep_concurrency_gaps_and_chains passed')
+
+
+def test_waterfall_rows_and_column_sidecar():
+    """The waterfall keeps index order and every row; the .index.col sidecar gives the same report."""
+    with tempfile.TemporaryDirectory() as tmp:
+        index = os.path.join(tmp, 'capture_1.index.ndjson')
+        rows = sample_rows()
+        write_index(index, rows)
+        waterfall = os.path.join(tmp, 'waterfall.ndjson')
+        from_ndjson = build_timeline(index, waterfall_file=waterfall)
+
+        with open(waterfall) as f:
+            items = [json.loads(line) for line in f]
+        assert [item['id'] for item in items] == [r['id'] for r in rows]
+        assert items[0]['startMs'] == 0.0 and items[0]['endMs'] == 300.0
+        assert items[7]['concurrency'] == 8 and items[7]['hostConcurrency'] == 8
+        assert items[14]['startMs'] == items[14]['endMs'] == 4250.0
+        assert items[14]['concurrency'] == 1
+        assert all(items[k]['serialized'] for k in range(8, 12))
+        assert items[-1]['startMs'] is None and items[-1]['concurrency'] is None
+
+        build_columns(index)
+        from_columns = build_timeline(index)
+        assert from_columns == from_ndjson
+    print('✓ test_waterfall_rows_and_column_sidecar passed')
+
+
+def test_cli_outputs():
+    """The CLI writes JSON/Markdown reports and rejects bad arguments."""
+    with tempfile.TemporaryDirectory() as tmp:
+        index = os.path.join(tmp, 'capture_1.index.ndjson')
+        write_index(index, sample_rows())
+        json_out = os.path.join(tmp, 'timeline.json')
+        md_out = os.path.join(tmp, 'timeline.md')
+        assert main([index, '--json', json_out, '--md', md_out, '--slow-ms', '800']) == 0
+        with open(json_out) as f:
+            report = json.load(f)
+        assert report['schemaVersion'] == '1' and report['summary']['slowThresholdMs'] == 800
+        assert oct(os.stat(json_out).st_mode & 0o777) == '0o600'
+        with open(md_out) as f:
+            md = f.read()
+        assert '# Capture Timeline' in md and '## Serialized Chains' in md
+        assert '| 13 | `GET slow.example.com/x` | 1200 | 1150 |' in md
+
+        assert main([os.path.join(tmp, 'missing.ndjson')]) == 1
+        assert main([index, '--saturation', '0']) == 1
+
+        empty = os.path.join(tmp, 'empty.index.ndjson')
+        write_index(empty, [])
+        assert main([empty, '--md', md_out]) == 0
+    print('✓ test_cli_outputs passed')
+
+
+if __name__ == '__main__':
+    print('Running timeline tests...')
+    print()
+
+    test_sweep_concurrency_gaps_and_chains()
+    test_waterfall_rows_and_column_sidecar()
+    test_cli_outputs()
+
+    print()
+    print('✓ All timeline tests passed!')